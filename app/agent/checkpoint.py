@@ -0,0 +1,500 @@
+"""SQLite checkpoint saver for the agent graph.
+
+Agent state survives a worker restart, and a session can move between
+workers that share the database file. The `messages` channel is a
+`DeltaChannel`, so most checkpoints store only the messages a step added
+(as pending writes). A full snapshot of the list is written every
+`AGENT_SNAPSHOT_EVERY` updates, and resuming a thread reads the nearest
+snapshot plus the writes made after it.
+
+Every `AGENT_CHECKPOINT_COMPACT_EVERY` checkpoints of a thread, the saver
+compacts it. It keeps the latest checkpoint and the ancestors back to the
+snapshot that checkpoint depends on, and deletes everything older,
+including channel blobs no kept checkpoint refers to.
+
+Channel blobs, snapshots among them, never change once written, so the
+saver keeps the most recently used ones in memory, still encoded
+(`AGENT_SNAPSHOT_CACHE_SIZE`). A session served by the
+same worker turn after turn then reads only the new writes from SQLite, not
+the whole history. Channel versions carry a random suffix, as in
+`InMemorySaver`, so a thread deleted and re-created elsewhere cannot hit a
+stale entry.
+
+One connection in WAL mode is shared by all threads behind a lock. The
+async methods run the sync ones in a worker thread.
+"""
+
+import asyncio
+import random
+import sqlite3
+import threading
+from collections import OrderedDict
+from collections.abc import AsyncIterator, Iterator, Mapping, Sequence
+from contextlib import contextmanager
+from typing import Any
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    DeltaChannelHistory,
+    PendingWrite,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+    writes_sort_key,
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL,
+    checkpoint_id TEXT NOT NULL,
+    parent_checkpoint_id TEXT,
+    checkpoint_type TEXT NOT NULL,
+    checkpoint BLOB NOT NULL,
+    metadata_type TEXT NOT NULL,
+    metadata BLOB NOT NULL,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    version TEXT NOT NULL,
+    type TEXT NOT NULL,
+    blob BLOB,
+    PRIMARY KEY (thread_id, checkpoint_ns, channel, version)
+);
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL,
+    checkpoint_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    type TEXT NOT NULL,
+    blob BLOB,
+    task_path TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+);
+"""
+
+# Parent chain of a checkpoint, nearest first. A linear chain is produced in
+# depth order, so callers can stop reading once they have what they need.
+_CHAIN_SQL = """
+WITH RECURSIVE chain(checkpoint_id, parent_checkpoint_id) AS (
+    SELECT checkpoint_id, parent_checkpoint_id FROM checkpoints
+    WHERE thread_id = :thread_id AND checkpoint_ns = :ns AND checkpoint_id = :checkpoint_id
+    UNION ALL
+    SELECT c.checkpoint_id, c.parent_checkpoint_id FROM checkpoints c
+    JOIN chain ON c.checkpoint_id = chain.parent_checkpoint_id
+    WHERE c.thread_id = :thread_id AND c.checkpoint_ns = :ns
+)
+SELECT chain.checkpoint_id, c.checkpoint_type, c.checkpoint
+FROM chain JOIN checkpoints c
+    ON c.thread_id = :thread_id AND c.checkpoint_ns = :ns AND c.checkpoint_id = chain.checkpoint_id
+"""
+
+
+def _thread_config(thread_id: str, checkpoint_ns: str, checkpoint_id: str) -> RunnableConfig:
+    return {
+        "configurable": {
+            "thread_id": thread_id,
+            "checkpoint_ns": checkpoint_ns,
+            "checkpoint_id": checkpoint_id,
+        }
+    }
+
+
+class SQLiteCheckpointSaver(BaseCheckpointSaver[str]):
+    def __init__(self, path: str, *, compact_every: int = 0, cache_size: int = 128, serde=None) -> None:
+        super().__init__(serde=serde)
+        self.path = path
+        self.compact_every = compact_every
+        self.cache_size = cache_size
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+        self._puts_since_compaction: dict[str, int] = {}
+        # Encoded (type, blob) by (thread, namespace, channel, version).
+        self._blobs: OrderedDict[tuple[str, str, str, str], tuple[str, bytes]] = OrderedDict()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        # Opened lazily so importing the graph does not create the database file.
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            conn = self.conn
+            conn.execute("BEGIN")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            self._blobs.clear()
+
+    def get_next_version(self, current: str | None, channel: None = None) -> str:
+        number = 0 if current is None else int(str(current).split(".")[0])
+        return f"{number + 1:032}.{random.random():016}"
+
+    def _remember_blob(self, key: tuple[str, str, str, str], row: tuple[str, bytes]) -> None:
+        if self.cache_size <= 0:
+            return
+        self._blobs[key] = row
+        self._blobs.move_to_end(key)
+        while len(self._blobs) > self.cache_size:
+            self._blobs.popitem(last=False)
+
+    # -- reads ------------------------------------------------------------
+
+    def _load_blobs(self, thread_id: str, checkpoint_ns: str, versions: ChannelVersions) -> dict[str, Any]:
+        values = {}
+        for channel, version in versions.items():
+            key = (thread_id, checkpoint_ns, channel, str(version))
+            if (row := self._blobs.get(key)) is not None:
+                self._blobs.move_to_end(key)
+            else:
+                row = self.conn.execute(
+                    "SELECT type, blob FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?",
+                    key,
+                ).fetchone()
+                if row is not None and row[0] != "empty":
+                    self._remember_blob(key, row)
+            if row is not None and row[0] != "empty":
+                # Decoded on every read, so the caller can never change a cached value.
+                values[channel] = self.serde.loads_typed(row)
+        return values
+
+    def _pending_writes(
+        self, thread_id: str, checkpoint_ns: str, checkpoint_id: str, channels: Sequence[str] | None = None
+    ) -> list[PendingWrite]:
+        sql = (
+            "SELECT task_id, idx, channel, type, blob, task_path FROM writes "
+            "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?"
+        )
+        params = [thread_id, checkpoint_ns, checkpoint_id]
+        if channels is not None:
+            sql += f" AND channel IN ({', '.join('?' * len(channels))})"
+            params.extend(channels)
+        rows = self.conn.execute(sql, params).fetchall()
+        rows.sort(key=lambda r: writes_sort_key(r[5], r[0], r[1]))
+        return [(task_id, channel, self.serde.loads_typed((type_, blob))) for task_id, _, channel, type_, blob, _ in rows]
+
+    def _tuple(self, thread_id: str, checkpoint_ns: str, row: tuple) -> CheckpointTuple:
+        checkpoint_id, parent_id, checkpoint_type, checkpoint_blob, metadata_type, metadata_blob = row
+        checkpoint = self.serde.loads_typed((checkpoint_type, checkpoint_blob))
+        return CheckpointTuple(
+            config=_thread_config(thread_id, checkpoint_ns, checkpoint_id),
+            checkpoint={
+                **checkpoint,
+                "channel_values": self._load_blobs(thread_id, checkpoint_ns, checkpoint["channel_versions"]),
+            },
+            metadata=self.serde.loads_typed((metadata_type, metadata_blob)),
+            parent_config=_thread_config(thread_id, checkpoint_ns, parent_id) if parent_id else None,
+            pending_writes=self._pending_writes(thread_id, checkpoint_ns, checkpoint_id),
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> CheckpointTuple | None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        columns = "checkpoint_id, parent_checkpoint_id, checkpoint_type, checkpoint, metadata_type, metadata"
+        with self._lock:
+            if checkpoint_id := get_checkpoint_id(config):
+                row = self.conn.execute(
+                    f"SELECT {columns} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                    (thread_id, checkpoint_ns, checkpoint_id),
+                ).fetchone()
+            else:
+                row = self.conn.execute(
+                    f"SELECT {columns} FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+                    "ORDER BY checkpoint_id DESC LIMIT 1",
+                    (thread_id, checkpoint_ns),
+                ).fetchone()
+            return self._tuple(thread_id, checkpoint_ns, row) if row else None
+
+    def list(
+        self,
+        config: RunnableConfig | None,
+        *,
+        filter: dict[str, Any] | None = None,
+        before: RunnableConfig | None = None,
+        limit: int | None = None,
+    ) -> Iterator[CheckpointTuple]:
+        clauses, params = [], []
+        if config is not None:
+            clauses.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            if (checkpoint_ns := config["configurable"].get("checkpoint_ns")) is not None:
+                clauses.append("checkpoint_ns = ?")
+                params.append(checkpoint_ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                clauses.append("checkpoint_id = ?")
+                params.append(checkpoint_id)
+        if before is not None and (before_id := get_checkpoint_id(before)):
+            clauses.append("checkpoint_id < ?")
+            params.append(before_id)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, checkpoint_type, "
+                f"checkpoint, metadata_type, metadata FROM checkpoints {where} "
+                "ORDER BY thread_id, checkpoint_ns, checkpoint_id DESC",
+                params,
+            ).fetchall()
+            results = []
+            for thread_id, checkpoint_ns, *row in rows:
+                if limit is not None and len(results) >= limit:
+                    break
+                if filter:
+                    metadata = self.serde.loads_typed((row[4], row[5]))
+                    if not all(metadata.get(k) == v for k, v in filter.items()):
+                        continue
+                results.append(self._tuple(thread_id, checkpoint_ns, tuple(row)))
+        yield from results
+
+    def get_delta_channel_history(
+        self, *, config: RunnableConfig, channels: Sequence[str]
+    ) -> Mapping[str, DeltaChannelHistory]:
+        """Walk the parent chain once, stopping as soon as every channel has found its seed."""
+        if not channels:
+            return {}
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        collected: dict[str, list[PendingWrite]] = {c: [] for c in channels}
+        seeds: dict[str, Any] = {}
+        remaining = set(channels)
+        with self._lock:
+            checkpoint_id = get_checkpoint_id(config) or self._latest_id(thread_id, checkpoint_ns)
+            if checkpoint_id is None:
+                return {c: {"writes": []} for c in channels}
+            chain = self.conn.execute(
+                _CHAIN_SQL, {"thread_id": thread_id, "ns": checkpoint_ns, "checkpoint_id": checkpoint_id}
+            )
+            next(chain, None)  # writes stored on the target itself are pending, not history
+            for ancestor_id, checkpoint_type, checkpoint_blob in chain:
+                versions = self.serde.loads_typed((checkpoint_type, checkpoint_blob))["channel_versions"]
+                resolved = self._load_blobs(thread_id, checkpoint_ns, {ch: versions[ch] for ch in remaining if ch in versions})
+                for write in reversed(self._pending_writes(thread_id, checkpoint_ns, ancestor_id, list(remaining))):
+                    collected[write[1]].append(write)
+                seeds.update(resolved)
+                remaining.difference_update(resolved)
+                if not remaining:
+                    break
+        history: dict[str, DeltaChannelHistory] = {}
+        for ch in channels:
+            entry: DeltaChannelHistory = {"writes": collected[ch][::-1]}
+            if ch in seeds:
+                entry["seed"] = seeds[ch]
+            history[ch] = entry
+        return history
+
+    def _latest_id(self, thread_id: str, checkpoint_ns: str) -> str | None:
+        row = self.conn.execute(
+            "SELECT MAX(checkpoint_id) FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?",
+            (thread_id, checkpoint_ns),
+        ).fetchone()
+        return row[0]
+
+    # -- writes -----------------------------------------------------------
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        stored = checkpoint.copy()
+        values = stored.pop("channel_values")
+        # Only channels that changed in this step get a blob; unchanged ones
+        # keep pointing at the blob of their current version.
+        blobs = [
+            (thread_id, checkpoint_ns, channel, str(version),
+             *(self.serde.dumps_typed(values[channel]) if channel in values else ("empty", None)))
+            for channel, version in new_versions.items()
+        ]
+        checkpoint_type, checkpoint_blob = self.serde.dumps_typed(stored)
+        metadata_type, metadata_blob = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+        with self._transaction() as conn:
+            conn.executemany("INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?, ?)", blobs)
+            conn.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (thread_id, checkpoint_ns, checkpoint["id"], config["configurable"].get("checkpoint_id"),
+                 checkpoint_type, checkpoint_blob, metadata_type, metadata_blob),
+            )
+            if self.compact_every > 0:
+                count = self._puts_since_compaction.get(thread_id, 0) + 1
+                if count >= self.compact_every:
+                    self._compact(thread_id)
+                    count = 0
+                self._puts_since_compaction[thread_id] = count
+            for _, _, channel, version, type_, blob in blobs:
+                if type_ != "empty":
+                    self._remember_blob((thread_id, checkpoint_ns, channel, version), (type_, blob))
+        return _thread_config(thread_id, checkpoint_ns, checkpoint["id"])
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        regular, special = [], []
+        for idx, (channel, value) in enumerate(writes):
+            idx = WRITES_IDX_MAP.get(channel, idx)
+            row = (thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel, *self.serde.dumps_typed(value), task_path)
+            (special if idx < 0 else regular).append(row)
+        with self._transaction() as conn:
+            # Regular writes are idempotent per (task, idx); special channels
+            # (errors, interrupts) replace the previous value.
+            conn.executemany("INSERT OR IGNORE INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", regular)
+            conn.executemany("INSERT OR REPLACE INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", special)
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._transaction() as conn:
+            for table in ("checkpoints", "blobs", "writes"):
+                conn.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+            self._puts_since_compaction.pop(thread_id, None)
+            for key in [k for k in self._blobs if k[0] == thread_id]:
+                del self._blobs[key]
+
+    def prune(self, thread_ids: Sequence[str], *, strategy: str = "keep_latest") -> None:
+        if strategy == "delete":
+            for thread_id in thread_ids:
+                self.delete_thread(thread_id)
+            return
+        if strategy != "keep_latest":
+            raise ValueError(f"Unsupported prune strategy: {strategy}")
+        with self._transaction():
+            for thread_id in thread_ids:
+                self._compact(thread_id)
+                self._puts_since_compaction.pop(thread_id, None)
+
+    def _compact(self, thread_id: str) -> None:
+        """Drop every checkpoint the latest one of each namespace does not depend on.
+
+        The latest checkpoint is kept, plus its ancestors back to the nearest
+        one holding a stored value for each delta channel that still has
+        unsnapshotted updates. Blobs no kept checkpoint refers to go too.
+        Callers hold the lock and an open transaction.
+        """
+        namespaces = [
+            ns for (ns,) in self.conn.execute(
+                "SELECT DISTINCT checkpoint_ns FROM checkpoints WHERE thread_id = ?", (thread_id,)
+            )
+        ]
+        for checkpoint_ns in namespaces:
+            latest_id = self._latest_id(thread_id, checkpoint_ns)
+            row = self.conn.execute(
+                "SELECT metadata_type, metadata FROM checkpoints "
+                "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                (thread_id, checkpoint_ns, latest_id),
+            ).fetchone()
+            pending = set(self.serde.loads_typed(row).get("counters_since_delta_snapshot") or {})
+            kept: list[str] = []
+            referenced: set[tuple[str, str]] = set()
+            chain = self.conn.execute(_CHAIN_SQL, {"thread_id": thread_id, "ns": checkpoint_ns, "checkpoint_id": latest_id})
+            for ancestor_id, checkpoint_type, checkpoint_blob in chain.fetchall():
+                kept.append(ancestor_id)
+                versions = self.serde.loads_typed((checkpoint_type, checkpoint_blob))["channel_versions"]
+                referenced.update((ch, str(v)) for ch, v in versions.items())
+                pending.difference_update(
+                    self._load_blobs(thread_id, checkpoint_ns, {ch: versions[ch] for ch in pending if ch in versions})
+                )
+                if not pending:
+                    break
+            else:
+                continue  # reached the root without a seed for every delta channel; nothing is safe to drop
+
+            placeholders = ", ".join("?" * len(kept))
+            for table in ("checkpoints", "writes"):
+                self.conn.execute(
+                    f"DELETE FROM {table} WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id NOT IN ({placeholders})",
+                    (thread_id, checkpoint_ns, *kept),
+                )
+            stale = [
+                (thread_id, checkpoint_ns, channel, version)
+                for channel, version in self.conn.execute(
+                    "SELECT channel, version FROM blobs WHERE thread_id = ? AND checkpoint_ns = ?",
+                    (thread_id, checkpoint_ns),
+                )
+                if (channel, version) not in referenced
+            ]
+            self.conn.executemany(
+                "DELETE FROM blobs WHERE thread_id = ? AND checkpoint_ns = ? AND channel = ? AND version = ?", stale
+            )
+            for key in stale:
+                self._blobs.pop(key, None)
+
+    # -- async ------------------------------------------------------------
+
+    async def aget_tuple(self, config: RunnableConfig) -> CheckpointTuple | None:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: RunnableConfig | None,
+        *,
+        filter: dict[str, Any] | None = None,
+        before: RunnableConfig | None = None,
+        limit: int | None = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        results = await asyncio.to_thread(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for item in results:
+            yield item
+
+    async def aget_delta_channel_history(
+        self, *, config: RunnableConfig, channels: Sequence[str]
+    ) -> Mapping[str, DeltaChannelHistory]:
+        return await asyncio.to_thread(self.get_delta_channel_history, config=config, channels=channels)
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+    async def aprune(self, thread_ids: Sequence[str], *, strategy: str = "keep_latest") -> None:
+        await asyncio.to_thread(self.prune, thread_ids, strategy=strategy)
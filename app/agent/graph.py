@@ -1,5 +1,107 @@
 """LangGraph agent definition.
 
-This module will contain the compiled LangGraph StateGraph
-for the conversational agent with tool-calling capabilities.
+A tool-calling loop: `agent` calls the model, and if it requested tools,
+`tools` runs every call of that turn concurrently before looping back.
+The loop stops when the model answers without tool calls, after
+`AGENT_MAX_STEPS` model calls, or once the context deadline has passed.
+
+The graph is compiled with a SQLite checkpointer, and each chat session is a
+thread (`thread_id` = session id). The thread therefore holds the whole
+conversation, including earlier tool calls. Callers send only the messages
+of the new turn.
 """
+
+import asyncio
+import time
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, ToolCall, ToolMessage
+from langchain_core.messages.utils import count_tokens_approximately, trim_messages
+from langgraph.graph import END, START, StateGraph
+from langgraph.runtime import Runtime
+
+from app.agent.checkpoint import SQLiteCheckpointSaver
+from app.agent.prompts import agent_system_prompt
+from app.agent.state import AgentContext, AgentState
+from app.agent.tools import TOOLS, TOOLS_BY_NAME
+from app.config import settings
+
+
+def _model_window(messages: list[BaseMessage]) -> list[BaseMessage]:
+    """The current turn in full, after as much earlier history as fits in `MAX_TOKENS`."""
+    turn_start = max((i for i, m in enumerate(messages) if isinstance(m, HumanMessage)), default=0)
+    # Only the tail that can fit the budget is handed to trim_messages, so a
+    # long thread does not cost a token count over every message it holds.
+    window_start, tokens = turn_start + 1, 0
+    while window_start > 0 and tokens <= settings.MAX_TOKENS:
+        window_start -= 1
+        tokens += count_tokens_approximately([messages[window_start]])
+    history = trim_messages(
+        messages[window_start:turn_start + 1],
+        strategy="last",
+        token_counter=count_tokens_approximately,
+        max_tokens=settings.MAX_TOKENS,
+        start_on="human",
+    )
+    return history + messages[turn_start + 1:]
+
+
+async def call_model(state: AgentState, runtime: Runtime[AgentContext]) -> dict:
+    context = runtime.context
+    model = context.llm.bind_tools(TOOLS) if context.knowledge_base_ids else context.llm
+    messages = [
+        SystemMessage(content=agent_system_prompt(context.knowledge_base_ids)),
+        *context.memory,
+        *_model_window(state["messages"]),
+    ]
+    response = await model.ainvoke(messages)
+    return {"messages": [response], "steps": state["steps"] + 1}
+
+
+async def _run_tool_call(call: ToolCall, timeout: float) -> ToolMessage:
+    selected = TOOLS_BY_NAME.get(call["name"])
+    if selected is None:
+        content = f"Error: unknown tool {call['name']!r}."
+    else:
+        try:
+            content = await asyncio.wait_for(selected.ainvoke(call["args"]), timeout=max(timeout, 0))
+        except TimeoutError:
+            content = "Error: the tool call timed out."
+        except Exception as e:  # surfaced to the model so it can recover
+            content = f"Error: {e}"
+    return ToolMessage(content=str(content), tool_call_id=call["id"], name=call["name"])
+
+
+async def run_tools(state: AgentState, runtime: Runtime[AgentContext]) -> dict:
+    """Execute all tool calls from the last model turn concurrently."""
+    last = state["messages"][-1]
+    remaining = runtime.context.deadline - time.monotonic()
+    results = await asyncio.gather(*(_run_tool_call(call, remaining) for call in last.tool_calls))
+    return {"messages": list(results)}
+
+
+def route_after_model(state: AgentState, runtime: Runtime[AgentContext]) -> str:
+    last = state["messages"][-1]
+    if not isinstance(last, AIMessage) or not last.tool_calls:
+        return END
+    if state["steps"] >= settings.AGENT_MAX_STEPS or time.monotonic() >= runtime.context.deadline:
+        return END
+    return "tools"
+
+
+def build_agent_graph(checkpointer=None):
+    graph = StateGraph(AgentState, context_schema=AgentContext)
+    graph.add_node("agent", call_model)
+    graph.add_node("tools", run_tools)
+    graph.add_edge(START, "agent")
+    graph.add_conditional_edges("agent", route_after_model, ["tools", END])
+    graph.add_edge("tools", "agent")
+    return graph.compile(checkpointer=checkpointer)
+
+
+agent_graph = build_agent_graph(
+    SQLiteCheckpointSaver(
+        settings.AGENT_CHECKPOINT_PATH,
+        compact_every=settings.AGENT_CHECKPOINT_COMPACT_EVERY,
+        cache_size=settings.AGENT_SNAPSHOT_CACHE_SIZE,
+    )
+)
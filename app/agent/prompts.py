@@ -1,5 +1,27 @@
 """System prompts.
 
-This module will hold system prompt templates used by the agent
-for different conversation modes and tasks.
+Templates used by the agent for different conversation modes and tasks.
 """
+
+AGENT_SYSTEM_PROMPT = (
+    "You are a helpful assistant. Answer the user's question directly when you can."
+)
+
+KNOWLEDGE_BASE_INSTRUCTIONS = (
+    "\n\nYou can search these knowledge bases with the `search_knowledge_base` tool: {kb_ids}. "
+    "When a question needs information from several knowledge bases or several distinct "
+    "searches, request all of those tool calls in the same turn so they run together. "
+    "If the results don't contain relevant information, say so."
+)
+
+
+def agent_system_prompt(kb_ids: list[str]) -> str:
+    if not kb_ids:
+        return AGENT_SYSTEM_PROMPT
+    return AGENT_SYSTEM_PROMPT + KNOWLEDGE_BASE_INSTRUCTIONS.format(kb_ids=", ".join(kb_ids))
+
+
+AGENT_INCOMPLETE_MESSAGE = (
+    "I wasn't able to finish working on this within the allowed number of steps or time. "
+    "Please try a narrower question."
+)
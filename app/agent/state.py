@@ -1,5 +1,53 @@
 """Agent state schema.
 
-This module will define the TypedDict state schema used by
-the LangGraph agent to track conversation and tool state.
+The graph state is kept deliberately small: the running message list and a
+step counter. Per-request inputs that never change during a run (the model,
+the knowledge bases the caller may search, the wall-clock deadline) travel
+in `AgentContext` instead of being copied into every checkpointed state.
+
+`messages` is a `DeltaChannel`: a checkpoint records only the messages a
+step appended, with a full snapshot every `AGENT_SNAPSHOT_EVERY` updates,
+so persisting a turn costs the same however long the session is.
 """
+
+from collections.abc import Sequence
+from dataclasses import dataclass, field
+from typing import Annotated, TypedDict
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langgraph.channels import DeltaChannel
+from langgraph.graph.message import Messages, add_messages
+
+from app.config import settings
+from app.models import RetrievalFilter
+from app.rag.vector_store.base import DEFAULT_TENANT
+
+
+def add_message_batches(messages: list[BaseMessage], batches: Sequence[Messages]) -> list[BaseMessage]:
+    """Merge several `add_messages` updates in one pass.
+
+    This gives the same result as applying the batches one at a time, except
+    when a message is removed and re-added in a later batch, which the agent
+    never does. Replaying a long delta chain therefore copies the history once,
+    not once per batch.
+    """
+    return add_messages(messages, [m for batch in batches for m in (batch if isinstance(batch, list) else [batch])])
+
+
+class AgentState(TypedDict):
+    messages: Annotated[
+        list[BaseMessage],
+        DeltaChannel(add_message_batches, snapshot_frequency=settings.AGENT_SNAPSHOT_EVERY),
+    ]
+    steps: int
+
+
+@dataclass
+class AgentContext:
+    llm: BaseChatModel
+    deadline: float  # time.monotonic() value after which no further model or tool step starts
+    knowledge_base_ids: list[str]
+    metadata_filter: RetrievalFilter | None = None
+    tenant_id: str = DEFAULT_TENANT  # namespace of knowledge_base_ids in the vector store
+    memory: list[BaseMessage] = field(default_factory=list)  # e.g. the session summary, placed after the system prompt
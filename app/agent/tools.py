@@ -1,5 +1,32 @@
 """Agent tools.
 
-This module will define LangChain tools that the agent can invoke,
-such as knowledge base search, web lookup, or custom functions.
+LangChain tools the agent can invoke. Tools read per-request settings
+(allowed knowledge bases, metadata filter) from the graph's `AgentContext`.
 """
+
+from langchain_core.tools import tool
+from langgraph.runtime import get_runtime
+
+from app.agent.state import AgentContext
+from app.api.knowledge_base import kb_collection
+from app.rag.retriever import aretrieve_context, format_context
+
+
+@tool
+async def search_knowledge_base(query: str, knowledge_base_id: str) -> str:
+    """Search one of the user's knowledge bases for passages relevant to the query.
+
+    Args:
+        query: Natural-language search query.
+        knowledge_base_id: ID of the knowledge base to search.
+    """
+    context = get_runtime(AgentContext).context
+    if knowledge_base_id not in context.knowledge_base_ids:
+        return f"Error: knowledge base {knowledge_base_id!r} is not available in this conversation."
+    collection = await kb_collection(knowledge_base_id, context.tenant_id)
+    docs = await aretrieve_context(collection, query, metadata_filter=context.metadata_filter)
+    return format_context(docs) or "No relevant documents found."
+
+
+TOOLS = [search_knowledge_base]
+TOOLS_BY_NAME = {t.name: t for t in TOOLS}
@@ -0,0 +1,95 @@
+import secrets
+from dataclasses import asdict
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import FileResponse
+
+from app.config import settings
+from app.api.knowledge_base import kb_registry
+from app.maintenance import recent_reports, run_maintenance
+from app.models import MaintenanceReport, ProfileInfo, ReindexStatus, RetrievalCacheInfo, TenantUsage
+from app.profiling import find_profile, profile_path, recent_profiles
+from app.rag.retriever import retrieval_cache
+from app.rag.vector_store import DEFAULT_TENANT
+from app.reindex import reindex_jobs
+from app.tenants import tenant_usage
+
+
+def require_admin(x_admin_token: str | None = Header(default=None)) -> None:
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled until ADMIN_TOKEN is set")
+    if x_admin_token is None or not secrets.compare_digest(x_admin_token.encode(), settings.ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+
+router = APIRouter(prefix="/admin", tags=["Admin"], dependencies=[Depends(require_admin)])
+
+
+@router.get("/profiles")
+async def list_profiles() -> list[ProfileInfo]:
+    """Recent request profiles, newest first."""
+    return list(recent_profiles)
+
+
+@router.get("/profiles/{profile_id}")
+async def get_profile(profile_id: str):
+    """Download a profile artifact: an HTML flamegraph or a Chrome trace JSON."""
+    info = find_profile(profile_id)
+    if info is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    media_type = "text/html" if info.mode == "sampling" else "application/json"
+    return FileResponse(profile_path(info), media_type=media_type, filename=info.filename)
+
+
+@router.get("/tenants")
+async def list_tenants() -> list[TenantUsage]:
+    """Usage counted per tenant by this worker, with the knowledge bases and bytes each one stores."""
+    knowledge_bases: dict[str, list[dict]] = {}
+    for kb in await kb_registry.avalues():
+        knowledge_bases.setdefault(kb.get("tenant_id", DEFAULT_TENANT), []).append(kb)
+    return [
+        TenantUsage(
+            tenant_id=tenant_id,
+            knowledge_bases=len(knowledge_bases.get(tenant_id, [])),
+            storage_bytes=sum(kb.get("storage_bytes", 0) for kb in knowledge_bases.get(tenant_id, [])),
+            **asdict(tenant_usage[tenant_id]),
+        )
+        for tenant_id in sorted(knowledge_bases.keys() | tenant_usage.keys())
+    ]
+
+
+@router.get("/retrieval-cache")
+async def get_retrieval_cache() -> RetrievalCacheInfo:
+    """Size and hit rate of this worker's retrieval cache since startup."""
+    stats = retrieval_cache.stats
+    lookups = stats.hits + stats.misses
+    return RetrievalCacheInfo(
+        enabled=retrieval_cache.enabled,
+        entries=len(retrieval_cache),
+        bytes=retrieval_cache.bytes,
+        max_bytes=settings.RETRIEVAL_CACHE_MAX_BYTES,
+        ttl_seconds=settings.RETRIEVAL_CACHE_TTL_SECONDS,
+        hit_rate=stats.hits / lookups if lookups else None,
+        **asdict(stats),
+    )
+
+
+@router.get("/maintenance")
+async def list_maintenance_reports() -> list[MaintenanceReport]:
+    """Reports of this worker's recent maintenance passes, newest first."""
+    return list(recent_reports)
+
+
+@router.post("/maintenance")
+async def run_maintenance_now() -> MaintenanceReport:
+    """Run a maintenance pass now and return its report."""
+    report = await run_maintenance(kb_registry)
+    if report is None:
+        raise HTTPException(status_code=409, detail="A maintenance pass is already running")
+    return report
+
+
+@router.get("/reindex")
+async def list_reindex_jobs() -> list[ReindexStatus]:
+    """Reindex jobs started by this worker, running and finished."""
+    return list(reindex_jobs.values())
@@ -1,17 +1,56 @@
+import asyncio
 import logging
+import os
+import sqlite3
+import time
 import uuid
+from contextlib import asynccontextmanager, closing
 from datetime import datetime, timezone
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from fastapi.responses import StreamingResponse
 from langchain_core.globals import set_debug
-from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, UsageMetadata
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import (
+    AIMessage,
+    AIMessageChunk,
+    BaseMessage,
+    HumanMessage,
+    SystemMessage,
+    UsageMetadata,
+)
+from langchain_core.messages.ai import add_usage
 from langchain_core.messages.utils import count_tokens_approximately, trim_messages
-from langchain_ollama import ChatOllama
 
+from app.agent.prompts import AGENT_INCOMPLETE_MESSAGE
+from app.api.knowledge_base import kb_collection
 from app.config import settings
-from app.models import ChatRequest, ChatResponse, Message, SessionMessages, StreamChunk, TokenUsage
-from app.rag.retriever import format_context, retrieve_context
+from app.llm import ModelRouter, Tier, create_chat_model
+from app.memory import restore_summary, schedule_summary, summary_messages
+from app.models import (
+    ChatRequest,
+    ChatResponse,
+    Citation,
+    Message,
+    PromptEvalStats,
+    RetrievalFilter,
+    SessionMessages,
+    StreamChunk,
+    TokenUsage,
+)
+from app.rag.citations import CitationTracker
+from app.rag.retriever import aretrieve_context, format_context
+from app.rag.vector_store import DEFAULT_TENANT
+from app.state import shared_state
+from app.tenants import chat_tenant, get_tenant_id, record_tokens
+from app.telemetry import (
+    CHAT_REQUEST_SECONDS,
+    CHAT_STAGE_SECONDS,
+    CHAT_TOKENS,
+    Gauge,
+    prompt_eval_totals,
+    record_prompt_eval,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -21,10 +60,33 @@ if settings.DEBUG:
     logging.basicConfig(level=logging.DEBUG)
     set_debug(True)
 
-llm = ChatOllama(model=settings.OLLAMA_MODEL)
+# Created on first use by `chat_models`, so importing the app builds no Ollama
+# clients. Tests and benchmarks patch these names directly.
+llm: BaseChatModel | None = None
+small_llm: BaseChatModel | None = None
+model_router = ModelRouter()
+Gauge(
+    "chat_in_flight",
+    "Chat turns currently being served, per model tier.",
+    ("tier",),
+    lambda: {(tier,): count for tier, count in model_router.in_flight.items()},
+)
 
 sessions: dict[str, list[BaseMessage]] = {}
 
+# With shared state: how many of each session's stored messages its cached
+# history holds, and a lock serializing this worker's reads and writes of it.
+# A lock is dropped once no task holds or awaits it (see `_session_lock`).
+session_positions: dict[str, int] = {}
+session_locks: dict[str, asyncio.Lock] = {}
+_session_lock_users: dict[str, int] = {}
+
+# Id of the last history message each session's agent thread already holds.
+agent_cursors: dict[str, str] = {}
+
+# Index of the first history message in each session's prompt (stable_prefix layout).
+window_starts: dict[str, int] = {}
+
 
 def get_trimmed_messages(history: list[BaseMessage]) -> list[BaseMessage]:
     return trim_messages(
@@ -36,105 +98,526 @@ def get_trimmed_messages(history: list[BaseMessage]) -> list[BaseMessage]:
     )
 
 
-def _build_rag_prefix(
-    kb_ids: list[str] | None,
+def _block_window(session_id: str, history: list[BaseMessage]) -> list[BaseMessage]:
+    """Trim from the front in blocks of about `PROMPT_TRIM_BLOCK_TOKENS`, not one turn at a time.
+
+    The window keeps its start until it outgrows `MAX_TOKENS`. It then jumps
+    forward far enough to leave room for several more turns, so the opening
+    messages of the prompt stay unchanged across most turns.
+    """
+    floor = window_starts.get(session_id, 0)
+    if floor >= len(history):
+        floor = 0
+    start = floor
+    if count_tokens_approximately(history[start:]) > settings.MAX_TOKENS:
+        budget = settings.MAX_TOKENS - settings.PROMPT_TRIM_BLOCK_TOKENS
+        start = max(i for i, m in enumerate(history) if isinstance(m, HumanMessage))
+        tokens = count_tokens_approximately(history[start:])
+        for i in range(start - 1, floor - 1, -1):
+            tokens += count_tokens_approximately([history[i]])
+            if tokens > budget:
+                break
+            if isinstance(history[i], HumanMessage):
+                start = i
+    window_starts[session_id] = start
+    return history[start:]
+
+
+def _history_window(session_id: str, history: list[BaseMessage]) -> list[BaseMessage]:
+    if settings.PROMPT_LAYOUT == "stable_prefix":
+        return _block_window(session_id, history)
+    return get_trimmed_messages(history)
+
+
+async def _build_rag_prefix(
+    collections: dict[str, str],
     query: str,
-) -> list[BaseMessage]:
-    """Retrieve context from one or more knowledge bases and return a SystemMessage."""
-    if not kb_ids:
-        return []
-    all_docs: list[tuple[str, dict, float]] = []
-    for kb_id in kb_ids:
-        all_docs.extend(retrieve_context(kb_id, query))
+    metadata_filter: RetrievalFilter | None = None,
+) -> tuple[list[BaseMessage], list[Citation]]:
+    """Retrieve context from one or more knowledge bases concurrently and return a SystemMessage.
+
+    `collections` maps knowledge base ids to their collections. Also returns
+    the citation of each chunk in the context, in label order.
+    """
+    if not collections:
+        return [], []
+
+    async def search(collection: str) -> list[tuple[str, dict, float, str | None]]:
+        with CHAT_STAGE_SECONDS.time(stage="kb_search"):
+            return await aretrieve_context(collection, query, metadata_filter=metadata_filter)
+
+    results = await asyncio.gather(*(search(collection) for collection in collections.values()))
+    all_docs = [doc for docs in results for doc in docs]
     context = format_context(all_docs)
     if not context:
-        return []
-    return [
-        SystemMessage(
-            content=(
-                "Use the following context to answer the user's question. "
-                "If the context doesn't contain relevant information, say so.\n\n"
-                f"{context}"
-            )
+        return [], []
+    sources = []
+    for kb_id, docs in zip(collections, results):
+        for _content, metadata, score, chunk_id in docs:
+            sources.append(Citation(
+                document=len(sources) + 1,
+                kb_id=kb_id,
+                chunk_id=chunk_id,
+                source_filename=metadata.get("source_filename", "unknown"),
+                score=score,
+            ))
+    prefix = SystemMessage(
+        content=(
+            "Use the following context to answer the user's question. "
+            "If the context doesn't contain relevant information, say so. "
+            "Cite the documents you use by their labels, like [Document 1].\n\n"
+            f"{context}"
         )
-    ]
+    )
+    return [prefix], sources
 
 
-@router.post("")
-async def chat(request: ChatRequest) -> ChatResponse:
-    session_id = request.session_id or str(uuid.uuid4())
-    history = sessions.setdefault(session_id, [])
-    history.append(HumanMessage(content=request.message))
+def _start_retrieval(request: ChatRequest, tenant_id: str) -> asyncio.Task | None:
+    """Start a chat turn's knowledge base lookup right away, to overlap session loading and trimming.
+
+    Agent turns search through their own tool, so they get None.
+    """
+    if request.mode != "chat" or not request.knowledge_base_ids:
+        return None
+
+    async def retrieve() -> tuple[list[BaseMessage], list[Citation]]:
+        collections = {kb_id: await kb_collection(kb_id, tenant_id) for kb_id in request.knowledge_base_ids}
+        return await _build_rag_prefix(collections, request.message, request.filter)
+
+    return asyncio.create_task(retrieve())
+
+
+def _cancel(task: asyncio.Task | None) -> None:
+    if task is not None:
+        task.cancel()
 
-    rag_prefix = _build_rag_prefix(request.knowledge_base_ids, request.message)
-    trimmed = get_trimmed_messages(history)
-    messages = rag_prefix + trimmed
 
-    logger.debug("Sending %d message(s) to LLM (trimmed from %d): %s", len(messages), len(history), messages)
-    result = await llm.ainvoke(messages)
-    logger.debug("LLM response: %s", result.content)
-    history.append(AIMessage(content=str(result.content)))
+def _agent_graph():
+    # Imported on first use: the agent graph pulls in langgraph, which most of app startup is spent on otherwise.
+    from app.agent.graph import agent_graph
 
-    meta: UsageMetadata | dict = result.usage_metadata or {}
+    return agent_graph
+
+
+def _thread_config(session_id: str) -> dict:
+    return {"configurable": {"thread_id": session_id}}
+
+
+def _has_agent_thread(session_id: str) -> bool:
+    """Whether the agent checkpoint holds a thread for the session, read with plain SQL so langgraph stays unloaded."""
+    if not os.path.exists(settings.AGENT_CHECKPOINT_PATH):
+        return False
+    with closing(sqlite3.connect(settings.AGENT_CHECKPOINT_PATH)) as conn:
+        try:
+            row = conn.execute("SELECT 1 FROM checkpoints WHERE thread_id = ? LIMIT 1", (session_id,)).fetchone()
+        except sqlite3.OperationalError:
+            return False  # created, but no agent turn was stored yet
+    return row is not None
+
+
+def _memory_prefix(session_id: str) -> list[BaseMessage]:
+    return summary_messages(session_id) if settings.MEMORY_MODE == "summary" else []
+
+
+def _remember(session_id: str, history: list[BaseMessage]) -> None:
+    """In summary mode, hand messages that just left the trim window to the background summarizer."""
+    if settings.MEMORY_MODE == "summary":
+        dropped = history[:len(history) - len(_history_window(session_id, history))]
+        large, small = chat_models()
+        schedule_summary(session_id, dropped, small or large)
+
+
+def _token_usage(meta: UsageMetadata | dict, tenant_id: str) -> TokenUsage:
     usage = TokenUsage(
         input_tokens=meta.get("input_tokens", 0),
         output_tokens=meta.get("output_tokens", 0),
         total_tokens=meta.get("total_tokens", 0),
     )
+    CHAT_TOKENS.inc(usage.input_tokens, type="input")
+    CHAT_TOKENS.inc(usage.output_tokens, type="output")
+    record_tokens(tenant_id, usage)
+    return usage
+
 
-    return ChatResponse(
-        response=str(result.content),
-        session_id=session_id,
-        timestamp=datetime.now(timezone.utc),
-        usage=usage,
+def chat_models() -> tuple[BaseChatModel, BaseChatModel | None]:
+    """The large chat model and, when `OLLAMA_SMALL_MODEL` is set, the small one."""
+    global llm, small_llm
+    if llm is None:
+        llm = create_chat_model()
+    if small_llm is None and settings.OLLAMA_SMALL_MODEL:
+        small_llm = create_chat_model(settings.OLLAMA_SMALL_MODEL)
+    return llm, small_llm
+
+
+def _route(request: ChatRequest) -> tuple[Tier, BaseChatModel]:
+    large, small = chat_models()
+    tier = model_router.select(request, small_available=small is not None)
+    return tier, small if tier == "small" else large
+
+
+def _compose_prompt(session_id: str, window: list[BaseMessage], rag_prefix: list[BaseMessage]) -> list[BaseMessage]:
+    """Order the prompt for `PROMPT_LAYOUT`.
+
+    `classic` puts the retrieved context first. `stable_prefix` keeps
+    everything that repeats from the previous turn (summary, then history) at
+    the front and places this turn's context just before the new question,
+    so the model server only has to evaluate the tail of the prompt.
+    """
+    if settings.PROMPT_LAYOUT == "stable_prefix":
+        return _memory_prefix(session_id) + window[:-1] + rag_prefix + window[-1:]
+    return _memory_prefix(session_id) + rag_prefix + window
+
+
+def _agent_context(request: ChatRequest, session_id: str, tenant_id: str):
+    from app.agent.state import AgentContext
+
+    return AgentContext(
+        llm=chat_models()[0],
+        deadline=time.monotonic() + settings.AGENT_TIMEOUT_SECONDS,
+        knowledge_base_ids=request.knowledge_base_ids or [],
+        metadata_filter=request.filter,
+        tenant_id=tenant_id,
+        memory=_memory_prefix(session_id),
     )
 
 
-@router.post("/stream")
-async def chat_stream(request: ChatRequest):
-    session_id = request.session_id or str(uuid.uuid4())
+@asynccontextmanager
+async def _session_lock(session_id: str):
+    lock = session_locks.setdefault(session_id, asyncio.Lock())
+    _session_lock_users[session_id] = _session_lock_users.get(session_id, 0) + 1
+    try:
+        async with lock:
+            yield
+    finally:
+        _session_lock_users[session_id] -= 1
+        if not _session_lock_users[session_id]:
+            del _session_lock_users[session_id]
+            del session_locks[session_id]
+
+
+async def _restore_history(session_id: str) -> list[BaseMessage] | None:
+    """Return the session's history, or None if it does not exist.
+
+    With shared state, messages other workers added since this worker last
+    saw the session are read first. A session found nowhere else is rebuilt
+    from its agent checkpoint, if it has one; langgraph is only loaded when
+    it does.
+    """
+    if shared_state is not None:
+        async with _session_lock(session_id):
+            cached = sessions.get(session_id, [])
+            start = session_positions.get(session_id, 0)
+            newer, summary = await shared_state.aread_session(session_id, start)
+            if summary is not None:
+                restore_summary(session_id, *summary)
+            if cached or newer:
+                history = sessions.setdefault(session_id, cached)
+                history.extend(newer)
+                session_positions[session_id] = start + len(newer)
+                return history
+    elif session_id in sessions:
+        return sessions[session_id]
+    if not await asyncio.to_thread(_has_agent_thread, session_id):
+        return None
+    state = await _agent_graph().aget_state(_thread_config(session_id))
+    transcript = [
+        m for m in state.values.get("messages", [])
+        if isinstance(m, HumanMessage) or (isinstance(m, AIMessage) and m.content and not m.tool_calls)
+    ]
+    if not transcript:
+        return None
     history = sessions.setdefault(session_id, [])
-    history.append(HumanMessage(content=request.message))
+    agent_cursors[session_id] = transcript[-1].id
+    await _store(session_id, history, transcript)
+    return history
 
-    async def generate():
-        collected = []
-        total_usage = {}
-        rag_prefix = _build_rag_prefix(request.knowledge_base_ids, request.message)
-        trimmed = get_trimmed_messages(history)
-        messages = rag_prefix + trimmed
-        logger.debug("Streaming %d message(s) to LLM (trimmed from %d): %s", len(messages), len(history), messages)
-        async for chunk in llm.astream(messages):
-            collected.append(str(chunk.content))
-            if chunk.usage_metadata:
-                total_usage = chunk.usage_metadata
-            event = StreamChunk(
-                session_id=session_id,
-                content=str(chunk.content),
-                done=False,
-                timestamp=datetime.now(timezone.utc),
+
+async def _store(session_id: str, history: list[BaseMessage], messages: list[BaseMessage]) -> None:
+    """Add messages to the session's history, in the order shared state stores them."""
+    if shared_state is None:
+        history.extend(messages)
+        return
+    async with _session_lock(session_id):
+        first = await shared_state.aappend_messages(session_id, messages)
+        start = session_positions.get(session_id, 0)
+        if first > start:
+            # Other workers stored messages since this one last read the session; they come first.
+            newer, _ = await shared_state.aread_session(session_id, start, stop=first)
+            history.extend(newer)
+        history.extend(messages)
+        session_positions[session_id] = first + len(messages)
+
+
+async def _append(session_id: str, history: list[BaseMessage], message: BaseMessage) -> None:
+    await _store(session_id, history, [message])
+
+
+async def _agent_input(session_id: str, history: list[BaseMessage]) -> list[BaseMessage]:
+    """Messages of the trimmed history that the session's agent thread does not hold yet.
+
+    Usually just the new question, plus any turns taken in chat mode since
+    the last agent turn. The thread is only read when this worker has not
+    tracked the session's position in it.
+    """
+    trimmed = get_trimmed_messages(history)
+    ids = [m.id for m in trimmed]
+    if (cursor := agent_cursors.get(session_id)) in ids:
+        return trimmed[ids.index(cursor) + 1:]
+    state = await _agent_graph().aget_state(_thread_config(session_id))
+    known = {m.id for m in state.values.get("messages", [])}
+    return [m for m in trimmed if m.id not in known]
+
+
+async def _run_agent(
+    request: ChatRequest, session_id: str, history: list[BaseMessage], tenant_id: str
+) -> AIMessage:
+    """Run the tool-calling agent and return its answer with usage summed over all model calls."""
+    messages = await _agent_input(session_id, history)
+    try:
+        async with asyncio.timeout(settings.AGENT_TIMEOUT_SECONDS):
+            state = await _agent_graph().ainvoke(
+                {"messages": messages, "steps": 0},
+                config=_thread_config(session_id),
+                context=_agent_context(request, session_id, tenant_id),
             )
-            yield f"data: {event.model_dump_json()}\n\n"
-        history.append(AIMessage(content="".join(collected)))
-        usage = TokenUsage(
-            input_tokens=total_usage.get("input_tokens", 0),
-            output_tokens=total_usage.get("output_tokens", 0),
-            total_tokens=total_usage.get("total_tokens", 0),
-        )
-        event = StreamChunk(
+    except TimeoutError as e:
+        raise HTTPException(status_code=504, detail="Agent timed out") from e
+
+    thread = state["messages"]
+    turn_end = max(i for i, m in enumerate(thread) if m.id == messages[-1].id)
+    produced = [m for m in thread[turn_end + 1:] if isinstance(m, AIMessage)]
+    usage = None
+    for message in produced:
+        usage = add_usage(usage, message.usage_metadata)
+    if not produced:
+        return AIMessage(content=AGENT_INCOMPLETE_MESSAGE, id=str(uuid.uuid4()))
+    final = produced[-1]
+    # A trailing tool request means the step cap or deadline stopped the loop.
+    content = AGENT_INCOMPLETE_MESSAGE if final.tool_calls and not final.content else str(final.content)
+    return AIMessage(content=content, usage_metadata=usage, id=final.id)
+
+
+async def _astream_agent(request: ChatRequest, session_id: str, history: list[BaseMessage], tenant_id: str):
+    """Yield the agent's answer tokens, then a final empty chunk carrying the summed usage."""
+    messages = await _agent_input(session_id, history)
+    usage = None
+    last = None
+    try:
+        async with asyncio.timeout(settings.AGENT_TIMEOUT_SECONDS):
+            async for message, meta in _agent_graph().astream(
+                {"messages": messages, "steps": 0},
+                config=_thread_config(session_id),
+                context=_agent_context(request, session_id, tenant_id),
+                stream_mode="messages",
+            ):
+                if meta.get("langgraph_node") != "agent" or not isinstance(message, AIMessage):
+                    continue
+                usage = add_usage(usage, message.usage_metadata)
+                last = message
+                yield AIMessageChunk(content=message.content)
+    except TimeoutError:
+        yield AIMessageChunk(content=AGENT_INCOMPLETE_MESSAGE)
+    else:
+        if last is None:
+            yield AIMessageChunk(content=AGENT_INCOMPLETE_MESSAGE)
+    # The thread stores the answer under this id, so the history entry must match it.
+    yield AIMessageChunk(content="", usage_metadata=usage, id=last.id if last else None)
+
+
+def _check_fits(request: ChatRequest) -> None:
+    """Refuse an agent question that alone exceeds MAX_TOKENS: the trimmed history would drop it."""
+    if request.mode == "agent" and not get_trimmed_messages([HumanMessage(content=request.message)]):
+        raise HTTPException(status_code=413, detail="Message exceeds the context budget")
+
+
+def _session_key(tenant_id: str, session_id: str) -> str:
+    """The key a tenant's session is stored and cached under; other tenants' sessions are not found."""
+    return session_id if tenant_id == DEFAULT_TENANT else f"{tenant_id}/{session_id}"
+
+
+async def _session_history(session_id: str | None, tenant_id: str) -> tuple[str, str, list[BaseMessage]]:
+    """The session's id, its storage key and its history, starting a new session without an id."""
+    if session_id is None:
+        session_id = str(uuid.uuid4())
+        key = _session_key(tenant_id, session_id)
+        return session_id, key, sessions.setdefault(key, [])
+    key = _session_key(tenant_id, session_id)
+    history = await _restore_history(key)
+    return session_id, key, history if history is not None else sessions.setdefault(key, [])
+
+
+@router.post("")
+async def chat(request: ChatRequest, tenant_id: str = Depends(chat_tenant)) -> ChatResponse:
+    started = time.perf_counter()
+    _check_fits(request)
+    retrieval = _start_retrieval(request, tenant_id)
+    try:
+        with CHAT_STAGE_SECONDS.time(stage="session_load"):
+            session_id, key, history = await _session_history(request.session_id, tenant_id)
+        await _append(key, history, HumanMessage(content=request.message, id=str(uuid.uuid4())))
+
+        tier, model = _route(request)
+        # Agent turns cite nothing: each of their searches labels its chunks from 1 again.
+        sources: list[Citation] = []
+        async with model_router.slot(tier):
+            if request.mode == "agent":
+                with CHAT_STAGE_SECONDS.time(stage="generation"):
+                    result = await _run_agent(request, key, history, tenant_id)
+                message_id = result.id
+            else:
+                with CHAT_STAGE_SECONDS.time(stage="trim"):
+                    window = _history_window(key, history)
+                with CHAT_STAGE_SECONDS.time(stage="retrieval_wait"):
+                    rag_prefix, sources = await retrieval if retrieval is not None else ([], [])
+                with CHAT_STAGE_SECONDS.time(stage="prompt_assembly"):
+                    messages = _compose_prompt(key, window, rag_prefix)
+
+                logger.debug("Sending %d message(s) to %s model (trimmed from %d)", len(messages), tier, len(history))
+                with CHAT_STAGE_SECONDS.time(stage="generation"):
+                    result = await model.ainvoke(messages)
+                record_prompt_eval(settings.PROMPT_LAYOUT, result.response_metadata)
+                message_id = str(uuid.uuid4())
+        await _append(key, history, AIMessage(content=str(result.content), id=message_id))
+        if request.mode == "agent":
+            agent_cursors[key] = message_id
+        _remember(key, history)
+
+        citations = CitationTracker(sources)
+        citations.feed(str(result.content))
+        response = ChatResponse(
+            response=str(result.content),
             session_id=session_id,
-            content="",
-            done=True,
             timestamp=datetime.now(timezone.utc),
-            usage=usage,
+            usage=_token_usage(result.usage_metadata or {}, tenant_id),
+            model=model_router.model_name(tier),
+            citations=citations.citations,
         )
-        yield f"data: {event.model_dump_json()}\n\n"
+        CHAT_REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint="chat", mode=request.mode)
+        return response
+    finally:
+        # Still running if the turn failed before awaiting it; a done task ignores this.
+        _cancel(retrieval)
+
+
+@router.post("/stream")
+async def chat_stream(request: ChatRequest, tenant_id: str = Depends(chat_tenant)):
+    started = time.perf_counter()
+    _check_fits(request)
+    retrieval = _start_retrieval(request, tenant_id)
+    try:
+        with CHAT_STAGE_SECONDS.time(stage="session_load"):
+            session_id, key, history = await _session_history(request.session_id, tenant_id)
+        await _append(key, history, HumanMessage(content=request.message, id=str(uuid.uuid4())))
+    except BaseException:
+        _cancel(retrieval)
+        raise
+    # Replaced once retrieval is done; agent turns cite nothing (see `chat`).
+    citations = CitationTracker([])
+
+    async def stream_tokens(tier: Tier, model: BaseChatModel):
+        nonlocal citations
+        async with model_router.slot(tier):
+            if request.mode == "agent":
+                source = _astream_agent(request, key, history, tenant_id)
+            else:
+                with CHAT_STAGE_SECONDS.time(stage="trim"):
+                    window = _history_window(key, history)
+                with CHAT_STAGE_SECONDS.time(stage="retrieval_wait"):
+                    rag_prefix, sources = await retrieval if retrieval is not None else ([], [])
+                citations = CitationTracker(sources)
+                with CHAT_STAGE_SECONDS.time(stage="prompt_assembly"):
+                    messages = _compose_prompt(key, window, rag_prefix)
+                logger.debug("Streaming %d message(s) to %s model (trimmed from %d)", len(messages), tier, len(history))
+                source = model.astream(messages)
+            generation_started = time.perf_counter()
+            first_token = True
+            async for chunk in source:
+                if first_token and chunk.content:
+                    CHAT_STAGE_SECONDS.observe(time.perf_counter() - generation_started, stage="first_token")
+                    first_token = False
+                yield chunk
+            CHAT_STAGE_SECONDS.observe(time.perf_counter() - generation_started, stage="generation")
+
+    encoding_seconds = 0.0
+
+    def encode(event: StreamChunk) -> str:
+        nonlocal encoding_seconds
+        encode_started = time.perf_counter()
+        data = f"data: {event.model_dump_json()}\n\n"
+        encoding_seconds += time.perf_counter() - encode_started
+        return data
+
+    async def generate():
+        try:
+            if retrieval is not None:
+                yield encode(StreamChunk(
+                    session_id=session_id,
+                    content="",
+                    done=False,
+                    timestamp=datetime.now(timezone.utc),
+                    status="retrieving",
+                ))
+            collected = []
+            total_usage = {}
+            message_id = str(uuid.uuid4())
+            tier, model = _route(request)
+            async for chunk in stream_tokens(tier, model):
+                if chunk.usage_metadata:
+                    total_usage = chunk.usage_metadata
+                if request.mode == "agent" and chunk.id:
+                    message_id = chunk.id
+                elif request.mode == "chat":
+                    record_prompt_eval(settings.PROMPT_LAYOUT, chunk.response_metadata)
+                if not chunk.content:
+                    continue
+                collected.append(str(chunk.content))
+                yield encode(StreamChunk(
+                    session_id=session_id,
+                    content=str(chunk.content),
+                    done=False,
+                    timestamp=datetime.now(timezone.utc),
+                    citations=citations.feed(str(chunk.content)),
+                ))
+            await _append(key, history, AIMessage(content="".join(collected), id=message_id))
+            if request.mode == "agent":
+                agent_cursors[key] = message_id
+            _remember(key, history)
+            yield encode(StreamChunk(
+                session_id=session_id,
+                content="",
+                done=True,
+                timestamp=datetime.now(timezone.utc),
+                usage=_token_usage(total_usage, tenant_id),
+                model=model_router.model_name(tier),
+                citations=citations.citations,
+            ))
+            CHAT_STAGE_SECONDS.observe(encoding_seconds, stage="sse_encode")
+            CHAT_REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint="stream", mode=request.mode)
+        finally:
+            # The model call failed or the client went away before retrieval was awaited.
+            _cancel(retrieval)
 
     return StreamingResponse(generate(), media_type="text/event-stream")
 
 
+@router.get("/prompt-eval")
+async def get_prompt_eval_stats() -> list[PromptEvalStats]:
+    """Average Ollama prompt-eval tokens and time per turn, for each layout used since startup."""
+    return [
+        PromptEvalStats(
+            layout=layout,
+            turns=totals.turns,
+            avg_prompt_eval_tokens=totals.prompt_eval_tokens / totals.turns,
+            avg_prompt_eval_ms=totals.prompt_eval_ms / totals.turns,
+        )
+        for layout, totals in prompt_eval_totals.items()
+    ]
+
+
 @router.get("/{session_id}/messages")
-async def get_session_messages(session_id: str) -> SessionMessages:
-    if session_id not in sessions:
+async def get_session_messages(session_id: str, tenant_id: str = Depends(get_tenant_id)) -> SessionMessages:
+    history = await _restore_history(_session_key(tenant_id, session_id))
+    if history is None:
         raise HTTPException(status_code=404, detail="Session not found")
 
     messages = [
@@ -142,6 +625,6 @@ async def get_session_messages(session_id: str) -> SessionMessages:
             role="user" if isinstance(msg, HumanMessage) else "assistant",
             content=str(msg.content),
         )
-        for msg in sessions[session_id]
+        for msg in history
     ]
     return SessionMessages(session_id=session_id, messages=messages)
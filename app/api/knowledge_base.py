@@ -1,78 +1,457 @@
+import asyncio
+import hashlib
+import json
+import logging
 import os
 import uuid
 from datetime import datetime, timezone
+from typing import Literal
 
-from fastapi import APIRouter, HTTPException, UploadFile
+from fastapi import APIRouter, Body, Depends, Form, HTTPException, UploadFile
+from fastapi.responses import StreamingResponse
+from langchain_core.documents import Document
 
 from app.config import settings
+from app.maintenance import (
+    begin_ingest,
+    drop_collection,
+    end_ingest,
+    entry_ids,
+    holding_ingests,
+    journaled_ids,
+    release_ids,
+)
 from app.models import (
+    BatchQueryRequest,
+    BatchQueryResponse,
+    BatchQueryResult,
     CreateKnowledgeBaseRequest,
     DocumentUploadResponse,
     FileError,
     KnowledgeBaseQueryRequest,
     KnowledgeBaseQueryResponse,
     KnowledgeBaseResponse,
+    ReindexRequest,
+    ReindexStatus,
     RetrievedDocument,
+    StreamedDocument,
+    StreamQueryEnd,
+    StreamQueryRequest,
 )
+from app.rag.embeddings import same_model
 from app.rag.ingest import SUPPORTED_EXTENSIONS, process_document
-from app.rag.retriever import retrieve_context
-from app.rag.vector_store import get_vector_store
+from app.rag.retriever import aiter_documents, aretrieve_context, aretrieve_many, aretrieve_ranking, bump_kb_version
+from app.rag.vector_store import DEFAULT_TENANT, VectorStoreBackend, get_vector_store
+from app.rag.vector_store.filters import RESERVED_METADATA_KEYS, UPLOADED_AT_KEY, to_epoch
+from app.reindex import (
+    ReindexConflictError,
+    cancel_reindex,
+    kb_write_lock,
+    reindex_jobs,
+    start_reindex,
+    write_targets,
+)
+from app.state import create_kb_registry
+from app.telemetry import INGEST_BYTES, INGEST_CHUNKS, INGEST_SECONDS
+from app.tenants import check_rate, get_tenant_id, query_tenant, record_ingest, tenant_usage, upload_slot
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/knowledge-base", tags=["Knowledge Base"])
 
-# In-memory registry for KB metadata
-kb_registry: dict[str, dict] = {}
+# KB metadata, in this process or in the shared state database (STATE_BACKEND)
+kb_registry = create_kb_registry()
+
+
+async def _owned(kb_id: str, tenant_id: str) -> dict | None:
+    kb = await kb_registry.aget(kb_id)
+    if kb is None or kb.get("tenant_id", DEFAULT_TENANT) != tenant_id:
+        return None
+    return kb
+
+
+async def _get_kb(kb_id: str, tenant_id: str) -> dict:
+    """The tenant's knowledge base record; other tenants' knowledge bases are not found."""
+    kb = await _owned(kb_id, tenant_id)
+    if kb is None:
+        raise HTTPException(status_code=404, detail="Knowledge base not found")
+    return kb
+
+
+async def kb_collection(kb_id: str, tenant_id: str) -> str:
+    """Collection to search for a tenant's knowledge base; an unknown id names an empty one."""
+    kb = await _owned(kb_id, tenant_id)
+    return VectorStoreBackend.collection_of(kb) if kb else VectorStoreBackend.collection_for(tenant_id, kb_id)
+
+
+async def tenant_storage_bytes(tenant_id: str) -> int:
+    return sum(
+        kb.get("storage_bytes", 0)
+        for kb in await kb_registry.avalues()
+        if kb.get("tenant_id", DEFAULT_TENANT) == tenant_id
+    )
+
+
+# Storage is counted as the UTF-8 bytes of chunk text, for uploads and imports alike.
+# Bytes this worker is writing but has not registered yet, per tenant.
+_storage_reserved: dict[str, int] = {}
+_storage_lock = asyncio.Lock()
+
+
+def _text_bytes(texts) -> int:
+    return sum(len(text.encode()) for text in texts)
+
+
+async def _reserve_storage(tenant_id: str, sizes: list[int]) -> list[bool]:
+    """Reserve each size that still fits in the tenant's quota, in order; return which did.
+
+    Usage is read and the reservation made under one lock, so concurrent
+    uploads and imports in this worker cannot both take the last free bytes.
+    Callers release what they reserved with `_release_storage` only after
+    registering what they stored.
+    """
+    quota = settings.TENANT_MAX_STORAGE_BYTES
+    async with _storage_lock:
+        used = await tenant_storage_bytes(tenant_id) + _storage_reserved.get(tenant_id, 0) if quota else 0
+        fits = []
+        for size in sizes:
+            fits.append(not quota or used + size <= quota)
+            if fits[-1]:
+                used += size
+        reserved = sum(size for size, ok in zip(sizes, fits) if ok)
+        if reserved:
+            _storage_reserved[tenant_id] = _storage_reserved.get(tenant_id, 0) + reserved
+    return fits
+
+
+def _release_storage(tenant_id: str, size: int) -> None:
+    if not size:
+        return
+    _storage_reserved[tenant_id] -= size
+    if not _storage_reserved[tenant_id]:
+        del _storage_reserved[tenant_id]
+
+
+def _quota_error(quota: int) -> str:
+    return f"Storage quota of {quota} bytes exceeded for this tenant"
+
+
+def _parse_upload_metadata(raw: str | None) -> dict:
+    """Parse the optional JSON object of custom metadata attached to every uploaded chunk."""
+    if not raw:
+        return {}
+    try:
+        metadata = json.loads(raw)
+    except json.JSONDecodeError as e:
+        raise HTTPException(status_code=422, detail=f"Invalid metadata JSON: {e.msg}") from e
+    if not isinstance(metadata, dict):
+        raise HTTPException(status_code=422, detail="Metadata must be a JSON object")
+    for key, value in metadata.items():
+        if key in RESERVED_METADATA_KEYS:
+            raise HTTPException(status_code=422, detail=f"Metadata key is reserved: {key}")
+        if not isinstance(value, (str, int, float, bool)):
+            raise HTTPException(status_code=422, detail=f"Metadata value for {key!r} must be a scalar")
+    return metadata
 
 
 @router.post("", response_model=KnowledgeBaseResponse, status_code=201)
-async def create_knowledge_base(request: CreateKnowledgeBaseRequest):
+async def create_knowledge_base(request: CreateKnowledgeBaseRequest, tenant_id: str = Depends(get_tenant_id)):
     kb_id = str(uuid.uuid4())
-    kb_registry[kb_id] = {
+    try:
+        await get_vector_store().acreate_collection(
+            VectorStoreBackend.collection_for(tenant_id, kb_id),
+            request.vector_quantization,
+            settings.OLLAMA_EMBEDDING_MODEL,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e)) from e
+    await kb_registry.aset(kb_id, {
         "id": kb_id,
         "name": request.name,
         "description": request.description,
         "document_count": 0,
         "created_at": datetime.now(timezone.utc),
-    }
-    return KnowledgeBaseResponse(**kb_registry[kb_id])
+        "vector_quantization": request.vector_quantization,
+        "embedding_model": settings.OLLAMA_EMBEDDING_MODEL,
+        "tenant_id": tenant_id,
+        "storage_bytes": 0,
+    })
+    return KnowledgeBaseResponse(**await kb_registry.aget(kb_id))
 
 
 @router.get("", response_model=list[KnowledgeBaseResponse])
-async def list_knowledge_bases():
-    return [KnowledgeBaseResponse(**kb) for kb in kb_registry.values()]
+async def list_knowledge_bases(tenant_id: str = Depends(get_tenant_id)):
+    return [
+        KnowledgeBaseResponse(**kb)
+        for kb in await kb_registry.avalues()
+        if kb.get("tenant_id", DEFAULT_TENANT) == tenant_id
+    ]
+
+
+@router.post("/query", response_model=BatchQueryResponse)
+async def batch_query_knowledge_bases(request: BatchQueryRequest, tenant_id: str = Depends(get_tenant_id)):
+    if len(request.items) > settings.BATCH_QUERY_MAX_ITEMS:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Too many items: {len(request.items)} (max {settings.BATCH_QUERY_MAX_ITEMS})",
+        )
+    check_rate(tenant_id, "query", cost=len(request.items))
+    tenant_usage[tenant_id].queries += len(request.items)
+
+    owned = [await _owned(item.kb_id, tenant_id) for item in request.items]
+    outcomes = iter(await aretrieve_many([
+        item.model_copy(update={"kb_id": VectorStoreBackend.collection_of(kb)})
+        for item, kb in zip(request.items, owned) if kb is not None
+    ]))
+
+    results = []
+    for item, ok in zip(request.items, (kb is not None for kb in owned)):
+        result = BatchQueryResult(kb_id=item.kb_id, query=item.query, results=[])
+        outcome = next(outcomes) if ok else None
+        if outcome is None:
+            result.error = "Knowledge base not found"
+        elif isinstance(outcome, Exception):
+            result.error = str(outcome) or type(outcome).__name__
+        else:
+            result.results = [
+                RetrievedDocument(content=content, metadata=metadata, score=score, id=chunk_id)
+                for content, metadata, score, chunk_id in outcome
+            ]
+        results.append(result)
+    return BatchQueryResponse(results=results)
 
 
 @router.get("/{kb_id}", response_model=KnowledgeBaseResponse)
-async def get_knowledge_base(kb_id: str):
-    if kb_id not in kb_registry:
-        raise HTTPException(status_code=404, detail="Knowledge base not found")
-    return KnowledgeBaseResponse(**kb_registry[kb_id])
+async def get_knowledge_base(kb_id: str, tenant_id: str = Depends(get_tenant_id)):
+    return KnowledgeBaseResponse(**await _get_kb(kb_id, tenant_id))
 
 
 @router.delete("/{kb_id}", status_code=204)
-async def delete_knowledge_base(kb_id: str):
-    if kb_id not in kb_registry:
-        raise HTTPException(status_code=404, detail="Knowledge base not found")
+async def delete_knowledge_base(kb_id: str, tenant_id: str = Depends(get_tenant_id)):
+    await _get_kb(kb_id, tenant_id)
+    await cancel_reindex(kb_registry, kb_id)
+    reindex_jobs.pop(kb_id, None)
+    # Read again: a reindex that finished meanwhile has moved the knowledge base to a new collection.
+    await drop_collection(VectorStoreBackend.collection_of(await _get_kb(kb_id, tenant_id)))
+    await kb_registry.adelete(kb_id)
+
+
+@router.post("/{kb_id}/reindex", response_model=ReindexStatus, status_code=202)
+async def reindex_knowledge_base(
+    kb_id: str, request: ReindexRequest = Body(default_factory=ReindexRequest), tenant_id: str = Depends(get_tenant_id)
+):
+    """Re-embed the knowledge base's chunks with another model in the background (see app.reindex)."""
+    await _get_kb(kb_id, tenant_id)
+    try:
+        return await start_reindex(kb_registry, kb_id, request.embedding_model or settings.OLLAMA_EMBEDDING_MODEL)
+    except ReindexConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e)) from e
+
+
+@router.get("/{kb_id}/reindex", response_model=ReindexStatus)
+async def get_reindex_status(kb_id: str, tenant_id: str = Depends(get_tenant_id)):
+    await _get_kb(kb_id, tenant_id)
+    status = reindex_jobs.get(kb_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="No reindex was started for this knowledge base by this worker")
+    return status
+
+
+@router.delete("/{kb_id}/reindex", status_code=204)
+async def cancel_knowledge_base_reindex(kb_id: str, tenant_id: str = Depends(get_tenant_id)):
+    await _get_kb(kb_id, tenant_id)
+    if not await cancel_reindex(kb_registry, kb_id):
+        raise HTTPException(status_code=404, detail="Knowledge base is not being reindexed")
+
+
+@router.get("/{kb_id}/export")
+async def export_knowledge_base(
+    kb_id: str, vectors: Literal["float32", "int8"] = "float32", tenant_id: str = Depends(get_tenant_id)
+):
+    # Imported on first use, to keep NumPy out of app startup.
+    from app.rag import snapshot
+
+    kb = await _get_kb(kb_id, tenant_id)
+    knowledge_base = {
+        "name": kb["name"],
+        "description": kb["description"],
+        "vector_quantization": kb.get("vector_quantization", "none"),
+        "document_count": kb["document_count"],
+        "storage_bytes": kb.get("storage_bytes", 0),
+    }
+    archive = snapshot.write_archive(
+        get_vector_store(),
+        VectorStoreBackend.collection_of(kb),
+        knowledge_base,
+        kb.get("embedding_model") or settings.OLLAMA_EMBEDDING_MODEL,
+        vectors,
+    )
+    # A sync iterator: Starlette reads it in the thread pool, one batch at a time.
+    return StreamingResponse(
+        archive, media_type="application/x-tar", headers={"Content-Disposition": f'attachment; filename="{kb_id}.tar"'}
+    )
+
+
+@router.post("/import", response_model=KnowledgeBaseResponse, status_code=201)
+async def import_knowledge_base(
+    archive: UploadFile, name: str | None = Form(default=None), tenant_id: str = Depends(get_tenant_id)
+):
+    with upload_slot(tenant_id):
+        return await _import_archive(archive, name, tenant_id)
+
+
+async def _import_archive(archive: UploadFile, name: str | None, tenant_id: str) -> KnowledgeBaseResponse:
+    """Create a knowledge base from a snapshot, storing its embeddings as they are.
+
+    The knowledge base is registered only once every document is stored; if
+    loading fails, its collection is deleted again.
+    """
+    from app.rag import snapshot
+
+    batches = snapshot.read_archive(archive.file)
+    try:
+        manifest = await asyncio.to_thread(next, batches)
+    except snapshot.SnapshotError as e:
+        raise HTTPException(status_code=422, detail=str(e)) from e
+    model = manifest["embedding_model"]
+    if not same_model(model, settings.OLLAMA_EMBEDDING_MODEL):
+        raise HTTPException(
+            status_code=409,
+            detail=f"Archive was embedded with {model}, but this server embeds with {settings.OLLAMA_EMBEDDING_MODEL}",
+        )
+    source = manifest["knowledge_base"]
+
+    kb_id = str(uuid.uuid4())
+    collection = VectorStoreBackend.collection_for(tenant_id, kb_id)
+    backend = get_vector_store()
+    quantization = source.get("vector_quantization", "none")
+    count = 0
+    size = 0
     try:
-        get_vector_store().delete_collection(kb_id)
-    except Exception:
-        pass  # Collection may not exist yet if no documents were uploaded
-    del kb_registry[kb_id]
+        try:
+            await backend.acreate_collection(collection, quantization, settings.OLLAMA_EMBEDDING_MODEL)
+            while (rows := await asyncio.to_thread(next, batches, None)) is not None:
+                # Counted from the rows themselves: the archive's manifest is the client's to write.
+                batch_size = _text_bytes(rows.texts)
+                if not (await _reserve_storage(tenant_id, [batch_size]))[0]:
+                    raise HTTPException(status_code=413, detail=_quota_error(settings.TENANT_MAX_STORAGE_BYTES))
+                size += batch_size
+                await backend.aadd_rows(collection, rows)
+                count += len(rows.ids)
+        except Exception as e:
+            await drop_collection(collection)
+            if isinstance(e, ValueError):
+                raise HTTPException(status_code=422, detail=str(e)) from e
+            raise
+
+        await kb_registry.aset(kb_id, {
+            "id": kb_id,
+            "name": name or source["name"],
+            "description": source.get("description", ""),
+            "document_count": count,
+            "created_at": datetime.now(timezone.utc),
+            "vector_quantization": quantization,
+            "embedding_model": settings.OLLAMA_EMBEDDING_MODEL,
+            "tenant_id": tenant_id,
+            "storage_bytes": size,
+        })
+    finally:
+        _release_storage(tenant_id, size)
+    INGEST_CHUNKS.inc(count)
+    record_ingest(tenant_id, size, count)
+    return KnowledgeBaseResponse(**await kb_registry.aget(kb_id))
 
 
 @router.post(
     "/{kb_id}/documents",
     response_model=DocumentUploadResponse,
 )
-async def upload_documents(kb_id: str, files: list[UploadFile]):
-    if kb_id not in kb_registry:
-        raise HTTPException(status_code=404, detail="Knowledge base not found")
+async def upload_documents(
+    kb_id: str,
+    files: list[UploadFile],
+    metadata: str | None = Form(default=None),
+    tenant_id: str = Depends(get_tenant_id),
+):
+    await _get_kb(kb_id, tenant_id)
+    with upload_slot(tenant_id):
+        return await _ingest_files(kb_id, tenant_id, files, metadata)
+
+
+def _assign_chunk_ids(chunks: list[Document], filename: str, content: bytes, metadata: dict) -> None:
+    """Give chunks ids derived from the file, so uploading it again names the same chunks."""
+    digest = hashlib.sha256(content)
+    digest.update(json.dumps([filename, metadata], sort_keys=True).encode())
+    source = digest.hexdigest()
+    for index, chunk in enumerate(chunks):
+        chunk.id = str(uuid.uuid5(uuid.NAMESPACE_OID, f"{source}:{index}:{chunk.page_content}"))
+
+
+async def _commit_chunks(
+    backend: VectorStoreBackend, kb_id: str, tenant_id: str, chunks: list[Document]
+) -> set[str]:
+    """Store an upload's chunks as one batch, all or none; return the ids written.
+
+    Chunks already stored are skipped, unless a journal entry still lists them
+    as uncommitted. The ids of the rest are journaled before the first write,
+    and written in groups of INGEST_BATCH_CHUNKS. If a write fails, the chunks
+    this attempt wrote are deleted again, except those stored before it or
+    committed meanwhile by an upload of the same files on another worker
+    (which drops them from this attempt's journal entry). If deleting fails
+    too, the journal entry stays and maintenance deletes them later. While the
+    knowledge base is being reindexed, the batch goes to its shadow collection
+    as well. Maintenance leaves the journal entries alone until the commit
+    ends, however long it takes.
+
+    Commits to the same knowledge base are serialized (across workers with
+    shared state), so a retry that overlaps the original waits for it and
+    then skips its chunks.
+    """
+    async with kb_write_lock(kb_id):
+        targets = write_targets(await _get_kb(kb_id, tenant_id))
+        pending = {chunk.id: chunk for chunk in chunks}
+        stored = await backend.aexisting_ids(targets[0], list(pending)) - journaled_ids(targets[0])
+        batch = [chunk for chunk_id, chunk in pending.items() if chunk_id not in stored]
+        if not batch:
+            return set()
+        ids = [chunk.id for chunk in batch]
+        before = {collection: await backend.aexisting_ids(collection, ids) for collection in targets}
+        written: dict[str, set[str]] = {collection: set() for collection in targets}
+        entries = [begin_ingest(collection, ids) for collection in targets]
+        with holding_ingests(entries):
+            try:
+                for collection in targets:
+                    for start in range(0, len(batch), settings.INGEST_BATCH_CHUNKS):
+                        group = batch[start:start + settings.INGEST_BATCH_CHUNKS]
+                        # Counted before the write: a failed write may still have stored part of the group.
+                        written[collection].update(chunk.id for chunk in group)
+                        await backend.aadd(collection, group)
+            except Exception:
+                try:
+                    for entry, collection in zip(entries, targets):
+                        ours = (written[collection] & entry_ids(entry)) - before[collection]
+                        if ours:
+                            await backend.adelete_documents(collection, sorted(ours))
+                except Exception:
+                    logger.warning("Could not roll back a failed upload to %s", kb_id, exc_info=True)
+                else:
+                    for entry in entries:
+                        end_ingest(entry)
+                raise
+            for entry, collection in zip(entries, targets):
+                end_ingest(entry)
+                release_ids(collection, set(ids))
+        return set(ids)
+
+
+async def _ingest_files(kb_id: str, tenant_id: str, files: list[UploadFile], metadata: str | None):
+    custom_metadata = _parse_upload_metadata(metadata)
+    extra_metadata = {**custom_metadata, UPLOADED_AT_KEY: to_epoch(datetime.now(timezone.utc))}
 
     os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
     backend = get_vector_store()
-    store = backend.get_store(kb_id)
 
-    processed = 0
+    # Every file is parsed before anything is written: (filename, bytes, chunks)
+    staged: list[tuple[str, int, list[Document]]] = []
     errors: list[FileError] = []
 
     for file in files:
@@ -93,34 +472,143 @@ async def upload_documents(kb_id: str, files: list[UploadFile]):
             with open(file_path, "wb") as f:
                 f.write(content)
 
-            chunks = await process_document(file_path, filename)
-            store.add_documents(chunks)
-            processed += len(chunks)
+            with INGEST_SECONDS.time(stage="parse"):
+                chunks = await process_document(file_path, filename, extra_metadata)
+            _assign_chunk_ids(chunks, filename, content, custom_metadata)
+            staged.append((filename, len(content), chunks))
         except Exception as e:
             errors.append(FileError(filename=filename, error=str(e)))
         finally:
             if os.path.exists(file_path):
                 os.remove(file_path)
 
-    kb_registry[kb_id]["document_count"] += processed
+    # Files are held to the quota once their chunks, and so their stored size, are known.
+    sizes = [_text_bytes(chunk.page_content for chunk in chunks) for _, _, chunks in staged]
+    fits = await _reserve_storage(tenant_id, sizes)
+    errors.extend(
+        FileError(filename=filename, error=_quota_error(settings.TENANT_MAX_STORAGE_BYTES))
+        for (filename, _, _), ok in zip(staged, fits) if not ok
+    )
+    staged = [file for file, ok in zip(staged, fits) if ok]
+    reserved = sum(size for size, ok in zip(sizes, fits) if ok)
+
+    processed = 0
+    skipped = 0
+    try:
+        written: set[str] = set()
+        if staged:
+            try:
+                with INGEST_SECONDS.time(stage="embed_store"):
+                    written = await _commit_chunks(
+                        backend, kb_id, tenant_id, [c for _, _, chunks in staged for c in chunks]
+                    )
+            except Exception as e:
+                errors.extend(FileError(filename=filename, error=str(e)) for filename, _, _ in staged)
+                staged = []
+
+        stored = 0
+        for _, size, chunks in staged:
+            new = [chunk for chunk in chunks if chunk.id in written]
+            processed += len(new)
+            skipped += len(chunks) - len(new)
+            if new:
+                stored += _text_bytes(chunk.page_content for chunk in new)
+                INGEST_BYTES.inc(size)
+                INGEST_CHUNKS.inc(len(new))
+
+        if processed:
+            await bump_kb_version(await kb_collection(kb_id, tenant_id))
+            await kb_registry.aadd_documents(kb_id, processed, stored)
+            record_ingest(tenant_id, stored, processed)
+    finally:
+        _release_storage(tenant_id, reserved)
 
     return DocumentUploadResponse(
         message=f"Processed {processed} document chunks",
         documents_processed=processed,
+        duplicates_skipped=skipped,
         errors=errors,
     )
 
 
 @router.post("/{kb_id}/query", response_model=KnowledgeBaseQueryResponse)
-async def query_knowledge_base(kb_id: str, request: KnowledgeBaseQueryRequest):
-    if kb_id not in kb_registry:
-        raise HTTPException(status_code=404, detail="Knowledge base not found")
+async def query_knowledge_base(
+    kb_id: str, request: KnowledgeBaseQueryRequest, tenant_id: str = Depends(query_tenant)
+):
+    kb = await _get_kb(kb_id, tenant_id)
 
-    results = retrieve_context(kb_id, request.query, request.top_k)
+    results = await aretrieve_context(
+        VectorStoreBackend.collection_of(kb), request.query, request.top_k, request.filter
+    )
     return KnowledgeBaseQueryResponse(
         results=[
-            RetrievedDocument(content=content, metadata=metadata, score=score)
-            for content, metadata, score in results
+            RetrievedDocument(content=content, metadata=metadata, score=score, id=chunk_id)
+            for content, metadata, score, chunk_id in results
         ],
         query=request.query,
     )
+
+
+@router.post("/{kb_id}/query/stream")
+async def stream_query_knowledge_base(
+    kb_id: str,
+    request: StreamQueryRequest,
+    format: Literal["ndjson", "sse"] = "ndjson",
+    tenant_id: str = Depends(query_tenant),
+):
+    """Send a page of a large ranking one result per line, reading documents in batches.
+
+    Each line is a StreamedDocument; a StreamQueryEnd line, with the offset of
+    the next page, closes the stream. With `format=sse` lines are sent as
+    server-sent events instead of NDJSON.
+    """
+    kb = await _get_kb(kb_id, tenant_id)
+    k = request.top_k or settings.RAG_TOP_K
+    if request.offset < 0 or k < 1 or (request.max_content_chars or 0) < 0:
+        raise HTTPException(status_code=422, detail="offset and max_content_chars must be >= 0, top_k >= 1")
+    if request.offset + k > settings.QUERY_STREAM_MAX_RESULTS:
+        raise HTTPException(
+            status_code=422,
+            detail=f"offset + top_k is {request.offset + k} (max {settings.QUERY_STREAM_MAX_RESULTS})",
+        )
+    collection = VectorStoreBackend.collection_of(kb)
+    # One result past the page tells whether there is a next one.
+    ranking = await aretrieve_ranking(collection, request.query, request.offset + k + 1, request.filter)
+    page = ranking[request.offset:request.offset + k]
+    more = len(ranking) > request.offset + k
+    ranks = {chunk_id: rank for rank, (chunk_id, _) in enumerate(page, request.offset + 1)}
+
+    def encode(event: StreamedDocument | StreamQueryEnd) -> str:
+        line = event.model_dump_json()
+        return f"data: {line}\n\n" if format == "sse" else f"{line}\n"
+
+    def streamed(document: Document, score: float) -> StreamedDocument:
+        content, truncated = document.page_content, False
+        if not request.include_content:
+            content = None
+        elif request.max_content_chars is not None and len(content) > request.max_content_chars:
+            content, truncated = content[:request.max_content_chars], True
+        return StreamedDocument(
+            id=document.id,
+            rank=ranks[document.id],
+            content=content,
+            content_truncated=truncated,
+            metadata=document.metadata,
+            score=score,
+        )
+
+    async def generate():
+        returned = 0
+        try:
+            async for batch in aiter_documents(collection, page, settings.QUERY_STREAM_BATCH_ROWS):
+                returned += len(batch)
+                # One write per batch: a write per line costs more than encoding it.
+                yield "".join(encode(streamed(document, score)) for document, score in batch)
+        except Exception as e:
+            logger.exception("Streaming query results of %s failed", kb_id)
+            yield encode(StreamQueryEnd(returned=returned, next_offset=None, error=str(e) or type(e).__name__))
+            return
+        yield encode(StreamQueryEnd(returned=returned, next_offset=request.offset + k if more else None))
+
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return StreamingResponse(generate(), media_type=media_type)
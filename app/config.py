@@ -1,3 +1,5 @@
+from typing import Literal
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -8,12 +10,50 @@ class Settings(BaseSettings):
     DEBUG: bool = False
     MAX_TOKENS: int = 1024
 
+    # Conversation memory: "trim" drops turns outside MAX_TOKENS, "summary"
+    # also folds them into a running summary in the background.
+    MEMORY_MODE: Literal["trim", "summary"] = "trim"
+    SUMMARY_MAX_TOKENS: int = 256
+
+    # Prompt layout: "classic" puts retrieved context first; "stable_prefix"
+    # keeps history first and trims it in blocks so the model server can
+    # reuse its cached prompt prefix across turns.
+    PROMPT_LAYOUT: Literal["classic", "stable_prefix"] = "classic"
+    PROMPT_TRIM_BLOCK_TOKENS: int = 512
+
+    # Model routing: with OLLAMA_SMALL_MODEL set, short turns without
+    # knowledge bases go to the small model unless its queue is backed up.
+    OLLAMA_SMALL_MODEL: str | None = None
+    ROUTER_SMALL_MAX_CHARS: int = 160
+    ROUTER_SMALL_MAX_QUEUE: int = 8
+    ROUTER_LARGE_MAX_QUEUE: int = 4
+
     # Embedding
     OLLAMA_EMBEDDING_MODEL: str = "nomic-embed-text"
 
+    # Ollama client: shared connection pool, per-model keep-alive (negative
+    # keeps a model loaded indefinitely) and startup warm-up.
+    OLLAMA_BASE_URL: str | None = None
+    OLLAMA_MAX_CONNECTIONS: int = 32
+    OLLAMA_MAX_KEEPALIVE_CONNECTIONS: int = 16
+    OLLAMA_KEEPALIVE_EXPIRY_SECONDS: float = 60.0
+    OLLAMA_KEEP_ALIVE_SECONDS: int = 1800
+    OLLAMA_EMBEDDING_KEEP_ALIVE_SECONDS: int = 1800
+    OLLAMA_WARMUP: bool = True
+    OLLAMA_WARMUP_RETRY_SECONDS: float = 5.0
+
     # Vector store
     VECTOR_STORE_BACKEND: str = "chroma"
     CHROMA_PERSIST_DIR: str = "./chroma_data"
+    LOCAL_VECTOR_DIR: str = "./vector_data"
+    LOCAL_ANN_THRESHOLD: int = 20000
+    LOCAL_ANN_EF: int = 64
+
+    # Vector quantization (local backend)
+    VECTOR_RESCORE_FACTOR: int = 8
+    VECTOR_PQ_SUBVECTOR_DIM: int = 8
+    VECTOR_PQ_TRAIN_MIN: int = 4096
+    VECTOR_PQ_TRAIN_SAMPLE: int = 10000
 
     # Chunking
     CHUNK_SIZE: int = 1000
@@ -21,9 +61,71 @@ class Settings(BaseSettings):
 
     # Retrieval
     RAG_TOP_K: int = 4
+    BATCH_QUERY_MAX_ITEMS: int = 100
+    BATCH_QUERY_CONCURRENCY: int = 16
+    # Search results cached per worker, keyed by knowledge base version (0 bytes disables).
+    RETRIEVAL_CACHE_MAX_BYTES: int = 32 * 1024 * 1024
+    RETRIEVAL_CACHE_TTL_SECONDS: float = 300.0
+    # Streamed queries: documents read per batch, and how deep into the ranking a page may reach.
+    QUERY_STREAM_BATCH_ROWS: int = 64
+    QUERY_STREAM_MAX_RESULTS: int = 10000
+
+    # Agent
+    AGENT_MAX_STEPS: int = 6
+    AGENT_TIMEOUT_SECONDS: float = 60.0
+    AGENT_CHECKPOINT_PATH: str = "./agent_state.db"
+    AGENT_SNAPSHOT_EVERY: int = 50
+    AGENT_CHECKPOINT_COMPACT_EVERY: int = 100
+    AGENT_SNAPSHOT_CACHE_SIZE: int = 128
+
+    # Profiling: requests with an X-Profile header (when enabled) or a random
+    # sample are profiled; artifacts are listed under /admin/profiles.
+    PROFILE_DIR: str = "./profiles"
+    PROFILE_HEADER_ENABLED: bool = False
+    PROFILE_SAMPLE_RATE: float = 0.0
+    PROFILE_SAMPLED_MODE: Literal["sampling", "trace"] = "trace"
+    PROFILE_INTERVAL_SECONDS: float = 0.001
+    PROFILE_KEEP: int = 50
+
+    # Admin endpoints require X-Admin-Token, and answer 403 while this is unset.
+    # X-Profile needs it too when it is set.
+    ADMIN_TOKEN: str | None = None
+
+    # Maintenance (see app.maintenance): runs every MAINTENANCE_INTERVAL_SECONDS
+    # (0 = only on POST /admin/maintenance), busy at most MAINTENANCE_BUSY_FRACTION
+    # of the time. Upload temp files and ingest journal entries older than
+    # MAINTENANCE_GRACE_SECONDS are abandoned; collections with at least
+    # MAINTENANCE_COMPACT_MIN_DEAD_FRACTION of their rows deleted are compacted.
+    MAINTENANCE_INTERVAL_SECONDS: float = 3600.0
+    MAINTENANCE_BUSY_FRACTION: float = 0.25
+    MAINTENANCE_GRACE_SECONDS: float = 3600.0
+    MAINTENANCE_COMPACT_MIN_DEAD_FRACTION: float = 0.2
+
+    # Reindexing (see app.reindex): jobs re-embed up to REINDEX_BATCH_ROWS
+    # chunks per step, busy at most REINDEX_BUSY_FRACTION of the time.
+    REINDEX_BATCH_ROWS: int = 256
+    REINDEX_BUSY_FRACTION: float = 0.5
+
+    # Tenants (X-Tenant-Id header), per tenant and per worker. TENANT_IDS lists
+    # the tenants accepted (empty accepts any well-formed id). Rates are
+    # requests per second (0 = unlimited); quotas of 0 are unlimited.
+    TENANT_IDS: list[str] = []
+    TENANT_CHAT_RATE: float = 0.0
+    TENANT_CHAT_BURST: int = 20
+    TENANT_QUERY_RATE: float = 0.0
+    TENANT_QUERY_BURST: int = 50
+    TENANT_MAX_CONCURRENT_UPLOADS: int = 0
+    TENANT_MAX_STORAGE_BYTES: int = 0
+
+    # Shared state: "sqlite" keeps chat sessions and the knowledge base registry
+    # in STATE_DB_PATH, so several workers can serve the same sessions.
+    STATE_BACKEND: Literal["memory", "sqlite"] = "memory"
+    STATE_DB_PATH: str = "./shared_state.db"
 
-    # File uploads
+    # File uploads: an upload's chunks are committed together, in writes of up
+    # to INGEST_BATCH_CHUNKS chunks (each embedded in one request).
     UPLOAD_DIR: str = "./uploads"
+    INGEST_BATCH_CHUNKS: int = 512
 
 
 settings = Settings()
@@ -0,0 +1,141 @@
+"""Ollama clients: shared connection pool, keep-alive and startup warm-up.
+
+Every chat and embedding client is built on the same pair of httpx
+transports, so calls reuse pooled keep-alive connections to the Ollama
+server instead of each client opening its own. Each model is created with its
+own `keep_alive`, which Ollama applies on every request, so a model stays
+loaded between requests.
+
+`warm_up` loads the models once at startup. It retries until Ollama
+answers, and `readiness` reports which models are warm.
+
+`ModelRouter` spreads chat turns over model tiers: a small model for cheap
+turns when `OLLAMA_SMALL_MODEL` is set, and `OLLAMA_MODEL` for the rest.
+"""
+
+import asyncio
+import logging
+from collections.abc import AsyncIterator, Callable
+from contextlib import asynccontextmanager
+from typing import Literal
+
+import httpx
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import HumanMessage
+
+from app.config import settings
+from app.models import ChatRequest
+
+logger = logging.getLogger(__name__)
+
+_limits = httpx.Limits(
+    max_connections=settings.OLLAMA_MAX_CONNECTIONS,
+    max_keepalive_connections=settings.OLLAMA_MAX_KEEPALIVE_CONNECTIONS,
+    keepalive_expiry=settings.OLLAMA_KEEPALIVE_EXPIRY_SECONDS,
+)
+_sync_transport = httpx.HTTPTransport(limits=_limits)
+_async_transport = httpx.AsyncHTTPTransport(limits=_limits)
+
+# Model kind -> whether it has answered a warm-up request.
+readiness: dict[str, bool] = {"chat": False, "embeddings": False}
+if settings.OLLAMA_SMALL_MODEL:
+    readiness["chat_small"] = False
+
+Tier = Literal["small", "large"]
+
+
+def pooled_client_kwargs() -> dict:
+    """Client arguments that put an Ollama client on the shared connection pool."""
+    return {
+        "base_url": settings.OLLAMA_BASE_URL,
+        "sync_client_kwargs": {"transport": _sync_transport},
+        "async_client_kwargs": {"transport": _async_transport},
+    }
+
+
+def create_chat_model(model: str | None = None) -> BaseChatModel:
+    # Imported here so that importing the app does not load langchain_ollama.
+    from langchain_ollama import ChatOllama
+
+    return ChatOllama(
+        model=model or settings.OLLAMA_MODEL,
+        keep_alive=settings.OLLAMA_KEEP_ALIVE_SECONDS,
+        **pooled_client_kwargs(),
+    )
+
+
+class ModelRouter:
+    """Pick a model tier per chat turn from request features and per-tier queue depth.
+
+    Agent turns and turns with knowledge bases always go to the large tier.
+    Other turns go to the small tier when `classifier` says so, or, without a
+    classifier verdict, when the message is at most `ROUTER_SMALL_MAX_CHARS`
+    long. A tier whose in-flight count has reached its `ROUTER_*_MAX_QUEUE`
+    hands the turn to the other tier if that one is less busy; turns that
+    need the large tier are never moved down.
+
+    `classifier` returns "small", "large" or None (no opinion) for a request.
+    """
+
+    def __init__(self, classifier: Callable[[ChatRequest], Tier | None] | None = None) -> None:
+        self.classifier = classifier
+        self.in_flight: dict[Tier, int] = {"small": 0, "large": 0}
+
+    @staticmethod
+    def model_name(tier: Tier) -> str:
+        return settings.OLLAMA_SMALL_MODEL if tier == "small" and settings.OLLAMA_SMALL_MODEL else settings.OLLAMA_MODEL
+
+    def select(self, request: ChatRequest, small_available: bool) -> Tier:
+        if not small_available or request.mode == "agent" or request.knowledge_base_ids:
+            return "large"
+        verdict = self.classifier(request) if self.classifier is not None else None
+        tier: Tier = verdict or ("small" if len(request.message) <= settings.ROUTER_SMALL_MAX_CHARS else "large")
+        other: Tier = "large" if tier == "small" else "small"
+        limit = settings.ROUTER_SMALL_MAX_QUEUE if tier == "small" else settings.ROUTER_LARGE_MAX_QUEUE
+        if self.in_flight[tier] >= limit and self.in_flight[other] < self.in_flight[tier]:
+            return other
+        return tier
+
+    @asynccontextmanager
+    async def slot(self, tier: Tier) -> AsyncIterator[None]:
+        """Count a call as in flight on `tier` for as long as the block runs."""
+        self.in_flight[tier] += 1
+        try:
+            yield
+        finally:
+            self.in_flight[tier] -= 1
+
+
+async def _warm(kind: str, call) -> None:
+    while True:
+        try:
+            await call()
+        except Exception as exc:
+            logger.warning("Warm-up of the %s model failed (%s); retrying", kind, exc)
+            await asyncio.sleep(settings.OLLAMA_WARMUP_RETRY_SECONDS)
+            continue
+        readiness[kind] = True
+        logger.info("Warm-up of the %s model done", kind)
+        return
+
+
+def _warm_chat(kind: str, chat_model: BaseChatModel):
+    return _warm(kind, lambda: chat_model.ainvoke([HumanMessage(content="hi")], options={"num_predict": 1}))
+
+
+async def warm_up(
+    chat_model: BaseChatModel,
+    embeddings: Embeddings,
+    small_chat_model: BaseChatModel | None = None,
+) -> None:
+    """Load the chat and embedding models into Ollama, concurrently, retrying until all answer."""
+    warming = [_warm_chat("chat", chat_model), _warm("embeddings", lambda: embeddings.aembed_query("warm-up"))]
+    if small_chat_model is not None:
+        warming.append(_warm_chat("chat_small", small_chat_model))
+    await asyncio.gather(*warming)
+
+
+async def close_pool() -> None:
+    await _async_transport.aclose()
+    _sync_transport.close()
@@ -1,12 +1,71 @@
+import asyncio
+import contextlib
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse
 
+from app.api import chat
+from app.api.admin import router as admin_router
 from app.api.chat import router as chat_router
-from app.api.knowledge_base import router as kb_router
+from app.api.knowledge_base import kb_registry, router as kb_router
+from app.config import settings
+from app.llm import close_pool, readiness, warm_up
+from app.maintenance import maintenance_loop
+from app.profiling import ProfilingMiddleware
+from app.reindex import stop_reindex_jobs
+from app.models import ReadinessStatus
+from app.rag.embeddings import get_embeddings
+from app.telemetry import render_metrics
+
+
+async def _warm_up() -> None:
+    # The clients are created here, not at startup, so their imports don't delay it.
+    chat_model, small_chat_model = chat.chat_models()
+    await warm_up(chat_model, get_embeddings(), small_chat_model)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warming = None
+    if settings.OLLAMA_WARMUP:
+        # Warm up in the background so the server can answer /ready meanwhile.
+        warming = asyncio.create_task(_warm_up())
+    else:
+        readiness.update(dict.fromkeys(readiness, True))
+    maintenance = None
+    if settings.MAINTENANCE_INTERVAL_SECONDS > 0:
+        maintenance = asyncio.create_task(maintenance_loop(kb_registry))
+    yield
+    for task in (warming, maintenance):
+        if task is not None:
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+    await stop_reindex_jobs(kb_registry)
+    await close_pool()
 
-app = FastAPI()
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(ProfilingMiddleware)
 app.include_router(chat_router)
 app.include_router(kb_router)
+app.include_router(admin_router)
+
+
+@app.get("/ready", responses={503: {"model": ReadinessStatus}})
+async def ready() -> ReadinessStatus:
+    """Ready once the chat and embedding models have been loaded into Ollama."""
+    status = ReadinessStatus(ready=all(readiness.values()), models=dict(readiness))
+    if not status.ready:
+        return JSONResponse(status_code=503, content=status.model_dump())
+    return status
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Request, stage, token, in-flight and ingest metrics in the Prometheus text format."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
 
 
 @app.get("/", response_class=HTMLResponse)
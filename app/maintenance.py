@@ -0,0 +1,388 @@
+"""Background maintenance of knowledge base storage."""
+
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import statistics
+import time
+import uuid
+from collections import deque
+from collections.abc import Callable
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+from app.config import settings
+from app.models import CompactionResult, MaintenanceReport
+from app.rag.retriever import bump_kb_version
+from app.rag.vector_store import CollectionNotFoundError, VectorStoreBackend, get_vector_store
+from app.state import Registry, shared_state
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows: passes are only serialized within the worker
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Collections whose delete failed in this worker; the next pass retries them.
+pending_collection_deletes: set[str] = set()
+recent_reports: deque[MaintenanceReport] = deque(maxlen=20)
+_running = asyncio.Lock()
+
+
+# --- Ingest journal ---
+
+
+def _journal_dir() -> Path:
+    return Path(settings.UPLOAD_DIR) / ".ingest"
+
+
+def _write_entry(entry: Path, collection: str, ids: list[str]) -> None:
+    # Written aside and renamed, so readers never see half an entry.
+    staged = entry.with_suffix(".tmp")
+    staged.write_text(json.dumps({"collection": collection, "ids": ids}))
+    os.replace(staged, entry)
+
+
+def _journal_entries(collection: str) -> list[tuple[Path, list[str]]]:
+    directory = _journal_dir()
+    if not directory.exists():
+        return []
+    entries = []
+    for entry in sorted(directory.glob("*.json")):
+        try:
+            record = json.loads(entry.read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            continue
+        if record["collection"] == collection:
+            entries.append((entry, record["ids"]))
+    return entries
+
+
+def begin_ingest(collection: str, ids: list[str]) -> Path:
+    """Record the chunk ids an upload is about to write; returns the entry for `end_ingest`."""
+    directory = _journal_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    entry = directory / f"{uuid.uuid4()}.json"
+    _write_entry(entry, collection, ids)
+    return entry
+
+
+@contextmanager
+def holding_ingests(entries: list[Path]):
+    """Mark the entries' uploads as still writing until the block exits.
+
+    Maintenance skips a held entry however old it is, so a slow commit never
+    loses its chunks. Without flock, the entry's age is all it goes by.
+    """
+    if fcntl is None:
+        yield
+        return
+    locks = [entry.with_suffix(".lock") for entry in entries]
+    try:
+        with contextlib.ExitStack() as stack:
+            for lock in locks:
+                fcntl.flock(stack.enter_context(open(lock, "a")), fcntl.LOCK_EX)
+            yield
+    finally:
+        for lock in locks:
+            lock.unlink(missing_ok=True)
+
+
+def end_ingest(entry: Path) -> None:
+    """Clear a journal entry once its chunks are stored or rolled back."""
+    entry.unlink(missing_ok=True)
+    entry.with_suffix(".lock").unlink(missing_ok=True)
+
+
+def entry_ids(entry: Path) -> set[str]:
+    """Chunk ids a journal entry still lists: those no later upload has committed."""
+    try:
+        return set(json.loads(entry.read_text())["ids"])
+    except FileNotFoundError:
+        return set()
+
+
+def journaled_ids(collection: str) -> set[str]:
+    """Chunk ids of the collection that journal entries still list as uncommitted."""
+    return {chunk_id for _, ids in _journal_entries(collection) for chunk_id in ids}
+
+
+def release_ids(collection: str, committed: set[str]) -> None:
+    """Drop ids a later upload committed from older entries, so maintenance keeps those chunks."""
+    for entry, ids in _journal_entries(collection):
+        remaining = [chunk_id for chunk_id in ids if chunk_id not in committed]
+        if not remaining:
+            end_ingest(entry)
+        elif len(remaining) < len(ids):
+            # Keep the entry's age: it still expires when the failed upload's did.
+            with contextlib.suppress(FileNotFoundError):
+                stat = entry.stat()
+                _write_entry(entry, collection, remaining)
+                os.utime(entry, (stat.st_atime, stat.st_mtime))
+
+
+async def drop_collection(collection: str) -> None:
+    """Delete a collection that no knowledge base uses any more; on failure, leave it to the next pass."""
+    try:
+        await get_vector_store().adelete_collection(collection)
+    except CollectionNotFoundError:
+        pass  # No documents were uploaded
+    except Exception:
+        logger.exception("Could not delete collection %s", collection)
+        pending_collection_deletes.add(collection)
+    await bump_kb_version(collection)
+
+
+# --- Passes ---
+
+
+async def _registered_collections(registry: Registry) -> set[str]:
+    """Collections of registered knowledge bases, with those a reindex is filling."""
+    collections = set()
+    for kb in await registry.avalues():
+        collections.add(VectorStoreBackend.collection_of(kb))
+        if kb.get("shadow_collection"):
+            collections.add(kb["shadow_collection"])
+    return collections
+
+
+def _abandoned(path: Path, now: float) -> bool:
+    return now - path.stat().st_mtime > settings.MAINTENANCE_GRACE_SECONDS
+
+
+def _ingest_held(entry: Path) -> bool:
+    """Whether an upload still holds the entry (see `holding_ingests`)."""
+    if fcntl is None:
+        return False
+    try:
+        f = open(entry.with_suffix(".lock"))
+    except FileNotFoundError:
+        return False
+    with f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True
+        fcntl.flock(f, fcntl.LOCK_UN)
+        return False
+
+
+@contextmanager
+def _host_lock():
+    """Yield whether this process holds the host-wide maintenance lock."""
+    if fcntl is None:
+        yield True
+        return
+    os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
+    with open(os.path.join(settings.UPLOAD_DIR, ".maintenance.lock"), "a") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class Pacer:
+    """Sleeps after each step so that work takes at most a fraction of the time.
+
+    The fraction is read at each pause (MAINTENANCE_BUSY_FRACTION by default),
+    so a change to the setting applies to work already running.
+    """
+
+    def __init__(self, busy_fraction: Callable[[], float] = lambda: settings.MAINTENANCE_BUSY_FRACTION) -> None:
+        self._busy_fraction = busy_fraction
+        self._started = time.perf_counter()
+
+    async def pause(self) -> None:
+        busy = time.perf_counter() - self._started
+        fraction = self._busy_fraction()
+        if 0 < fraction < 1:
+            await asyncio.sleep(busy * (1 - fraction) / fraction)
+        self._started = time.perf_counter()
+
+
+async def _search_ms(backend: VectorStoreBackend, collection: str, vector: list[float] | None) -> float | None:
+    """Median time of a few searches, after one that loads the collection; None if it cannot search."""
+    if vector is None:
+        return None
+    try:
+        await backend.asearch_by_vector(collection, vector, settings.RAG_TOP_K)
+        samples = []
+        for _ in range(5):
+            start = time.perf_counter()
+            await backend.asearch_by_vector(collection, vector, settings.RAG_TOP_K)
+            samples.append(time.perf_counter() - start)
+    except Exception:
+        return None
+    return round(statistics.median(samples) * 1000, 3)
+
+
+async def _remove_stale_uploads(report: dict, pacer: Pacer) -> None:
+    upload_dir = Path(settings.UPLOAD_DIR)
+    if not upload_dir.exists():
+        return
+    now = time.time()
+    for path in upload_dir.iterdir():
+        if path.name.startswith(".") or not path.is_file() or not _abandoned(path, now):
+            continue
+        size = path.stat().st_size
+        path.unlink(missing_ok=True)
+        report["stale_uploads_removed"] += 1
+        report["reclaimed_bytes"] += size
+        await pacer.pause()
+
+
+async def _clean_failed_ingests(backend: VectorStoreBackend, report: dict, pacer: Pacer) -> None:
+    directory = _journal_dir()
+    if not directory.exists():
+        return
+    now = time.time()
+    collections = set(await backend.alist_collections())
+    for entry in sorted(directory.glob("*.json")):
+        try:
+            if not _abandoned(entry, now) or _ingest_held(entry):
+                continue  # the upload may still be running
+            record = json.loads(entry.read_text())
+        except FileNotFoundError:
+            continue  # committed or released meanwhile
+        try:
+            if record["collection"] in collections:
+                await backend.adelete_documents(record["collection"], record["ids"])
+                await bump_kb_version(record["collection"])
+        except Exception as e:
+            report["errors"].append(f"failed ingest {entry.name}: {e}")
+            continue
+        end_ingest(entry)
+        report["failed_ingests_cleaned"] += 1
+        report["failed_chunks_deleted"] += len(record["ids"])
+        await pacer.pause()
+
+
+async def _delete_orphans(
+    backend: VectorStoreBackend, registry: Registry, report: dict, pacer: Pacer
+) -> None:
+    registered = await _registered_collections(registry)
+    for collection in await backend.alist_collections():
+        if collection in registered:
+            continue
+        if shared_state is None and collection not in pending_collection_deletes:
+            report["unregistered_collections"].append(collection)
+            continue
+        # Checked again just before deleting, in case the knowledge base was created meanwhile.
+        if collection in await _registered_collections(registry):
+            continue
+        before = await asyncio.to_thread(backend.storage_bytes)
+        try:
+            await backend.adelete_collection(collection)
+        except CollectionNotFoundError:
+            pass
+        except Exception as e:
+            report["errors"].append(f"orphan collection {collection}: {e}")
+            continue
+        after = await asyncio.to_thread(backend.storage_bytes)
+        pending_collection_deletes.discard(collection)
+        await bump_kb_version(collection)
+        report["orphan_collections_deleted"].append(collection)
+        if before is not None and after is not None:
+            report["reclaimed_bytes"] += max(before - after, 0)
+        await pacer.pause()
+
+
+async def _compact(backend: VectorStoreBackend, registry: Registry, report: dict, pacer: Pacer) -> None:
+    existing = set(await backend.alist_collections())
+    # Search probes by embedding model, embedded once each (None when embedding failed).
+    probes: dict[str | None, list[float] | None] = {}
+    for collection in sorted(await _registered_collections(registry) & existing):
+        try:
+            dead = await asyncio.to_thread(backend.dead_fraction, collection)
+            if dead < settings.MAINTENANCE_COMPACT_MIN_DEAD_FRACTION or dead == 0:
+                continue
+            model = await backend.acollection_model(collection)
+            if model not in probes:
+                probes[model] = None
+                with contextlib.suppress(Exception):
+                    probes[model] = await backend.embeddings_for(model).aembed_query("maintenance search probe")
+            probe = probes[model]
+            before_ms = await _search_ms(backend, collection, probe)
+            reclaimed = await asyncio.to_thread(backend.compact_collection, collection)
+            after_ms = await _search_ms(backend, collection, probe)
+        except Exception as e:
+            report["errors"].append(f"compacting {collection}: {e}")
+            continue
+        report["compactions"].append(CompactionResult(
+            collection=collection,
+            dead_fraction=round(dead, 4),
+            reclaimed_bytes=reclaimed,
+            search_ms_before=before_ms,
+            search_ms_after=after_ms,
+        ))
+        report["reclaimed_bytes"] += reclaimed
+        await pacer.pause()
+
+
+async def _run_pass(registry: Registry) -> MaintenanceReport:
+    started_at = datetime.now(timezone.utc)
+    started = time.perf_counter()
+    backend = get_vector_store()
+    pacer = Pacer()
+    report = {
+        "stale_uploads_removed": 0,
+        "failed_ingests_cleaned": 0,
+        "failed_chunks_deleted": 0,
+        "orphan_collections_deleted": [],
+        "unregistered_collections": [],
+        "compactions": [],
+        "reclaimed_bytes": 0,
+        "errors": [],
+    }
+    storage_before = await asyncio.to_thread(backend.storage_bytes)
+    await _remove_stale_uploads(report, pacer)
+    await _clean_failed_ingests(backend, report, pacer)
+    await _delete_orphans(backend, registry, report, pacer)
+    await _compact(backend, registry, report, pacer)
+    return MaintenanceReport(
+        started_at=started_at,
+        duration_ms=round((time.perf_counter() - started) * 1000, 1),
+        storage_bytes_before=storage_before,
+        storage_bytes_after=await asyncio.to_thread(backend.storage_bytes),
+        **report,
+    )
+
+
+async def run_maintenance(registry: Registry) -> MaintenanceReport | None:
+    """Run one maintenance pass; None when another pass is already running on this host."""
+    if _running.locked():
+        return None
+    async with _running:
+        with _host_lock() as acquired:
+            if not acquired:
+                return None
+            report = await _run_pass(registry)
+    recent_reports.appendleft(report)
+    logger.info(
+        "maintenance reclaimed=%d bytes compacted=%d orphans=%d failed_ingests=%d stale_uploads=%d errors=%d",
+        report.reclaimed_bytes,
+        len(report.compactions),
+        len(report.orphan_collections_deleted),
+        report.failed_ingests_cleaned,
+        report.stale_uploads_removed,
+        len(report.errors),
+    )
+    return report
+
+
+async def maintenance_loop(registry: Registry) -> None:
+    while True:
+        await asyncio.sleep(settings.MAINTENANCE_INTERVAL_SECONDS)
+        try:
+            await run_maintenance(registry)
+        except Exception:
+            logger.exception("Maintenance pass failed")
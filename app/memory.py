@@ -0,0 +1,100 @@
+"""Rolling conversation summary for long sessions (`MEMORY_MODE="summary"`).
+
+Messages that fall out of the trim window are folded into a running summary
+by a background task, after the response has been sent. The summary rides
+along as a `SystemMessage` ahead of the trimmed history, so the prompt stays
+within `MAX_TOKENS` plus `SUMMARY_MAX_TOKENS` however long the session runs.
+
+A turn never waits for summarization. Until a task finishes, the previous
+summary is used. Only one task runs per session at a time; messages that
+drop out meanwhile are picked up by the next turn.
+
+With shared state (`STATE_BACKEND="sqlite"`) each new summary is also
+stored there, and a worker picks it up when it next loads the session.
+"""
+
+import asyncio
+import logging
+from dataclasses import dataclass
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+
+from app.config import settings
+from app.state import shared_state
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_SYSTEM_PROMPT = (
+    "You maintain a running summary of a conversation between a user and an assistant. "
+    "Merge the new messages into the existing summary. Keep facts, names, numbers, decisions "
+    "and open questions; drop pleasantries. Write plain prose, no preamble, under {max_words} words."
+)
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+
+@dataclass
+class SessionSummary:
+    message: SystemMessage | None = None
+    covered_id: str | None = None  # id of the last history message folded into `message`
+    task: asyncio.Task | None = None
+
+
+summaries: dict[str, SessionSummary] = {}
+
+
+def summary_messages(session_id: str) -> list[BaseMessage]:
+    """The session's current summary as a prompt prefix, or nothing if there is none yet."""
+    summary = summaries.get(session_id)
+    return [summary.message] if summary is not None and summary.message is not None else []
+
+
+def _transcript(messages: list[BaseMessage]) -> str:
+    return "\n".join(
+        f"{'User' if isinstance(m, HumanMessage) else 'Assistant'}: {m.content}" for m in messages
+    )
+
+
+def restore_summary(session_id: str, content: str, covered_id: str) -> None:
+    """Adopt the session summary from shared state, unless this worker is updating it."""
+    summary = summaries.setdefault(session_id, SessionSummary())
+    if summary.task is not None and not summary.task.done():
+        return
+    if summary.covered_id != covered_id:
+        summary.message = SystemMessage(content=content)
+        summary.covered_id = covered_id
+
+
+async def _summarize(
+    session_id: str, summary: SessionSummary, pending: list[BaseMessage], llm: BaseChatModel
+) -> None:
+    previous = summary.message.content.removeprefix(SUMMARY_PREFIX) if summary.message else "(none yet)"
+    prompt = [
+        SystemMessage(content=SUMMARY_SYSTEM_PROMPT.format(max_words=settings.SUMMARY_MAX_TOKENS * 3 // 4)),
+        HumanMessage(content=f"Existing summary:\n{previous}\n\nNew messages:\n{_transcript(pending)}"),
+    ]
+    try:
+        response = await llm.ainvoke(prompt, options={"num_predict": settings.SUMMARY_MAX_TOKENS})
+    except Exception:  # the next turn retries with the same messages
+        logger.warning("Conversation summarization failed", exc_info=True)
+        return
+    summary.message = SystemMessage(content=f"{SUMMARY_PREFIX}{response.content}")
+    summary.covered_id = pending[-1].id
+    if shared_state is not None:
+        await shared_state.awrite_summary(session_id, summary.message.content, summary.covered_id)
+
+
+def schedule_summary(session_id: str, dropped: list[BaseMessage], llm: BaseChatModel) -> None:
+    """Start folding newly dropped messages into the session summary, without awaiting it.
+
+    `dropped` is the part of the history before the current trim window.
+    """
+    summary = summaries.setdefault(session_id, SessionSummary())
+    if summary.task is not None and not summary.task.done():
+        return
+    ids = [m.id for m in dropped]
+    start = ids.index(summary.covered_id) + 1 if summary.covered_id in ids else 0
+    pending = dropped[start:]
+    if pending:
+        summary.task = asyncio.create_task(_summarize(session_id, summary, pending, llm))
@@ -1,15 +1,42 @@
 from datetime import datetime
+from typing import Annotated, Literal
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, field_validator
 
 
 # --- Chat models ---
 
 
+class RetrievalFilter(BaseModel):
+    source_filename: str | Annotated[list[str], Field(min_length=1)] | None = None
+    uploaded_after: datetime | None = None
+    uploaded_before: datetime | None = None
+    metadata: dict[str, str | int | float | bool] | None = None
+
+    @field_validator("metadata")
+    @classmethod
+    def _no_operator_keys(cls, metadata: dict | None) -> dict | None:
+        # A "$" key would be read as an operator of the where clause, not as a field.
+        if metadata and any(key.startswith("$") for key in metadata):
+            raise ValueError("metadata keys must not start with '$'")
+        return metadata
+
+
 class ChatRequest(BaseModel):
     message: str
     session_id: str | None = None
     knowledge_base_ids: list[str] | None = None
+    filter: RetrievalFilter | None = None
+    mode: Literal["chat", "agent"] = "chat"
+
+
+class Citation(BaseModel):
+    # N of the "[Document N — source]" label the answer referenced
+    document: int
+    kb_id: str
+    chunk_id: str | None
+    source_filename: str
+    score: float
 
 
 class TokenUsage(BaseModel):
@@ -23,6 +50,8 @@ class ChatResponse(BaseModel):
     session_id: str
     timestamp: datetime
     usage: TokenUsage
+    model: str | None = None
+    citations: list[Citation] = []
 
 
 class Message(BaseModel):
@@ -36,6 +65,10 @@ class StreamChunk(BaseModel):
     done: bool
     timestamp: datetime
     usage: TokenUsage | None = None
+    model: str | None = None
+    status: Literal["retrieving"] | None = None
+    # Citations whose markers this chunk completed; the final chunk lists all of them
+    citations: list[Citation] = []
 
 
 class SessionMessages(BaseModel):
@@ -43,12 +76,25 @@ class SessionMessages(BaseModel):
     messages: list[Message]
 
 
+class ReadinessStatus(BaseModel):
+    ready: bool
+    models: dict[str, bool]
+
+
+class PromptEvalStats(BaseModel):
+    layout: str
+    turns: int
+    avg_prompt_eval_tokens: float
+    avg_prompt_eval_ms: float
+
+
 # --- Knowledge Base models ---
 
 
 class CreateKnowledgeBaseRequest(BaseModel):
     name: str
     description: str = ""
+    vector_quantization: Literal["none", "int8", "pq"] = "none"
 
 
 class KnowledgeBaseResponse(BaseModel):
@@ -57,17 +103,22 @@ class KnowledgeBaseResponse(BaseModel):
     description: str
     document_count: int
     created_at: datetime
+    vector_quantization: str = "none"
+    # None for knowledge bases created before models were recorded: the configured model
+    embedding_model: str | None = None
 
 
 class KnowledgeBaseQueryRequest(BaseModel):
     query: str
     top_k: int | None = None
+    filter: RetrievalFilter | None = None
 
 
 class RetrievedDocument(BaseModel):
     content: str
     metadata: dict
     score: float
+    id: str | None = None
 
 
 class KnowledgeBaseQueryResponse(BaseModel):
@@ -75,12 +126,143 @@ class KnowledgeBaseQueryResponse(BaseModel):
     query: str
 
 
+class StreamQueryRequest(KnowledgeBaseQueryRequest):
+    # Results ranked below the first `offset` are sent, top_k of them
+    offset: int = 0
+    include_content: bool = True
+    max_content_chars: int | None = None
+
+
+class StreamedDocument(RetrievedDocument):
+    # None when the request left content out
+    content: str | None = None
+    # 1-based position in the whole ranking, across pages
+    rank: int
+    content_truncated: bool = False
+
+
+class StreamQueryEnd(BaseModel):
+    done: bool = True
+    returned: int
+    # Offset of the next page, or None when the ranking has no more results
+    next_offset: int | None
+    error: str | None = None
+
+
+class BatchQueryItem(BaseModel):
+    kb_id: str
+    query: str
+    top_k: int | None = None
+    filter: RetrievalFilter | None = None
+
+
+class BatchQueryRequest(BaseModel):
+    items: list[BatchQueryItem]
+
+
+class BatchQueryResult(BaseModel):
+    kb_id: str
+    query: str
+    results: list[RetrievedDocument]
+    error: str | None = None
+
+
+class BatchQueryResponse(BaseModel):
+    results: list[BatchQueryResult]
+
+
 class DocumentUploadResponse(BaseModel):
     message: str
     documents_processed: int
+    # Chunks skipped because an earlier upload of the same file already stored them
+    duplicates_skipped: int = 0
     errors: list["FileError"]
 
 
 class FileError(BaseModel):
     filename: str
     error: str
+
+
+class ReindexRequest(BaseModel):
+    # Defaults to the configured OLLAMA_EMBEDDING_MODEL
+    embedding_model: str | None = None
+
+
+class ReindexStatus(BaseModel):
+    kb_id: str
+    state: Literal["running", "completed", "failed", "cancelled"]
+    from_model: str | None
+    to_model: str
+    # The knowledge base's document count when the job started
+    documents_total: int
+    documents_done: int
+    documents_per_second: float | None = None
+    eta_seconds: float | None = None
+    started_at: datetime
+    finished_at: datetime | None = None
+    error: str | None = None
+
+
+# --- Admin models ---
+
+
+class CompactionResult(BaseModel):
+    collection: str
+    dead_fraction: float
+    reclaimed_bytes: int
+    search_ms_before: float | None
+    search_ms_after: float | None
+
+
+class MaintenanceReport(BaseModel):
+    started_at: datetime
+    duration_ms: float
+    stale_uploads_removed: int
+    failed_ingests_cleaned: int
+    failed_chunks_deleted: int
+    orphan_collections_deleted: list[str]
+    # Without a registry entry, but kept: a per-worker registry forgets knowledge bases on restart.
+    unregistered_collections: list[str]
+    compactions: list[CompactionResult]
+    reclaimed_bytes: int
+    storage_bytes_before: int | None
+    storage_bytes_after: int | None
+    errors: list[str]
+
+
+class RetrievalCacheInfo(BaseModel):
+    enabled: bool
+    entries: int
+    bytes: int
+    max_bytes: int
+    ttl_seconds: float
+    hits: int
+    misses: int
+    hit_rate: float | None
+    evictions: int
+    expirations: int
+
+
+class TenantUsage(BaseModel):
+    tenant_id: str
+    knowledge_bases: int
+    storage_bytes: int
+    chat_requests: int
+    input_tokens: int
+    output_tokens: int
+    total_tokens: int
+    queries: int
+    ingested_bytes: int
+    ingested_chunks: int
+    rate_limited: int
+
+
+class ProfileInfo(BaseModel):
+    id: str
+    mode: Literal["sampling", "trace"]
+    method: str
+    path: str
+    created_at: datetime
+    duration_ms: float
+    filename: str
@@ -0,0 +1,242 @@
+"""Request-scoped profiling for sampling slow requests in production.
+
+A request is profiled when it carries an `X-Profile` header (honoured only
+with `PROFILE_HEADER_ENABLED`) or when it falls in the `PROFILE_SAMPLE_RATE`
+sample. It then runs in one of two modes:
+
+- "sampling": a pyinstrument sampling profile of just that request (other
+  requests on the event loop are not included), saved as an HTML flamegraph.
+  Needs the optional `profiling` extra.
+- "trace": a LangChain callback tracer that records every model, chain,
+  tool and retriever run of the request, with time to first token, plus
+  the chat stages timed for /metrics, as a Chrome trace JSON (open it in
+  Perfetto or chrome://tracing).
+
+Artifacts go to `PROFILE_DIR`; the newest `PROFILE_KEEP` are kept and listed
+through the admin API. Unprofiled requests only pay for the header check and
+the sampling draw.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from collections.abc import Callable
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from functools import partial
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.tracers.context import register_configure_hook
+
+from app.config import settings
+from app.models import ProfileInfo
+from app.telemetry import stage_observer
+
+try:
+    from pyinstrument import Profiler
+except ImportError:  # optional: pip install .[profiling]
+    Profiler = None
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = b"x-profile"
+ADMIN_TOKEN_HEADER = b"x-admin-token"
+UNPROFILED_PREFIXES = ("/admin", "/metrics", "/ready")
+
+recent_profiles: deque[ProfileInfo] = deque()
+_profiles_lock = threading.Lock()
+
+
+class TraceRecorder(BaseCallbackHandler):
+    """Collects LangChain runs as Chrome trace events (`ph: X` spans, `ph: i` first tokens)."""
+
+    run_inline = True
+
+    def __init__(self) -> None:
+        self.events: list[dict] = []
+        self._origin = time.perf_counter()
+        self._open: dict[UUID, tuple[str, str, float]] = {}
+        self._first_token_seen: set[UUID] = set()
+
+    def _now_us(self) -> float:
+        return (time.perf_counter() - self._origin) * 1e6
+
+    def _start(self, run_id: UUID, category: str, serialized: dict | None, kwargs: dict) -> None:
+        name = kwargs.get("name") or (serialized or {}).get("name") or category
+        self._open[run_id] = (name, category, self._now_us())
+
+    def _end(self, run_id: UUID, error: BaseException | None = None) -> None:
+        opened = self._open.pop(run_id, None)
+        if opened is None:
+            return
+        name, category, start = opened
+        args = {"run_id": str(run_id)}
+        if error is not None:
+            args["error"] = repr(error)
+        self.events.append({
+            "name": name, "cat": category, "ph": "X", "ts": start, "dur": self._now_us() - start,
+            "pid": 1, "tid": 1, "args": args,
+        })
+
+    def record_stage(self, stage: str, seconds: float) -> None:
+        """Add a chat stage timed by `app.telemetry` as a span ending now."""
+        end = self._now_us()
+        self.events.append({
+            "name": stage, "cat": "stage", "ph": "X", "ts": end - seconds * 1e6, "dur": seconds * 1e6,
+            "pid": 1, "tid": 1, "args": {},
+        })
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs) -> None:
+        self._start(run_id, "llm", serialized, kwargs)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs) -> None:
+        self._start(run_id, "llm", serialized, kwargs)
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs) -> None:
+        if run_id not in self._first_token_seen:
+            self._first_token_seen.add(run_id)
+            self.events.append({
+                "name": "first_token", "cat": "llm", "ph": "i", "s": "t", "ts": self._now_us(),
+                "pid": 1, "tid": 1, "args": {"run_id": str(run_id)},
+            })
+
+    def on_llm_end(self, response, *, run_id, **kwargs) -> None:
+        self._end(run_id)
+
+    def on_llm_error(self, error, *, run_id, **kwargs) -> None:
+        self._end(run_id, error)
+
+    def on_chain_start(self, serialized, inputs, *, run_id, **kwargs) -> None:
+        self._start(run_id, "chain", serialized, kwargs)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs) -> None:
+        self._end(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs) -> None:
+        self._end(run_id, error)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs) -> None:
+        self._start(run_id, "tool", serialized, kwargs)
+
+    def on_tool_end(self, output, *, run_id, **kwargs) -> None:
+        self._end(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs) -> None:
+        self._end(run_id, error)
+
+    def on_retriever_start(self, serialized, query, *, run_id, **kwargs) -> None:
+        self._start(run_id, "retriever", serialized, kwargs)
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs) -> None:
+        self._end(run_id)
+
+    def on_retriever_error(self, error, *, run_id, **kwargs) -> None:
+        self._end(run_id, error)
+
+
+# While set, LangChain attaches the recorder to every run started in this context.
+trace_recorder: ContextVar[TraceRecorder | None] = ContextVar("trace_recorder", default=None)
+register_configure_hook(trace_recorder, inheritable=True)
+
+
+def _requested_mode(scope: dict) -> str | None:
+    if settings.PROFILE_HEADER_ENABLED:
+        headers = dict(scope["headers"])
+        requested = headers.get(PROFILE_HEADER)
+        authorized = not settings.ADMIN_TOKEN or headers.get(ADMIN_TOKEN_HEADER, b"").decode() == settings.ADMIN_TOKEN
+        if requested is not None and authorized:
+            return requested.decode().strip().lower() or "sampling"
+    if settings.PROFILE_SAMPLE_RATE > 0 and random.random() < settings.PROFILE_SAMPLE_RATE:
+        return settings.PROFILE_SAMPLED_MODE
+    return None
+
+
+def _save(
+    scope: dict, mode: str, created_at: datetime, duration_ms: float, render: Callable[[], str], extension: str
+) -> None:
+    """Render a finished profile and write it out; blocking, so run it off the event loop."""
+    content = render()
+    profile_id = uuid.uuid4().hex[:12]
+    info = ProfileInfo(
+        id=profile_id,
+        mode=mode,
+        method=scope["method"],
+        path=scope["path"],
+        created_at=created_at,
+        duration_ms=duration_ms,
+        filename=f"{created_at:%Y%m%dT%H%M%S}-{profile_id}.{extension}",
+    )
+    os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+    with open(profile_path(info), "w", encoding="utf-8") as f:
+        f.write(content)
+    with _profiles_lock:
+        recent_profiles.appendleft(info)
+        while len(recent_profiles) > settings.PROFILE_KEEP:
+            expired = recent_profiles.pop()
+            try:
+                os.remove(profile_path(expired))
+            except FileNotFoundError:
+                pass
+    logger.info("Profiled %s %s (%s) -> %s", info.method, info.path, mode, info.filename)
+
+
+def profile_path(info: ProfileInfo) -> str:
+    return os.path.join(settings.PROFILE_DIR, info.filename)
+
+
+def find_profile(profile_id: str) -> ProfileInfo | None:
+    with _profiles_lock:
+        return next((p for p in recent_profiles if p.id == profile_id), None)
+
+
+class ProfilingMiddleware:
+    """ASGI middleware that profiles selected requests; others pass straight through."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http" or scope["path"].startswith(UNPROFILED_PREFIXES):
+            await self.app(scope, receive, send)
+            return
+        mode = _requested_mode(scope)
+        if mode is None:
+            await self.app(scope, receive, send)
+            return
+        if mode == "sampling" and Profiler is None:
+            logger.warning("pyinstrument is not installed; tracing %s instead of sampling it", scope["path"])
+            mode = "trace"
+        if mode not in ("sampling", "trace"):
+            await self.app(scope, receive, send)
+            return
+
+        created_at = datetime.now(timezone.utc)
+        started = time.perf_counter()
+        if mode == "sampling":
+            profiler = Profiler(interval=settings.PROFILE_INTERVAL_SECONDS, async_mode="enabled")
+            profiler.start()
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                profiler.stop()
+                duration_ms = (time.perf_counter() - started) * 1000
+                await asyncio.to_thread(_save, scope, mode, created_at, duration_ms, profiler.output_html, "html")
+        else:
+            recorder = TraceRecorder()
+            token = trace_recorder.set(recorder)
+            stage_token = stage_observer.set(recorder.record_stage)
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                stage_observer.reset(stage_token)
+                trace_recorder.reset(token)
+                duration_ms = (time.perf_counter() - started) * 1000
+                render = partial(json.dumps, {"traceEvents": recorder.events})
+                await asyncio.to_thread(_save, scope, mode, created_at, duration_ms, render, "trace.json")
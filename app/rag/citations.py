@@ -0,0 +1,60 @@
+"""Citations read from the `[Document N — source]` labels an answer repeats.
+
+`format_context` labels each retrieved chunk, and the RAG prompt asks the
+model to cite chunks by their labels. `CitationTracker` scans the answer for
+bracketed references (`[Document 2]`, `[Document 1 — report.pdf]`,
+`[Document 1, Document 3]`, `[Documents 2 and 4]`) and maps their numbers back
+to the chunks that were labelled with them. No model call is involved.
+
+Text can be fed as it streams: a marker split across chunks is reported with
+the chunk that completes it.
+"""
+
+import re
+
+from app.models import Citation
+
+# A bracketed span without nested brackets; only its tail can still be open.
+_BRACKETS = re.compile(r"\[([^\[\]]*)\]")
+_REFERENCE = re.compile(r"Documents?\s+(\d+(?:\s*(?:,|&|and)\s*\d+)*)")
+# Longer open spans are not labels: a source filename rarely takes more.
+_MAX_MARKER_CHARS = 300
+
+
+class CitationTracker:
+    """Collects, in order of first reference, the sources an answer cites.
+
+    `sources[i]` is the chunk labelled `[Document i+1 — ...]`. References to
+    numbers without a source are ignored.
+    """
+
+    def __init__(self, sources: list[Citation]) -> None:
+        self._sources = sources
+        self._pending = ""
+        self._cited: set[int] = set()
+        self.citations: list[Citation] = []
+
+    def feed(self, text: str) -> list[Citation]:
+        """Scan more of the answer; return the citations it adds."""
+        if not self._sources:
+            return []
+        self._pending += text
+        added = []
+        end = 0
+        for match in _BRACKETS.finditer(self._pending):
+            added += self._cite(match.group(1))
+            end = match.end()
+        rest = self._pending[end:]
+        start = rest.rfind("[")
+        self._pending = rest[start:] if start != -1 and len(rest) - start <= _MAX_MARKER_CHARS else ""
+        return added
+
+    def _cite(self, marker: str) -> list[Citation]:
+        added = []
+        for reference in _REFERENCE.finditer(marker):
+            for number in map(int, re.findall(r"\d+", reference.group(1))):
+                if 1 <= number <= len(self._sources) and number not in self._cited:
+                    self._cited.add(number)
+                    added.append(self._sources[number - 1])
+        self.citations += added
+        return added
@@ -1,10 +1,40 @@
 from functools import lru_cache
 
-from langchain_ollama import OllamaEmbeddings
+from langchain_core.embeddings import Embeddings
 
 from app.config import settings
+from app.llm import pooled_client_kwargs
+from app.telemetry import CHAT_STAGE_SECONDS
 
 
-@lru_cache(maxsize=1)
-def get_embeddings() -> OllamaEmbeddings:
-    return OllamaEmbeddings(model=settings.OLLAMA_EMBEDDING_MODEL)
+def same_model(a: str, b: str) -> bool:
+    """Whether two Ollama model names refer to the same model (`name` is `name:latest`)."""
+    def normalize(name: str) -> str:
+        return name if ":" in name else f"{name}:latest"
+
+    return normalize(a) == normalize(b)
+
+
+# A few entries: during a reindex two models embed side by side.
+@lru_cache(maxsize=4)
+def get_embeddings(model: str | None = None) -> Embeddings:
+    """Client for an Ollama embedding model; None is OLLAMA_EMBEDDING_MODEL."""
+    # Imported on first use so that importing the app does not load langchain_ollama.
+    from langchain_ollama import OllamaEmbeddings
+
+    class TimedOllamaEmbeddings(OllamaEmbeddings):
+        """Records query embedding time as the `query_embedding` stage."""
+
+        def embed_query(self, text: str) -> list[float]:
+            with CHAT_STAGE_SECONDS.time(stage="query_embedding"):
+                return super().embed_query(text)
+
+        async def aembed_query(self, text: str) -> list[float]:
+            with CHAT_STAGE_SECONDS.time(stage="query_embedding"):
+                return await super().aembed_query(text)
+
+    return TimedOllamaEmbeddings(
+        model=model or settings.OLLAMA_EMBEDDING_MODEL,
+        keep_alive=settings.OLLAMA_EMBEDDING_KEEP_ALIVE_SECONDS,
+        **pooled_client_kwargs(),
+    )
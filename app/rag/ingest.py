@@ -1,9 +1,7 @@
 import asyncio
 from pathlib import Path
 
-from langchain_community.document_loaders import CSVLoader, PyPDFLoader, TextLoader
 from langchain_core.documents import Document
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 
 from app.config import settings
 
@@ -11,20 +9,29 @@ SUPPORTED_EXTENSIONS = {".pdf", ".txt", ".md", ".csv"}
 
 
 def get_loader(file_path: str):
+    # Loaders are imported per file type, on first use, to keep them out of app startup.
     ext = Path(file_path).suffix.lower()
     if ext == ".pdf":
+        from langchain_community.document_loaders import PyPDFLoader
+
         return PyPDFLoader(file_path)
     if ext in (".txt", ".md"):
+        from langchain_community.document_loaders import TextLoader
+
         return TextLoader(file_path)
     if ext == ".csv":
+        from langchain_community.document_loaders import CSVLoader
+
         return CSVLoader(file_path)
     raise ValueError(f"Unsupported file type: {ext}")
 
 
-def _process_sync(file_path: str, filename: str) -> list[Document]:
+def _process_sync(file_path: str, filename: str, extra_metadata: dict | None = None) -> list[Document]:
     loader = get_loader(file_path)
     documents = loader.load()
 
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
     splitter = RecursiveCharacterTextSplitter(
         chunk_size=settings.CHUNK_SIZE,
         chunk_overlap=settings.CHUNK_OVERLAP,
@@ -32,10 +39,13 @@ def _process_sync(file_path: str, filename: str) -> list[Document]:
     chunks = splitter.split_documents(documents)
 
     for chunk in chunks:
+        chunk.metadata.update(extra_metadata or {})
         chunk.metadata["source_filename"] = filename
 
     return chunks
 
 
-async def process_document(file_path: str, filename: str) -> list[Document]:
-    return await asyncio.to_thread(_process_sync, file_path, filename)
+async def process_document(
+    file_path: str, filename: str, extra_metadata: dict | None = None
+) -> list[Document]:
+    return await asyncio.to_thread(_process_sync, file_path, filename, extra_metadata)
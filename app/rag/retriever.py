@@ -1,26 +1,274 @@
+"""Retrieval from knowledge bases, with a per-worker cache of search results.
+
+Dashboards and chat retries repeat the same searches, each of which costs an
+embedding call and a vector search. `retrieval_cache` keeps recent results,
+keyed by (knowledge base, its version, query, k, filter). Uploads and deletes
+call `bump_kb_version`, so a search after an ingest never sees results cached
+before it. With `STATE_BACKEND=sqlite` versions are shared by all workers,
+so this holds whichever worker took the upload.
+"""
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import AsyncIterator
+from dataclasses import dataclass
+
+from langchain_core.documents import Document
+
 from app.config import settings
+from app.models import BatchQueryItem, RetrievalFilter
 from app.rag.vector_store import get_vector_store
+from app.state import shared_state
+from app.telemetry import RETRIEVAL_CACHE_LOOKUPS, Gauge
+
+# (content, metadata, score, chunk id)
+Results = list[tuple[str, dict, float, str | None]]
+CacheKey = tuple[str, int, str, int, str | None]
+
+_kb_versions: dict[str, int] = {}
+
+
+async def kb_version(kb_id: str) -> int:
+    if shared_state is not None:
+        return await asyncio.to_thread(shared_state.collection_version, kb_id)
+    return _kb_versions.get(kb_id, 0)
+
+
+async def bump_kb_version(kb_id: str) -> None:
+    """Mark the collection's content as changed, so earlier cached results are no longer served."""
+    if shared_state is not None:
+        await asyncio.to_thread(shared_state.bump_collection_version, kb_id)
+    else:
+        _kb_versions[kb_id] = _kb_versions.get(kb_id, 0) + 1
+    retrieval_cache.invalidate(kb_id)
+
+
+def _results_size(results: Results) -> int:
+    return sum(
+        len(content.encode()) + sum(len(str(k)) + len(str(v)) for k, v in metadata.items()) + len(chunk_id or "")
+        for content, metadata, _score, chunk_id in results
+    )
+
+
+@dataclass
+class RetrievalCacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+
+
+class RetrievalCache:
+    """LRU cache of search results with a TTL, bounded by the bytes of cached content.
+
+    Sizes count the UTF-8 content, metadata and chunk id of each result. The
+    limit and TTL are read from settings on each call; a limit of 0 disables
+    the cache. Cached result lists are shared between callers, so treat them
+    as read-only.
+    """
+
+    def __init__(self) -> None:
+        self._entries: OrderedDict[CacheKey, tuple[float, int, Results]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.stats = RetrievalCacheStats()
+
+    @property
+    def enabled(self) -> bool:
+        return settings.RETRIEVAL_CACHE_MAX_BYTES > 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _drop(self, key: CacheKey) -> None:
+        _expires, size, _results = self._entries.pop(key)
+        self.bytes -= size
+
+    def get(self, key: CacheKey) -> Results | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                self._drop(key)
+                self.stats.expirations += 1
+                entry = None
+            if entry is None:
+                self.stats.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.stats.hits += 1
+        RETRIEVAL_CACHE_LOOKUPS.inc(result="miss" if entry is None else "hit")
+        return None if entry is None else entry[2]
 
+    def put(self, key: CacheKey, results: Results) -> None:
+        max_bytes = settings.RETRIEVAL_CACHE_MAX_BYTES
+        size = _results_size(results)
+        if size > max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + settings.RETRIEVAL_CACHE_TTL_SECONDS, size, results)
+            self.bytes += size
+            while self.bytes > max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.stats.evictions += 1
 
-def retrieve_context(
-    kb_id: str, query: str, top_k: int | None = None
-) -> list[tuple[str, dict, float]]:
-    """Retrieve relevant documents from a knowledge base.
+    def invalidate(self, kb_id: str) -> None:
+        """Drop the collection's entries; they are unreachable once its version changes anyway."""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == kb_id]:
+                self._drop(key)
 
-    Returns list of (content, metadata, score) tuples.
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+            self.stats = RetrievalCacheStats()
+
+
+retrieval_cache = RetrievalCache()
+Gauge("retrieval_cache_bytes", "Bytes of search results in the retrieval cache.", (), lambda: {(): retrieval_cache.bytes})
+Gauge("retrieval_cache_entries", "Search results in the retrieval cache.", (), lambda: {(): len(retrieval_cache)})
+
+
+def _cache_key(kb_id: str, version: int, query: str, k: int, metadata_filter: RetrievalFilter | None) -> CacheKey:
+    return (
+        kb_id,
+        version,
+        query,
+        k,
+        metadata_filter.model_dump_json(exclude_none=True) if metadata_filter else None,
+    )
+
+
+async def aretrieve_context(
+    kb_id: str,
+    query: str,
+    top_k: int | None = None,
+    metadata_filter: RetrievalFilter | None = None,
+) -> Results:
+    """Retrieve relevant documents from a knowledge base, keeping vector I/O off the event loop.
+
+    The optional metadata filter is translated by the backend and applied
+    inside the index, so the top-k is taken over matching documents only.
+    Results are served from `retrieval_cache` when it holds them.
+
+    Returns list of (content, metadata, score, chunk id) tuples.
     """
     k = top_k or settings.RAG_TOP_K
-    store = get_vector_store().get_store(kb_id)
-    results = store.similarity_search_with_score(query, k=k)
-    return [(doc.page_content, doc.metadata, score) for doc, score in results]
+    key = _cache_key(kb_id, await kb_version(kb_id), query, k, metadata_filter) if retrieval_cache.enabled else None
+    if key is not None and (cached := retrieval_cache.get(key)) is not None:
+        return cached
+    backend = get_vector_store()
+    where = backend.translate_filter(metadata_filter) if metadata_filter else None
+    found = await backend.asearch(kb_id, query, k, where)
+    results = [(doc.page_content, doc.metadata, score, doc.id) for doc, score in found]
+    if key is not None:
+        retrieval_cache.put(key, results)
+    return results
+
+
+async def aretrieve_many(
+    items: list[BatchQueryItem],
+) -> list[Results | Exception]:
+    """Run many (kb, query) searches with one batched embedding call.
+
+    Items found in the retrieval cache are answered from it. Distinct query
+    strings of the rest are embedded once per embedding model of the
+    collections they search, then their searches run concurrently (bounded
+    by BATCH_QUERY_CONCURRENCY). Results are returned in item order; a failed
+    search yields its exception in place of the result list.
+    """
+    if not items:
+        return []
+    k = [item.top_k or settings.RAG_TOP_K for item in items]
+    keys: list[CacheKey | None] = [None] * len(items)
+    if retrieval_cache.enabled:
+        kb_ids = list(dict.fromkeys(item.kb_id for item in items))
+        versions = dict(zip(kb_ids, await asyncio.gather(*(kb_version(kb_id) for kb_id in kb_ids))))
+        keys = [
+            _cache_key(item.kb_id, versions[item.kb_id], item.query, item_k, item.filter)
+            for item, item_k in zip(items, k)
+        ]
+    cached = [retrieval_cache.get(key) if key is not None else None for key in keys]
+    misses = [i for i, results in enumerate(cached) if results is None]
+    if not misses:
+        return cached
+
+    backend = get_vector_store()
+    collections = list(dict.fromkeys(items[i].kb_id for i in misses))
+    model_of = dict(zip(collections, await asyncio.gather(*(backend.acollection_model(c) for c in collections))))
+    queries: dict[str | None, dict[str, None]] = {}
+    for i in misses:
+        queries.setdefault(model_of[items[i].kb_id], {})[items[i].query] = None
+    embedded = await asyncio.gather(
+        *(backend.embeddings_for(model).aembed_documents(list(texts)) for model, texts in queries.items())
+    )
+    vectors = {
+        (model, query): vector
+        for (model, texts), model_vectors in zip(queries.items(), embedded)
+        for query, vector in zip(texts, model_vectors)
+    }
+    semaphore = asyncio.Semaphore(settings.BATCH_QUERY_CONCURRENCY)
+
+    async def run(i: int) -> Results:
+        item = items[i]
+        where = backend.translate_filter(item.filter) if item.filter else None
+        async with semaphore:
+            vector = vectors[(model_of[item.kb_id], item.query)]
+            found = await backend.asearch_by_vector(item.kb_id, vector, k[i], where)
+        results = [(doc.page_content, doc.metadata, score, doc.id) for doc, score in found]
+        if keys[i] is not None:
+            retrieval_cache.put(keys[i], results)
+        return results
+
+    outcomes = await asyncio.gather(*(run(i) for i in misses), return_exceptions=True)
+    for i, outcome in zip(misses, outcomes):
+        cached[i] = outcome
+    return cached
+
+
+async def aretrieve_ranking(
+    kb_id: str,
+    query: str,
+    k: int,
+    metadata_filter: RetrievalFilter | None = None,
+) -> list[tuple[str, float]]:
+    """The ids and scores of the k best matches, without reading their documents.
+
+    For results streamed in pages (see `aiter_documents`). These searches
+    bypass `retrieval_cache`: their rankings are large and rarely repeated.
+    """
+    backend = get_vector_store()
+    embeddings = backend.embeddings_for(await backend.acollection_model(kb_id))
+    embedding = await embeddings.aembed_query(query)
+    where = backend.translate_filter(metadata_filter) if metadata_filter else None
+    return await backend.asearch_ids(kb_id, embedding, k, where)
+
+
+async def aiter_documents(
+    kb_id: str, ranking: list[tuple[str, float]], batch_size: int
+) -> AsyncIterator[list[tuple[Document, float]]]:
+    """Read the ranked documents in batches of `batch_size`, yielding each batch with its scores, in order.
+
+    Only one batch is held at a time. Documents deleted since the search are skipped.
+    """
+    backend = get_vector_store()
+    for start in range(0, len(ranking), batch_size):
+        part = ranking[start:start + batch_size]
+        documents = await backend.aget_documents(kb_id, [chunk_id for chunk_id, _ in part])
+        scores = dict(part)
+        yield [(document, scores[document.id]) for document in documents]
 
 
-def format_context(documents: list[tuple[str, dict, float]]) -> str:
+def format_context(documents: Results) -> str:
     """Format retrieved documents into a context string for the LLM."""
     if not documents:
         return ""
     parts = []
-    for i, (content, metadata, _score) in enumerate(documents, 1):
+    for i, (content, metadata, _score, _chunk_id) in enumerate(documents, 1):
         source = metadata.get("source_filename", "unknown")
         parts.append(f"[Document {i} — {source}]\n{content}")
     return "\n\n".join(parts)
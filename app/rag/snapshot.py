@@ -0,0 +1,158 @@
+"""Knowledge base snapshots: documents and their embeddings in a streamed tar archive."""
+
+import gzip
+import io
+import json
+import tarfile
+from collections.abc import Iterator
+from typing import IO, Any, Literal
+
+import numpy as np
+
+from app.rag.vector_store import StoredRows, VectorStoreBackend
+
+FORMAT_VERSION = 1
+ROWS_PER_BATCH = 2048
+
+VectorEncoding = Literal["float32", "int8"]
+
+
+class SnapshotError(ValueError):
+    """Raised for an archive that is not a readable snapshot."""
+
+
+# --- Writing ---
+
+
+class _Sink:
+    """Write-only file object that collects tar output until it is drained."""
+
+    def __init__(self) -> None:
+        self._parts: list[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def _add_member(archive: tarfile.TarFile, name: str, data: bytes) -> None:
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    archive.addfile(info, io.BytesIO(data))
+
+
+def _encode_vectors(vectors: np.ndarray, encoding: VectorEncoding) -> list[tuple[str, bytes]]:
+    if encoding == "float32":
+        return [("f32", np.ascontiguousarray(vectors, dtype=np.float32).tobytes())]
+    # Symmetric per-row int8: each row scaled so its largest component maps to ±127.
+    scales = np.abs(vectors).max(axis=1) / 127
+    scales[scales == 0] = 1
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return [("i8", codes.tobytes()), ("scale.f32", scales.astype(np.float32).tobytes())]
+
+
+def write_archive(
+    backend: VectorStoreBackend,
+    collection: str,
+    knowledge_base: dict[str, Any],
+    embedding_model: str,
+    encoding: VectorEncoding = "float32",
+) -> Iterator[bytes]:
+    """Yield the archive of a collection in pieces of about one batch."""
+    sink = _Sink()
+    batches = backend.iter_rows(collection, ROWS_PER_BATCH)
+    first = next(batches, None)
+    with tarfile.open(fileobj=sink, mode="w|") as archive:
+        manifest = {
+            "format": FORMAT_VERSION,
+            "knowledge_base": knowledge_base,
+            "embedding_model": embedding_model,
+            "dim": int(first.vectors.shape[1]) if first is not None else None,
+            "vector_encoding": encoding,
+        }
+        _add_member(archive, "manifest.json", json.dumps(manifest).encode())
+        yield sink.drain()
+        index = 0
+        count = 0
+        rows = first
+        while rows is not None:
+            lines = "\n".join(
+                json.dumps({"i": i, "t": t, "m": m}, separators=(",", ":"))
+                for i, t, m in zip(rows.ids, rows.texts, rows.metadatas)
+            )
+            _add_member(archive, f"rows/{index:06d}.jsonl.gz", gzip.compress(lines.encode(), compresslevel=6))
+            for suffix, data in _encode_vectors(rows.vectors, encoding):
+                _add_member(archive, f"rows/{index:06d}.{suffix}", data)
+            yield sink.drain()
+            index += 1
+            count += len(rows.ids)
+            rows = next(batches, None)
+        _add_member(archive, "end.json", json.dumps({"documents": count}).encode())
+    yield sink.drain()
+
+
+# --- Reading ---
+
+
+def _read(archive: tarfile.TarFile, member: tarfile.TarInfo) -> bytes:
+    f = archive.extractfile(member)
+    if f is None:
+        raise SnapshotError(f"Archive member {member.name} is not a file")
+    return f.read()
+
+
+def read_archive(fileobj: IO[bytes]) -> Iterator[dict | StoredRows]:
+    """Yield an archive's manifest, then its documents in batches.
+
+    Raises SnapshotError when the archive is malformed or of an unknown format.
+    """
+    try:
+        archive = tarfile.open(fileobj=fileobj, mode="r|")
+    except tarfile.TarError as e:
+        raise SnapshotError(f"Not a snapshot archive: {e}") from e
+    with archive:
+        members = iter(archive)
+        try:
+            member = next(members, None)
+            if member is None or member.name != "manifest.json":
+                raise SnapshotError("Archive does not start with manifest.json")
+            manifest = json.loads(_read(archive, member))
+            if manifest.get("format") != FORMAT_VERSION:
+                raise SnapshotError(f"Unsupported snapshot format: {manifest.get('format')}")
+            yield manifest
+
+            dim = manifest["dim"]
+            encoding = manifest["vector_encoding"]
+            count = 0
+            for member in members:
+                if member.name == "end.json":
+                    if json.loads(_read(archive, member))["documents"] != count:
+                        raise SnapshotError("Archive document count does not match its contents")
+                    return
+                if not member.name.endswith(".jsonl.gz"):
+                    raise SnapshotError(f"Unexpected archive member {member.name}")
+                records = [json.loads(line) for line in gzip.decompress(_read(archive, member)).splitlines()]
+                if encoding == "float32":
+                    vectors = np.frombuffer(_read(archive, next(members)), dtype=np.float32)
+                else:
+                    codes = np.frombuffer(_read(archive, next(members)), dtype=np.int8)
+                    scales = np.frombuffer(_read(archive, next(members)), dtype=np.float32)
+                    vectors = codes.reshape(len(scales), -1) * scales[:, None]
+                vectors = vectors.reshape(len(records), dim).astype(np.float32, copy=False)
+                count += len(records)
+                yield StoredRows(
+                    ids=[r["i"] for r in records],
+                    texts=[r["t"] for r in records],
+                    metadatas=[r["m"] for r in records],
+                    vectors=vectors,
+                )
+            raise SnapshotError("Archive is truncated")
+        except SnapshotError:
+            raise
+        except (tarfile.TarError, OSError, StopIteration, KeyError, TypeError, ValueError) as e:
+            raise SnapshotError(f"Corrupt snapshot archive: {e}") from e
@@ -1,4 +1,4 @@
-from .base import VectorStoreBackend
+from .base import DEFAULT_TENANT, CollectionNotFoundError, StoredRows, VectorStoreBackend
 from .factory import get_vector_store
 
-__all__ = ["VectorStoreBackend", "get_vector_store"]
+__all__ = ["DEFAULT_TENANT", "CollectionNotFoundError", "StoredRows", "VectorStoreBackend", "get_vector_store"]
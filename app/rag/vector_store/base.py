@@ -1,17 +1,225 @@
+import asyncio
 from abc import ABC, abstractmethod
+from collections.abc import Iterator
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any
 
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 from langchain_core.vectorstores import VectorStore
 
+from app.models import RetrievalFilter
+from app.rag.embeddings import get_embeddings
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# Tenant of requests without an X-Tenant-Id header; its collections keep bare names.
+DEFAULT_TENANT = "default"
+
+
+@dataclass
+class StoredRows:
+    """A batch of stored documents with their embeddings (float32, one row per id)."""
+
+    ids: list[str]
+    texts: list[str]
+    metadatas: list[dict]
+    vectors: "np.ndarray"
+
+
+class CollectionNotFoundError(ValueError):
+    """Raised by `delete_collection` for a collection that does not exist."""
+
 
 class VectorStoreBackend(ABC):
+    """Backend abstraction over per-collection vector stores.
+
+    The async methods default to running their sync counterparts in the
+    default thread pool, so handlers never block the event loop on vector
+    I/O. Backends with a native async client should override them.
+    """
+
+    @staticmethod
+    def collection_for(tenant_id: str, kb_id: str) -> str:
+        """Name of the collection holding a tenant's knowledge base.
+
+        Each tenant's collections live under a `<tenant>.` prefix, so a
+        knowledge base id from another tenant never names one of them. The
+        default tenant keeps bare ids, so existing collections stay in place.
+        """
+        return kb_id if tenant_id == DEFAULT_TENANT else f"{tenant_id}.{kb_id}"
+
+    @staticmethod
+    def collection_of(kb: dict) -> str:
+        """Name of the collection a knowledge base record is currently searched in.
+
+        A reindex (see app.reindex) moves a knowledge base to a new collection
+        and records its name; other knowledge bases are in `collection_for`'s.
+        """
+        return kb.get("collection") or VectorStoreBackend.collection_for(kb.get("tenant_id", DEFAULT_TENANT), kb["id"])
+
+    @property
+    def embeddings(self) -> Embeddings:
+        """Embedding model of collections created without one (OLLAMA_EMBEDDING_MODEL)."""
+        return self.embeddings_for(None)
+
+    def embeddings_for(self, model: str | None) -> Embeddings:
+        """Embeddings of the named model; None is OLLAMA_EMBEDDING_MODEL."""
+        return get_embeddings(model)
+
+    def collection_model(self, collection_name: str) -> str | None:
+        """Embedding model the collection was created with; None when it did not record one.
+
+        Stores returned by `get_store` embed documents and queries with it.
+        """
+        return None
+
     @abstractmethod
     def get_store(self, collection_name: str) -> VectorStore:
         """Return a VectorStore instance for the given collection."""
 
+    def create_collection(
+        self, collection_name: str, quantization: str = "none", embedding_model: str | None = None
+    ) -> None:
+        """Create a collection up front with the given vector storage mode and embedding model.
+
+        Collections are otherwise created lazily on first write, for the
+        configured embedding model. Backends that cannot store quantized
+        vectors reject any mode other than "none"; backends that cannot record
+        a model use the configured one.
+        """
+        if quantization != "none":
+            raise ValueError(f"{type(self).__name__} does not support vector quantization")
+
     @abstractmethod
     def delete_collection(self, collection_name: str) -> None:
-        """Delete a collection and all its data."""
+        """Delete a collection and all its data; raise CollectionNotFoundError if it does not exist."""
 
     @abstractmethod
     def list_collections(self) -> list[str]:
         """Return names of all existing collections."""
+
+    @abstractmethod
+    def translate_filter(self, metadata_filter: RetrievalFilter) -> Any:
+        """Return the native filter expression passed as `filter=` to the store's search methods.
+
+        Returns None when the filter matches every document.
+        """
+
+    def search(
+        self, collection_name: str, query: str, k: int, where: Any = None
+    ) -> list[tuple[Document, float]]:
+        """Similarity search with scores, optionally restricted by a native filter."""
+        store = self.get_store(collection_name)
+        if where is None:
+            return store.similarity_search_with_score(query, k=k)
+        return store.similarity_search_with_score(query, k=k, filter=where)
+
+    @abstractmethod
+    def search_by_vector(
+        self, collection_name: str, embedding: list[float], k: int, where: Any = None
+    ) -> list[tuple[Document, float]]:
+        """Like `search`, but with a precomputed query embedding."""
+
+    def search_ids(
+        self, collection_name: str, embedding: list[float], k: int, where: Any = None
+    ) -> list[tuple[str, float]]:
+        """Like `search_by_vector`, but only the ids of the hits, so a large k reads no documents."""
+        return [(doc.id, score) for doc, score in self.search_by_vector(collection_name, embedding, k, where)]
+
+    def get_documents(self, collection_name: str, ids: list[str]) -> list[Document]:
+        """Stored documents by id, in the order of `ids`; ids that are not stored are left out."""
+        found = {doc.id: doc for doc in self.get_store(collection_name).get_by_ids(ids)}
+        return [found[i] for i in ids if i in found]
+
+    def add(self, collection_name: str, documents: list[Document]) -> list[str]:
+        """Embed and store documents, returning their ids."""
+        return self.get_store(collection_name).add_documents(documents)
+
+    def existing_ids(self, collection_name: str, ids: list[str]) -> set[str]:
+        """The subset of `ids` stored in the collection."""
+        return {doc.id for doc in self.get_store(collection_name).get_by_ids(ids)}
+
+    def delete_documents(self, collection_name: str, ids: list[str]) -> None:
+        """Delete documents by id; ids that are not stored are ignored."""
+        self.get_store(collection_name).delete(ids=ids)
+
+    # --- Bulk transfer ---
+    #
+    # Snapshots (see app.rag.snapshot) move documents with their embeddings,
+    # so nothing is embedded again.
+
+    @abstractmethod
+    def iter_rows(self, collection_name: str, batch_size: int) -> Iterator[StoredRows]:
+        """Yield the collection's documents with their embeddings, in batches of up to `batch_size`."""
+
+    @abstractmethod
+    def add_rows(self, collection_name: str, rows: StoredRows) -> None:
+        """Store documents with precomputed embeddings, replacing any with the same ids."""
+
+    # --- Maintenance ---
+    #
+    # Defaults suit backends that manage their own storage: nothing to compact
+    # and no size to report.
+
+    def dead_fraction(self, collection_name: str) -> float:
+        """Share of the collection's storage held by deleted or replaced documents."""
+        return 0.0
+
+    def compact_collection(self, collection_name: str) -> int:
+        """Rewrite the collection without deleted documents; return the bytes reclaimed."""
+        return 0
+
+    def storage_bytes(self) -> int | None:
+        """Bytes the backend stores on disk, or None when it cannot tell."""
+        return None
+
+    # --- Async counterparts ---
+
+    async def aget_store(self, collection_name: str) -> VectorStore:
+        return await asyncio.to_thread(self.get_store, collection_name)
+
+    async def acreate_collection(
+        self, collection_name: str, quantization: str = "none", embedding_model: str | None = None
+    ) -> None:
+        await asyncio.to_thread(self.create_collection, collection_name, quantization, embedding_model)
+
+    async def acollection_model(self, collection_name: str) -> str | None:
+        return await asyncio.to_thread(self.collection_model, collection_name)
+
+    async def adelete_collection(self, collection_name: str) -> None:
+        await asyncio.to_thread(self.delete_collection, collection_name)
+
+    async def alist_collections(self) -> list[str]:
+        return await asyncio.to_thread(self.list_collections)
+
+    async def asearch(
+        self, collection_name: str, query: str, k: int, where: Any = None
+    ) -> list[tuple[Document, float]]:
+        return await asyncio.to_thread(self.search, collection_name, query, k, where)
+
+    async def asearch_by_vector(
+        self, collection_name: str, embedding: list[float], k: int, where: Any = None
+    ) -> list[tuple[Document, float]]:
+        return await asyncio.to_thread(self.search_by_vector, collection_name, embedding, k, where)
+
+    async def asearch_ids(
+        self, collection_name: str, embedding: list[float], k: int, where: Any = None
+    ) -> list[tuple[str, float]]:
+        return await asyncio.to_thread(self.search_ids, collection_name, embedding, k, where)
+
+    async def aget_documents(self, collection_name: str, ids: list[str]) -> list[Document]:
+        return await asyncio.to_thread(self.get_documents, collection_name, ids)
+
+    async def aadd(self, collection_name: str, documents: list[Document]) -> list[str]:
+        return await asyncio.to_thread(self.add, collection_name, documents)
+
+    async def aadd_rows(self, collection_name: str, rows: StoredRows) -> None:
+        await asyncio.to_thread(self.add_rows, collection_name, rows)
+
+    async def aexisting_ids(self, collection_name: str, ids: list[str]) -> set[str]:
+        return await asyncio.to_thread(self.existing_ids, collection_name, ids)
+
+    async def adelete_documents(self, collection_name: str, ids: list[str]) -> None:
+        await asyncio.to_thread(self.delete_documents, collection_name, ids)
@@ -1,26 +1,111 @@
+from collections.abc import Iterator
+from pathlib import Path
+
 import chromadb
+import numpy as np
+from chromadb.errors import NotFoundError
 from langchain_chroma import Chroma
+from langchain_core.documents import Document
 from langchain_core.vectorstores import VectorStore
 
 from app.config import settings
-from app.rag.embeddings import get_embeddings
+from app.models import RetrievalFilter
 
-from .base import VectorStoreBackend
+from .base import CollectionNotFoundError, StoredRows, VectorStoreBackend
+from .filters import build_where
 
 
 class ChromaVectorStoreBackend(VectorStoreBackend):
     def __init__(self) -> None:
         self._client = chromadb.PersistentClient(path=settings.CHROMA_PERSIST_DIR)
+        # Embedding model per existing collection, from its metadata; it never changes once created.
+        self._models: dict[str, str | None] = {}
+
+    def collection_model(self, collection_name: str) -> str | None:
+        if collection_name not in self._models:
+            try:
+                metadata = self._client.get_collection(name=collection_name, embedding_function=None).metadata
+            except NotFoundError:
+                return None
+            self._models[collection_name] = (metadata or {}).get("embedding_model")
+        return self._models[collection_name]
 
     def get_store(self, collection_name: str) -> VectorStore:
         return Chroma(
             client=self._client,
             collection_name=collection_name,
-            embedding_function=get_embeddings(),
+            embedding_function=self.embeddings_for(self.collection_model(collection_name)),
+        )
+
+    def create_collection(
+        self, collection_name: str, quantization: str = "none", embedding_model: str | None = None
+    ) -> None:
+        super().create_collection(collection_name, quantization, embedding_model)
+        if embedding_model is not None:
+            self._client.get_or_create_collection(
+                name=collection_name, metadata={"embedding_model": embedding_model}, embedding_function=None
+            )
+
+    def search_by_vector(
+        self, collection_name: str, embedding: list[float], k: int, where: dict | None = None
+    ) -> list[tuple[Document, float]]:
+        # Despite its name, this returns raw distances, like similarity_search_with_score.
+        store = self.get_store(collection_name)
+        return store.similarity_search_by_vector_with_relevance_scores(embedding, k=k, filter=where)
+
+    def search_ids(
+        self, collection_name: str, embedding: list[float], k: int, where: dict | None = None
+    ) -> list[tuple[str, float]]:
+        try:
+            collection = self._client.get_collection(name=collection_name, embedding_function=None)
+        except NotFoundError:
+            return []
+        found = collection.query(query_embeddings=[embedding], n_results=k, where=where, include=["distances"])
+        return list(zip(found["ids"][0], found["distances"][0]))
+
+    def existing_ids(self, collection_name: str, ids: list[str]) -> set[str]:
+        if not ids:
+            return set()
+        return set(self.get_store(collection_name).get(ids=ids, include=[])["ids"])
+
+    def iter_rows(self, collection_name: str, batch_size: int) -> Iterator[StoredRows]:
+        store = self.get_store(collection_name)
+        offset = 0
+        while True:
+            batch = store.get(limit=batch_size, offset=offset, include=["documents", "metadatas", "embeddings"])
+            if not batch["ids"]:
+                return
+            yield StoredRows(
+                ids=batch["ids"],
+                texts=batch["documents"],
+                metadatas=[m or {} for m in batch["metadatas"]],
+                vectors=np.asarray(batch["embeddings"], dtype=np.float32),
+            )
+            offset += len(batch["ids"])
+
+    def add_rows(self, collection_name: str, rows: StoredRows) -> None:
+        # The same collection settings Chroma() creates it with, minus an embedding function.
+        collection = self._client.get_or_create_collection(name=collection_name, embedding_function=None)
+        collection.upsert(
+            ids=rows.ids,
+            documents=rows.texts,
+            metadatas=[m or None for m in rows.metadatas],
+            embeddings=rows.vectors,
         )
 
     def delete_collection(self, collection_name: str) -> None:
-        self._client.delete_collection(name=collection_name)
+        self._models.pop(collection_name, None)
+        try:
+            self._client.delete_collection(name=collection_name)
+        except NotFoundError as e:
+            raise CollectionNotFoundError(str(e)) from e
+
+    def storage_bytes(self) -> int:
+        root = Path(settings.CHROMA_PERSIST_DIR)
+        return sum(path.stat().st_size for path in root.rglob("*") if path.is_file())
 
     def list_collections(self) -> list[str]:
         return [c.name for c in self._client.list_collections()]
+
+    def translate_filter(self, metadata_filter: RetrievalFilter) -> dict | None:
+        return build_where(metadata_filter)
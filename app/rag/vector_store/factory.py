@@ -12,4 +12,8 @@ def get_vector_store() -> VectorStoreBackend:
         from .chroma_backend import ChromaVectorStoreBackend
 
         return ChromaVectorStoreBackend()
+    if backend == "local":
+        from .local_backend import LocalVectorStoreBackend
+
+        return LocalVectorStoreBackend()
     raise ValueError(f"Unsupported vector store backend: {backend}")
@@ -0,0 +1,47 @@
+"""Translation of request-level retrieval filters into metadata `where` clauses.
+
+The clause format follows Chroma's metadata filter syntax (`$eq`, `$in`,
+`$gte`, `$lte`, `$and`), which backends either pass through natively or
+map onto their own index filters.
+"""
+
+from datetime import datetime, timezone
+
+from app.models import RetrievalFilter
+
+SOURCE_FILENAME_KEY = "source_filename"
+UPLOADED_AT_KEY = "uploaded_at"
+
+RESERVED_METADATA_KEYS = {SOURCE_FILENAME_KEY, UPLOADED_AT_KEY}
+
+
+def to_epoch(value: datetime) -> int:
+    """Convert a datetime to epoch seconds, treating naive values as UTC."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
+
+
+def build_where(metadata_filter: RetrievalFilter) -> dict | None:
+    """Build a `where` clause for the filter, or None if it matches everything."""
+    clauses: list[dict] = []
+
+    source = metadata_filter.source_filename
+    if isinstance(source, list):
+        clauses.append({SOURCE_FILENAME_KEY: {"$in": source}})
+    elif source is not None:
+        clauses.append({SOURCE_FILENAME_KEY: {"$eq": source}})
+
+    if metadata_filter.uploaded_after is not None:
+        clauses.append({UPLOADED_AT_KEY: {"$gte": to_epoch(metadata_filter.uploaded_after)}})
+    if metadata_filter.uploaded_before is not None:
+        clauses.append({UPLOADED_AT_KEY: {"$lte": to_epoch(metadata_filter.uploaded_before)}})
+
+    for key, value in (metadata_filter.metadata or {}).items():
+        clauses.append({key: {"$eq": value}})
+
+    if not clauses:
+        return None
+    if len(clauses) == 1:
+        return clauses[0]
+    return {"$and": clauses}
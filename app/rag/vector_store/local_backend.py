@@ -0,0 +1,706 @@
+"""In-process vector store backed by memory-mapped float32 arrays."""
+
+import json
+import os
+import re
+import shutil
+import threading
+import uuid
+from collections.abc import Iterable, Iterator, Sequence
+from contextlib import contextmanager
+from dataclasses import dataclass, field, replace
+from functools import reduce
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from app.config import settings
+from app.models import RetrievalFilter
+from app.rag.embeddings import get_embeddings
+
+from .base import CollectionNotFoundError, StoredRows, VectorStoreBackend
+from .filters import build_where
+from .quantization import QUANTIZATION_MODES, make_quantizer
+
+try:
+    import hnswlib
+except ImportError:  # pragma: no cover - optional dependency
+    hnswlib = None
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows: one writing process only
+    fcntl = None
+
+_COLLECTION_NAME = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]*$")
+
+# Present while compacted files are being swapped in; see `_Collection._finish_compaction`.
+_COMPACT_MARKER = "compacting"
+_COMPACTED_FILES = ("vectors.f32", "norms.f32", "meta.jsonl")
+# Codes are rebuilt from the compacted vectors on load (PQ keeps its codebooks).
+_CODE_FILES = ("codes.i8", "scales.f32", "codes.pq")
+# Rows copied per block while compacting, bounding the scratch memory.
+_COMPACT_BLOCK = 16384
+
+
+def _dir_bytes(path: Path) -> int:
+    return sum(p.stat().st_size for p in path.iterdir() if p.is_file()) if path.exists() else 0
+
+
+_RANGE_OPS = {
+    "$gt": np.greater,
+    "$gte": np.greater_equal,
+    "$lt": np.less,
+    "$lte": np.less_equal,
+}
+
+
+@dataclass(frozen=True)
+class _Snapshot:
+    """The rows of a collection as of one write.
+
+    Writers build the next snapshot beside the current one and publish it in a
+    single assignment, so a search that reads one snapshot sees ids, vectors,
+    norms and liveness that agree.
+    """
+
+    ids: list[str]
+    texts: list[str]
+    metadatas: list[dict]
+    row_of: dict[str, int]
+    live: np.ndarray
+    vectors: np.ndarray
+    sq_norms: np.ndarray
+    # Codes are only appended, so rows of this snapshot stay valid as later writes add more.
+    quantizer: Any = None
+    # Metadata columns built for filtering; a new snapshot starts without them.
+    columns: dict[tuple[str, bool], np.ndarray] = field(default_factory=dict, compare=False)
+
+    @classmethod
+    def empty(cls, dim: int = 0, quantizer: Any = None) -> "_Snapshot":
+        return cls(
+            ids=[],
+            texts=[],
+            metadatas=[],
+            row_of={},
+            live=np.zeros(0, dtype=bool),
+            vectors=np.zeros((0, dim), dtype=np.float32),
+            sq_norms=np.zeros(0, dtype=np.float32),
+            quantizer=quantizer,
+        )
+
+    def documents(self, rows: Iterable[int]) -> list[Document]:
+        return [Document(id=self.ids[r], page_content=self.texts[r], metadata=self.metadatas[r]) for r in rows]
+
+
+class _Collection:
+    """On-disk state and search for a single collection."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self.dim: int | None = None
+        self.quantization = "none"
+        self.embedding_model: str | None = None
+        self.snapshot = _Snapshot.empty()
+        self._ann = None
+        self._version: tuple | None = None
+        with self._file_lock() as lock:
+            # Exclusive only while an interrupted compaction is finished: it renames files.
+            self._finish_compaction()
+            if lock is not None:
+                fcntl.flock(lock, fcntl.LOCK_SH)
+            self._load()
+
+    @property
+    def _manifest_path(self) -> Path:
+        return self.path / "manifest.json"
+
+    @property
+    def _vectors_path(self) -> Path:
+        return self.path / "vectors.f32"
+
+    @property
+    def _meta_path(self) -> Path:
+        return self.path / "meta.jsonl"
+
+    @property
+    def _norms_path(self) -> Path:
+        return self.path / "norms.f32"
+
+    @property
+    def resident_bytes(self) -> int:
+        """Bytes of vector data held in memory for search, excluding the memory-mapped vectors."""
+        snapshot = self.snapshot
+        quantized = snapshot.quantizer.nbytes if snapshot.quantizer is not None else 0
+        return snapshot.sq_norms.nbytes + quantized
+
+    def _disk_version(self) -> tuple:
+        """Size and mtime of the manifest and sidecar; any write by any process changes it."""
+        version = []
+        for path in (self._manifest_path, self._meta_path):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                version.append(None)
+            else:
+                version.append((stat.st_size, stat.st_mtime_ns))
+        return tuple(version)
+
+    @property
+    def stale(self) -> bool:
+        """Whether another process has written to the collection since it was loaded."""
+        return self._disk_version() != self._version
+
+    @contextmanager
+    def _file_lock(self):
+        """Hold the collection's lock file exclusively; yields it, or None when there is nothing to lock."""
+        if fcntl is None or not self.path.exists():
+            yield None
+            return
+        with (self.path / ".lock").open("a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield f
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    @contextmanager
+    def _writing(self):
+        with self._lock, self._file_lock():
+            if self.stale:
+                # Another process wrote after the backend last checked; catch up before writing.
+                self._finish_compaction()
+                self._load()
+            yield
+            self._version = self._disk_version()
+
+    def _write_manifest(self) -> None:
+        self.path.mkdir(parents=True, exist_ok=True)
+        manifest = {"dim": self.dim, "quantization": self.quantization, "embedding_model": self.embedding_model}
+        self._manifest_path.write_text(json.dumps(manifest))
+
+    def _load(self) -> None:
+        self._version = self._disk_version()
+        self._ann = None
+        manifest = json.loads(self._manifest_path.read_text()) if self._manifest_path.exists() else {}
+        self.dim = manifest.get("dim")
+        self.quantization = manifest.get("quantization", "none")
+        self.embedding_model = manifest.get("embedding_model")
+        if self.dim is None:
+            self.snapshot = _Snapshot.empty()
+            return
+        ids: list[str] = []
+        texts: list[str] = []
+        metadatas: list[dict] = []
+        row_of: dict[str, int] = {}
+        live: list[bool] = []
+        if self._meta_path.exists():
+            with self._meta_path.open(encoding="utf-8") as f:
+                for line in f:
+                    record = json.loads(line)
+                    if "d" in record:
+                        row = row_of.pop(record["d"], None)
+                        if row is not None:
+                            live[row] = False
+                        continue
+                    row_of[record["i"]] = len(ids)
+                    ids.append(record["i"])
+                    texts.append(record["t"])
+                    metadatas.append(record["m"])
+                    live.append(True)
+        # Drop vector bytes left behind by a write that never reached the sidecar.
+        expected = len(ids) * self.dim * 4
+        if self._vectors_path.exists() and self._vectors_path.stat().st_size > expected:
+            with self._vectors_path.open("r+b") as f:
+                f.truncate(expected)
+        vectors = self._map_vectors(len(ids))
+        if self._norms_path.exists() and self._norms_path.stat().st_size == len(ids) * 4:
+            sq_norms = np.fromfile(self._norms_path, dtype=np.float32)
+        else:
+            sq_norms = np.einsum("ij,ij->i", vectors, vectors)
+            self._norms_path.write_bytes(sq_norms.tobytes())
+        quantizer = make_quantizer(self.quantization, self.path, self.dim)
+        if quantizer is not None:
+            quantizer.load(vectors)
+        self.snapshot = _Snapshot(
+            ids, texts, metadatas, row_of, np.array(live, dtype=bool), vectors, sq_norms, quantizer
+        )
+
+    def _map_vectors(self, rows: int) -> np.ndarray:
+        if rows == 0:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        return np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+
+    # --- Writes ---
+
+    def configure(self, quantization: str, embedding_model: str | None = None) -> None:
+        if quantization not in QUANTIZATION_MODES:
+            raise ValueError(f"Unsupported vector quantization: {quantization}")
+        self.path.mkdir(parents=True, exist_ok=True)
+        with self._writing():
+            if self.snapshot.ids:
+                raise ValueError("Quantization can only be chosen for an empty collection")
+            self.quantization = quantization
+            self.embedding_model = embedding_model
+            self._write_manifest()
+
+    def upsert(self, ids: list[str], texts: list[str], metadatas: list[dict], vectors: np.ndarray) -> None:
+        if len(ids) == 0:
+            return
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if len(set(ids)) < len(ids):
+            # An id given twice keeps its last occurrence, as two upserts in a row would.
+            keep = sorted({chunk_id: n for n, chunk_id in enumerate(ids)}.values())
+            ids = [ids[n] for n in keep]
+            texts = [texts[n] for n in keep]
+            metadatas = [metadatas[n] for n in keep]
+            vectors = vectors[keep]
+        self.path.mkdir(parents=True, exist_ok=True)
+        with self._writing():
+            current = self.snapshot
+            quantizer = current.quantizer
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+                self._write_manifest()
+                quantizer = make_quantizer(self.quantization, self.path, self.dim)
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match collection dimension {self.dim}")
+
+            replaced = [current.row_of[i] for i in ids if i in current.row_of]
+            lines = [json.dumps({"d": current.ids[row]}) for row in replaced]
+            lines += [
+                json.dumps({"i": i, "t": t, "m": m}, separators=(",", ":"))
+                for i, t, m in zip(ids, texts, metadatas)
+            ]
+
+            # Vectors first: a crash before the sidecar write leaves only a
+            # trailing tail that `_load` truncates.
+            with self._vectors_path.open("ab") as f:
+                f.write(vectors.tobytes())
+            with self._meta_path.open("a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+            norms = np.einsum("ij,ij->i", vectors, vectors)
+            with self._norms_path.open("ab") as f:
+                f.write(norms.tobytes())
+
+            start = len(current.ids)
+            live = np.concatenate([current.live, np.ones(len(ids), dtype=bool)])
+            live[replaced] = False
+            row_of = dict(current.row_of)
+            row_of.update((i, start + offset) for offset, i in enumerate(ids))
+            if quantizer is not None:
+                # Before publishing: codes must cover every row of a published snapshot.
+                quantizer.add(vectors)
+            self.snapshot = _Snapshot(
+                ids=current.ids + list(ids),
+                texts=current.texts + list(texts),
+                metadatas=current.metadatas + list(metadatas),
+                row_of=row_of,
+                live=live,
+                vectors=self._map_vectors(start + len(ids)),
+                sq_norms=np.concatenate([current.sq_norms, norms]),
+                quantizer=quantizer,
+            )
+            if quantizer is not None:
+                quantizer.prepare(self.snapshot.vectors, live)
+            if self._ann is not None:
+                self._ann_add(np.arange(start, start + len(ids)), vectors, replaced)
+
+    def delete(self, ids: Iterable[str]) -> None:
+        with self._writing():
+            current = self.snapshot
+            row_of = dict(current.row_of)
+            rows = [row_of.pop(i) for i in ids if i in row_of]
+            if not rows:
+                return
+            with self._meta_path.open("a", encoding="utf-8") as f:
+                f.write("\n".join(json.dumps({"d": current.ids[row]}) for row in rows) + "\n")
+            live = current.live.copy()
+            live[rows] = False
+            self.snapshot = replace(current, row_of=row_of, live=live)
+            if self._ann is not None:
+                for row in rows:
+                    self._ann.mark_deleted(row)
+
+    @property
+    def dead_fraction(self) -> float:
+        """Share of stored rows that are deleted or replaced."""
+        snapshot = self.snapshot
+        return 1.0 - int(np.count_nonzero(snapshot.live)) / len(snapshot.ids) if snapshot.ids else 0.0
+
+    def compact(self) -> int:
+        """Rewrite the collection without its dead rows and return the bytes reclaimed.
+
+        Files are replaced, not edited, and this instance is left stale: the
+        backend loads the compacted collection afresh, while searches already
+        running finish on this one.
+        """
+        with self._lock, self._file_lock():
+            if self.stale:
+                self._finish_compaction()
+                self._load()
+            snapshot = self.snapshot
+            rows = np.flatnonzero(snapshot.live)
+            if self.dim is None or len(rows) == len(snapshot.ids):
+                return 0
+            before = _dir_bytes(self.path)
+            with (self.path / "vectors.f32.compact").open("wb") as f:
+                for start in range(0, len(rows), _COMPACT_BLOCK):
+                    f.write(np.ascontiguousarray(snapshot.vectors[rows[start:start + _COMPACT_BLOCK]]).tobytes())
+            (self.path / "norms.f32.compact").write_bytes(snapshot.sq_norms[rows].tobytes())
+            with (self.path / "meta.jsonl.compact").open("w", encoding="utf-8") as f:
+                for row in rows:
+                    record = {"i": snapshot.ids[row], "t": snapshot.texts[row], "m": snapshot.metadatas[row]}
+                    f.write(json.dumps(record, separators=(",", ":")) + "\n")
+            (self.path / _COMPACT_MARKER).touch()
+            self._finish_compaction()
+            self._version = None
+            return before - _dir_bytes(self.path)
+
+    def _finish_compaction(self) -> None:
+        """Swap in staged compacted files once they are complete; drop them otherwise."""
+        marker = self.path / _COMPACT_MARKER
+        staged = [self.path / f"{name}.compact" for name in _COMPACTED_FILES]
+        if not marker.exists():
+            for path in staged:
+                path.unlink(missing_ok=True)
+            return
+        for name, path in zip(_COMPACTED_FILES, staged):
+            if path.exists():
+                os.replace(path, self.path / name)
+        for name in _CODE_FILES:
+            (self.path / name).unlink(missing_ok=True)
+        marker.unlink(missing_ok=True)
+
+    # --- Reads ---
+
+    def rows(self, batch_size: int) -> Iterator[StoredRows]:
+        """Live rows with their vectors, as of the call."""
+        snapshot = self.snapshot
+        live = np.flatnonzero(snapshot.live)
+        for start in range(0, len(live), batch_size):
+            part = live[start:start + batch_size]
+            yield StoredRows(
+                ids=[snapshot.ids[row] for row in part],
+                texts=[snapshot.texts[row] for row in part],
+                metadatas=[snapshot.metadatas[row] for row in part],
+                vectors=np.asarray(snapshot.vectors[part]),
+            )
+
+    def search(
+        self, query: np.ndarray, k: int, where: dict | None = None, snapshot: _Snapshot | None = None
+    ) -> list[tuple[int, float]]:
+        """Return (row, squared L2 distance) pairs for the k nearest live rows matching `where`.
+
+        Rows index `snapshot`, the current one unless given.
+        """
+        snapshot = snapshot or self.snapshot
+        if not snapshot.ids or k <= 0:
+            return []
+        query = np.asarray(query, dtype=np.float32)
+        mask = snapshot.live if where is None else snapshot.live & self.where_mask(where, snapshot)
+        candidates = int(np.count_nonzero(mask))
+        if candidates == 0:
+            return []
+        if snapshot.quantizer is not None:
+            if snapshot.quantizer.ready:
+                return self._quantized_search(snapshot, query, k, mask)
+            return self._exact_search(snapshot, query, k, mask)
+        if hnswlib is not None and candidates >= settings.LOCAL_ANN_THRESHOLD:
+            try:
+                return self._ann_search(snapshot, query, min(k, candidates), mask if where is not None else None)
+            except RuntimeError:
+                pass  # hnswlib could not fill k results under the filter; fall back to exact
+        return self._exact_search(snapshot, query, k, mask)
+
+    def _exact_search(
+        self, snapshot: _Snapshot, query: np.ndarray, k: int, mask: np.ndarray
+    ) -> list[tuple[int, float]]:
+        vectors, sq_norms = snapshot.vectors, snapshot.sq_norms
+        rows = None if mask.all() else np.flatnonzero(mask)
+        if rows is not None:
+            vectors, sq_norms = vectors[rows], sq_norms[rows]
+        distances = sq_norms - 2.0 * (vectors @ query) + float(query @ query)
+        k = min(k, len(distances))
+        top = np.argpartition(distances, k - 1)[:k]
+        top = top[np.argsort(distances[top])]
+        selected = top if rows is None else rows[top]
+        return [(int(row), max(float(distances[i]), 0.0)) for row, i in zip(selected, top)]
+
+    def _quantized_search(
+        self, snapshot: _Snapshot, query: np.ndarray, k: int, mask: np.ndarray
+    ) -> list[tuple[int, float]]:
+        count = len(snapshot.ids)
+        rows = None if mask.all() else np.flatnonzero(mask)
+        sq_norms = snapshot.sq_norms if rows is None else snapshot.sq_norms[rows]
+        # The query norm is constant across rows, so it is left out of the first-stage ranking.
+        approximate = sq_norms - 2.0 * snapshot.quantizer.inner_products(query, rows, count)
+        shortlist = min(len(approximate), k * settings.VECTOR_RESCORE_FACTOR)
+        candidates = np.argpartition(approximate, shortlist - 1)[:shortlist]
+        candidates = np.sort(candidates if rows is None else rows[candidates])
+        rescore_mask = np.zeros(count, dtype=bool)
+        rescore_mask[candidates] = True
+        return self._exact_search(snapshot, query, k, rescore_mask)
+
+    # --- Metadata filtering ---
+
+    def where_mask(self, where: dict, snapshot: _Snapshot | None = None) -> np.ndarray:
+        """Evaluate a Chroma-style `where` clause over all rows of `snapshot` as a boolean mask."""
+        snapshot = snapshot or self.snapshot
+        if "$and" in where:
+            return reduce(np.logical_and, (self.where_mask(c, snapshot) for c in where["$and"]))
+        if "$or" in where:
+            return reduce(np.logical_or, (self.where_mask(c, snapshot) for c in where["$or"]))
+        masks = []
+        for key, condition in where.items():
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+            for op, value in condition.items():
+                masks.append(_condition_mask(snapshot, key, op, value))
+        return reduce(np.logical_and, masks)
+
+    # --- Approximate search ---
+
+    def _ann_search(
+        self, snapshot: _Snapshot, query: np.ndarray, k: int, mask: np.ndarray | None
+    ) -> list[tuple[int, float]]:
+        index = self._ensure_ann()
+        index.set_ef(max(settings.LOCAL_ANN_EF, k))
+        # The index may already hold rows written after `snapshot`; they are skipped.
+        count = len(snapshot.ids)
+        filter_fn = None if mask is None else (lambda row: row < count and bool(mask[row]))
+        labels, distances = index.knn_query(query, k=k, filter=filter_fn)
+        return [(int(row), float(d)) for row, d in zip(labels[0], distances[0]) if row < count]
+
+    def _ensure_ann(self):
+        index = self._ann
+        if index is None:
+            with self._lock:
+                if self._ann is None:
+                    # Built under the write lock from the latest rows, so later writes extend it in order.
+                    snapshot = self.snapshot
+                    rows = np.flatnonzero(snapshot.live)
+                    index = hnswlib.Index(space="l2", dim=self.dim)
+                    index.init_index(max_elements=max(2 * len(snapshot.ids), 1024), ef_construction=200, M=16)
+                    index.add_items(snapshot.vectors[rows], rows)
+                    self._ann = index
+                index = self._ann
+        return index
+
+    def _ann_add(self, rows: np.ndarray, vectors: np.ndarray, replaced: list[int]) -> None:
+        if len(self.snapshot.ids) > self._ann.get_max_elements():
+            # Resizing is unsafe while other threads query the index; the next search builds a larger one.
+            self._ann = None
+            return
+        self._ann.add_items(vectors, rows)
+        for row in replaced:
+            self._ann.mark_deleted(row)
+
+
+def _condition_mask(snapshot: _Snapshot, key: str, op: str, value: Any) -> np.ndarray:
+    if op in _RANGE_OPS:
+        return _RANGE_OPS[op](_column(snapshot, key, numeric=True), value)
+    column = _column(snapshot, key, numeric=False)
+    if op == "$eq":
+        return column == value
+    if op == "$ne":
+        return column != value
+    if op in ("$in", "$nin"):
+        values = set(value)
+        mask = np.fromiter((v in values for v in column), dtype=bool, count=len(column))
+        return mask if op == "$in" else ~mask
+    raise ValueError(f"Unsupported filter operator: {op}")
+
+
+def _column(snapshot: _Snapshot, key: str, numeric: bool) -> np.ndarray:
+    column = snapshot.columns.get((key, numeric))
+    if column is None:
+        values = [m.get(key) for m in snapshot.metadatas]
+        if numeric:
+            column = np.array(
+                [v if isinstance(v, (int, float)) and not isinstance(v, bool) else np.nan for v in values],
+                dtype=np.float64,
+            )
+        else:
+            column = np.empty(len(values), dtype=object)
+            column[:] = values
+        snapshot.columns[(key, numeric)] = column
+    return column
+
+
+class LocalVectorStore(VectorStore):
+    """LangChain VectorStore view over a local memory-mapped collection."""
+
+    def __init__(self, collection: _Collection, embedding: Embeddings) -> None:
+        self._collection = collection
+        self._embedding = embedding
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: list[dict] | None = None,
+        ids: list[str] | None = None,
+        **kwargs: Any,
+    ) -> list[str]:
+        texts = list(texts)
+        ids = [i or str(uuid.uuid4()) for i in ids] if ids else [str(uuid.uuid4()) for _ in texts]
+        metadatas = metadatas or [{} for _ in texts]
+        vectors = np.asarray(self._embedding.embed_documents(texts), dtype=np.float32)
+        self._collection.upsert(ids, texts, metadatas, vectors)
+        return ids
+
+    def delete(self, ids: list[str] | None = None, **kwargs: Any) -> None:
+        if ids:
+            self._collection.delete(ids)
+
+    def get_by_ids(self, ids: Sequence[str], /) -> list[Document]:
+        snapshot = self._collection.snapshot
+        return snapshot.documents(snapshot.row_of[i] for i in ids if i in snapshot.row_of)
+
+    def similarity_search_by_vector_with_score(
+        self, embedding: list[float], k: int = 4, filter: dict | None = None, **kwargs: Any
+    ) -> list[tuple[Document, float]]:
+        snapshot = self._collection.snapshot
+        hits = self._collection.search(np.asarray(embedding, dtype=np.float32), k, filter, snapshot)
+        docs = snapshot.documents(row for row, _ in hits)
+        return [(doc, distance) for doc, (_, distance) in zip(docs, hits)]
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, filter: dict | None = None, **kwargs: Any
+    ) -> list[tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(self._embedding.embed_query(query), k, filter)
+
+    def similarity_search_by_vector(
+        self, embedding: list[float], k: int = 4, filter: dict | None = None, **kwargs: Any
+    ) -> list[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k, filter)]
+
+    def similarity_search(self, query: str, k: int = 4, filter: dict | None = None, **kwargs: Any) -> list[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter)]
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: list[str],
+        embedding: Embeddings,
+        metadatas: list[dict] | None = None,
+        *,
+        ids: list[str] | None = None,
+        collection_dir: str | None = None,
+        **kwargs: Any,
+    ) -> "LocalVectorStore":
+        if collection_dir is None:
+            raise ValueError("collection_dir is required")
+        store = cls(_Collection(Path(collection_dir)), embedding)
+        store.add_texts(texts, metadatas, ids=ids)
+        return store
+
+
+class LocalVectorStoreBackend(VectorStoreBackend):
+    def __init__(self, root: str | None = None, embeddings: Embeddings | None = None) -> None:
+        self._root = Path(root or settings.LOCAL_VECTOR_DIR)
+        self._embeddings = embeddings
+        self._collections: dict[str, _Collection] = {}
+        self._lock = threading.Lock()
+
+    def _path(self, collection_name: str) -> Path:
+        if not _COLLECTION_NAME.match(collection_name):
+            raise ValueError(f"Invalid collection name: {collection_name}")
+        return self._root / collection_name
+
+    def _collection(self, collection_name: str) -> _Collection:
+        collection = self._collections.get(collection_name)
+        if collection is None or collection.stale:
+            with self._lock:
+                current = self._collections.get(collection_name)
+                if current is collection:
+                    # Searches already running keep the old instance.
+                    current = _Collection(self._path(collection_name))
+                    self._collections[collection_name] = current
+                collection = current
+        return collection
+
+    def embeddings_for(self, model: str | None) -> Embeddings:
+        return self._embeddings or get_embeddings(model)
+
+    def collection_model(self, collection_name: str) -> str | None:
+        return self._collection(collection_name).embedding_model
+
+    def get_store(self, collection_name: str) -> VectorStore:
+        collection = self._collection(collection_name)
+        return LocalVectorStore(collection, self.embeddings_for(collection.embedding_model))
+
+    def search_by_vector(
+        self, collection_name: str, embedding: list[float], k: int, where: dict | None = None
+    ) -> list[tuple[Document, float]]:
+        return self.get_store(collection_name).similarity_search_by_vector_with_score(embedding, k, where)
+
+    def search_ids(
+        self, collection_name: str, embedding: list[float], k: int, where: dict | None = None
+    ) -> list[tuple[str, float]]:
+        collection = self._collection(collection_name)
+        snapshot = collection.snapshot
+        hits = collection.search(np.asarray(embedding, dtype=np.float32), k, where, snapshot)
+        return [(snapshot.ids[row], distance) for row, distance in hits]
+
+    def create_collection(
+        self, collection_name: str, quantization: str = "none", embedding_model: str | None = None
+    ) -> None:
+        self._collection(collection_name).configure(quantization, embedding_model)
+
+    def delete_collection(self, collection_name: str) -> None:
+        path = self._path(collection_name)
+        with self._lock:
+            self._collections.pop(collection_name, None)
+            if not path.exists():
+                raise CollectionNotFoundError(f"Collection {collection_name} does not exist")
+            shutil.rmtree(path)
+
+    def iter_rows(self, collection_name: str, batch_size: int) -> Iterator[StoredRows]:
+        if not self._path(collection_name).exists():
+            return
+        yield from self._collection(collection_name).rows(batch_size)
+
+    def add_rows(self, collection_name: str, rows: StoredRows) -> None:
+        self._collection(collection_name).upsert(rows.ids, rows.texts, rows.metadatas, rows.vectors)
+
+    def existing_ids(self, collection_name: str, ids: list[str]) -> set[str]:
+        row_of = self._collection(collection_name).snapshot.row_of
+        return {i for i in ids if i in row_of}
+
+    def delete_documents(self, collection_name: str, ids: list[str]) -> None:
+        if self._path(collection_name).exists():
+            self._collection(collection_name).delete(ids)
+
+    def dead_fraction(self, collection_name: str) -> float:
+        return self._collection(collection_name).dead_fraction
+
+    def compact_collection(self, collection_name: str) -> int:
+        reclaimed = self._collection(collection_name).compact()
+        if reclaimed:
+            with self._lock:
+                # Later lookups load the compacted files; searches already running keep the old instance.
+                self._collections.pop(collection_name, None)
+        return reclaimed
+
+    def storage_bytes(self) -> int:
+        if not self._root.exists():
+            return 0
+        return sum(_dir_bytes(path) for path in self._root.iterdir() if path.is_dir())
+
+    def list_collections(self) -> list[str]:
+        if not self._root.exists():
+            return []
+        return sorted(p.name for p in self._root.iterdir() if (p / "manifest.json").exists())
+
+    def translate_filter(self, metadata_filter: RetrievalFilter) -> dict | None:
+        return build_where(metadata_filter)
@@ -0,0 +1,191 @@
+"""Compressed vector codes for first-stage search in the local backend.
+
+Quantizers keep compact codes resident in memory and approximate the inner
+product between a query and every stored vector. The local backend ranks
+candidates with these approximations and rescores the best
+`k * VECTOR_RESCORE_FACTOR` of them against the full-precision vectors,
+which stay on disk behind a memory map and are only paged in for the
+rescored rows.
+
+- `int8`: per-vector symmetric scalar quantization, `dim` bytes per vector.
+- `pq`: product quantization with 256 centroids per sub-space, one byte per
+  sub-space. Codebooks are trained once the collection reaches
+  `VECTOR_PQ_TRAIN_MIN` vectors; until then search falls back to exact.
+"""
+
+from pathlib import Path
+
+import numpy as np
+
+from app.config import settings
+
+QUANTIZATION_MODES = ("none", "int8", "pq")
+
+# Rows per block when decoding codes, bounding the float32 scratch space per query.
+_BLOCK = 16384
+
+
+def _append(path: Path, array: np.ndarray) -> None:
+    with path.open("ab") as f:
+        f.write(np.ascontiguousarray(array).tobytes())
+
+
+class Int8Quantizer:
+    def __init__(self, path: Path, dim: int) -> None:
+        self._codes_path = path / "codes.i8"
+        self._scales_path = path / "scales.f32"
+        self.dim = dim
+        self.codes = np.zeros((0, dim), dtype=np.int8)
+        self.scales = np.zeros(0, dtype=np.float32)
+
+    @property
+    def ready(self) -> bool:
+        return True
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + self.scales.nbytes
+
+    @staticmethod
+    def _encode(vectors: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+        return codes, scales.astype(np.float32)
+
+    def load(self, vectors: np.ndarray) -> None:
+        if self._codes_path.exists() and self._scales_path.exists():
+            codes = np.fromfile(self._codes_path, dtype=np.int8).reshape(-1, self.dim)
+            scales = np.fromfile(self._scales_path, dtype=np.float32)
+            if len(codes) == len(vectors) and len(scales) == len(vectors):
+                self.codes, self.scales = codes, scales
+                return
+        self._codes_path.unlink(missing_ok=True)
+        self._scales_path.unlink(missing_ok=True)
+        self.codes = np.zeros((0, self.dim), dtype=np.int8)
+        self.scales = np.zeros(0, dtype=np.float32)
+        for start in range(0, len(vectors), _BLOCK):
+            self.add(np.asarray(vectors[start:start + _BLOCK]))
+
+    def add(self, vectors: np.ndarray) -> None:
+        codes, scales = self._encode(vectors)
+        _append(self._codes_path, codes)
+        _append(self._scales_path, scales)
+        self.codes = np.concatenate([self.codes, codes])
+        self.scales = np.concatenate([self.scales, scales])
+
+    def prepare(self, vectors: np.ndarray, live: np.ndarray) -> None:
+        """Int8 codes need no training."""
+
+    def inner_products(self, query: np.ndarray, rows: np.ndarray | None, count: int) -> np.ndarray:
+        codes, scales = self.codes[:count], self.scales[:count]
+        if rows is not None:
+            codes, scales = codes[rows], scales[rows]
+        out = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), _BLOCK):
+            out[start:start + _BLOCK] = codes[start:start + _BLOCK].astype(np.float32) @ query
+        return out * scales
+
+
+class ProductQuantizer:
+    def __init__(self, path: Path, dim: int) -> None:
+        self._codebooks_path = path / "pq_codebooks.npy"
+        self._codes_path = path / "codes.pq"
+        self.dim = dim
+        self.sub_dim = next(d for d in range(min(settings.VECTOR_PQ_SUBVECTOR_DIM, dim), 0, -1) if dim % d == 0)
+        self.m = dim // self.sub_dim
+        self.codebooks: np.ndarray | None = None
+        self.codes = np.zeros((0, self.m), dtype=np.uint8)
+
+    @property
+    def ready(self) -> bool:
+        return self.codebooks is not None
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + (self.codebooks.nbytes if self.codebooks is not None else 0)
+
+    def _encode(self, vectors: np.ndarray, codebooks: np.ndarray) -> np.ndarray:
+        codes = np.empty((len(vectors), self.m), dtype=np.uint8)
+        subs = vectors.reshape(len(vectors), self.m, self.sub_dim)
+        for j in range(self.m):
+            centroids = codebooks[j]
+            distances = subs[:, j, :] @ (-2.0 * centroids.T)
+            distances += (centroids * centroids).sum(axis=1)
+            codes[:, j] = distances.argmin(axis=1)
+        return codes
+
+    def _encode_all(self, vectors: np.ndarray, codebooks: np.ndarray) -> None:
+        codes = np.zeros((len(vectors), self.m), dtype=np.uint8)
+        for start in range(0, len(vectors), _BLOCK):
+            block = np.asarray(vectors[start:start + _BLOCK], dtype=np.float32)
+            codes[start:start + _BLOCK] = self._encode(block, codebooks)
+        self._codes_path.write_bytes(codes.tobytes())
+        # Codes before codebooks: a concurrent search sees `ready` only once every row is encoded.
+        self.codes = codes
+        self.codebooks = codebooks
+
+    def load(self, vectors: np.ndarray) -> None:
+        if not self._codebooks_path.exists():
+            return
+        codebooks = np.load(self._codebooks_path)
+        if self._codes_path.exists():
+            codes = np.fromfile(self._codes_path, dtype=np.uint8).reshape(-1, self.m)
+            if len(codes) == len(vectors):
+                self.codes, self.codebooks = codes, codebooks
+                return
+        self._encode_all(vectors, codebooks)
+
+    def add(self, vectors: np.ndarray) -> None:
+        if not self.ready:
+            return
+        codes = self._encode(vectors, self.codebooks)
+        _append(self._codes_path, codes)
+        self.codes = np.concatenate([self.codes, codes])
+
+    def prepare(self, vectors: np.ndarray, live: np.ndarray) -> None:
+        """Train codebooks once enough vectors exist, then encode every stored row."""
+        rows = np.flatnonzero(live)
+        if self.ready or len(rows) < settings.VECTOR_PQ_TRAIN_MIN:
+            return
+        rng = np.random.default_rng(0)
+        sample = np.sort(rng.choice(rows, size=min(len(rows), settings.VECTOR_PQ_TRAIN_SAMPLE), replace=False))
+        data = np.asarray(vectors[sample], dtype=np.float32).reshape(len(sample), self.m, self.sub_dim)
+        ks = min(256, len(sample))
+        codebooks = np.stack([_kmeans(data[:, j, :], ks, rng) for j in range(self.m)])
+        np.save(self._codebooks_path, codebooks)
+        self._encode_all(vectors, codebooks)
+
+    def inner_products(self, query: np.ndarray, rows: np.ndarray | None, count: int) -> np.ndarray:
+        table = np.einsum("mkd,md->mk", self.codebooks, query.reshape(self.m, self.sub_dim))
+        codes = self.codes[:count] if rows is None else self.codes[rows]
+        subspaces = np.arange(self.m)
+        out = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), _BLOCK):
+            out[start:start + _BLOCK] = table[subspaces, codes[start:start + _BLOCK]].sum(axis=1)
+        return out
+
+
+def _kmeans(data: np.ndarray, k: int, rng: np.random.Generator, iterations: int = 15) -> np.ndarray:
+    data = np.ascontiguousarray(data)
+    centroids = data[rng.choice(len(data), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        # The per-row squared norm does not change the argmin, so it is left out.
+        distances = data @ (-2.0 * centroids.T)
+        distances += (centroids * centroids).sum(axis=1)
+        assignment = distances.argmin(axis=1)
+        counts = np.bincount(assignment, minlength=k)
+        sums = np.stack([np.bincount(assignment, weights=data[:, c], minlength=k) for c in range(data.shape[1])], axis=1)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+    return centroids
+
+
+def make_quantizer(mode: str, path: Path, dim: int) -> Int8Quantizer | ProductQuantizer | None:
+    if mode == "none":
+        return None
+    if mode == "int8":
+        return Int8Quantizer(path, dim)
+    if mode == "pq":
+        return ProductQuantizer(path, dim)
+    raise ValueError(f"Unsupported vector quantization: {mode}")
@@ -0,0 +1,213 @@
+"""Re-embedding a knowledge base with another embedding model, without downtime."""
+
+import asyncio
+import contextlib
+import logging
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+
+from app.config import settings
+from app.maintenance import Pacer, drop_collection, journaled_ids
+from app.models import ReindexStatus
+from app.rag.embeddings import same_model
+from app.rag.vector_store import DEFAULT_TENANT, StoredRows, VectorStoreBackend, get_vector_store
+from app.state import Registry, shared_state
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows: commits are only serialized within the worker
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Serializes, per knowledge base in this worker, upload commits with the
+# start and switch-over of its reindex, so no commit misses the shadow.
+# Taken through `kb_write_lock`, which adds the lock shared by workers.
+kb_write_locks: defaultdict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+_FILE_LOCK_POLL_SECONDS = 0.05
+# Jobs started by this worker, by knowledge base id, including finished ones.
+reindex_jobs: dict[str, ReindexStatus] = {}
+_tasks: dict[str, asyncio.Task] = {}
+
+
+class ReindexConflictError(ValueError):
+    """Raised when a knowledge base cannot be reindexed in its current state."""
+
+
+@contextlib.asynccontextmanager
+async def kb_write_lock(kb_id: str):
+    """Hold `kb_write_locks[kb_id]` and, with shared state, the knowledge base's lock file.
+
+    With shared state other workers commit to the same knowledge base, so a
+    lock file next to STATE_DB_PATH serializes them too. It is polled rather
+    than waited on in a thread, so a cancelled caller leaves no waiter behind.
+    """
+    async with kb_write_locks[kb_id]:
+        if shared_state is None or fcntl is None:
+            yield
+            return
+        directory = Path(f"{shared_state.path}.locks")
+        directory.mkdir(exist_ok=True)
+        with open(directory / f"{kb_id}.lock", "a") as f:
+            while True:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    await asyncio.sleep(_FILE_LOCK_POLL_SECONDS)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def write_targets(kb: dict) -> list[str]:
+    """Collections an upload to the knowledge base must write to: its own, and a reindex's shadow."""
+    collection = VectorStoreBackend.collection_of(kb)
+    return [collection, kb["shadow_collection"]] if kb.get("shadow_collection") else [collection]
+
+
+def _progress(status: ReindexStatus) -> None:
+    status.documents_total = max(status.documents_total, status.documents_done)
+    elapsed = (datetime.now(timezone.utc) - status.started_at).total_seconds()
+    if elapsed > 0 and status.documents_done:
+        status.documents_per_second = round(status.documents_done / elapsed, 1)
+        status.eta_seconds = round((status.documents_total - status.documents_done) / status.documents_per_second, 1)
+
+
+async def _copy(
+    backend: VectorStoreBackend, source: str, shadow: str, status: ReindexStatus, only_missing: bool
+) -> None:
+    # Imported on first use, to keep NumPy out of app startup.
+    import numpy as np
+
+    embeddings = backend.embeddings_for(status.to_model)
+    pacer = Pacer(lambda: settings.REINDEX_BUSY_FRACTION)
+    batches = backend.iter_rows(source, settings.REINDEX_BATCH_ROWS)
+    while (rows := await asyncio.to_thread(next, batches, None)) is not None:
+        # Uncommitted chunks are left out; an upload still running writes them to the shadow itself.
+        skip = journaled_ids(source)
+        if only_missing:
+            skip |= await backend.aexisting_ids(shadow, rows.ids)
+        keep = [i for i, chunk_id in enumerate(rows.ids) if chunk_id not in skip]
+        if keep:
+            texts = [rows.texts[i] for i in keep]
+            vectors = await embeddings.aembed_documents(texts)
+            await backend.aadd_rows(shadow, StoredRows(
+                ids=[rows.ids[i] for i in keep],
+                texts=texts,
+                metadatas=[rows.metadatas[i] for i in keep],
+                vectors=np.asarray(vectors, dtype=np.float32),
+            ))
+            status.documents_done += len(keep)
+            _progress(status)
+        await pacer.pause()
+
+
+async def _abandon(registry: Registry, kb_id: str, shadow: str) -> None:
+    async with kb_write_lock(kb_id):
+        kb = await registry.aget(kb_id)
+        if kb is not None and kb.get("shadow_collection") == shadow:
+            await registry.aupdate_record(kb_id, shadow_collection=None, shadow_embedding_model=None)
+    await drop_collection(shadow)
+
+
+async def _run(registry: Registry, kb_id: str, source: str, shadow: str, status: ReindexStatus) -> None:
+    backend = get_vector_store()
+    try:
+        await _copy(backend, source, shadow, status, only_missing=False)
+        await _copy(backend, source, shadow, status, only_missing=True)
+        async with kb_write_lock(kb_id):
+            kb = await registry.aget(kb_id)
+            if kb is None or kb.get("shadow_collection") != shadow:
+                raise ReindexConflictError("The reindex was cancelled")
+            await registry.aupdate_record(
+                kb_id,
+                collection=shadow,
+                embedding_model=status.to_model,
+                shadow_collection=None,
+                shadow_embedding_model=None,
+            )
+        await drop_collection(source)
+        status.state = "completed"
+        status.eta_seconds = 0.0
+        logger.info(
+            "reindexed %s from %s to %s: %d documents", kb_id, status.from_model, status.to_model, status.documents_done
+        )
+    except asyncio.CancelledError:
+        status.state = "cancelled"
+        await _abandon(registry, kb_id, shadow)
+        raise
+    except Exception as e:
+        logger.exception("Reindex of %s failed", kb_id)
+        status.state = "failed"
+        status.error = str(e) or type(e).__name__
+        await _abandon(registry, kb_id, shadow)
+    finally:
+        status.finished_at = datetime.now(timezone.utc)
+        if _tasks.get(kb_id) is asyncio.current_task():
+            del _tasks[kb_id]
+
+
+async def start_reindex(registry: Registry, kb_id: str, embedding_model: str) -> ReindexStatus:
+    """Register a shadow collection for `embedding_model` and start filling it in the background.
+
+    Raises ReindexConflictError when the knowledge base is being reindexed
+    already or is embedded with that model.
+    """
+    backend = get_vector_store()
+    async with kb_write_lock(kb_id):
+        kb = await registry.aget(kb_id)
+        if kb is None:
+            raise KeyError(kb_id)
+        if kb.get("shadow_collection"):
+            raise ReindexConflictError("Knowledge base is already being reindexed")
+        current = kb.get("embedding_model")
+        if current is not None and same_model(current, embedding_model):
+            raise ReindexConflictError(f"Knowledge base is already embedded with {current}")
+        base = VectorStoreBackend.collection_for(kb.get("tenant_id", DEFAULT_TENANT), kb_id)
+        shadow = f"{base}.r{uuid.uuid4().hex[:8]}"
+        await backend.acreate_collection(shadow, kb.get("vector_quantization", "none"), embedding_model)
+        await registry.aupdate_record(kb_id, shadow_collection=shadow, shadow_embedding_model=embedding_model)
+    status = ReindexStatus(
+        kb_id=kb_id,
+        state="running",
+        from_model=current,
+        to_model=embedding_model,
+        documents_total=kb["document_count"],
+        documents_done=0,
+        started_at=datetime.now(timezone.utc),
+    )
+    reindex_jobs[kb_id] = status
+    _tasks[kb_id] = asyncio.create_task(_run(registry, kb_id, VectorStoreBackend.collection_of(kb), shadow, status))
+    return status
+
+
+async def cancel_reindex(registry: Registry, kb_id: str) -> bool:
+    """Stop the knowledge base's reindex and delete its shadow; False when there is none.
+
+    A shadow without a job in this worker, left by a restart, is deleted too.
+    """
+    task = _tasks.pop(kb_id, None)
+    if task is not None:
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+        status = reindex_jobs[kb_id]
+        if status.state == "running":
+            # Cancelled before it started, so it did not clean up itself.
+            status.state = "cancelled"
+            status.finished_at = datetime.now(timezone.utc)
+    kb = await registry.aget(kb_id)
+    if kb is not None and kb.get("shadow_collection"):
+        await _abandon(registry, kb_id, kb["shadow_collection"])
+        return True
+    return task is not None
+
+
+async def stop_reindex_jobs(registry: Registry) -> None:
+    """Cancel every job of this worker, on shutdown."""
+    for kb_id in list(_tasks):
+        await cancel_reindex(registry, kb_id)
@@ -0,0 +1,277 @@
+"""Session and knowledge base state shared by several worker processes."""
+
+import asyncio
+import json
+import sqlite3
+import threading
+from collections.abc import Iterator, MutableMapping
+from contextlib import contextmanager
+from datetime import datetime
+
+from langchain_core.messages import BaseMessage, message_to_dict, messages_from_dict
+
+from app.config import settings
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS session_messages (
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    message TEXT NOT NULL,
+    PRIMARY KEY (session_id, seq)
+);
+CREATE TABLE IF NOT EXISTS session_summaries (
+    session_id TEXT PRIMARY KEY,
+    content TEXT NOT NULL,
+    covered_id TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS knowledge_bases (
+    id TEXT PRIMARY KEY,
+    record TEXT NOT NULL,
+    document_count INTEGER NOT NULL DEFAULT 0,
+    storage_bytes INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS collection_versions (
+    name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+"""
+
+_DATETIME_FIELDS = ("created_at",)
+# Kept in their own columns, so they can be incremented in place.
+_COUNTERS = ("document_count", "storage_bytes")
+
+
+class SharedState:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        # Opened lazily so importing the app does not create the database file.
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            conn = self.conn
+            # IMMEDIATE takes the write lock up front, so a read-then-write
+            # cannot interleave with another worker's.
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def execute(self, sql: str, parameters: tuple = ()) -> list[tuple]:
+        with self._lock:
+            return self.conn.execute(sql, parameters).fetchall()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    # -- sessions -----------------------------------------------------------
+
+    def read_session(
+        self, session_id: str, start: int = 0, stop: int | None = None
+    ) -> tuple[list[BaseMessage], tuple[str, str] | None]:
+        """Messages of the session from position `start` up to `stop`, and its (content, covered_id) summary."""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT message FROM session_messages "
+                "WHERE session_id = ? AND seq >= ? AND (? IS NULL OR seq < ?) ORDER BY seq",
+                (session_id, start, stop, stop),
+            ).fetchall()
+            summary = self.conn.execute(
+                "SELECT content, covered_id FROM session_summaries WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        return messages_from_dict([json.loads(message) for (message,) in rows]), summary
+
+    def append_messages(self, session_id: str, messages: list[BaseMessage]) -> int:
+        """Append messages to the session and return the position of the first."""
+        encoded = [json.dumps(message_to_dict(m)) for m in messages]
+        with self._transaction() as conn:
+            (seq,) = conn.execute(
+                "SELECT COALESCE(MAX(seq) + 1, 0) FROM session_messages WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            conn.executemany(
+                "INSERT INTO session_messages (session_id, seq, message) VALUES (?, ?, ?)",
+                [(session_id, seq + i, message) for i, message in enumerate(encoded)],
+            )
+        return seq
+
+    def write_summary(self, session_id: str, content: str, covered_id: str) -> None:
+        self.execute(
+            "INSERT OR REPLACE INTO session_summaries (session_id, content, covered_id) VALUES (?, ?, ?)",
+            (session_id, content, covered_id),
+        )
+
+    async def aread_session(
+        self, session_id: str, start: int = 0, stop: int | None = None
+    ) -> tuple[list[BaseMessage], tuple[str, str] | None]:
+        return await asyncio.to_thread(self.read_session, session_id, start, stop)
+
+    async def aappend_messages(self, session_id: str, messages: list[BaseMessage]) -> int:
+        return await asyncio.to_thread(self.append_messages, session_id, messages)
+
+    async def awrite_summary(self, session_id: str, content: str, covered_id: str) -> None:
+        await asyncio.to_thread(self.write_summary, session_id, content, covered_id)
+
+    # -- collection versions ------------------------------------------------
+
+    def collection_version(self, name: str) -> int:
+        rows = self.execute("SELECT version FROM collection_versions WHERE name = ?", (name,))
+        return rows[0][0] if rows else 0
+
+    def bump_collection_version(self, name: str) -> None:
+        self.execute(
+            "INSERT INTO collection_versions (name, version) VALUES (?, 1) "
+            "ON CONFLICT (name) DO UPDATE SET version = version + 1",
+            (name,),
+        )
+
+
+class KnowledgeBaseRegistry(dict[str, dict]):
+    """Knowledge base records by id, in this process."""
+
+    def add_documents(self, kb_id: str, count: int, size: int = 0) -> None:
+        kb = self[kb_id]
+        kb["document_count"] += count
+        kb["storage_bytes"] = kb.get("storage_bytes", 0) + size
+
+    def update_record(self, kb_id: str, **fields) -> None:
+        self[kb_id].update(fields)
+
+    # The async accessors of `SharedKnowledgeBaseRegistry`, for callers that take either.
+
+    async def aget(self, kb_id: str) -> dict | None:
+        return self.get(kb_id)
+
+    async def avalues(self) -> list[dict]:
+        return list(self.values())
+
+    async def aset(self, kb_id: str, kb: dict) -> None:
+        self[kb_id] = kb
+
+    async def adelete(self, kb_id: str) -> None:
+        del self[kb_id]
+
+    async def aadd_documents(self, kb_id: str, count: int, size: int = 0) -> None:
+        self.add_documents(kb_id, count, size)
+
+    async def aupdate_record(self, kb_id: str, **fields) -> None:
+        self.update_record(kb_id, **fields)
+
+
+class SharedKnowledgeBaseRegistry(MutableMapping[str, dict]):
+    """Knowledge base records by id, in the shared database.
+
+    Records are returned as copies, so change one by assigning it back, or
+    with `update_record`, which leaves the counters alone. `add_documents`
+    increments the counters in place, so concurrent uploads on different
+    workers are not lost. A write can wait on another worker's transaction,
+    so code on the event loop uses the async accessors, which run in a thread.
+    """
+
+    def __init__(self, state: SharedState) -> None:
+        self.state = state
+
+    @staticmethod
+    def _decode(record: str, document_count: int, storage_bytes: int) -> dict:
+        kb = json.loads(record)
+        for field in _DATETIME_FIELDS:
+            if isinstance(kb.get(field), str):
+                kb[field] = datetime.fromisoformat(kb[field])
+        kb["document_count"] = document_count
+        kb["storage_bytes"] = storage_bytes
+        return kb
+
+    def __getitem__(self, kb_id: str) -> dict:
+        rows = self.state.execute("SELECT record, document_count, storage_bytes FROM knowledge_bases WHERE id = ?", (kb_id,))
+        if not rows:
+            raise KeyError(kb_id)
+        return self._decode(*rows[0])
+
+    def __setitem__(self, kb_id: str, kb: dict) -> None:
+        record = {k: v.isoformat() if isinstance(v, datetime) else v for k, v in kb.items() if k not in _COUNTERS}
+        self.state.execute(
+            "INSERT OR REPLACE INTO knowledge_bases (id, record, document_count, storage_bytes) VALUES (?, ?, ?, ?)",
+            (kb_id, json.dumps(record), kb.get("document_count", 0), kb.get("storage_bytes", 0)),
+        )
+
+    def __delitem__(self, kb_id: str) -> None:
+        with self.state._transaction() as conn:
+            if conn.execute("DELETE FROM knowledge_bases WHERE id = ?", (kb_id,)).rowcount == 0:
+                raise KeyError(kb_id)
+
+    def __contains__(self, kb_id: object) -> bool:
+        return bool(self.state.execute("SELECT 1 FROM knowledge_bases WHERE id = ?", (kb_id,)))
+
+    def __iter__(self) -> Iterator[str]:
+        return iter([kb_id for (kb_id,) in self.state.execute("SELECT id FROM knowledge_bases ORDER BY rowid")])
+
+    def __len__(self) -> int:
+        return self.state.execute("SELECT COUNT(*) FROM knowledge_bases")[0][0]
+
+    def values(self) -> list[dict]:
+        rows = self.state.execute("SELECT record, document_count, storage_bytes FROM knowledge_bases ORDER BY rowid")
+        return [self._decode(*row) for row in rows]
+
+    def clear(self) -> None:
+        self.state.execute("DELETE FROM knowledge_bases")
+
+    def add_documents(self, kb_id: str, count: int, size: int = 0) -> None:
+        self.state.execute(
+            "UPDATE knowledge_bases SET document_count = document_count + ?, storage_bytes = storage_bytes + ? "
+            "WHERE id = ?",
+            (count, size, kb_id),
+        )
+
+    def update_record(self, kb_id: str, **fields) -> None:
+        with self.state._transaction() as conn:
+            row = conn.execute("SELECT record FROM knowledge_bases WHERE id = ?", (kb_id,)).fetchone()
+            if row is None:
+                raise KeyError(kb_id)
+            record = json.loads(row[0])
+            record.update({k: v.isoformat() if isinstance(v, datetime) else v for k, v in fields.items()})
+            conn.execute("UPDATE knowledge_bases SET record = ? WHERE id = ?", (json.dumps(record), kb_id))
+
+    async def aget(self, kb_id: str) -> dict | None:
+        return await asyncio.to_thread(self.get, kb_id)
+
+    async def avalues(self) -> list[dict]:
+        return await asyncio.to_thread(self.values)
+
+    async def aset(self, kb_id: str, kb: dict) -> None:
+        await asyncio.to_thread(self.__setitem__, kb_id, kb)
+
+    async def adelete(self, kb_id: str) -> None:
+        await asyncio.to_thread(self.__delitem__, kb_id)
+
+    async def aadd_documents(self, kb_id: str, count: int, size: int = 0) -> None:
+        await asyncio.to_thread(self.add_documents, kb_id, count, size)
+
+    async def aupdate_record(self, kb_id: str, **fields) -> None:
+        await asyncio.to_thread(self.update_record, kb_id, **fields)
+
+
+shared_state = SharedState(settings.STATE_DB_PATH) if settings.STATE_BACKEND == "sqlite" else None
+
+
+Registry = KnowledgeBaseRegistry | SharedKnowledgeBaseRegistry
+
+
+def create_kb_registry() -> Registry:
+    return KnowledgeBaseRegistry() if shared_state is None else SharedKnowledgeBaseRegistry(shared_state)
@@ -0,0 +1,205 @@
+"""In-process telemetry: prompt-eval timings per prompt layout and Prometheus metrics.
+
+Ollama reports how many prompt tokens it had to evaluate on each call and how
+long that took (`prompt_eval_count`, `prompt_eval_duration`). Tokens served
+from its KV cache are not evaluated again, so comparing these numbers per
+layout shows how much of each prompt the server could reuse.
+"""
+
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from collections import defaultdict
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PromptEvalTotals:
+    turns: int = 0
+    prompt_eval_tokens: int = 0
+    prompt_eval_ms: float = 0.0
+
+
+prompt_eval_totals: dict[str, PromptEvalTotals] = defaultdict(PromptEvalTotals)
+
+
+def record_prompt_eval(layout: str, response_metadata: Any) -> None:
+    """Add one model call's Ollama timings to the totals for `layout`; ignore calls without them."""
+    if not isinstance(response_metadata, dict) or "prompt_eval_duration" not in response_metadata:
+        return
+    tokens = response_metadata.get("prompt_eval_count") or 0
+    elapsed_ms = response_metadata["prompt_eval_duration"] / 1e6
+    totals = prompt_eval_totals[layout]
+    totals.turns += 1
+    totals.prompt_eval_tokens += tokens
+    totals.prompt_eval_ms += elapsed_ms
+    logger.info("prompt_eval layout=%s tokens=%d ms=%.1f", layout, tokens, elapsed_ms)
+
+
+# --- Prometheus metrics ---
+#
+# A minimal in-process registry rendered in the Prometheus text format at
+# GET /metrics. Recording a value is a dict lookup and a few additions under
+# a lock, cheap enough for every hot-path stage.
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _label_text(labelnames: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        return tuple(labels[name] for name in self.labelnames)
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}", *self._samples()]
+
+    def _samples(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple[str, ...], float] = defaultdict(float)
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] += amount
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            values = dict(self._values)
+        return [f"{self.name}{_label_text(self.labelnames, key)} {value}" for key, value in values.items()]
+
+
+class Gauge(_Metric):
+    """A value read at scrape time from `collect`, which returns it per label-value tuple."""
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...],
+        collect: Callable[[], dict[tuple[str, ...], float]],
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._collect = collect
+
+    def _samples(self) -> list[str]:
+        return [f"{self.name}{_label_text(self.labelnames, key)} {value}" for key, value in self._collect().items()]
+
+
+# Set while a request is traced (see app.profiling); also receives every `_Timer` stage.
+stage_observer: ContextVar[Callable[[str, float], None] | None] = ContextVar("stage_observer", default=None)
+
+
+class _Timer:
+    """Observes the time spent in a `with` block; lighter than a generator-based context manager."""
+
+    __slots__ = ("_histogram", "_labels", "_start")
+
+    def __init__(self, histogram: "Histogram", labels: dict[str, str]) -> None:
+        self._histogram = histogram
+        self._labels = labels
+
+    def __enter__(self) -> None:
+        self._start = time.perf_counter()
+
+    def __exit__(self, *exc_info) -> None:
+        elapsed = time.perf_counter() - self._start
+        self._histogram.observe(elapsed, **self._labels)
+        observer = stage_observer.get()
+        if observer is not None:
+            observer(self._labels.get("stage", self._histogram.name), elapsed)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._buckets = buckets
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self._values: dict[tuple[str, ...], list[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect_left(self._buckets, value)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0.0] * (len(self._buckets) + 2)
+            row[index] += 1
+            row[-1] += value
+
+    def time(self, **labels: str) -> "_Timer":
+        return _Timer(self, labels)
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            values = {key: list(row) for key, row in self._values.items()}
+        lines = []
+        for key, row in values.items():
+            cumulative = 0.0
+            for bound, count in zip((*self._buckets, "+Inf"), row[:-1]):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_label_text(self.labelnames, key, f'le=\"{bound}\"')} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_text(self.labelnames, key)} {row[-1]}")
+            lines.append(f"{self.name}_count{_label_text(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+registry: list[_Metric] = []
+
+
+def render_metrics() -> str:
+    return "\n".join(line for metric in registry for line in metric.render()) + "\n"
+
+
+CHAT_REQUEST_SECONDS = Histogram(
+    "chat_request_seconds", "Time to serve a chat request, end to end.", ("endpoint", "mode")
+)
+CHAT_STAGE_SECONDS = Histogram(
+    "chat_stage_seconds",
+    "Time spent in each stage of a chat request. kb_search is per knowledge base and includes its query_embedding.",
+    ("stage",),
+)
+CHAT_TOKENS = Counter("chat_tokens_total", "Tokens reported by the model for chat turns.", ("type",))
+INGEST_SECONDS = Histogram("ingest_seconds", "Time to ingest one uploaded file.", ("stage",))
+INGEST_BYTES = Counter("ingest_bytes_total", "Bytes of uploaded files ingested.")
+INGEST_CHUNKS = Counter("ingest_chunks_total", "Chunks stored from uploaded files.")
+RETRIEVAL_CACHE_LOOKUPS = Counter(
+    "retrieval_cache_lookups_total", "Retrieval cache lookups, by result (hit or miss).", ("result",)
+)
@@ -0,0 +1,203 @@
+"""Tenants: knowledge base isolation, rate limits, quotas and usage.
+
+A request's tenant comes from its `X-Tenant-Id` header, or is
+`DEFAULT_TENANT` without one. The header is not authenticated here: set
+`TENANT_IDS` to accept only known tenants, and have the gateway in front of
+the app set it. A tenant only sees its own knowledge bases and chat sessions,
+and their collections live in the tenant's namespace in the vector store (see
+`VectorStoreBackend.collection_for`).
+
+Limits apply per tenant, within each worker process:
+
+- Chat and query endpoints draw from token buckets (`TENANT_CHAT_RATE` /
+  `TENANT_CHAT_BURST`, `TENANT_QUERY_RATE` / `TENANT_QUERY_BURST`). An empty
+  bucket answers 429 with `Retry-After`, without touching the model or the
+  vector store, so one tenant's flood cannot queue ahead of everyone else.
+- `TENANT_MAX_CONCURRENT_UPLOADS` caps uploads in progress, and
+  `TENANT_MAX_STORAGE_BYTES` caps the bytes stored across the tenant's
+  knowledge bases.
+
+Usage (chat turns, tokens, queries, ingested bytes and chunks, rejected
+requests) is counted per tenant and listed at `GET /admin/tenants`.
+"""
+
+import math
+import re
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Literal
+
+from fastapi import Depends, Header, HTTPException
+
+from app.config import settings
+from app.models import TokenUsage
+from app.rag.vector_store.base import DEFAULT_TENANT
+
+# No dots, which separate the tenant from the knowledge base in collection
+# names, and short enough that "<tenant>.<uuid>" fits Chroma's 63 characters.
+_TENANT_ID = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_-]{0,25}$")
+
+Scope = Literal["chat", "query"]
+
+# Tenants whose usage a worker keeps; beyond it the least recently active is dropped.
+_MAX_TRACKED_TENANTS = 10000
+# Bucket count at which idle buckets are next swept out.
+_MIN_BUCKET_SWEEP = 1024
+
+
+@dataclass
+class TenantUsageTotals:
+    chat_requests: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    total_tokens: int = 0
+    queries: int = 0
+    ingested_bytes: int = 0
+    ingested_chunks: int = 0
+    rate_limited: int = 0
+
+
+class _UsageTable(OrderedDict[str, TenantUsageTotals]):
+    """Usage totals by tenant, created on first use, most recently used last."""
+
+    def __missing__(self, tenant_id: str) -> TenantUsageTotals:
+        totals = self[tenant_id] = TenantUsageTotals()
+        if len(self) > _MAX_TRACKED_TENANTS:
+            self.popitem(last=False)
+        return totals
+
+    def __getitem__(self, tenant_id: str) -> TenantUsageTotals:
+        totals = super().__getitem__(tenant_id)
+        self.move_to_end(tenant_id)
+        return totals
+
+
+tenant_usage = _UsageTable()
+
+
+class TokenBucket:
+    """Refills at `rate` tokens per second, holding at most `burst`."""
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self, cost: float = 1.0) -> float:
+        """Take `cost` tokens and return 0, or return the seconds until they would be available.
+
+        A cost above `burst` is charged as a full bucket, so it can still succeed.
+        """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        cost = min(cost, self.burst)
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+    def full(self, now: float) -> bool:
+        """Whether the bucket has refilled, and so acts as a new one."""
+        return self.tokens + (now - self.updated) * self.rate >= self.burst
+
+
+_buckets: dict[tuple[str, Scope], TokenBucket] = {}
+_next_bucket_sweep = _MIN_BUCKET_SWEEP
+# Only tenants with an upload running have an entry.
+_uploads_in_flight: dict[str, int] = {}
+
+
+def _limits(scope: Scope) -> tuple[float, int]:
+    if scope == "chat":
+        return settings.TENANT_CHAT_RATE, settings.TENANT_CHAT_BURST
+    return settings.TENANT_QUERY_RATE, settings.TENANT_QUERY_BURST
+
+
+def check_rate(tenant_id: str, scope: Scope, cost: float = 1.0) -> None:
+    """Charge `cost` to the tenant's bucket for `scope`, or raise 429."""
+    rate, burst = _limits(scope)
+    if rate <= 0:
+        return
+    bucket = _buckets.get((tenant_id, scope))
+    if bucket is None or (bucket.rate, bucket.burst) != (rate, burst):
+        _sweep_buckets()
+        bucket = _buckets[(tenant_id, scope)] = TokenBucket(rate, burst)
+    wait = bucket.take(cost)
+    if wait:
+        tenant_usage[tenant_id].rate_limited += 1
+        raise HTTPException(
+            status_code=429,
+            detail=f"Rate limit exceeded for tenant {tenant_id!r}",
+            headers={"Retry-After": str(math.ceil(wait))},
+        )
+
+
+def _sweep_buckets() -> None:
+    """Drop refilled buckets once there are many, so idle tenants do not accumulate."""
+    global _next_bucket_sweep
+    if len(_buckets) < _next_bucket_sweep:
+        return
+    now = time.monotonic()
+    for key in [key for key, bucket in _buckets.items() if bucket.full(now)]:
+        del _buckets[key]
+    _next_bucket_sweep = max(_MIN_BUCKET_SWEEP, 2 * len(_buckets))
+
+
+async def get_tenant_id(x_tenant_id: str | None = Header(default=None)) -> str:
+    if x_tenant_id is None:
+        return DEFAULT_TENANT
+    if not _TENANT_ID.match(x_tenant_id):
+        raise HTTPException(status_code=422, detail="Invalid tenant id")
+    if settings.TENANT_IDS and x_tenant_id not in settings.TENANT_IDS:
+        raise HTTPException(status_code=403, detail="Unknown tenant")
+    return x_tenant_id
+
+
+async def chat_tenant(tenant_id: str = Depends(get_tenant_id)) -> str:
+    """The request's tenant, after charging one chat request to its rate limit."""
+    check_rate(tenant_id, "chat")
+    tenant_usage[tenant_id].chat_requests += 1
+    return tenant_id
+
+
+async def query_tenant(tenant_id: str = Depends(get_tenant_id)) -> str:
+    """The request's tenant, after charging one query to its rate limit."""
+    check_rate(tenant_id, "query")
+    tenant_usage[tenant_id].queries += 1
+    return tenant_id
+
+
+@contextmanager
+def upload_slot(tenant_id: str):
+    """Hold one of the tenant's `TENANT_MAX_CONCURRENT_UPLOADS` slots, or raise 429."""
+    limit = settings.TENANT_MAX_CONCURRENT_UPLOADS
+    running = _uploads_in_flight.get(tenant_id, 0)
+    if limit and running >= limit:
+        tenant_usage[tenant_id].rate_limited += 1
+        raise HTTPException(status_code=429, detail=f"Too many concurrent uploads for tenant {tenant_id!r}")
+    _uploads_in_flight[tenant_id] = running + 1
+    try:
+        yield
+    finally:
+        _uploads_in_flight[tenant_id] -= 1
+        if not _uploads_in_flight[tenant_id]:
+            del _uploads_in_flight[tenant_id]
+
+
+def record_tokens(tenant_id: str, usage: TokenUsage) -> None:
+    totals = tenant_usage[tenant_id]
+    totals.input_tokens += usage.input_tokens
+    totals.output_tokens += usage.output_tokens
+    totals.total_tokens += usage.total_tokens
+
+
+def record_ingest(tenant_id: str, size: int, chunks: int) -> None:
+    totals = tenant_usage[tenant_id]
+    totals.ingested_bytes += size
+    totals.ingested_chunks += chunks
@@ -0,0 +1,99 @@
+"""Per-turn checkpoint cost of the agent graph as a session grows.
+
+Runs agent turns against the SQLite checkpointer on a temporary file, with
+a model stub that answers immediately. For each reported session length it
+prints the time spent inside the saver per turn, split into writes
+(checkpoints and pending writes) and reads (loading the thread), plus the
+bytes the thread occupies in the database.
+
+Usage:
+    uv run python -m benchmarks.agent_checkpoint --turns 1000 --report-every 250
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from unittest.mock import AsyncMock, MagicMock
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+STORED_COLUMNS = (("checkpoints", "checkpoint"), ("checkpoints", "metadata"), ("blobs", "blob"), ("writes", "blob"))
+
+
+def _timed(saver, name: str, totals: dict) -> None:
+    method = getattr(saver, name)
+    kind = "write" if name.startswith("put") else "read"
+
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            totals[kind] += time.perf_counter() - start
+
+    setattr(saver, name, wrapper)
+
+
+def _stored_bytes(saver) -> int:
+    return sum(
+        saver.conn.execute(f"SELECT COALESCE(SUM(LENGTH({column})), 0) FROM {table}").fetchone()[0]
+        for table, column in STORED_COLUMNS
+    )
+
+
+async def _run(args: argparse.Namespace) -> list[dict]:
+    from app.agent.checkpoint import SQLiteCheckpointSaver
+    from app.agent.graph import build_agent_graph
+    from app.agent.state import AgentContext
+
+    report = []
+    with tempfile.TemporaryDirectory() as root:
+        path = os.path.join(root, "agent_state.db")
+        saver = SQLiteCheckpointSaver(path, compact_every=args.compact_every)
+        totals = {"write": 0.0, "read": 0.0}
+        # The async methods run these in a worker thread; timing them here
+        # leaves out time spent waiting for the event loop.
+        for name in ("put", "put_writes", "get_tuple", "get_delta_channel_history"):
+            _timed(saver, name, totals)
+        graph = build_agent_graph(saver)
+        llm = MagicMock()
+        config = {"configurable": {"thread_id": "bench"}}
+        window_start = time.perf_counter()
+        for turn in range(1, args.turns + 1):
+            llm.ainvoke = AsyncMock(return_value=AIMessage(content="a" * args.message_chars))
+            context = AgentContext(llm=llm, deadline=time.monotonic() + 60, knowledge_base_ids=[])
+            await graph.ainvoke(
+                {"messages": [HumanMessage(content="q" * args.message_chars)], "steps": 0},
+                config=config,
+                context=context,
+            )
+            if turn % args.report_every == 0:
+                elapsed = time.perf_counter() - window_start
+                report.append({
+                    "messages": 2 * turn,
+                    "turn_ms": round(elapsed / args.report_every * 1000, 2),
+                    "saver_write_ms": round(totals["write"] / args.report_every * 1000, 2),
+                    "saver_read_ms": round(totals["read"] / args.report_every * 1000, 2),
+                    "stored_kb": round(_stored_bytes(saver) / 1024, 1),
+                })
+                totals.update(write=0.0, read=0.0)
+                window_start = time.perf_counter()
+        saver.close()
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=1000)
+    parser.add_argument("--report-every", type=int, default=250)
+    parser.add_argument("--message-chars", type=int, default=400)
+    parser.add_argument("--compact-every", type=int, default=100)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(_run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
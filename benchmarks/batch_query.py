@@ -0,0 +1,107 @@
+"""Fan-out search throughput: N single-KB queries vs one batch request.
+
+Runs the FastAPI app in-process against the local backend, with an
+embedding model that simulates Ollama's cost per embedding call (fixed
+round-trip plus per-text time, calls serialized like a single loaded model).
+
+Usage:
+    uv run python -m benchmarks.batch_query --kbs 20 --rounds 20
+"""
+
+import argparse
+import asyncio
+import json
+import tempfile
+import threading
+import time
+from unittest.mock import patch
+
+import numpy as np
+from httpx import ASGITransport, AsyncClient
+from langchain_core.embeddings import Embeddings
+
+DIM = 64
+
+
+class SimulatedOllamaEmbeddings(Embeddings):
+    def __init__(self, call_ms: float, per_text_ms: float) -> None:
+        self._call_s = call_ms / 1000
+        self._per_text_s = per_text_ms / 1000
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _vector(text: str) -> list[float]:
+        seed = sum(map(ord, text))
+        return [((seed * (i + 1)) % 97) / 97 for i in range(DIM)]
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        with self._lock:
+            time.sleep(self._call_s + self._per_text_s * len(texts))
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        return await asyncio.to_thread(self.embed_documents, texts)
+
+
+async def _run(args: argparse.Namespace) -> dict:
+    from app.api.knowledge_base import kb_registry
+    from app.main import app
+    from app.rag.vector_store.local_backend import LocalVectorStoreBackend
+
+    embeddings = SimulatedOllamaEmbeddings(args.embed_call_ms, args.embed_per_text_ms)
+    with tempfile.TemporaryDirectory() as root:
+        backend = LocalVectorStoreBackend(root=root, embeddings=embeddings)
+        kb_ids = [f"kb-{i}" for i in range(args.kbs)]
+        for kb_id in kb_ids:
+            kb_registry[kb_id] = {
+                "id": kb_id, "name": kb_id, "description": "", "document_count": args.chunks,
+                "created_at": "2024-01-01T00:00:00Z",
+            }
+            texts = [f"{kb_id} chunk {j}" for j in range(args.chunks)]
+            vectors = np.array([embeddings._vector(t) for t in texts], dtype=np.float32)
+            backend.get_store(kb_id)._collection.upsert(texts, texts, [{} for _ in texts], vectors)
+
+        with patch("app.api.knowledge_base.get_vector_store", return_value=backend), \
+                patch("app.rag.retriever.get_vector_store", return_value=backend):
+            async with AsyncClient(transport=ASGITransport(app=app), base_url="http://bench") as client:
+                async def single_round() -> None:
+                    await asyncio.gather(*(
+                        client.post(f"/knowledge-base/{kb_id}/query", json={"query": "quarterly revenue"})
+                        for kb_id in kb_ids
+                    ))
+
+                async def batch_round() -> None:
+                    items = [{"kb_id": kb_id, "query": "quarterly revenue"} for kb_id in kb_ids]
+                    await client.post("/knowledge-base/query", json={"items": items})
+
+                timings = {}
+                for name, round_fn in (("single", single_round), ("batch", batch_round)):
+                    start = time.perf_counter()
+                    for _ in range(args.rounds):
+                        await round_fn()
+                    elapsed = time.perf_counter() - start
+                    timings[name] = {
+                        "searches_per_s": round(args.rounds * args.kbs / elapsed, 1),
+                        "round_ms": round(elapsed / args.rounds * 1000, 2),
+                    }
+        kb_registry.clear()
+    timings["speedup"] = round(timings["batch"]["searches_per_s"] / timings["single"]["searches_per_s"], 1)
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--kbs", type=int, default=20)
+    parser.add_argument("--chunks", type=int, default=500)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--embed-call-ms", type=float, default=15.0)
+    parser.add_argument("--embed-per-text-ms", type=float, default=1.0)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(_run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Cost of deriving citations from a streamed answer's `[Document N]` markers.
+
+Builds answers of `--tokens` tokens (about 4 characters each) citing
+`--sources` retrieved chunks, with a marker every `--marker-every` tokens,
+often split across tokens as a model streams them. It feeds each answer to
+`app.rag.citations.CitationTracker` token by token, as `/chat/stream` does,
+and reports, as JSON, the time per token and per answer, and the citations
+found. Compare the per-answer time with the latency of the extra model call
+citations would otherwise take.
+
+Usage:
+    uv run python -m benchmarks.citations --tokens 500 2000 --sources 8
+"""
+
+import argparse
+import json
+import random
+import time
+
+from app.models import Citation
+from app.rag.citations import CitationTracker
+
+
+def _answer(tokens: int, sources: int, marker_every: int, rng: random.Random) -> list[str]:
+    joined = "".join(
+        f" [Document {rng.randint(1, sources)} — report-{i}.pdf]" if i % marker_every == 0 else " word"
+        for i in range(tokens)
+    )
+    # Streamed tokens cut through markers as often as through words.
+    return [joined[i:i + 4] for i in range(0, len(joined), 4)]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens", type=int, nargs="+", default=[500, 2000])
+    parser.add_argument("--sources", type=int, default=8)
+    parser.add_argument("--marker-every", type=int, default=40)
+    parser.add_argument("--answers", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    sources = [
+        Citation(document=i, kb_id="kb", chunk_id=f"chunk-{i}", source_filename=f"report-{i}.pdf", score=0.5)
+        for i in range(1, args.sources + 1)
+    ]
+    results = {}
+    for tokens in args.tokens:
+        answers = [_answer(tokens, args.sources, args.marker_every, rng) for _ in range(args.answers)]
+        fed = sum(len(answer) for answer in answers)
+        found = 0
+        start = time.perf_counter()
+        for answer in answers:
+            tracker = CitationTracker(sources)
+            for token in answer:
+                tracker.feed(token)
+            found += len(tracker.citations)
+        elapsed = time.perf_counter() - start
+        results[f"tokens_{tokens}"] = {
+            "us_per_token": round(elapsed / fed * 1e6, 2),
+            "ms_per_answer": round(elapsed / args.answers * 1000, 3),
+            "citations_per_answer": round(found / args.answers, 1),
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
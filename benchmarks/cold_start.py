@@ -0,0 +1,57 @@
+"""Cold start: time to import the app in a fresh interpreter.
+
+Runs `import app.main` in `--runs` new Python processes and reports the mean
+and best wall time of the import, plus which heavy packages it loaded (they
+should all be deferred to first use).
+
+Usage:
+    uv run python -m benchmarks.cold_start --runs 10
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+HEAVY_PACKAGES = (
+    "chromadb",
+    "langchain_community",
+    "langchain_ollama",
+    "langchain_text_splitters",
+    "langgraph",
+    "numpy",
+    "pypdf",
+)
+SCRIPT = f"""
+import json, sys, time
+start = time.perf_counter()
+import app.main
+elapsed = time.perf_counter() - start
+loaded = sorted({{name.split(".")[0] for name in sys.modules}} & set({HEAVY_PACKAGES!r}))
+print(json.dumps({{"seconds": elapsed, "loaded": loaded}}))
+"""
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    samples, loaded = [], []
+    for _ in range(args.runs):
+        output = subprocess.run([sys.executable, "-c", SCRIPT], cwd=ROOT, capture_output=True, text=True, check=True)
+        result = json.loads(output.stdout.strip().splitlines()[-1])
+        samples.append(result["seconds"])
+        loaded = result["loaded"]
+    print(json.dumps({
+        "import_mean_ms": round(statistics.mean(samples) * 1000, 1),
+        "import_min_ms": round(min(samples) * 1000, 1),
+        "heavy_packages_loaded": loaded,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
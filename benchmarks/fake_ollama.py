@@ -0,0 +1,127 @@
+"""A stand-in Ollama server with configurable latency, for benchmarks.
+
+Implements the endpoints the app uses: `POST /api/chat` (streamed NDJSON or
+a single JSON body) and `POST /api/embed`, plus `GET /api/tags`. Each model
+serves `--parallel` requests at a time, like an Ollama runner. A chat call
+waits `--first-token-ms` plus `--prompt-ms-per-token` for every prompt token
+(about four characters), then emits `--response-tokens` tokens at
+`--tokens-per-s`. Embedding calls take `--embed-ms` plus `--embed-ms-per-text`
+per input and return deterministic vectors of `--embed-dim` dimensions.
+
+Usage:
+    uv run python -m benchmarks.fake_ollama --port 11500 --tokens-per-s 80
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+import numpy as np
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+CHARS_PER_TOKEN = 4
+
+
+def create_app(args: argparse.Namespace) -> FastAPI:
+    app = FastAPI()
+    runners: dict[str, asyncio.Semaphore] = defaultdict(lambda: asyncio.Semaphore(args.parallel))
+
+    def _now() -> str:
+        return datetime.now(timezone.utc).isoformat()
+
+    def _vector(text: str) -> list[float]:
+        seed = int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "little")
+        vector = np.random.default_rng(seed).standard_normal(args.embed_dim)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    @app.get("/api/tags")
+    async def tags():
+        return {"models": []}
+
+    @app.post("/api/embed")
+    async def embed(request: Request):
+        body = await request.json()
+        texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        async with runners[body["model"]]:
+            await asyncio.sleep((args.embed_ms + args.embed_ms_per_text * len(texts)) / 1000)
+        return {"model": body["model"], "embeddings": [_vector(t) for t in texts]}
+
+    @app.post("/api/chat")
+    async def chat(request: Request):
+        body = await request.json()
+        model = body["model"]
+        prompt_tokens = sum(len(str(m.get("content", ""))) for m in body.get("messages", [])) // CHARS_PER_TOKEN + 1
+        num_predict = (body.get("options") or {}).get("num_predict")
+        response_tokens = min(args.response_tokens, num_predict) if num_predict else args.response_tokens
+        prompt_eval_s = (args.first_token_ms + args.prompt_ms_per_token * prompt_tokens) / 1000
+
+        def part(content: str, done: bool = False, **extra) -> dict:
+            return {
+                "model": model, "created_at": _now(),
+                "message": {"role": "assistant", "content": content}, "done": done, **extra,
+            }
+
+        def final(started: float) -> dict:
+            return part(
+                "", True,
+                done_reason="stop",
+                total_duration=int((time.perf_counter() - started) * 1e9),
+                load_duration=0,
+                prompt_eval_count=prompt_tokens,
+                prompt_eval_duration=int(prompt_eval_s * 1e9),
+                eval_count=response_tokens,
+                eval_duration=int(response_tokens / args.tokens_per_s * 1e9),
+            )
+
+        async def tokens():
+            async with runners[model]:
+                started = time.perf_counter()
+                await asyncio.sleep(prompt_eval_s)
+                for i in range(response_tokens):
+                    yield part(f"tok{i} ")
+                    await asyncio.sleep(1 / args.tokens_per_s)
+                yield final(started)
+
+        if body.get("stream", True):
+            async def ndjson():
+                async for chunk in tokens():
+                    yield json.dumps(chunk) + "\n"
+
+            return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+        content = []
+        async for chunk in tokens():
+            content.append(chunk["message"]["content"])
+        return JSONResponse({**chunk, "message": {"role": "assistant", "content": "".join(content)}})
+
+    return app
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--parallel", type=int, default=4, help="concurrent requests per model")
+    parser.add_argument("--first-token-ms", type=float, default=50.0)
+    parser.add_argument("--prompt-ms-per-token", type=float, default=0.05)
+    parser.add_argument("--tokens-per-s", type=float, default=200.0)
+    parser.add_argument("--response-tokens", type=int, default=40)
+    parser.add_argument("--embed-ms", type=float, default=5.0)
+    parser.add_argument("--embed-ms-per-text", type=float, default=0.5)
+    parser.add_argument("--embed-dim", type=int, default=256)
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=11500)
+    add_arguments(parser)
+    args = parser.parse_args()
+    uvicorn.run(create_app(args), host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Batched ingest: upload time by commit size, and the cost of retrying an upload.
+
+Starts the app against `benchmarks.fake_ollama` (see `benchmarks.suite`) once
+per `--batch-chunks` value (as `INGEST_BATCH_CHUNKS`). Each run uploads a
+synthetic corpus of `--files` files in one request, then sends the same
+request again, as a client would after a timeout. It reports, as JSON:
+
+- the upload time and the chunks stored per second
+- the retry time, and how many chunks the retry stored and skipped
+- the knowledge base's final document count
+
+A batch size of 1 writes and embeds every chunk separately.
+
+Usage:
+    uv run python -m benchmarks.ingest_batching --files 30 --batch-chunks 1 32 512
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from benchmarks.fake_ollama import add_arguments as add_fake_ollama_arguments
+from benchmarks.suite import corpus, serve
+
+
+async def _measure(base_url: str, args: argparse.Namespace) -> dict:
+    files = [("files", (name, content, content_type)) for name, content, content_type in corpus(0, args.files)]
+    async with httpx.AsyncClient(base_url=base_url, timeout=600.0) as client:
+        kb_id = (await client.post("/knowledge-base", json={"name": "Ingest"})).json()["id"]
+
+        start = time.perf_counter()
+        upload = (await client.post(f"/knowledge-base/{kb_id}/documents", files=files)).raise_for_status().json()
+        upload_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        retry = (await client.post(f"/knowledge-base/{kb_id}/documents", files=files)).raise_for_status().json()
+        retry_s = time.perf_counter() - start
+
+        kb = (await client.get(f"/knowledge-base/{kb_id}")).json()
+
+    return {
+        "upload_s": round(upload_s, 3),
+        "chunks_per_s": round(upload["documents_processed"] / upload_s, 1),
+        "retry_s": round(retry_s, 3),
+        "retry_stored": retry["documents_processed"],
+        "retry_skipped": retry["duplicates_skipped"],
+        "document_count": kb["document_count"],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=30)
+    parser.add_argument("--batch-chunks", type=int, nargs="+", default=[1, 32, 512])
+    parser.add_argument("--backend", default="local", choices=["local", "chroma"])
+    add_fake_ollama_arguments(parser)
+    args = parser.parse_args()
+
+    results = {}
+    for size in args.batch_chunks:
+        with serve(args, env={"INGEST_BATCH_CHUNKS": str(size)}) as (base_url, _):
+            results[f"batch_{size}"] = asyncio.run(_measure(base_url, args))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
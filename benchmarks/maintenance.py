@@ -0,0 +1,104 @@
+"""Maintenance: disk usage and search latency of a churned local collection, before and after a pass.
+
+Builds a local-backend collection of `--rows` random vectors, then re-uploads
+`--churn` of them `--rounds` times (each re-upload leaves the old rows behind
+as tombstones, as repeated ingests of changed documents do). It adds an
+orphaned collection and stale upload temp files, runs one `app.maintenance`
+pass over it, and reports disk bytes and exact-search latency before and
+after, with the pass's own report, as JSON.
+
+Usage:
+    uv run python -m benchmarks.maintenance --rows 50000 --dim 768 --churn 0.5 --rounds 2
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from unittest.mock import patch
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from benchmarks.vector_store_latency import _time_queries
+
+
+class RandomEmbeddings(Embeddings):
+    def __init__(self, dim: int) -> None:
+        self.dim = dim
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return np.random.default_rng(len(text)).standard_normal(self.dim).astype(np.float32).tolist()
+
+
+def _measure(backend, queries: np.ndarray, k: int) -> dict:
+    store = backend.get_store("bench")
+    return {
+        "storage_mb": round(backend.storage_bytes() / 1e6, 2),
+        "dead_fraction": round(backend.dead_fraction("bench"), 3),
+        "search": _time_queries(lambda q, kk: store.similarity_search_by_vector_with_score(q, k=kk), queries, k),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--churn", type=float, default=0.5, help="share of rows re-uploaded per round")
+    parser.add_argument("--rounds", type=int, default=2)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=4)
+    args = parser.parse_args()
+
+    from app import maintenance
+    from app.config import settings
+    from app.rag.vector_store.local_backend import LocalVectorStoreBackend
+    from app.state import KnowledgeBaseRegistry
+
+    rng = np.random.default_rng(0)
+    ids = [f"chunk-{i}" for i in range(args.rows)]
+    texts = [f"text {i}" for i in range(args.rows)]
+    queries = rng.standard_normal((args.queries, args.dim)).astype(np.float32)
+
+    with tempfile.TemporaryDirectory() as root, patch.multiple(
+        settings,
+        UPLOAD_DIR=os.path.join(root, "uploads"),
+        MAINTENANCE_BUSY_FRACTION=1.0,
+        LOCAL_ANN_THRESHOLD=10**9,  # exact search, so latency tracks the rows scanned
+    ):
+        backend = LocalVectorStoreBackend(root=os.path.join(root, "vectors"), embeddings=RandomEmbeddings(args.dim))
+        collection = backend.get_store("bench")._collection
+        collection.upsert(ids, texts, [{} for _ in ids], rng.standard_normal((args.rows, args.dim)).astype(np.float32))
+        churned = int(args.rows * args.churn)
+        for _ in range(args.rounds):
+            rows = rng.choice(args.rows, size=churned, replace=False)
+            vectors = rng.standard_normal((churned, args.dim)).astype(np.float32)
+            collection.upsert([ids[r] for r in rows], [texts[r] for r in rows], [{} for _ in rows], vectors)
+        backend.get_store("orphan")._collection.upsert(
+            ids[:1000], texts[:1000], [{} for _ in range(1000)], rng.standard_normal((1000, args.dim)).astype(np.float32)
+        )
+        maintenance.pending_collection_deletes.add("orphan")
+        os.makedirs(settings.UPLOAD_DIR)
+        past = time.time() - 2 * settings.MAINTENANCE_GRACE_SECONDS
+        for i in range(20):
+            path = os.path.join(settings.UPLOAD_DIR, f"upload-{i}.pdf")
+            with open(path, "wb") as f:
+                f.write(os.urandom(256 * 1024))
+            os.utime(path, (past, past))
+
+        registry = KnowledgeBaseRegistry(bench={"id": "bench"})
+        before = _measure(backend, queries, args.k)
+        with patch("app.maintenance.get_vector_store", return_value=backend):
+            report = asyncio.run(maintenance.run_maintenance(registry))
+        after = _measure(backend, queries, args.k)
+
+    print(json.dumps({"before": before, "after": after, "report": report.model_dump(mode="json")}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
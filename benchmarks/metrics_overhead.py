@@ -0,0 +1,75 @@
+"""Cost of the /metrics instrumentation on a chat request.
+
+Counts the metric updates one RAG `/chat` turn makes (with stub retrieval
+and model, in-process) and times the same number of updates. Reports the
+instrumentation cost per request next to the time of the stubbed request.
+A real turn also waits on Ollama, so its overhead share is far smaller.
+
+Usage:
+    uv run python -m benchmarks.metrics_overhead --requests 200
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from unittest.mock import patch
+
+from httpx import ASGITransport, AsyncClient
+from langchain_core.messages import AIMessage
+
+
+async def _run(args: argparse.Namespace) -> dict:
+    from app.main import app
+    from app.telemetry import CHAT_REQUEST_SECONDS, CHAT_STAGE_SECONDS, Histogram, registry
+
+    async def search(kb_id, query, top_k=None, metadata_filter=None):
+        return [(f"{kb_id} says something about {query}", {"source_filename": f"{kb_id}.txt"}, 0.9, None)]
+
+    class Model:
+        async def ainvoke(self, messages, **kwargs):
+            return AIMessage(content="answer")
+
+    def observations() -> int:
+        return int(sum(sum(row[:-1]) for h in (CHAT_STAGE_SECONDS, CHAT_REQUEST_SECONDS) for row in h._values.values()))
+
+    body = {"message": "What changed?", "knowledge_base_ids": ["kb-0", "kb-1"]}
+    with patch("app.api.chat.aretrieve_context", search), patch("app.api.chat.llm", Model()):
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://bench") as client:
+            await client.post("/chat", json=body)
+            before = observations()
+            start = time.perf_counter()
+            for _ in range(args.requests):
+                await client.post("/chat", json=body)
+            request_s = (time.perf_counter() - start) / args.requests
+            # Histogram observations, plus the two token counter increments.
+            updates = (observations() - before) / args.requests + 2
+
+    histogram = Histogram("bench_seconds", "Scratch histogram.", ("stage",))
+    registry.remove(histogram)
+    start = time.perf_counter()
+    for _ in range(args.samples):
+        with histogram.time(stage="bench"):
+            pass
+    update_s = (time.perf_counter() - start) / args.samples
+
+    overhead_s = updates * update_s
+    return {
+        "updates_per_request": updates,
+        "update_us": round(update_s * 1e6, 2),
+        "overhead_us_per_request": round(overhead_s * 1e6, 1),
+        "stub_request_ms": round(request_s * 1000, 2),
+        "overhead_pct_of_stub_request": round(overhead_s / request_s * 100, 2),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--samples", type=int, default=100_000)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(_run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Chat latency with and without a small-model tier, on a mixed workload.
+
+Drives `/chat` in-process with concurrent sessions whose turns mix short
+follow-ups ("thanks", "shorter please") with long questions. The models are
+stubs that simulate an Ollama runner: calls to one model are served one at a
+time and take a fixed time per turn, the small model `--small-speedup` times
+faster than the large one. Reports mean / p95 latency and how many turns
+each model served.
+
+Usage:
+    uv run python -m benchmarks.model_routing --sessions 8 --turns 10
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from unittest.mock import patch
+
+from httpx import ASGITransport, AsyncClient
+from langchain_core.messages import AIMessage
+
+SHORT_TURNS = ["thanks!", "shorter please", "ok, and?", "got it"]
+
+
+class SimulatedRunner:
+    def __init__(self, turn_ms: float) -> None:
+        self._turn_s = turn_ms / 1000
+        self._lock = asyncio.Lock()
+        self.calls = 0
+
+    async def ainvoke(self, messages, **kwargs) -> AIMessage:
+        async with self._lock:
+            self.calls += 1
+            await asyncio.sleep(self._turn_s)
+        return AIMessage(content="answer")
+
+
+async def _session(client: AsyncClient, session: int, turns: int, latencies: list[float]) -> None:
+    session_id = None
+    for turn in range(turns):
+        message = SHORT_TURNS[turn % len(SHORT_TURNS)] if turn % 2 else f"Session {session}: " + "explain this " * 20
+        body = {"message": message, **({"session_id": session_id} if session_id else {})}
+        start = time.perf_counter()
+        response = await client.post("/chat", json=body)
+        latencies.append(time.perf_counter() - start)
+        session_id = response.json()["session_id"]
+
+
+async def _run(args: argparse.Namespace) -> dict:
+    from app.config import settings
+    from app.main import app
+
+    report = {}
+    for label, small_model in (("single_model", None), ("routed", "small")):
+        large = SimulatedRunner(args.large_turn_ms)
+        small = SimulatedRunner(args.large_turn_ms / args.small_speedup) if small_model else None
+        latencies: list[float] = []
+        with patch.object(settings, "OLLAMA_SMALL_MODEL", small_model), \
+                patch("app.api.chat.llm", large), patch("app.api.chat.small_llm", small):
+            async with AsyncClient(transport=ASGITransport(app=app), base_url="http://bench", timeout=None) as client:
+                await asyncio.gather(*(_session(client, s, args.turns, latencies) for s in range(args.sessions)))
+        report[label] = {
+            "mean_ms": round(statistics.mean(latencies) * 1000, 1),
+            "p95_ms": round(statistics.quantiles(latencies, n=20)[-1] * 1000, 1),
+            "large_calls": large.calls,
+            "small_calls": small.calls if small else 0,
+        }
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--large-turn-ms", type=float, default=40.0)
+    parser.add_argument("--small-speedup", type=float, default=4.0)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(_run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
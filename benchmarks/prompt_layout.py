@@ -0,0 +1,99 @@
+"""Prompt-eval cost per turn for each `PROMPT_LAYOUT` over multi-turn sessions.
+
+Drives `/chat` in-process with retrieved context on every turn, once per
+layout, and reads the averages back from `GET /chat/prompt-eval`. By default
+the model is a stub that simulates Ollama's KV cache: it only "evaluates" the
+tokens after the prefix it shares with the previous prompt, at a fixed cost
+per token, and reports `prompt_eval_count` / `prompt_eval_duration` the way
+Ollama does. Prompt evaluation is what the first token waits for, so
+`avg_prompt_eval_ms` stands in for time-to-first-token.
+
+Pass `--ollama` to send the turns to the configured Ollama model instead.
+
+Usage:
+    uv run python -m benchmarks.prompt_layout --sessions 5 --turns 30
+"""
+
+import argparse
+import asyncio
+import json
+import os
+from contextlib import nullcontext
+from unittest.mock import patch
+
+from httpx import ASGITransport, AsyncClient
+from langchain_core.messages import AIMessage, BaseMessage, SystemMessage
+
+CHARS_PER_TOKEN = 4
+
+
+class SimulatedOllamaCache:
+    def __init__(self, per_token_ms: float, answer_chars: int) -> None:
+        self._per_token_ms = per_token_ms
+        self._answer = "a" * answer_chars
+        self._cached = ""
+
+    async def ainvoke(self, messages: list[BaseMessage], **kwargs) -> AIMessage:
+        prompt = "".join(f"<{m.type}>{m.content}" for m in messages)
+        shared = os.path.commonprefix([self._cached, prompt])
+        self._cached = prompt + self._answer
+        evaluated = (len(prompt) - len(shared)) // CHARS_PER_TOKEN + 1
+        return AIMessage(
+            content=self._answer,
+            response_metadata={
+                "prompt_eval_count": evaluated,
+                "prompt_eval_duration": int(evaluated * self._per_token_ms * 1e6),
+            },
+        )
+
+
+async def _run(args: argparse.Namespace) -> list[dict]:
+    from app.config import settings
+    from app.main import app
+    from app.telemetry import prompt_eval_totals
+
+    async def rag_prefix(kb_ids, query, metadata_filter=None) -> tuple[list[BaseMessage], list]:
+        return [SystemMessage(content=f"Context for {query}:\n" + query * (args.context_chars // len(query)))], []
+
+    report = []
+    with patch("app.api.chat._build_rag_prefix", rag_prefix):
+        for layout in ("classic", "stable_prefix"):
+            settings.PROMPT_LAYOUT = layout
+            prompt_eval_totals.clear()
+            async with AsyncClient(transport=ASGITransport(app=app), base_url="http://bench", timeout=None) as client:
+                for session in range(args.sessions):
+                    # A fresh model per session: another session's prompt would evict the cache anyway.
+                    llm = SimulatedOllamaCache(args.per_token_ms, args.answer_chars)
+                    with nullcontext() if args.ollama else patch("app.api.chat.llm", llm):
+                        session_id = None
+                        for turn in range(args.turns):
+                            body = {"message": f"Session {session} question {turn}: " + "q" * args.question_chars,
+                                    "knowledge_base_ids": ["bench"]}
+                            if session_id:
+                                body["session_id"] = session_id
+                            response = await client.post("/chat", json=body)
+                            session_id = response.json()["session_id"]
+                stats = (await client.get("/chat/prompt-eval")).json()
+            report.extend(
+                {**s, "avg_prompt_eval_tokens": round(s["avg_prompt_eval_tokens"], 1),
+                 "avg_prompt_eval_ms": round(s["avg_prompt_eval_ms"], 1)}
+                for s in stats
+            )
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=5)
+    parser.add_argument("--turns", type=int, default=30)
+    parser.add_argument("--question-chars", type=int, default=200)
+    parser.add_argument("--answer-chars", type=int, default=800)
+    parser.add_argument("--context-chars", type=int, default=2000)
+    parser.add_argument("--per-token-ms", type=float, default=0.5)
+    parser.add_argument("--ollama", action="store_true", help="use the configured Ollama model instead of the stub")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(_run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Large top_k queries: buffered /query vs streamed /query/stream.
+
+Serves the app with uvicorn on a local port (see `benchmarks.stream_latency`)
+against a local-backend knowledge base of `--rows` chunks of about
+`--chunk-chars` characters. For each `--top-k` it sends the same query to
+`/query` and to `/query/stream` (full content, content truncated to 200
+characters, metadata only) and reports, as JSON: time to first byte, total
+time, response MB and the peak memory Python allocated meanwhile, in the
+server and the client (tracemalloc; the client keeps no more than a chunk).
+
+Usage:
+    uv run python -m benchmarks.query_stream --rows 20000 --top-k 1000 10000
+"""
+
+import argparse
+import asyncio
+import json
+import tempfile
+import time
+import tracemalloc
+from unittest.mock import patch
+
+import numpy as np
+from httpx import AsyncClient
+
+from benchmarks.maintenance import RandomEmbeddings
+from benchmarks.stream_latency import _serve
+
+VARIANTS = {
+    "buffered": ("query", {}),
+    "stream": ("query/stream", {}),
+    "stream_truncated": ("query/stream", {"max_content_chars": 200}),
+    "stream_metadata": ("query/stream", {"include_content": False}),
+}
+
+
+async def _measure(client: AsyncClient, url: str, body: dict) -> dict:
+    tracemalloc.start()
+    start = time.perf_counter()
+    first_byte = None
+    size = 0
+    async with client.stream("POST", url, json=body) as response:
+        response.raise_for_status()
+        async for chunk in response.aiter_bytes():
+            first_byte = first_byte or time.perf_counter()
+            size += len(chunk)
+    total = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "first_byte_ms": round((first_byte - start) * 1000, 1),
+        "total_ms": round(total * 1000, 1),
+        "response_mb": round(size / 1e6, 2),
+        "peak_alloc_mb": round(peak / 1e6, 1),
+    }
+
+
+async def _run(args: argparse.Namespace) -> dict:
+    from app.api.knowledge_base import kb_registry
+    from app.config import settings
+    from app.main import app
+    from app.rag.vector_store.local_backend import LocalVectorStoreBackend
+
+    rng = np.random.default_rng(0)
+    results = {}
+    with tempfile.TemporaryDirectory() as root:
+        backend = LocalVectorStoreBackend(root=root, embeddings=RandomEmbeddings(args.dim))
+        kb_registry["bench"] = {
+            "id": "bench", "name": "bench", "description": "", "document_count": args.rows,
+            "created_at": "2024-01-01T00:00:00Z",
+        }
+        words = args.chunk_chars // 8
+        texts = [
+            f"Chunk {i}: " + " ".join(f"term{j:03d}" for j in rng.integers(0, 1000, words)) for i in range(args.rows)
+        ]
+        metadatas = [{"source_filename": f"doc-{i // 50}.pdf", "page": i % 50} for i in range(args.rows)]
+        vectors = rng.standard_normal((args.rows, args.dim)).astype(np.float32)
+        backend._collection("bench").upsert([f"chunk-{i}" for i in range(args.rows)], texts, metadatas, vectors)
+
+        with patch("app.api.knowledge_base.get_vector_store", return_value=backend), \
+                patch("app.rag.retriever.get_vector_store", return_value=backend), \
+                patch.object(settings, "RETRIEVAL_CACHE_MAX_BYTES", 0), \
+                patch.object(settings, "QUERY_STREAM_MAX_RESULTS", max(args.top_k)):
+            server, base_url = _serve(app)
+            async with AsyncClient(base_url=base_url, timeout=600) as client:
+                # The first search builds the index.
+                (await client.post("/knowledge-base/bench/query", json={"query": "warm up"})).raise_for_status()
+                for k in args.top_k:
+                    results[f"top_{k}"] = {
+                        name: await _measure(
+                            client, f"/knowledge-base/bench/{path}", {"query": "quarterly revenue", "top_k": k, **extra}
+                        )
+                        for name, (path, extra) in VARIANTS.items()
+                    }
+            server.should_exit = True
+        kb_registry.clear()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--chunk-chars", type=int, default=1000)
+    parser.add_argument("--top-k", type=int, nargs="+", default=[1000, 10000])
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(_run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Reindexing: re-embedding throughput, and query latency while a reindex runs.
+
+Starts the app against `benchmarks.fake_ollama` (see `benchmarks.suite`) once
+per `--busy-fractions` value (as `REINDEX_BUSY_FRACTION`), with the retrieval
+cache off. Each run uploads a synthetic corpus of `--files` files into one
+knowledge base and times `--queries` standalone queries. It then reindexes the
+knowledge base to `--to-model` and runs the same queries back to back until
+the job completes. It reports, as JSON:
+
+- the job's duration and the documents it re-embedded per second
+- query latency before and during the reindex, and the queries answered
+  during it
+- whether the knowledge base ended up on the new model with its documents
+
+The stand-in server serves each model with its own `--parallel` runners, so
+the job competes with queries for the app's CPU and disk, not for the
+embedding model's queue.
+
+Usage:
+    uv run python -m benchmarks.reindex --files 30 --busy-fractions 1.0 0.5 0.25
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from benchmarks.fake_ollama import add_arguments as add_fake_ollama_arguments
+from benchmarks.suite import WORDS, _percentiles, corpus, serve
+
+
+async def _timed_queries(client: httpx.AsyncClient, kb_id: str, count: int) -> list[float]:
+    samples = []
+    for i in range(count):
+        query = " ".join(WORDS[(i + j) % len(WORDS)] for j in range(3))
+        start = time.perf_counter()
+        (await client.post(f"/knowledge-base/{kb_id}/query", json={"query": query})).raise_for_status()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+async def _measure(base_url: str, args: argparse.Namespace) -> dict:
+    files = [("files", (name, content, content_type)) for name, content, content_type in corpus(0, args.files)]
+    async with httpx.AsyncClient(base_url=base_url, timeout=600.0) as client:
+        kb_id = (await client.post("/knowledge-base", json={"name": "Reindex"})).json()["id"]
+        (await client.post(f"/knowledge-base/{kb_id}/documents", files=files)).raise_for_status()
+        before = await _timed_queries(client, kb_id, args.queries)
+
+        start = time.perf_counter()
+        (await client.post(f"/knowledge-base/{kb_id}/reindex", json={"embedding_model": args.to_model})).raise_for_status()
+        during: list[float] = []
+        while True:
+            during += await _timed_queries(client, kb_id, 5)
+            status = (await client.get(f"/knowledge-base/{kb_id}/reindex")).json()
+            if status["state"] != "running":
+                break
+        reindex_s = time.perf_counter() - start
+        kb = (await client.get(f"/knowledge-base/{kb_id}")).json()
+
+    return {
+        "state": status["state"],
+        "documents": status["documents_done"],
+        "reindex_s": round(reindex_s, 3),
+        "documents_per_s": round(status["documents_done"] / reindex_s, 1),
+        "query_ms_before": _percentiles(before),
+        "query_ms_during": _percentiles(during),
+        "queries_during": len(during),
+        "switched": kb["embedding_model"] == args.to_model and kb["document_count"] == status["documents_done"],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=30)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--to-model", default="mxbai-embed-large")
+    parser.add_argument("--busy-fractions", type=float, nargs="+", default=[1.0, 0.5, 0.25])
+    parser.add_argument("--backend", default="local", choices=["local", "chroma"])
+    add_fake_ollama_arguments(parser)
+    args = parser.parse_args()
+
+    results = {}
+    for fraction in args.busy_fractions:
+        # The retrieval cache is off, so every query is embedded and searched.
+        env = {"REINDEX_BUSY_FRACTION": str(fraction), "RETRIEVAL_CACHE_MAX_BYTES": "0"}
+        with serve(args, env=env) as (base_url, _):
+            results[f"busy_{fraction}"] = asyncio.run(_measure(base_url, args))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Retrieval cache: repeated knowledge base queries with the cache off and on.
+
+Starts the app against `benchmarks.fake_ollama` (see `benchmarks.suite`),
+uploads a synthetic corpus into one knowledge base, then sends `--queries`
+`POST /knowledge-base/{kb_id}/query` requests drawn from `--distinct` query
+strings, with the most popular repeated most often, as a dashboard or chat
+retries would. It runs once with `RETRIEVAL_CACHE_MAX_BYTES=0` and once with
+the default cache, and reports latency p50/p95/p99 in ms, throughput and the
+cache's hit rate (from `GET /admin/retrieval-cache`) as JSON.
+
+Usage:
+    uv run python -m benchmarks.retrieval_cache --queries 500 --distinct 25
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import httpx
+
+from benchmarks.fake_ollama import add_arguments as add_fake_ollama_arguments
+from benchmarks.suite import ADMIN_TOKEN, WORDS, _percentiles, _run_workers, corpus, serve
+
+
+async def _measure(base_url: str, args: argparse.Namespace) -> dict:
+    rng = random.Random(0)
+    pool = [" ".join(rng.sample(WORDS, 4)) for _ in range(args.distinct)]
+    # Zipf-like popularity: query i is drawn with weight 1 / (i + 1).
+    queries = rng.choices(pool, weights=[1 / (i + 1) for i in range(len(pool))], k=args.queries)
+    latencies: list[float] = []
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=300.0) as client:
+        kb_id = (await client.post("/knowledge-base", json={"name": "Dashboards"})).json()["id"]
+        files = [("files", (name, content, content_type)) for name, content, content_type in corpus(0, args.files)]
+        (await client.post(f"/knowledge-base/{kb_id}/documents", files=files)).raise_for_status()
+
+        async def query(text: str) -> None:
+            start = time.perf_counter()
+            response = await client.post(f"/knowledge-base/{kb_id}/query", json={"query": text})
+            latencies.append(time.perf_counter() - start)
+            response.raise_for_status()
+
+        elapsed = await _run_workers(args.concurrency, queries, query)
+        cache = (await client.get("/admin/retrieval-cache", headers={"X-Admin-Token": ADMIN_TOKEN})).json()
+
+    return {
+        "queries_per_s": round(len(latencies) / elapsed, 2),
+        "latency_ms": _percentiles(latencies),
+        "hit_rate": cache["hit_rate"],
+        "cached_bytes": cache["bytes"],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--distinct", type=int, default=25, help="distinct query strings")
+    parser.add_argument("--files", type=int, default=6, help="files uploaded into the knowledge base")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--backend", default="local", choices=["local", "chroma"])
+    add_fake_ollama_arguments(parser)
+    args = parser.parse_args()
+
+    results = {}
+    for name, env in (("cache_off", {"RETRIEVAL_CACHE_MAX_BYTES": "0"}), ("cache_on", {})):
+        with serve(args, env=env) as (base_url, _):
+            results[name] = asyncio.run(_measure(base_url, args))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
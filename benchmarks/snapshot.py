@@ -0,0 +1,79 @@
+"""Snapshots: archive size, export and import throughput, and the recall of int8 vectors.
+
+Fills a local-backend collection with `--rows` random `--dim`-dimensional
+vectors and short texts. It exports the collection with `app.rag.snapshot` in
+each vector encoding and imports every archive into a fresh collection. It
+reports archive MB, export and import rows/s, and recall@k of searches on the
+imported copy against the original, as JSON. Nothing is embedded on either
+side.
+
+Usage:
+    uv run python -m benchmarks.snapshot --rows 50000 --dim 768
+"""
+
+import argparse
+import io
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from app.rag import snapshot
+from app.rag.vector_store.local_backend import LocalVectorStoreBackend
+from benchmarks.maintenance import RandomEmbeddings
+
+
+def _top_ids(backend: LocalVectorStoreBackend, collection: str, queries: np.ndarray, k: int) -> list[set[str]]:
+    return [{doc.id for doc, _ in backend.search_by_vector(collection, q.tolist(), k)} for q in queries]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    queries = rng.standard_normal((args.queries, args.dim)).astype(np.float32)
+    results = {}
+    with tempfile.TemporaryDirectory() as root:
+        backend = LocalVectorStoreBackend(root=os.path.join(root, "vectors"), embeddings=RandomEmbeddings(args.dim))
+        ids = [f"chunk-{i}" for i in range(args.rows)]
+        texts = [f"Section {i}: " + " ".join(f"term{j}" for j in rng.integers(0, 5000, 60)) for i in range(args.rows)]
+        metadatas = [{"source_filename": f"doc-{i // 50}.pdf", "page": i % 50} for i in range(args.rows)]
+        backend._collection("source").upsert(
+            ids, texts, metadatas, rng.standard_normal((args.rows, args.dim)).astype(np.float32)
+        )
+        expected = _top_ids(backend, "source", queries, args.k)
+        kb = {"name": "bench", "description": "", "vector_quantization": "none"}
+
+        for encoding in ("float32", "int8"):
+            start = time.perf_counter()
+            archive = b"".join(snapshot.write_archive(backend, "source", kb, "nomic-embed-text", encoding))
+            export_s = time.perf_counter() - start
+
+            start = time.perf_counter()
+            batches = snapshot.read_archive(io.BytesIO(archive))
+            next(batches)
+            for rows in batches:
+                backend.add_rows(f"copy-{encoding}", rows)
+            import_s = time.perf_counter() - start
+
+            found = _top_ids(backend, f"copy-{encoding}", queries, args.k)
+            results[encoding] = {
+                "archive_mb": round(len(archive) / 1e6, 2),
+                "export_rows_per_s": round(args.rows / export_s),
+                "import_rows_per_s": round(args.rows / import_s),
+                f"recall_at_{args.k}": round(
+                    sum(len(e & f) for e, f in zip(expected, found)) / (args.k * args.queries), 4
+                ),
+            }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
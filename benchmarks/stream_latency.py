@@ -0,0 +1,97 @@
+"""Time-to-first-byte and time-to-first-token of `/chat/stream` with RAG.
+
+Serves the app with uvicorn on a local port (the in-process ASGI transport
+buffers whole responses), with stubs for the slow parts of a RAG turn:
+loading the session (`--history-ms`), searching each knowledge base
+(`--retrieval-ms`), and the model's prompt evaluation before its first
+token (`--first-token-ms`). Reports mean / p95 time to the first byte of
+the response body and to the first event with content.
+
+Usage:
+    uv run python -m benchmarks.stream_latency --requests 50 --kbs 2
+"""
+
+import argparse
+import asyncio
+import json
+import socket
+import statistics
+import threading
+import time
+from unittest.mock import patch
+
+import uvicorn
+from httpx import AsyncClient
+from langchain_core.messages import AIMessageChunk
+
+
+def _summary(samples: list[float]) -> dict:
+    return {
+        "mean_ms": round(statistics.mean(samples) * 1000, 1),
+        "p95_ms": round(statistics.quantiles(samples, n=20)[-1] * 1000, 1),
+    }
+
+
+def _serve(app) -> tuple[uvicorn.Server, str]:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    # No lifespan: it would try to warm up a real Ollama.
+    server = uvicorn.Server(uvicorn.Config(app, port=port, lifespan="off", log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return server, f"http://127.0.0.1:{port}"
+
+
+async def _run(args: argparse.Namespace) -> dict:
+    from app.main import app
+
+    async def load_history(session_id):
+        await asyncio.sleep(args.history_ms / 1000)
+        return None
+
+    async def search(kb_id, query, top_k=None, metadata_filter=None):
+        await asyncio.sleep(args.retrieval_ms / 1000)
+        return [(f"{kb_id} says something about {query}", {"source_filename": f"{kb_id}.txt"}, 0.9, None)]
+
+    class Model:
+        async def astream(self, messages, **kwargs):
+            await asyncio.sleep(args.first_token_ms / 1000)
+            for _ in range(args.tokens):
+                yield AIMessageChunk(content="tok ")
+
+    ttfb, ttft = [], []
+    body = {"message": "What changed?", "session_id": "bench", "knowledge_base_ids": [f"kb-{i}" for i in range(args.kbs)]}
+    with patch("app.api.chat._restore_history", load_history), \
+            patch("app.api.chat.aretrieve_context", search), patch("app.api.chat.llm", Model()):
+        server, base_url = _serve(app)
+        async with AsyncClient(base_url=base_url, timeout=None) as client:
+            for _ in range(args.requests):
+                start = time.perf_counter()
+                first_byte = first_token = None
+                async with client.stream("POST", "/chat/stream", json=body) as response:
+                    async for line in response.aiter_lines():
+                        first_byte = first_byte or time.perf_counter()
+                        if line.startswith("data: ") and json.loads(line[len("data: "):])["content"]:
+                            first_token = first_token or time.perf_counter()
+                ttfb.append(first_byte - start)
+                ttft.append(first_token - start)
+        server.should_exit = True
+    return {"ttfb": _summary(ttfb), "ttft": _summary(ttft)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--kbs", type=int, default=2)
+    parser.add_argument("--history-ms", type=float, default=20.0)
+    parser.add_argument("--retrieval-ms", type=float, default=40.0)
+    parser.add_argument("--first-token-ms", type=float, default=60.0)
+    parser.add_argument("--tokens", type=int, default=20)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(_run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
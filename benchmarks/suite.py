@@ -0,0 +1,448 @@
+"""End-to-end benchmark suite: the real app against a stand-in Ollama server.
+
+`run` starts `benchmarks.fake_ollama` and the app (`uvicorn app.main:app`) as
+subprocesses on local ports, with all state in a temporary directory, waits
+for `/ready`, then measures:
+
+- ingest: uploads of synthetic PDF / CSV / Markdown corpora into `--kbs`
+  knowledge bases (files/s, chunks/s, MB/s, per-upload latency)
+- chat: `/chat` turns over multi-turn sessions
+- stream: `/chat/stream` turns (time to first byte, first token, and last byte)
+- rag: `/chat` turns retrieving from every knowledge base
+
+With `--workers N` the app runs N uvicorn workers on shared SQLite state, so
+consecutive turns of a session usually land on different workers.
+
+Latencies are reported as p50/p95/p99 in ms, alongside throughput and the
+app process's peak RSS, as JSON. `compare` diffs two result files and can
+fail on regressions.
+
+Usage:
+    uv run python -m benchmarks.suite run --output before.json
+    uv run python -m benchmarks.suite run --output after.json
+    uv run python -m benchmarks.suite compare before.json after.json --fail-above 10
+"""
+
+import argparse
+import asyncio
+import csv
+import io
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+
+from benchmarks.fake_ollama import add_arguments as add_fake_ollama_arguments
+
+ROOT = Path(__file__).resolve().parent.parent
+WORDS = (
+    "revenue forecast quarter margin pipeline customer churn contract region budget hiring "
+    "latency throughput incident release roadmap vendor invoice audit policy compliance"
+).split()
+
+
+# --- Synthetic corpora ---
+
+
+def _sentences(seed: int, count: int) -> list[str]:
+    return [
+        " ".join(WORDS[(seed * 7 + i * 13 + j * 3) % len(WORDS)] for j in range(12)).capitalize() + "."
+        for i in range(count)
+    ]
+
+
+def _markdown(seed: int, sections: int) -> bytes:
+    parts = [f"# Report {seed}\n"]
+    for s in range(sections):
+        parts.append(f"\n## Section {s}\n\n" + " ".join(_sentences(seed + s, 8)) + "\n")
+    return "".join(parts).encode()
+
+
+def _csv(seed: int, rows: int) -> bytes:
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(["id", "region", "metric", "value", "note"])
+    for r in range(rows):
+        region, metric = WORDS[(seed + r) % len(WORDS)], WORDS[(seed * 3 + r) % len(WORDS)]
+        writer.writerow([r, region, metric, (seed * r) % 997, _sentences(seed + r, 1)[0]])
+    return out.getvalue().encode()
+
+
+def _pdf(seed: int, pages: int) -> bytes:
+    """A minimal multi-page text PDF (Helvetica, no compression) that pypdf can parse."""
+    objects: list[bytes] = []
+    page_ids = [3 + 2 * p for p in range(pages)]
+    font_id = 3 + 2 * pages
+    objects.append(b"<< /Type /Catalog /Pages 2 0 R >>")
+    objects.append(f"<< /Type /Pages /Kids [{' '.join(f'{i} 0 R' for i in page_ids)}] /Count {pages} >>".encode())
+    for p in range(pages):
+        lines = _sentences(seed + p, 40)
+        text = " T* ".join("(" + line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ") Tj" for line in lines)
+        stream = f"BT /F1 9 Tf 40 800 Td 12 TL {text} ET".encode()
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] /Contents {page_ids[p] + 1} 0 R "
+            f"/Resources << /Font << /F1 {font_id} 0 R >> >> >>".encode()
+        )
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+def corpus(kb_index: int, files: int) -> list[tuple[str, bytes, str]]:
+    """(filename, content, content type) for one knowledge base, cycling PDF / CSV / Markdown."""
+    makers = [
+        ("pdf", "application/pdf", lambda seed: _pdf(seed, 3)),
+        ("csv", "text/csv", lambda seed: _csv(seed, 60)),
+        ("md", "text/markdown", lambda seed: _markdown(seed, 6)),
+    ]
+    documents = []
+    for f in range(files):
+        ext, content_type, make = makers[f % len(makers)]
+        seed = kb_index * 1000 + f
+        documents.append((f"doc-{seed}.{ext}", make(seed), content_type))
+    return documents
+
+
+# --- Process management ---
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for(url: str, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f"{url} did not become ready within {timeout:.0f}s")
+
+
+def _peak_rss_mb(pid: int) -> float | None:
+    """Peak RSS of the process plus its children (the workers, with `--workers`)."""
+    try:
+        status = Path(f"/proc/{pid}/status").read_text()
+        children = Path(f"/proc/{pid}/task/{pid}/children").read_text().split()
+    except OSError:
+        return None
+    peak = next(int(line.split()[1]) / 1024 for line in status.splitlines() if line.startswith("VmHWM:"))
+    return round(peak + sum(_peak_rss_mb(int(child)) or 0 for child in children), 1)
+
+
+def _git_revision() -> str | None:
+    try:
+        revision = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT, capture_output=True, text=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return revision + ("-dirty" if dirty else "")
+
+
+# --- Measurement ---
+
+
+def _percentiles(samples: list[float]) -> dict:
+    if len(samples) < 2:
+        value = round(samples[0] * 1000, 2) if samples else None
+        return {"p50": value, "p95": value, "p99": value}
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    return {"p50": round(cuts[49] * 1000, 2), "p95": round(cuts[94] * 1000, 2), "p99": round(cuts[98] * 1000, 2)}
+
+
+async def _run_workers(concurrency: int, jobs: list, worker) -> float:
+    """Run `worker(job)` over all jobs with `concurrency` workers; return the wall time."""
+    queue: asyncio.Queue = asyncio.Queue()
+    for job in jobs:
+        queue.put_nowait(job)
+
+    async def drain() -> None:
+        while not queue.empty():
+            await worker(queue.get_nowait())
+
+    start = time.perf_counter()
+    await asyncio.gather(*(drain() for _ in range(concurrency)))
+    return time.perf_counter() - start
+
+
+async def _ingest(client: httpx.AsyncClient, args: argparse.Namespace) -> tuple[list[str], dict]:
+    kb_ids = []
+    for k in range(args.kbs):
+        response = await client.post("/knowledge-base", json={"name": f"bench-{k}"})
+        response.raise_for_status()
+        kb_ids.append(response.json()["id"])
+
+    latencies: list[float] = []
+    totals = {"files": 0, "chunks": 0, "bytes": 0}
+    jobs = [(kb_id, doc) for k, kb_id in enumerate(kb_ids) for doc in corpus(k, args.files_per_kb)]
+
+    async def upload(job) -> None:
+        kb_id, (filename, content, content_type) = job
+        start = time.perf_counter()
+        response = await client.post(f"/knowledge-base/{kb_id}/documents", files={"files": (filename, content, content_type)})
+        latencies.append(time.perf_counter() - start)
+        response.raise_for_status()
+        result = response.json()
+        if result["errors"]:
+            raise RuntimeError(f"Upload of {filename} failed: {result['errors']}")
+        totals["files"] += 1
+        totals["chunks"] += result["documents_processed"]
+        totals["bytes"] += len(content)
+
+    elapsed = await _run_workers(args.upload_concurrency, jobs, upload)
+    return kb_ids, {
+        **totals,
+        "files_per_s": round(totals["files"] / elapsed, 2),
+        "chunks_per_s": round(totals["chunks"] / elapsed, 2),
+        "mb_per_s": round(totals["bytes"] / elapsed / 1e6, 3),
+        "latency_ms": _percentiles(latencies),
+    }
+
+
+async def _chat(client: httpx.AsyncClient, args: argparse.Namespace, kb_ids: list[str] | None) -> dict:
+    latencies: list[float] = []
+
+    async def session(index: int) -> None:
+        session_id = None
+        for turn in range(args.turns):
+            body = {"message": f"Session {index} turn {turn}: what does the report say about revenue?"}
+            if session_id:
+                body["session_id"] = session_id
+            if kb_ids:
+                body["knowledge_base_ids"] = kb_ids
+            start = time.perf_counter()
+            response = await client.post("/chat", json=body)
+            latencies.append(time.perf_counter() - start)
+            response.raise_for_status()
+            session_id = response.json()["session_id"]
+
+    elapsed = await _run_workers(args.concurrency, list(range(args.sessions)), session)
+    return {
+        "requests": len(latencies),
+        "requests_per_s": round(len(latencies) / elapsed, 2),
+        "latency_ms": _percentiles(latencies),
+    }
+
+
+async def _stream(client: httpx.AsyncClient, args: argparse.Namespace) -> dict:
+    ttfb: list[float] = []
+    ttft: list[float] = []
+    totals: list[float] = []
+
+    async def session(index: int) -> None:
+        session_id = None
+        for turn in range(args.turns):
+            body = {"message": f"Session {index} turn {turn}: summarise the pipeline."}
+            if session_id:
+                body["session_id"] = session_id
+            start = time.perf_counter()
+            first_byte = first_token = None
+            async with client.stream("POST", "/chat/stream", json=body) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    first_byte = first_byte or time.perf_counter()
+                    if not line.startswith("data: "):
+                        continue
+                    event = json.loads(line[len("data: "):])
+                    session_id = event["session_id"]
+                    if event["content"] and first_token is None:
+                        first_token = time.perf_counter()
+            end = time.perf_counter()
+            ttfb.append(first_byte - start)
+            ttft.append((first_token or end) - start)
+            totals.append(end - start)
+
+    elapsed = await _run_workers(args.concurrency, list(range(args.sessions)), session)
+    return {
+        "requests": len(totals),
+        "requests_per_s": round(len(totals) / elapsed, 2),
+        "ttfb_ms": _percentiles(ttfb),
+        "ttft_ms": _percentiles(ttft),
+        "latency_ms": _percentiles(totals),
+    }
+
+
+async def _scenarios(base_url: str, args: argparse.Namespace) -> dict:
+    results = {}
+    async with httpx.AsyncClient(base_url=base_url, timeout=300.0) as client:
+        kb_ids, results["ingest"] = await _ingest(client, args)
+        results["chat"] = await _chat(client, args, None)
+        results["stream"] = await _stream(client, args)
+        results["rag"] = await _chat(client, args, kb_ids)
+    return results
+
+
+# Admin endpoints stay closed unless a token is configured.
+ADMIN_TOKEN = "benchmark"
+FAKE_OLLAMA_OPTIONS = (
+    "parallel", "first_token_ms", "prompt_ms_per_token", "tokens_per_s", "response_tokens",
+    "embed_ms", "embed_ms_per_text", "embed_dim",
+)
+
+
+@contextmanager
+def serve(args: argparse.Namespace, workers: int = 1, env: dict[str, str] | None = None):
+    """Run the fake Ollama server and the app on free ports; yield (base URL, app process)."""
+    fake_args = [f"--{name.replace('_', '-')}={getattr(args, name)}" for name in FAKE_OLLAMA_OPTIONS]
+    with tempfile.TemporaryDirectory() as root:
+        ollama_port, app_port = _free_port(), _free_port()
+        env = {
+            **os.environ,
+            "OLLAMA_BASE_URL": f"http://127.0.0.1:{ollama_port}",
+            "VECTOR_STORE_BACKEND": getattr(args, "backend", "local"),
+            "LOCAL_VECTOR_DIR": os.path.join(root, "vectors"),
+            "CHROMA_PERSIST_DIR": os.path.join(root, "chroma"),
+            "UPLOAD_DIR": os.path.join(root, "uploads"),
+            "AGENT_CHECKPOINT_PATH": os.path.join(root, "agent_state.db"),
+            "PROFILE_DIR": os.path.join(root, "profiles"),
+            "STATE_BACKEND": "sqlite" if workers > 1 else "memory",
+            "STATE_DB_PATH": os.path.join(root, "shared_state.db"),
+            "ADMIN_TOKEN": ADMIN_TOKEN,
+            **(env or {}),
+        }
+        ollama = subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.fake_ollama", f"--port={ollama_port}", *fake_args], cwd=ROOT, env=env
+        )
+        server = None
+        try:
+            _wait_for(f"http://127.0.0.1:{ollama_port}/api/tags")
+            server = subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(app_port), "--log-level", "warning",
+                 "--workers", str(workers)],
+                cwd=ROOT, env=env,
+            )
+            base_url = f"http://127.0.0.1:{app_port}"
+            _wait_for(f"{base_url}/ready")
+            yield base_url, server
+        finally:
+            for process in (server, ollama):
+                if process is not None:
+                    process.terminate()
+                    process.wait(timeout=30)
+
+
+def run(args: argparse.Namespace) -> dict:
+    with serve(args, workers=args.workers) as (base_url, server):
+        scenarios = asyncio.run(_scenarios(base_url, args))
+        peak_rss_mb = _peak_rss_mb(server.pid)
+
+    return {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "revision": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": {k: v for k, v in vars(args).items() if k not in ("command", "output")},
+        },
+        "peak_rss_mb": peak_rss_mb,
+        "scenarios": scenarios,
+    }
+
+
+# --- Comparison ---
+
+
+def _flatten(results: dict) -> dict[str, float]:
+    flat = {"peak_rss_mb": results.get("peak_rss_mb")}
+
+    def walk(prefix: str, node) -> None:
+        if isinstance(node, dict):
+            for key, value in node.items():
+                walk(f"{prefix}.{key}" if prefix else key, value)
+        elif isinstance(node, (int, float)):
+            flat[prefix] = node
+
+    walk("", results["scenarios"])
+    return {k: v for k, v in flat.items() if v is not None}
+
+
+def _higher_is_better(metric: str) -> bool:
+    return "_per_s" in metric
+
+
+def compare(base: dict, new: dict, fail_above: float | None) -> int:
+    base_flat, new_flat = _flatten(base), _flatten(new)
+    print(f"base: {base['meta'].get('revision')}  new: {new['meta'].get('revision')}")
+    print(f"{'metric':<32} {'base':>12} {'new':>12} {'change':>9}")
+    regressions = []
+    for metric in sorted(base_flat.keys() & new_flat.keys()):
+        old, current = base_flat[metric], new_flat[metric]
+        if metric.endswith(("files", "chunks", "bytes", "requests")):
+            continue
+        change = (current - old) / old * 100 if old else 0.0
+        worse = -change if _higher_is_better(metric) else change
+        flag = ""
+        if fail_above is not None and worse > fail_above:
+            regressions.append(metric)
+            flag = "  REGRESSION"
+        print(f"{metric:<32} {old:>12.2f} {current:>12.2f} {change:>+8.1f}%{flag}")
+    if regressions:
+        print(f"{len(regressions)} metric(s) regressed by more than {fail_above}%")
+        return 1
+    return 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run the suite and print or save JSON results")
+    run_parser.add_argument("--output", help="write results here instead of stdout")
+    run_parser.add_argument("--backend", default="local", choices=["local", "chroma"])
+    run_parser.add_argument("--workers", type=int, default=1, help="app worker processes (shared state when > 1)")
+    run_parser.add_argument("--kbs", type=int, default=4)
+    run_parser.add_argument("--files-per-kb", type=int, default=6)
+    run_parser.add_argument("--upload-concurrency", type=int, default=4)
+    run_parser.add_argument("--sessions", type=int, default=24)
+    run_parser.add_argument("--turns", type=int, default=5)
+    run_parser.add_argument("--concurrency", type=int, default=8)
+    add_fake_ollama_arguments(run_parser)
+
+    compare_parser = commands.add_parser("compare", help="diff two result files")
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--fail-above", type=float, help="exit 1 if any metric is this many percent worse")
+
+    args = parser.parse_args()
+    if args.command == "compare":
+        base, new = (json.loads(Path(p).read_text()) for p in (args.base, args.new))
+        sys.exit(compare(base, new, args.fail_above))
+
+    results = json.dumps(run(args), indent=2)
+    if args.output:
+        Path(args.output).write_text(results + "\n")
+    else:
+        print(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Tenant isolation: one tenant floods `/chat` while another chats normally.
+
+Starts the app against `benchmarks.fake_ollama` (see `benchmarks.suite`) three
+times:
+
+- alone: the quiet tenant only, for reference
+- unlimited: the noisy tenant floods with `--noisy-concurrency` clients,
+  ignoring 429s, with no tenant rate limit
+- limited: the same flood with `TENANT_CHAT_RATE=--rate` and
+  `TENANT_CHAT_BURST=--burst`
+
+and reports the quiet tenant's `/chat` latency (p50/p95/p99 in ms), plus how
+many of the noisy tenant's requests were served or rejected, as JSON.
+
+Usage:
+    uv run python -m benchmarks.tenant_isolation --duration 20
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from benchmarks.fake_ollama import add_arguments as add_fake_ollama_arguments
+from benchmarks.suite import _percentiles, serve
+
+
+async def _measure(base_url: str, args: argparse.Namespace, flood: bool) -> dict:
+    deadline = time.monotonic() + args.duration
+    quiet_latencies: list[float] = []
+    noisy = {"served": 0, "rejected": 0}
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=300.0) as client:
+
+        async def quiet() -> None:
+            while time.monotonic() < deadline:
+                start = time.perf_counter()
+                response = await client.post(
+                    "/chat", json={"message": "What changed this quarter?"}, headers={"X-Tenant-Id": "quiet"}
+                )
+                quiet_latencies.append(time.perf_counter() - start)
+                response.raise_for_status()
+                await asyncio.sleep(args.quiet_interval)
+
+        async def flooder() -> None:
+            while time.monotonic() < deadline:
+                response = await client.post(
+                    "/chat", json={"message": "Summarise everything again."}, headers={"X-Tenant-Id": "noisy"}
+                )
+                noisy["served" if response.status_code == 200 else "rejected"] += 1
+
+        await asyncio.gather(quiet(), *(flooder() for _ in range(args.noisy_concurrency if flood else 0)))
+
+    return {"quiet_requests": len(quiet_latencies), "quiet_latency_ms": _percentiles(quiet_latencies), "noisy": noisy}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds per run")
+    parser.add_argument("--quiet-interval", type=float, default=0.25, help="pause between the quiet tenant's turns")
+    parser.add_argument("--noisy-concurrency", type=int, default=32)
+    parser.add_argument("--rate", type=float, default=4.0, help="TENANT_CHAT_RATE for the limited run")
+    parser.add_argument("--burst", type=int, default=4, help="TENANT_CHAT_BURST for the limited run")
+    add_fake_ollama_arguments(parser)
+    args = parser.parse_args()
+
+    runs = {
+        "alone": ({}, False),
+        "unlimited": ({}, True),
+        "limited": ({"TENANT_CHAT_RATE": str(args.rate), "TENANT_CHAT_BURST": str(args.burst)}, True),
+    }
+    results = {}
+    for name, (env, flood) in runs.items():
+        with serve(args, env=env) as (base_url, _):
+            results[name] = asyncio.run(_measure(base_url, args, flood))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
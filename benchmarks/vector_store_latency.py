@@ -0,0 +1,97 @@
+"""Head-to-head query latency: local memory-mapped backend vs Chroma.
+
+Both backends are loaded with the same random vectors and queried through
+their LangChain VectorStore wrappers with precomputed query vectors, so the
+numbers cover client and index overhead but not embedding.
+
+Usage:
+    uv run python -m benchmarks.vector_store_latency --sizes 1000 10000 50000 --dim 768
+"""
+
+import argparse
+import json
+import statistics
+import tempfile
+import time
+from unittest.mock import patch
+
+import numpy as np
+
+
+def _percentile(samples: list[float], pct: float) -> float:
+    return float(np.percentile(samples, pct))
+
+
+def _time_queries(search, queries: np.ndarray, k: int) -> dict:
+    search(queries[0].tolist(), k)  # warm caches and lazy indexes
+    samples = []
+    for q in queries:
+        start = time.perf_counter()
+        search(q.tolist(), k)
+        samples.append((time.perf_counter() - start) * 1000)
+    return {
+        "p50_ms": round(_percentile(samples, 50), 3),
+        "p95_ms": round(_percentile(samples, 95), 3),
+        "mean_ms": round(statistics.fmean(samples), 3),
+    }
+
+
+def _bench_local(root: str, ids, texts, vectors, queries, k: int, ann_threshold: int) -> dict:
+    from app.config import settings
+    from app.rag.vector_store.local_backend import LocalVectorStoreBackend
+
+    with patch.object(settings, "LOCAL_ANN_THRESHOLD", ann_threshold):
+        backend = LocalVectorStoreBackend(root=root, embeddings=object())
+        store = backend.get_store("bench")
+        store._collection.upsert(ids, texts, [{} for _ in ids], vectors)
+        return _time_queries(lambda q, kk: store.similarity_search_by_vector_with_score(q, k=kk), queries, k)
+
+
+def _bench_chroma(root: str, ids, texts, vectors, queries, k: int) -> dict:
+    import chromadb
+    from langchain_chroma import Chroma
+
+    client = chromadb.PersistentClient(path=root)
+    store = Chroma(client=client, collection_name="bench")
+    batch = client.get_max_batch_size()
+    for start in range(0, len(ids), batch):
+        end = start + batch
+        store._collection.add(ids=ids[start:end], documents=texts[start:end], embeddings=vectors[start:end])
+    return _time_queries(lambda q, kk: store.similarity_search_by_vector_with_relevance_scores(q, k=kk), queries, k)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--ann-threshold", type=int, default=20000)
+    parser.add_argument("--json", action="store_true", help="Print machine-readable results")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    results = []
+    for size in args.sizes:
+        vectors = rng.standard_normal((size, args.dim), dtype=np.float32)
+        queries = rng.standard_normal((args.queries, args.dim), dtype=np.float32)
+        ids = [f"doc-{i}" for i in range(size)]
+        texts = [f"chunk {i}" for i in range(size)]
+        with tempfile.TemporaryDirectory() as local_dir, tempfile.TemporaryDirectory() as chroma_dir:
+            row = {
+                "size": size,
+                "local": _bench_local(local_dir, ids, texts, vectors, queries, args.k, args.ann_threshold),
+                "chroma": _bench_chroma(chroma_dir, ids, texts, vectors.tolist(), queries, args.k),
+            }
+        results.append(row)
+        if not args.json:
+            print(
+                f"n={size:>8}  local p50={row['local']['p50_ms']:.3f}ms p95={row['local']['p95_ms']:.3f}ms  "
+                f"chroma p50={row['chroma']['p50_ms']:.3f}ms p95={row['chroma']['p95_ms']:.3f}ms"
+            )
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
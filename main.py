@@ -1,6 +1,29 @@
+import argparse
+
 import uvicorn
 
+from app.config import settings
 from app.main import app  # noqa: F401
 
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the API server.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="run this many worker processes without auto-reload (default: one, reloading on code changes)",
+    )
+    args = parser.parse_args()
+
+    if args.workers is None:
+        uvicorn.run("app.main:app", host=args.host, port=args.port, reload=True)
+        return
+    if args.workers > 1 and settings.STATE_BACKEND != "sqlite":
+        parser.error("several workers need STATE_BACKEND=sqlite to share sessions and knowledge bases")
+    uvicorn.run("app.main:app", host=args.host, port=args.port, workers=args.workers)
+
+
 if __name__ == "__main__":
-    uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
+    main()
@@ -1,8 +1,15 @@
+from types import MethodType
 from unittest.mock import MagicMock, patch
 
 import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 
 
+GEO_TEXTS = ["Paris is in France", "Berlin is in Germany", "The revenue report", "France and Germany"]
+
+ADMIN_HEADERS = {"X-Admin-Token": "admin-secret"}
+
 FAKE_USAGE_METADATA = {
     "input_tokens": 10,
     "output_tokens": 5,
@@ -10,6 +17,22 @@ FAKE_USAGE_METADATA = {
 }
 
 
+class FakeEmbeddings(Embeddings):
+    """Bag-of-words embeddings over a tiny vocabulary, so similarity is predictable."""
+
+    VOCAB = ["paris", "france", "berlin", "germany", "revenue", "report"]
+
+    def _embed(self, text):
+        words = [w.strip("?.,!").lower() for w in text.split()]
+        return [float(words.count(v)) for v in self.VOCAB] + [1.0]
+
+    def embed_documents(self, texts):
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
 def make_fake_response(content, usage_metadata=None):
     resp = MagicMock()
     resp.content = content
@@ -17,13 +40,59 @@ def make_fake_response(content, usage_metadata=None):
     return resp
 
 
+@pytest.fixture(autouse=True)
+def upload_dir(tmp_path, monkeypatch):
+    """Keep upload temp files and the ingest journal out of the working tree."""
+    from app.config import settings
+
+    path = tmp_path / "uploads"
+    monkeypatch.setattr(settings, "UPLOAD_DIR", str(path))
+    return path
+
+
+@pytest.fixture(autouse=True)
+def admin_token(monkeypatch):
+    """Admin endpoints refuse every request while no token is configured."""
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "ADMIN_TOKEN", ADMIN_HEADERS["X-Admin-Token"])
+
+
 @pytest.fixture(autouse=True)
 def clear_sessions():
     from app.api import chat
 
     chat.sessions.clear()
+    chat.agent_cursors.clear()
+    chat.window_starts.clear()
     yield
     chat.sessions.clear()
+    chat.agent_cursors.clear()
+    chat.window_starts.clear()
+
+
+@pytest.fixture(autouse=True)
+def clear_summaries():
+    from app import memory
+
+    memory.summaries.clear()
+    yield
+    memory.summaries.clear()
+
+
+@pytest.fixture(autouse=True)
+def agent_checkpointer(tmp_path, monkeypatch):
+    """Give each test a fresh checkpointer under tmp_path instead of the one in the working tree."""
+    from app.agent.checkpoint import SQLiteCheckpointSaver
+    from app.agent.graph import agent_graph
+    from app.config import settings
+
+    path = str(tmp_path / "agent_state.db")
+    monkeypatch.setattr(settings, "AGENT_CHECKPOINT_PATH", path)
+    saver = SQLiteCheckpointSaver(path)
+    monkeypatch.setattr(agent_graph, "checkpointer", saver)
+    yield saver
+    saver.close()
 
 
 @pytest.fixture(autouse=True)
@@ -35,6 +104,28 @@ def clear_kb_registry():
     knowledge_base.kb_registry.clear()
 
 
+@pytest.fixture(autouse=True)
+def clear_tenants():
+    from app import tenants
+
+    for state in (tenants.tenant_usage, tenants._buckets, tenants._uploads_in_flight):
+        state.clear()
+    yield
+    for state in (tenants.tenant_usage, tenants._buckets, tenants._uploads_in_flight):
+        state.clear()
+
+
+@pytest.fixture(autouse=True)
+def clear_retrieval_cache():
+    from app.rag import retriever
+
+    retriever.retrieval_cache.clear()
+    retriever._kb_versions.clear()
+    yield
+    retriever.retrieval_cache.clear()
+    retriever._kb_versions.clear()
+
+
 @pytest.fixture
 def mock_llm():
     with patch("app.api.chat.llm") as mock:
@@ -50,9 +141,47 @@ def mock_vector_store():
     mock_backend.list_collections.return_value = []
     mock_store.similarity_search_with_score.return_value = []
 
+    # Route the mock's composite and async methods through the real base-class
+    # defaults, so tests can keep asserting on get_store/delete_collection.
+    from app.rag.vector_store import VectorStoreBackend
+
+    for name in (
+        "search",
+        "add",
+        "aget_store",
+        "acreate_collection",
+        "acollection_model",
+        "adelete_collection",
+        "alist_collections",
+        "asearch",
+        "asearch_ids",
+        "aget_documents",
+        "aadd",
+        "existing_ids",
+        "aexisting_ids",
+        "delete_documents",
+        "adelete_documents",
+    ):
+        setattr(mock_backend, name, MethodType(getattr(VectorStoreBackend, name), mock_backend))
+
     with patch("app.api.knowledge_base.get_vector_store", return_value=mock_backend) as _:
         with patch("app.rag.retriever.get_vector_store", return_value=mock_backend):
-            yield mock_backend, mock_store
+            with patch("app.maintenance.get_vector_store", return_value=mock_backend):
+                with patch("app.reindex.get_vector_store", return_value=mock_backend):
+                    yield mock_backend, mock_store
+
+
+async def _one_chunk_per_file(file_path, filename, extra_metadata=None):
+    with open(file_path) as f:
+        text = f.read()
+    return [Document(page_content=text, metadata={**(extra_metadata or {}), "source_filename": filename})]
+
+
+@pytest.fixture
+def fake_process():
+    """Ingest each uploaded file as one chunk holding its text, instead of parsing it."""
+    with patch("app.api.knowledge_base.process_document", side_effect=_one_chunk_per_file) as mock:
+        yield mock
 
 
 @pytest.fixture
@@ -60,3 +189,44 @@ def mock_embeddings():
     with patch("app.rag.embeddings.get_embeddings") as mock:
         mock.return_value = MagicMock()
         yield mock
+
+
+@pytest.fixture
+def local_vector_store(tmp_path):
+    """A real LocalVectorStoreBackend on a temp dir with deterministic embeddings."""
+    from app.rag.vector_store.local_backend import LocalVectorStoreBackend
+
+    backend = LocalVectorStoreBackend(root=str(tmp_path / "vectors"), embeddings=FakeEmbeddings())
+    with patch("app.api.knowledge_base.get_vector_store", return_value=backend):
+        with patch("app.rag.retriever.get_vector_store", return_value=backend):
+            with patch("app.maintenance.get_vector_store", return_value=backend):
+                with patch("app.reindex.get_vector_store", return_value=backend):
+                    yield backend
+
+
+@pytest.fixture
+def create_geo_kb(local_vector_store):
+    """Create a knowledge base through the API holding `GEO_TEXTS` in the local store; return its id."""
+
+    async def create(client, quantization="none"):
+        from app.api.knowledge_base import kb_registry
+
+        response = await client.post("/knowledge-base", json={"name": "Geo", "vector_quantization": quantization})
+        kb_id = response.json()["id"]
+        metadatas = [{"source_filename": f"{i}.txt"} for i in range(len(GEO_TEXTS))]
+        local_vector_store.get_store(kb_id).add_texts(GEO_TEXTS, metadatas=metadatas)
+        kb_registry.add_documents(kb_id, len(GEO_TEXTS), 100)
+        return kb_id
+
+    return create
+
+
+@pytest.fixture
+def query_kb():
+    """Query a knowledge base through the API; return each result's content and metadata."""
+
+    async def query(client, kb_id, text="paris france", top_k=4):
+        response = await client.post(f"/knowledge-base/{kb_id}/query", json={"query": text, "top_k": top_k})
+        return [(r["content"], r["metadata"]) for r in response.json()["results"]]
+
+    return query
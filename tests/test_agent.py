@@ -0,0 +1,293 @@
+import asyncio
+import json
+from typing import Annotated, TypedDict
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langgraph.channels import DeltaChannel
+from langgraph.graph import START, StateGraph
+
+from app.agent.state import add_message_batches
+from app.main import app
+
+USAGE = {"input_tokens": 10, "output_tokens": 5, "total_tokens": 15}
+
+
+def _tool_call(call_id, kb_id, query="revenue"):
+    return {
+        "name": "search_knowledge_base",
+        "args": {"query": query, "knowledge_base_id": kb_id},
+        "id": call_id,
+        "type": "tool_call",
+    }
+
+
+@pytest.fixture
+def bound_llm(mock_llm):
+    bound = MagicMock()
+    mock_llm.bind_tools.return_value = bound
+    return bound
+
+
+@pytest.mark.asyncio
+async def test_agent_runs_tool_calls_concurrently(bound_llm):
+    bound_llm.ainvoke = AsyncMock(side_effect=[
+        AIMessage(content="", tool_calls=[_tool_call("a", "kb-1"), _tool_call("b", "kb-2")], usage_metadata=USAGE),
+        AIMessage(content="Revenue grew in both.", usage_metadata=USAGE),
+    ])
+    started = []
+    both_started = asyncio.Event()
+
+    async def fake_retrieve(kb_id, query, top_k=None, metadata_filter=None):
+        started.append(kb_id)
+        if len(started) == 2:
+            both_started.set()
+        # Each search only finishes once the other has started, so sequential execution would time out.
+        await asyncio.wait_for(both_started.wait(), timeout=1)
+        return [(f"{kb_id} says revenue grew", {"source_filename": f"{kb_id}.txt"}, 0.1, None)]
+
+    with patch("app.agent.tools.aretrieve_context", side_effect=fake_retrieve):
+        async with AsyncClient(
+            transport=ASGITransport(app=app), base_url="http://test"
+        ) as client:
+            response = await client.post(
+                "/chat",
+                json={"message": "How did revenue do?", "knowledge_base_ids": ["kb-1", "kb-2"], "mode": "agent"},
+            )
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["response"] == "Revenue grew in both."
+    assert data["usage"]["total_tokens"] == 30
+    assert sorted(started) == ["kb-1", "kb-2"]
+
+    second_call = bound_llm.ainvoke.call_args_list[1][0][0]
+    tool_messages = [m for m in second_call if isinstance(m, ToolMessage)]
+    assert [m.tool_call_id for m in tool_messages] == ["a", "b"]
+    assert "kb-1 says revenue grew" in tool_messages[0].content
+
+    from app.api.chat import sessions
+
+    history = sessions[data["session_id"]]
+    assert [type(m) for m in history] == [HumanMessage, AIMessage]
+
+
+@pytest.mark.asyncio
+async def test_agent_rejects_unlisted_knowledge_base(bound_llm):
+    bound_llm.ainvoke = AsyncMock(side_effect=[
+        AIMessage(content="", tool_calls=[_tool_call("a", "other-kb")]),
+        AIMessage(content="I can't access that."),
+    ])
+
+    with patch("app.agent.tools.aretrieve_context", new_callable=AsyncMock) as retrieve:
+        async with AsyncClient(
+            transport=ASGITransport(app=app), base_url="http://test"
+        ) as client:
+            await client.post("/chat", json={"message": "Hi", "knowledge_base_ids": ["kb-1"], "mode": "agent"})
+
+    retrieve.assert_not_called()
+    tool_message = bound_llm.ainvoke.call_args_list[1][0][0][-1]
+    assert "not available" in tool_message.content
+
+
+@pytest.mark.asyncio
+async def test_agent_step_cap(bound_llm, monkeypatch):
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "AGENT_MAX_STEPS", 2)
+    bound_llm.ainvoke = AsyncMock(return_value=AIMessage(content="", tool_calls=[_tool_call("a", "kb-1")]))
+
+    with patch("app.agent.tools.aretrieve_context", new_callable=AsyncMock, return_value=[]):
+        async with AsyncClient(
+            transport=ASGITransport(app=app), base_url="http://test"
+        ) as client:
+            response = await client.post(
+                "/chat", json={"message": "Loop forever", "knowledge_base_ids": ["kb-1"], "mode": "agent"}
+            )
+
+    assert response.status_code == 200
+    assert bound_llm.ainvoke.call_count == 2
+    assert "allowed number of steps" in response.json()["response"]
+
+
+@pytest.mark.asyncio
+async def test_agent_timeout(mock_llm, monkeypatch):
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "AGENT_TIMEOUT_SECONDS", 0.05)
+
+    async def slow(messages):
+        await asyncio.sleep(1)
+
+    mock_llm.ainvoke = slow
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        response = await client.post("/chat", json={"message": "Hi", "mode": "agent"})
+
+    assert response.status_code == 504
+
+
+@pytest.mark.asyncio
+async def test_agent_refuses_a_message_over_the_context_budget(mock_llm, monkeypatch):
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "MAX_TOKENS", 50)
+
+    with patch("app.api.chat._agent_graph") as graph:
+        async with AsyncClient(
+            transport=ASGITransport(app=app), base_url="http://test"
+        ) as client:
+            responses = [
+                await client.post(path, json={"message": "word " * 200, "mode": "agent"})
+                for path in ("/chat", "/chat/stream")
+            ]
+
+    assert [r.status_code for r in responses] == [413, 413]
+    assert responses[0].json()["detail"] == "Message exceeds the context budget"
+    graph.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_agent_without_an_answer_reports_it_incomplete(mock_llm):
+    graph = MagicMock()
+    graph.aget_state = AsyncMock(return_value=MagicMock(values={}))
+    # The run ends before the model answers: the thread holds only the question.
+    graph.ainvoke = AsyncMock(side_effect=lambda state, **kwargs: {"messages": state["messages"]})
+
+    with patch("app.api.chat._agent_graph", return_value=graph):
+        async with AsyncClient(
+            transport=ASGITransport(app=app), base_url="http://test"
+        ) as client:
+            response = await client.post("/chat", json={"message": "Hi", "mode": "agent"})
+
+    assert response.status_code == 200
+    assert "allowed number of steps" in response.json()["response"]
+
+
+@pytest.mark.asyncio
+async def test_agent_stream(bound_llm):
+    bound_llm.ainvoke = AsyncMock(side_effect=[
+        AIMessage(content="", tool_calls=[_tool_call("a", "kb-1")], usage_metadata=USAGE),
+        AIMessage(content="Found it.", usage_metadata=USAGE),
+    ])
+
+    with patch("app.agent.tools.aretrieve_context", new_callable=AsyncMock, return_value=[]):
+        async with AsyncClient(
+            transport=ASGITransport(app=app), base_url="http://test"
+        ) as client:
+            response = await client.post(
+                "/chat/stream", json={"message": "Find it", "knowledge_base_ids": ["kb-1"], "mode": "agent"}
+            )
+
+    events = [
+        json.loads(line.removeprefix("data: "))
+        for line in response.text.strip().split("\n\n")
+    ]
+    assert "".join(e["content"] for e in events) == "Found it."
+    assert events[-1]["done"] is True
+    assert events[-1]["usage"]["total_tokens"] == 30
+
+
+@pytest.mark.asyncio
+async def test_agent_session_resumes_from_checkpoint(mock_llm):
+    mock_llm.ainvoke = AsyncMock(side_effect=[AIMessage(content="First answer."), AIMessage(content="Second answer.")])
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        first = await client.post("/chat", json={"message": "First question", "mode": "agent"})
+        session_id = first.json()["session_id"]
+
+        # Simulate a restarted worker: in-process history is gone, the checkpoint is not.
+        from app.api import chat
+
+        chat.sessions.clear()
+        chat.agent_cursors.clear()
+
+        restored = await client.get(f"/chat/{session_id}/messages")
+        second = await client.post(
+            "/chat", json={"message": "Second question", "session_id": session_id, "mode": "agent"}
+        )
+
+    assert [m["content"] for m in restored.json()["messages"]] == ["First question", "First answer."]
+    assert second.json()["response"] == "Second answer."
+    sent = mock_llm.ainvoke.call_args_list[1][0][0]
+    assert [m.content for m in sent[1:]] == ["First question", "First answer.", "Second question"]
+
+
+def _echo_graph(saver, snapshot_every):
+    class EchoState(TypedDict):
+        messages: Annotated[list, DeltaChannel(add_message_batches, snapshot_frequency=snapshot_every)]
+
+    def echo(state):
+        return {"messages": [AIMessage(content=f"echo {state['messages'][-1].content}")]}
+
+    graph = StateGraph(EchoState)
+    graph.add_node("echo", echo)
+    graph.add_edge(START, "echo")
+    return graph.compile(checkpointer=saver)
+
+
+def test_checkpointer_stores_deltas_between_snapshots(agent_checkpointer):
+    graph = _echo_graph(agent_checkpointer, snapshot_every=4)
+    config = {"configurable": {"thread_id": "t"}}
+    for i in range(6):
+        graph.invoke({"messages": [HumanMessage(content=f"q{i}")]}, config)
+
+    kinds = [row[0] for row in agent_checkpointer.conn.execute(
+        "SELECT type FROM blobs WHERE channel = 'messages' ORDER BY version"
+    )]
+    assert kinds.count("empty") > kinds.count("msgpack") > 0
+    write_sizes = [
+        len(value)
+        for tup in agent_checkpointer.list(config)
+        for _, channel, value in tup.pending_writes
+        if channel == "messages"
+    ]
+    assert write_sizes and max(write_sizes) == 1
+    assert len(graph.get_state(config).values["messages"]) == 12
+
+
+def test_checkpointer_serves_snapshots_from_its_cache(agent_checkpointer):
+    graph = _echo_graph(agent_checkpointer, snapshot_every=2)
+    config = {"configurable": {"thread_id": "t"}}
+    for i in range(3):
+        graph.invoke({"messages": [HumanMessage(content=f"q{i}")]}, config)
+    expected = [m.content for m in graph.get_state(config).values["messages"]]
+
+    # Only a cached snapshot can still seed the history now.
+    agent_checkpointer.conn.execute("UPDATE blobs SET blob = x'c1' WHERE channel = 'messages' AND type != 'empty'")
+    cached = graph.get_state(config).values["messages"]
+    cached.append(HumanMessage(content="not stored"))
+
+    assert agent_checkpointer._blobs
+    assert [m.content for m in graph.get_state(config).values["messages"]] == expected
+
+
+def test_checkpointer_compaction_keeps_state(tmp_path):
+    from app.agent.checkpoint import SQLiteCheckpointSaver
+
+    path = str(tmp_path / "agent.db")
+    saver = SQLiteCheckpointSaver(path)
+    graph = _echo_graph(saver, snapshot_every=4)
+    config = {"configurable": {"thread_id": "t"}}
+    for i in range(10):
+        graph.invoke({"messages": [HumanMessage(content=f"q{i}")]}, config)
+    before = saver.conn.execute("SELECT COUNT(*) FROM checkpoints").fetchone()[0]
+
+    saver.prune(["t"])
+    after = saver.conn.execute("SELECT COUNT(*) FROM checkpoints").fetchone()[0]
+    assert after < before
+    saver.close()
+
+    reopened = SQLiteCheckpointSaver(path)
+    graph = _echo_graph(reopened, snapshot_every=4)
+    graph.invoke({"messages": [HumanMessage(content="q10")]}, config)
+    messages = graph.get_state(config).values["messages"]
+    assert [m.content for m in messages[::2]] == [f"q{i}" for i in range(11)]
+    assert messages[-1].content == "echo q10"
+    reopened.close()
@@ -1,9 +1,10 @@
+import asyncio
 import json
-from unittest.mock import AsyncMock, MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock
 
 import pytest
 from httpx import ASGITransport, AsyncClient
-from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
 
 from app.main import app
 from tests.conftest import FAKE_USAGE_METADATA, make_fake_response
@@ -161,6 +162,7 @@ async def test_chat_stream(mock_llm):
     assert events[2]["done"] is True
     assert events[2]["usage"]["input_tokens"] == 10
     assert events[2]["usage"]["total_tokens"] == 15
+    assert events[2]["model"] == "llama3.2"
     assert events[0]["session_id"] == events[2]["session_id"]
 
 
@@ -232,6 +234,23 @@ async def test_get_session_messages_not_found():
     assert response.json()["detail"] == "Session not found"
 
 
+@pytest.mark.asyncio
+async def test_unknown_sessions_leave_the_agent_graph_unloaded(mock_llm, monkeypatch):
+    mock_llm.ainvoke = AsyncMock(return_value=make_fake_response("Hi there!"))
+    agent_graph = MagicMock(side_effect=AssertionError("agent graph loaded"))
+    monkeypatch.setattr("app.api.chat._agent_graph", agent_graph)
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        missing = await client.get("/chat/nonexistent/messages")
+        response = await client.post("/chat", json={"message": "Hello", "session_id": "nonexistent"})
+
+    assert missing.status_code == 404
+    assert response.json()["session_id"] == "nonexistent"
+    agent_graph.assert_not_called()
+
+
 @pytest.mark.asyncio
 async def test_home_page():
     async with AsyncClient(
@@ -348,3 +367,356 @@ async def test_chat_with_multiple_knowledge_bases(mock_llm, mock_vector_store):
     assert "History info" in call_args[0].content
 
 
+@pytest.mark.asyncio
+async def test_chat_summary_memory(mock_llm, monkeypatch):
+    from app import memory
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "MEMORY_MODE", "summary")
+    monkeypatch.setattr(settings, "MAX_TOKENS", 40)
+    summary_calls = []
+
+    async def fake_ainvoke(messages, **kwargs):
+        if "options" in kwargs:
+            summary_calls.append(messages[-1].content)
+            return make_fake_response("Bob likes sailing.")
+        return make_fake_response("Noted, tell me more about it please.")
+
+    mock_llm.ainvoke = fake_ainvoke
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        r1 = await client.post("/chat", json={"message": "My name is Bob and I like sailing"})
+        session_id = r1.json()["session_id"]
+        for text in ("I sail every weekend on the lake", "What boats do you recommend?"):
+            await client.post("/chat", json={"message": text, "session_id": session_id})
+        await memory.summaries[session_id].task
+
+        captured = []
+
+        async def capture(messages, **kwargs):
+            captured.append(messages)
+            return make_fake_response("Sure.")
+
+        mock_llm.ainvoke = capture
+        await client.post("/chat", json={"message": "Remind me?", "session_id": session_id})
+
+    assert "My name is Bob" in summary_calls[0]
+    prompt = captured[0]
+    assert isinstance(prompt[0], SystemMessage)
+    assert prompt[0].content.endswith("Bob likes sailing.")
+    assert not any("My name is Bob" in str(m.content) for m in prompt[1:])
+
+
+@pytest.mark.asyncio
+async def test_chat_summary_runs_off_the_request_path(mock_llm, monkeypatch):
+    from app import memory
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "MEMORY_MODE", "summary")
+    monkeypatch.setattr(settings, "MAX_TOKENS", 10)
+    release = asyncio.Event()
+
+    async def fake_ainvoke(messages, **kwargs):
+        if "options" in kwargs:
+            await release.wait()
+            raise RuntimeError("summarizer unavailable")
+        return make_fake_response("A reply long enough to push the first turn out of the window.")
+
+    mock_llm.ainvoke = fake_ainvoke
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        r1 = await client.post("/chat", json={"message": "First question here"})
+        session_id = r1.json()["session_id"]
+        r2 = await asyncio.wait_for(
+            client.post("/chat", json={"message": "Second question", "session_id": session_id}), timeout=1
+        )
+
+    assert r2.status_code == 200
+    task = memory.summaries[session_id].task
+    assert not task.done()
+    release.set()
+    await task
+    assert memory.summary_messages(session_id) == []
+
+
+@pytest.mark.asyncio
+async def test_stable_prefix_layout_puts_context_before_question(mock_llm, mock_vector_store, monkeypatch):
+    from langchain_core.documents import Document
+
+    from app.api.knowledge_base import kb_registry
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "PROMPT_LAYOUT", "stable_prefix")
+    kb_registry["kb"] = {
+        "id": "kb", "name": "KB", "description": "", "document_count": 1, "created_at": "2024-01-01T00:00:00Z",
+    }
+    _mock_backend, mock_store = mock_vector_store
+    mock_store.similarity_search_with_score.return_value = [
+        (Document(page_content="Paris is the capital of France", metadata={"source_filename": "geo.txt"}), 0.9),
+    ]
+    mock_llm.ainvoke = AsyncMock(side_effect=[make_fake_response(f"Answer {i}") for i in range(3)])
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        r1 = await client.post("/chat", json={"message": "Q1", "knowledge_base_ids": ["kb"]})
+        session_id = r1.json()["session_id"]
+        for text in ("Q2", "Q3"):
+            await client.post("/chat", json={"message": text, "session_id": session_id, "knowledge_base_ids": ["kb"]})
+
+    prompts = [c[0][0] for c in mock_llm.ainvoke.call_args_list]
+    assert [type(m) for m in prompts[2]] == [HumanMessage, AIMessage, HumanMessage, AIMessage, SystemMessage, HumanMessage]
+    assert "Paris" in prompts[2][-2].content
+    assert prompts[2][-1].content == "Q3"
+    # Everything before this turn's context repeats the previous prompt verbatim.
+    assert [m.content for m in prompts[2][:2]] == [m.content for m in prompts[1][:2]]
+
+
+@pytest.mark.asyncio
+async def test_stable_prefix_layout_trims_in_blocks(mock_llm, monkeypatch):
+    from langchain_core.messages.utils import count_tokens_approximately
+
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "PROMPT_LAYOUT", "stable_prefix")
+    monkeypatch.setattr(settings, "MAX_TOKENS", 200)
+    monkeypatch.setattr(settings, "PROMPT_TRIM_BLOCK_TOKENS", 100)
+    mock_llm.ainvoke = AsyncMock(return_value=make_fake_response("A fairly short answer to the question."))
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        r = await client.post("/chat", json={"message": "Question number 0 about something"})
+        session_id = r.json()["session_id"]
+        for i in range(1, 20):
+            await client.post("/chat", json={"message": f"Question number {i} about something", "session_id": session_id})
+
+    prompts = [c[0][0] for c in mock_llm.ainvoke.call_args_list]
+    assert all(count_tokens_approximately(p) <= 200 for p in prompts)
+    prefix_changes = sum(p[0].content != q[0].content for p, q in zip(prompts, prompts[1:]))
+    assert 0 < prefix_changes <= len(prompts) // 3
+
+
+@pytest.mark.asyncio
+async def test_prompt_eval_stats(mock_llm):
+    from app.telemetry import prompt_eval_totals
+
+    prompt_eval_totals.clear()
+    mock_llm.ainvoke = AsyncMock(side_effect=[
+        AIMessage(content="Hi", response_metadata={"prompt_eval_count": 100, "prompt_eval_duration": 8_000_000}),
+        AIMessage(content="Hi", response_metadata={"prompt_eval_count": 20, "prompt_eval_duration": 2_000_000}),
+    ])
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        r = await client.post("/chat", json={"message": "Hello"})
+        await client.post("/chat", json={"message": "Again", "session_id": r.json()["session_id"]})
+        response = await client.get("/chat/prompt-eval")
+
+    prompt_eval_totals.clear()
+    assert response.json() == [
+        {"layout": "classic", "turns": 2, "avg_prompt_eval_tokens": 60.0, "avg_prompt_eval_ms": 5.0}
+    ]
+
+
+@pytest.mark.asyncio
+async def test_chat_routes_cheap_turns_to_small_model(mock_llm, monkeypatch):
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "OLLAMA_SMALL_MODEL", "tiny")
+    small = MagicMock()
+    small.ainvoke = AsyncMock(return_value=make_fake_response("You're welcome"))
+    monkeypatch.setattr("app.api.chat.small_llm", small)
+    mock_llm.ainvoke = AsyncMock(return_value=make_fake_response("A long answer"))
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        long_turn = await client.post("/chat", json={"message": "Explain " + "in detail " * 30})
+        session_id = long_turn.json()["session_id"]
+        short_turn = await client.post("/chat", json={"message": "thanks!", "session_id": session_id})
+
+    assert long_turn.json()["model"] == settings.OLLAMA_MODEL
+    assert short_turn.json()["model"] == "tiny"
+    assert short_turn.json()["response"] == "You're welcome"
+    assert mock_llm.ainvoke.await_count == 1
+    assert small.ainvoke.await_count == 1
+
+
+def test_model_router_tiers_and_spillover(monkeypatch):
+    from app.config import settings
+    from app.llm import ModelRouter
+    from app.models import ChatRequest
+
+    monkeypatch.setattr(settings, "ROUTER_SMALL_MAX_QUEUE", 2)
+    monkeypatch.setattr(settings, "ROUTER_LARGE_MAX_QUEUE", 1)
+    router = ModelRouter()
+    short = ChatRequest(message="shorter please")
+    long = ChatRequest(message="x" * (settings.ROUTER_SMALL_MAX_CHARS + 1))
+
+    assert router.select(short, small_available=False) == "large"
+    assert router.select(short, small_available=True) == "small"
+    assert router.select(long, small_available=True) == "large"
+    assert router.select(ChatRequest(message="hi", knowledge_base_ids=["kb"]), small_available=True) == "large"
+    assert router.select(ChatRequest(message="hi", mode="agent"), small_available=True) == "large"
+
+    # A backed-up tier hands turns to the other one while that is less busy.
+    router.in_flight.update(small=2, large=1)
+    assert router.select(short, small_available=True) == "large"
+    router.in_flight.update(small=0, large=3)
+    assert router.select(long, small_available=True) == "small"
+    assert router.select(ChatRequest(message="hi", knowledge_base_ids=["kb"]), small_available=True) == "large"
+
+    router = ModelRouter(classifier=lambda request: "large" if "prove" in request.message else None)
+    assert router.select(ChatRequest(message="prove it"), small_available=True) == "large"
+
+
+@pytest.mark.asyncio
+async def test_chat_retrieval_overlaps_session_loading(mock_llm, monkeypatch):
+    """Retrieval starts before the session history has finished loading."""
+    retrieval_started = asyncio.Event()
+
+    async def fake_rag_prefix(kb_ids, query, metadata_filter=None):
+        retrieval_started.set()
+        return [SystemMessage(content="context")], []
+
+    async def slow_restore_history(session_id):
+        await asyncio.wait_for(retrieval_started.wait(), timeout=1)
+        return None
+
+    monkeypatch.setattr("app.api.chat._build_rag_prefix", fake_rag_prefix)
+    monkeypatch.setattr("app.api.chat._restore_history", slow_restore_history)
+    mock_llm.ainvoke = AsyncMock(return_value=make_fake_response("Paris"))
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        response = await client.post(
+            "/chat", json={"message": "Capital?", "session_id": "s1", "knowledge_base_ids": ["kb"]}
+        )
+
+    assert response.status_code == 200
+    assert mock_llm.ainvoke.call_args[0][0][0].content == "context"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("endpoint", ["/chat", "/chat/stream"])
+async def test_failed_turn_cancels_its_retrieval(mock_llm, monkeypatch, endpoint):
+    import app.api.chat as chat_module
+
+    tasks = []
+    start_retrieval = chat_module._start_retrieval
+
+    async def hanging_rag_prefix(kb_ids, query, metadata_filter=None):
+        await asyncio.Event().wait()
+
+    def recording_start(request, tenant_id):
+        tasks.append(start_retrieval(request, tenant_id))
+        return tasks[-1]
+
+    def broken_window(session_id, history):
+        raise RuntimeError("trimming failed")
+
+    monkeypatch.setattr("app.api.chat._build_rag_prefix", hanging_rag_prefix)
+    monkeypatch.setattr("app.api.chat._start_retrieval", recording_start)
+    monkeypatch.setattr("app.api.chat._history_window", broken_window)
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        with pytest.raises(RuntimeError):
+            await client.post(endpoint, json={"message": "Capital?", "knowledge_base_ids": ["kb"]})
+
+    await asyncio.sleep(0)
+    assert tasks and tasks[0].cancelled()
+
+
+@pytest.mark.asyncio
+async def test_chat_stream_sends_retrieving_event_first(mock_llm, monkeypatch):
+    async def fake_rag_prefix(kb_ids, query, metadata_filter=None):
+        return [SystemMessage(content="context")], []
+
+    prompts = []
+
+    async def fake_astream(messages):
+        prompts.append(messages)
+        yield make_fake_response("Paris", usage_metadata=FAKE_USAGE_METADATA)
+
+    monkeypatch.setattr("app.api.chat._build_rag_prefix", fake_rag_prefix)
+    mock_llm.astream = fake_astream
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        with_kb = await client.post("/chat/stream", json={"message": "Capital?", "knowledge_base_ids": ["kb"]})
+        without_kb = await client.post("/chat/stream", json={"message": "Hi"})
+
+    events = [json.loads(line.removeprefix("data: ")) for line in with_kb.text.strip().split("\n\n")]
+    assert [(e["status"], e["content"], e["done"]) for e in events] == [
+        ("retrieving", "", False),
+        (None, "Paris", False),
+        (None, "", True),
+    ]
+    assert prompts[0][0].content == "context"
+    assert all(
+        json.loads(line.removeprefix("data: "))["status"] is None
+        for line in without_kb.text.strip().split("\n\n")
+    )
+
+
+# --- Citations ---
+
+
+async def _two_kb_search(kb_id, query, top_k=None, metadata_filter=None):
+    return [
+        (f"{kb_id} passage {i}", {"source_filename": f"{kb_id}.txt"}, 0.5 + i, f"{kb_id}-chunk-{i}")
+        for i in range(2)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_chat_returns_the_citations_the_answer_references(mock_llm, monkeypatch):
+    monkeypatch.setattr("app.api.chat.aretrieve_context", _two_kb_search)
+    mock_llm.ainvoke = AsyncMock(return_value=make_fake_response(
+        "Revenue grew [Document 3 — kb-2.txt], as planned [Document 1, Document 3]. See also [Document 9]."
+    ))
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        response = await client.post("/chat", json={"message": "Revenue?", "knowledge_base_ids": ["kb-1", "kb-2"]})
+        plain = await client.post("/chat", json={"message": "Hello"})
+
+    assert response.json()["citations"] == [
+        {"document": 3, "kb_id": "kb-2", "chunk_id": "kb-2-chunk-0", "source_filename": "kb-2.txt", "score": 0.5},
+        {"document": 1, "kb_id": "kb-1", "chunk_id": "kb-1-chunk-0", "source_filename": "kb-1.txt", "score": 0.5},
+    ]
+    assert "[Document 1]" in mock_llm.ainvoke.call_args_list[0][0][0][0].content
+    assert plain.json()["citations"] == []
+
+
+@pytest.mark.asyncio
+async def test_chat_stream_reports_citations_as_their_markers_complete(mock_llm, monkeypatch):
+    async def fake_astream(messages):
+        for token in ["Paris [Docu", "ment 2]", " and Berlin [Documents 1 and", " 4]."]:
+            yield make_fake_response(token, usage_metadata=FAKE_USAGE_METADATA)
+
+    monkeypatch.setattr("app.api.chat.aretrieve_context", _two_kb_search)
+    mock_llm.astream = fake_astream
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        response = await client.post(
+            "/chat/stream", json={"message": "Capitals?", "knowledge_base_ids": ["kb-1", "kb-2"]}
+        )
+
+    events = [json.loads(line.removeprefix("data: ")) for line in response.text.strip().split("\n\n")][1:]
+    assert [[c["document"] for c in e["citations"]] for e in events] == [[], [2], [], [1, 4], [2, 1, 4]]
+    assert events[-1]["done"]
+    assert events[-1]["citations"][2]["chunk_id"] == "kb-2-chunk-1"
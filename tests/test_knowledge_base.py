@@ -1,18 +1,21 @@
 import io
+import json
 from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
 from httpx import ASGITransport, AsyncClient
 from langchain_core.documents import Document
 
+from app.config import settings
 from app.main import app
+from tests.conftest import ADMIN_HEADERS
 
 
 # --- CRUD Tests ---
 
 
 @pytest.mark.asyncio
-async def test_create_knowledge_base():
+async def test_create_knowledge_base(mock_vector_store):
     async with AsyncClient(
         transport=ASGITransport(app=app), base_url="http://test"
     ) as client:
@@ -28,10 +31,12 @@ async def test_create_knowledge_base():
     assert data["document_count"] == 0
     assert "id" in data
     assert "created_at" in data
+    assert data["embedding_model"] == settings.OLLAMA_EMBEDDING_MODEL
+    mock_vector_store[0].create_collection.assert_called_once_with(data["id"], "none", settings.OLLAMA_EMBEDDING_MODEL)
 
 
 @pytest.mark.asyncio
-async def test_create_knowledge_base_no_description():
+async def test_create_knowledge_base_no_description(mock_vector_store):
     async with AsyncClient(
         transport=ASGITransport(app=app), base_url="http://test"
     ) as client:
@@ -56,7 +61,7 @@ async def test_list_knowledge_bases_empty():
 
 
 @pytest.mark.asyncio
-async def test_list_knowledge_bases():
+async def test_list_knowledge_bases(mock_vector_store):
     async with AsyncClient(
         transport=ASGITransport(app=app), base_url="http://test"
     ) as client:
@@ -73,7 +78,7 @@ async def test_list_knowledge_bases():
 
 
 @pytest.mark.asyncio
-async def test_get_knowledge_base():
+async def test_get_knowledge_base(mock_vector_store):
     async with AsyncClient(
         transport=ASGITransport(app=app), base_url="http://test"
     ) as client:
@@ -428,3 +433,442 @@ async def test_delete_calls_delete_collection(mock_vector_store):
         await client.delete(f"/knowledge-base/{kb_id}")
 
     mock_backend.delete_collection.assert_called_once_with(kb_id)
+
+
+# --- Metadata filters ---
+
+
+@pytest.mark.asyncio
+async def test_query_with_filter_pushed_down(mock_vector_store):
+    from app.models import RetrievalFilter
+
+    mock_backend, mock_store = mock_vector_store
+    mock_backend.translate_filter.return_value = {"source_filename": {"$eq": "a.txt"}}
+    mock_store.similarity_search_with_score.return_value = []
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        create_resp = await client.post("/knowledge-base", json={"name": "Filter KB"})
+        kb_id = create_resp.json()["id"]
+
+        response = await client.post(
+            f"/knowledge-base/{kb_id}/query",
+            json={"query": "test", "top_k": 3, "filter": {"source_filename": "a.txt"}},
+        )
+
+    assert response.status_code == 200
+    mock_backend.translate_filter.assert_called_once_with(RetrievalFilter(source_filename="a.txt"))
+    mock_store.similarity_search_with_score.assert_called_once_with(
+        "test", k=3, filter={"source_filename": {"$eq": "a.txt"}}
+    )
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("bad_filter", [{"source_filename": []}, {"metadata": {"$or": "x"}}])
+async def test_query_with_invalid_filter_is_rejected(mock_vector_store, bad_filter):
+    mock_backend, _ = mock_vector_store
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        kb_id = (await client.post("/knowledge-base", json={"name": "Filter KB"})).json()["id"]
+        response = await client.post(f"/knowledge-base/{kb_id}/query", json={"query": "test", "filter": bad_filter})
+
+    assert response.status_code == 422
+    mock_backend.translate_filter.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_upload_with_custom_metadata(mock_vector_store):
+    with patch("app.api.knowledge_base.process_document", new_callable=AsyncMock) as mock_process:
+        mock_process.return_value = [Document(page_content="chunk", metadata={})]
+
+        async with AsyncClient(
+            transport=ASGITransport(app=app), base_url="http://test"
+        ) as client:
+            create_resp = await client.post("/knowledge-base", json={"name": "Meta KB"})
+            kb_id = create_resp.json()["id"]
+
+            response = await client.post(
+                f"/knowledge-base/{kb_id}/documents",
+                files=[("files", ("test.txt", b"Hello", "text/plain"))],
+                data={"metadata": '{"team": "finance", "year": 2024}'},
+            )
+
+    assert response.status_code == 200
+    extra_metadata = mock_process.call_args[0][2]
+    assert extra_metadata["team"] == "finance"
+    assert extra_metadata["year"] == 2024
+    assert isinstance(extra_metadata["uploaded_at"], int)
+
+
+@pytest.mark.asyncio
+async def test_upload_rejects_reserved_metadata(mock_vector_store):
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        create_resp = await client.post("/knowledge-base", json={"name": "Meta KB"})
+        kb_id = create_resp.json()["id"]
+
+        response = await client.post(
+            f"/knowledge-base/{kb_id}/documents",
+            files=[("files", ("test.txt", b"Hello", "text/plain"))],
+            data={"metadata": '{"source_filename": "spoofed.txt"}'},
+        )
+
+    assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_upload_and_query_with_local_backend(local_vector_store, fake_process):
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        create_resp = await client.post("/knowledge-base", json={"name": "Local KB"})
+        kb_id = create_resp.json()["id"]
+
+        await client.post(
+            f"/knowledge-base/{kb_id}/documents",
+            files=[
+                ("files", ("geo.txt", b"Paris is in France", "text/plain")),
+                ("files", ("finance.md", b"The revenue report", "text/markdown")),
+            ],
+        )
+        response = await client.post(
+            f"/knowledge-base/{kb_id}/query",
+            json={"query": "Paris", "filter": {"source_filename": "finance.md"}},
+        )
+
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [r["content"] for r in results] == ["The revenue report"]
+
+
+@pytest.mark.asyncio
+async def test_create_knowledge_base_with_quantization(local_vector_store):
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        response = await client.post("/knowledge-base", json={"name": "Small KB", "vector_quantization": "int8"})
+
+    assert response.status_code == 201
+    assert response.json()["vector_quantization"] == "int8"
+    assert local_vector_store._collection(response.json()["id"]).quantization == "int8"
+
+
+# --- Batch query ---
+
+
+def _register_kb(kb_id):
+    from app.api.knowledge_base import kb_registry
+
+    kb_registry[kb_id] = {
+        "id": kb_id,
+        "name": kb_id,
+        "description": "",
+        "document_count": 1,
+        "created_at": "2024-01-01T00:00:00Z",
+    }
+
+
+@pytest.mark.asyncio
+async def test_batch_query_embeds_distinct_queries_once(local_vector_store):
+    for kb_id, text in [("kb-geo", "Paris is in France"), ("kb-fin", "The revenue report")]:
+        _register_kb(kb_id)
+        local_vector_store.get_store(kb_id).add_texts([text], metadatas=[{"source_filename": f"{kb_id}.txt"}])
+
+    with patch.object(
+        local_vector_store._embeddings, "aembed_documents", wraps=local_vector_store._embeddings.aembed_documents
+    ) as embed:
+        async with AsyncClient(
+            transport=ASGITransport(app=app), base_url="http://test"
+        ) as client:
+            response = await client.post(
+                "/knowledge-base/query",
+                json={
+                    "items": [
+                        {"kb_id": "kb-geo", "query": "Paris"},
+                        {"kb_id": "kb-fin", "query": "Paris"},
+                        {"kb_id": "kb-fin", "query": "revenue", "top_k": 1},
+                        {"kb_id": "missing", "query": "Paris"},
+                    ]
+                },
+            )
+
+    assert response.status_code == 200
+    embed.assert_called_once_with(["Paris", "revenue"])
+    results = response.json()["results"]
+    assert [r["kb_id"] for r in results] == ["kb-geo", "kb-fin", "kb-fin", "missing"]
+    assert results[0]["results"][0]["content"] == "Paris is in France"
+    assert results[2]["results"][0]["content"] == "The revenue report"
+    assert results[3]["error"] == "Knowledge base not found"
+    assert results[3]["results"] == []
+
+
+@pytest.mark.asyncio
+async def test_batch_query_too_many_items(mock_vector_store):
+    from app.config import settings
+
+    items = [{"kb_id": "kb", "query": "q"}] * (settings.BATCH_QUERY_MAX_ITEMS + 1)
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        response = await client.post("/knowledge-base/query", json={"items": items})
+
+    assert response.status_code == 422
+
+
+# --- Retrieval cache ---
+
+
+@pytest.mark.asyncio
+async def test_repeated_query_is_cached_until_upload(local_vector_store, fake_process):
+    with patch.object(
+        local_vector_store._embeddings, "embed_query", wraps=local_vector_store._embeddings.embed_query
+    ) as embed:
+        async with AsyncClient(
+            transport=ASGITransport(app=app), base_url="http://test"
+        ) as client:
+            kb_id = (await client.post("/knowledge-base", json={"name": "Cached"})).json()["id"]
+            upload = {"files": [("files", ("a.txt", b"Paris is in France", "text/plain"))]}
+            await client.post(f"/knowledge-base/{kb_id}/documents", **upload)
+
+            first = await client.post(f"/knowledge-base/{kb_id}/query", json={"query": "paris"})
+            second = await client.post(f"/knowledge-base/{kb_id}/query", json={"query": "paris"})
+            embeds_before_upload = embed.call_count
+            upload = {"files": [("files", ("b.txt", b"Paris Paris Paris", "text/plain"))]}
+            await client.post(f"/knowledge-base/{kb_id}/documents", **upload)
+            third = await client.post(f"/knowledge-base/{kb_id}/query", json={"query": "paris"})
+            stats = (await client.get("/admin/retrieval-cache", headers=ADMIN_HEADERS)).json()
+
+    assert embeds_before_upload == 1
+    assert first.json() == second.json()
+    assert len(third.json()["results"]) == 2
+    assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (1, 2, pytest.approx(1 / 3))
+
+
+def test_retrieval_cache_evicts_least_recently_used_by_bytes(monkeypatch):
+    from app.config import settings
+    from app.rag.retriever import RetrievalCache
+
+    monkeypatch.setattr(settings, "RETRIEVAL_CACHE_MAX_BYTES", 25)
+    cache = RetrievalCache()
+    for name in ("a", "b", "c"):
+        cache.put((name, 0, "q", 4, None), [("x" * 10, {}, 1.0, None)])
+        cache.get(("a", 0, "q", 4, None))
+
+    assert cache.get(("b", 0, "q", 4, None)) is None
+    assert cache.get(("a", 0, "q", 4, None)) is not None
+    assert (len(cache), cache.bytes, cache.stats.evictions) == (2, 20, 1)
+
+    cache.put(("big", 0, "q", 4, None), [("x" * 26, {}, 1.0, None)])
+    assert cache.get(("big", 0, "q", 4, None)) is None
+
+
+def test_retrieval_cache_entries_expire(monkeypatch):
+    from app.config import settings
+    from app.rag.retriever import RetrievalCache
+
+    monkeypatch.setattr(settings, "RETRIEVAL_CACHE_TTL_SECONDS", 0.0)
+    cache = RetrievalCache()
+    cache.put(("kb", 0, "q", 4, None), [("text", {}, 1.0, None)])
+
+    assert cache.get(("kb", 0, "q", 4, None)) is None
+    assert (len(cache), cache.bytes, cache.stats.expirations) == (0, 0, 1)
+
+
+# --- Batched uploads ---
+
+
+async def _split_lines(file_path, filename, extra_metadata=None):
+    with open(file_path) as f:
+        return [Document(page_content=line, metadata={"source_filename": filename}) for line in f.read().splitlines()]
+
+
+UPLOAD = [
+    ("files", ("geo.txt", b"Paris is in France\nBerlin is in Germany", "text/plain")),
+    ("files", ("finance.md", b"The revenue report\nRevenue by country", "text/markdown")),
+]
+
+
+@pytest.mark.asyncio
+async def test_upload_commits_all_files_in_one_write(mock_vector_store):
+    mock_backend, mock_store = mock_vector_store
+
+    with patch("app.api.knowledge_base.process_document", side_effect=_split_lines):
+        async with AsyncClient(
+            transport=ASGITransport(app=app), base_url="http://test"
+        ) as client:
+            kb_id = (await client.post("/knowledge-base", json={"name": "Batched"})).json()["id"]
+            response = await client.post(f"/knowledge-base/{kb_id}/documents", files=UPLOAD)
+
+    assert response.json()["documents_processed"] == 4
+    mock_store.add_documents.assert_called_once()
+    assert [d.page_content for d in mock_store.add_documents.call_args.args[0]] == [
+        "Paris is in France", "Berlin is in Germany", "The revenue report", "Revenue by country"
+    ]
+
+
+@pytest.mark.asyncio
+async def test_failed_write_rolls_back_the_whole_upload(local_vector_store, monkeypatch):
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "INGEST_BATCH_CHUNKS", 2)
+    add = local_vector_store.add
+    calls = []
+
+    def fail_second_write(collection, documents):
+        calls.append(len(documents))
+        if len(calls) == 2:
+            raise RuntimeError("embedding server went away")
+        return add(collection, documents)
+
+    with patch("app.api.knowledge_base.process_document", side_effect=_split_lines), patch.object(
+        local_vector_store, "add", side_effect=fail_second_write
+    ):
+        async with AsyncClient(
+            transport=ASGITransport(app=app), base_url="http://test"
+        ) as client:
+            kb_id = (await client.post("/knowledge-base", json={"name": "Atomic"})).json()["id"]
+            response = await client.post(f"/knowledge-base/{kb_id}/documents", files=UPLOAD)
+            kb = (await client.get(f"/knowledge-base/{kb_id}")).json()
+            query = await client.post(f"/knowledge-base/{kb_id}/query", json={"query": "paris"})
+
+    assert calls == [2, 2]
+    assert response.json()["documents_processed"] == 0
+    assert [e["filename"] for e in response.json()["errors"]] == ["geo.txt", "finance.md"]
+    assert kb["document_count"] == 0
+    assert query.json()["results"] == []
+
+
+@pytest.mark.asyncio
+async def test_failed_write_keeps_chunks_another_upload_committed(local_vector_store, monkeypatch):
+    from app.config import settings
+    from app.maintenance import release_ids
+
+    monkeypatch.setattr(settings, "INGEST_BATCH_CHUNKS", 2)
+    add = local_vector_store.add
+    calls = []
+
+    def commit_elsewhere_then_fail(collection, documents):
+        calls.append([d.id for d in documents])
+        if len(calls) == 2:
+            # The same files, uploaded on another worker, commit the chunks of the first write.
+            release_ids(collection, set(calls[0]))
+            raise RuntimeError("embedding server went away")
+        return add(collection, documents)
+
+    with patch("app.api.knowledge_base.process_document", side_effect=_split_lines), patch.object(
+        local_vector_store, "add", side_effect=commit_elsewhere_then_fail
+    ):
+        async with AsyncClient(
+            transport=ASGITransport(app=app), base_url="http://test"
+        ) as client:
+            kb_id = (await client.post("/knowledge-base", json={"name": "Atomic"})).json()["id"]
+            response = await client.post(f"/knowledge-base/{kb_id}/documents", files=UPLOAD)
+
+    assert response.json()["documents_processed"] == 0
+    assert local_vector_store.existing_ids(kb_id, calls[0] + calls[1]) == set(calls[0])
+
+
+@pytest.mark.asyncio
+async def test_retried_upload_does_not_duplicate_chunks(local_vector_store):
+    from app.rag.retriever import kb_version
+
+    with patch("app.api.knowledge_base.process_document", side_effect=_split_lines):
+        async with AsyncClient(
+            transport=ASGITransport(app=app), base_url="http://test"
+        ) as client:
+            kb_id = (await client.post("/knowledge-base", json={"name": "Retry"})).json()["id"]
+            first = await client.post(f"/knowledge-base/{kb_id}/documents", files=UPLOAD)
+            version = await kb_version(kb_id)
+            duplicate = await client.post(f"/knowledge-base/{kb_id}/documents", files=UPLOAD)
+            unchanged = await kb_version(kb_id) == version
+            retry = await client.post(f"/knowledge-base/{kb_id}/documents", files=UPLOAD[:1] + [
+                ("files", ("notes.txt", b"Paris report", "text/plain")),
+            ])
+            kb = (await client.get(f"/knowledge-base/{kb_id}")).json()
+            query = await client.post(f"/knowledge-base/{kb_id}/query", json={"query": "paris", "top_k": 10})
+
+    assert (first.json()["documents_processed"], first.json()["duplicates_skipped"]) == (4, 0)
+    assert (duplicate.json()["documents_processed"], duplicate.json()["duplicates_skipped"]) == (0, 4)
+    # Nothing was written, so results cached before it stay valid.
+    assert unchanged
+    assert (retry.json()["documents_processed"], retry.json()["duplicates_skipped"]) == (1, 2)
+    assert kb["document_count"] == 5
+    assert len(query.json()["results"]) == 5
+
+
+# --- Streamed queries ---
+
+
+STREAM_TEXTS = [
+    "Paris Paris Paris France",
+    "Paris Paris is in France",
+    "Paris is in France",
+    "Berlin is in Germany",
+    "The revenue report",
+]
+
+
+async def _stream(client, kb_id, params=None, **body):
+    response = await client.post(
+        f"/knowledge-base/{kb_id}/query/stream", params=params, json={"query": "paris", **body}
+    )
+    return response, response.text
+
+
+@pytest.mark.asyncio
+async def test_stream_query_pages_through_the_ranking(local_vector_store, monkeypatch):
+    monkeypatch.setattr(settings, "QUERY_STREAM_BATCH_ROWS", 2)
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        kb_id = (await client.post("/knowledge-base", json={"name": "Stream"})).json()["id"]
+        local_vector_store.get_store(kb_id).add_texts(
+            STREAM_TEXTS, metadatas=[{"source_filename": f"{i}.txt"} for i in range(5)]
+        )
+        full = (await client.post(f"/knowledge-base/{kb_id}/query", json={"query": "paris", "top_k": 5})).json()
+        first, first_body = await _stream(client, kb_id, top_k=3)
+        second, second_body = await _stream(client, kb_id, top_k=3, offset=3)
+
+    assert first.headers["content-type"] == "application/x-ndjson"
+    *page1, end1 = [json.loads(line) for line in first_body.splitlines()]
+    *page2, end2 = [json.loads(line) for line in second_body.splitlines()]
+    assert [d["rank"] for d in page1 + page2] == [1, 2, 3, 4, 5]
+    assert [(d["content"], d["metadata"], d["score"]) for d in page1 + page2] == [
+        (r["content"], r["metadata"], r["score"]) for r in full["results"]
+    ]
+    assert end1 == {"done": True, "returned": 3, "next_offset": 3, "error": None}
+    assert end2 == {"done": True, "returned": 2, "next_offset": None, "error": None}
+
+
+@pytest.mark.asyncio
+async def test_stream_query_sends_metadata_only_or_truncated_content_as_sse(local_vector_store):
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        kb_id = (await client.post("/knowledge-base", json={"name": "Stream"})).json()["id"]
+        local_vector_store.get_store(kb_id).add_texts(STREAM_TEXTS[:2], metadatas=[{"source_filename": "a.txt"}] * 2)
+        metadata_only, metadata_body = await _stream(client, kb_id, include_content=False)
+        truncated, truncated_body = await _stream(client, kb_id, {"format": "sse"}, max_content_chars=10)
+
+    documents = [json.loads(line) for line in metadata_body.splitlines()][:-1]
+    assert [(d["content"], d["metadata"]) for d in documents] == [(None, {"source_filename": "a.txt"})] * 2
+    assert truncated.headers["content-type"].startswith("text/event-stream")
+    events = [json.loads(event.removeprefix("data: ")) for event in truncated_body.strip().split("\n\n")]
+    assert [(e["content"], e["content_truncated"]) for e in events[:-1]] == [
+        ("Paris Pari", True),
+        ("Paris Pari", True),
+    ]
+    assert events[-1]["done"]
+
+
+@pytest.mark.asyncio
+async def test_stream_query_rejects_pages_past_the_limit(local_vector_store, monkeypatch):
+    monkeypatch.setattr(settings, "QUERY_STREAM_MAX_RESULTS", 100)
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        kb_id = (await client.post("/knowledge-base", json={"name": "Stream"})).json()["id"]
+        too_deep, _ = await _stream(client, kb_id, top_k=50, offset=60)
+        missing, _ = await _stream(client, "missing")
+
+    assert too_deep.status_code == 422
+    assert "max 100" in too_deep.json()["detail"]
+    assert missing.status_code == 404
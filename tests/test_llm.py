@@ -0,0 +1,52 @@
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from app.main import app
+
+
+@pytest.fixture
+def cold_models(monkeypatch):
+    from app import llm
+
+    monkeypatch.setattr(llm, "readiness", {"chat": False, "embeddings": False})
+    monkeypatch.setattr("app.main.readiness", llm.readiness)
+    monkeypatch.setattr(llm.settings, "OLLAMA_WARMUP_RETRY_SECONDS", 0)
+    return llm
+
+
+@pytest.mark.asyncio
+async def test_ready_only_once_models_are_warm(cold_models):
+    chat_model = MagicMock()
+    chat_model.ainvoke = AsyncMock(side_effect=[ConnectionError("Ollama not up yet"), MagicMock()])
+    embeddings = MagicMock()
+    embeddings.aembed_query = AsyncMock(return_value=[0.0])
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        before = await client.get("/ready")
+        await cold_models.warm_up(chat_model, embeddings)
+        after = await client.get("/ready")
+
+    assert before.status_code == 503
+    assert before.json() == {"ready": False, "models": {"chat": False, "embeddings": False}}
+    assert after.status_code == 200
+    assert after.json() == {"ready": True, "models": {"chat": True, "embeddings": True}}
+    assert chat_model.ainvoke.await_count == 2
+    assert chat_model.ainvoke.call_args.kwargs["options"] == {"num_predict": 1}
+
+
+def test_ollama_clients_share_connection_pool():
+    from app.config import settings
+    from app.llm import create_chat_model
+    from app.rag.embeddings import get_embeddings
+
+    chat_model = create_chat_model()
+    embeddings = get_embeddings.__wrapped__()
+
+    assert chat_model.keep_alive == settings.OLLAMA_KEEP_ALIVE_SECONDS
+    assert embeddings.keep_alive == settings.OLLAMA_EMBEDDING_KEEP_ALIVE_SECONDS
+    assert chat_model._async_client._client._transport is embeddings._async_client._client._transport
+    assert chat_model._client._client._transport is embeddings._client._client._transport
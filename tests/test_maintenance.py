@@ -0,0 +1,251 @@
+import json
+import os
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from app.config import settings
+from app.main import app
+from app.rag.vector_store.local_backend import LocalVectorStoreBackend, _Collection
+from tests.conftest import ADMIN_HEADERS, GEO_TEXTS
+
+
+@pytest.fixture(autouse=True)
+def maintenance_state(monkeypatch):
+    from app import maintenance
+
+    monkeypatch.setattr(settings, "MAINTENANCE_BUSY_FRACTION", 1.0)
+    maintenance.pending_collection_deletes.clear()
+    maintenance.recent_reports.clear()
+    yield
+    maintenance.pending_collection_deletes.clear()
+    maintenance.recent_reports.clear()
+
+
+def _seed(backend, name="kb", quantization="none", copies=5):
+    backend.create_collection(name, quantization)
+    store = backend.get_store(name)
+    ids = store.add_texts(GEO_TEXTS * copies, metadatas=[{"source_filename": f"{i}.txt"} for i in range(4 * copies)])
+    return store, ids
+
+
+def _geo_files():
+    return [("files", (f"{i}.txt", text.encode(), "text/plain")) for i, text in enumerate(GEO_TEXTS)]
+
+
+def _register_kb(kb_id):
+    from app.api.knowledge_base import kb_registry
+
+    kb_registry[kb_id] = {
+        "id": kb_id, "name": kb_id, "description": "", "document_count": 0, "created_at": "2024-01-01T00:00:00Z",
+    }
+
+
+def _age(path, seconds=2 * 3600):
+    past = time.time() - seconds
+    os.utime(path, (past, past))
+
+
+@pytest.mark.parametrize("quantization", ["none", "int8"])
+def test_compaction_drops_dead_rows_and_keeps_results(local_vector_store, quantization):
+    store, ids = _seed(local_vector_store, quantization=quantization)
+    store.delete(ids[4:])
+    before = local_vector_store.search("kb", "paris france", 3)
+
+    assert local_vector_store.dead_fraction("kb") == pytest.approx(0.8)
+    reclaimed = local_vector_store.compact_collection("kb")
+
+    after = local_vector_store.search("kb", "paris france", 3)
+    assert reclaimed > 0
+    assert local_vector_store.dead_fraction("kb") == 0
+    assert [(d.id, d.page_content) for d, _ in after] == [(d.id, d.page_content) for d, _ in before]
+    assert local_vector_store.compact_collection("kb") == 0
+
+
+def test_interrupted_compaction_is_finished_on_load(local_vector_store):
+    store, ids = _seed(local_vector_store)
+    store.delete(ids[4:])
+    # Stop right after the compacted files are staged and marked complete.
+    with patch.object(_Collection, "_finish_compaction"):
+        local_vector_store.compact_collection("kb")
+
+    reopened = LocalVectorStoreBackend(root=str(local_vector_store._root), embeddings=local_vector_store._embeddings)
+
+    assert reopened.dead_fraction("kb") == 0
+    assert sorted(d.page_content for d, _ in reopened.search("kb", "paris", 4)) == sorted(GEO_TEXTS)
+    assert not list(reopened._root.joinpath("kb").glob("*.compact"))
+
+
+def test_interrupted_compaction_waits_for_readers(local_vector_store):
+    fcntl = pytest.importorskip("fcntl")
+
+    store, ids = _seed(local_vector_store)
+    store.delete(ids[4:])
+    with patch.object(_Collection, "_finish_compaction"):
+        local_vector_store.compact_collection("kb")
+    directory = local_vector_store._root / "kb"
+    reopened = []
+
+    with (directory / ".lock").open("a") as reader:
+        # Another process loading the collection holds the shared lock.
+        fcntl.flock(reader, fcntl.LOCK_SH)
+        opener = threading.Thread(target=lambda: reopened.append(
+            LocalVectorStoreBackend(root=str(local_vector_store._root), embeddings=local_vector_store._embeddings)
+            .dead_fraction("kb")
+        ))
+        opener.start()
+        opener.join(timeout=0.2)
+        staged_while_read = sorted(p.name for p in directory.glob("*.compact"))
+        fcntl.flock(reader, fcntl.LOCK_UN)
+    opener.join()
+
+    assert staged_while_read == ["meta.jsonl.compact", "norms.f32.compact", "vectors.f32.compact"]
+    assert reopened == [0]
+    assert not list(directory.glob("*.compact"))
+
+
+@pytest.mark.asyncio
+async def test_maintenance_pass_reclaims_leftovers(local_vector_store):
+    from app import maintenance
+
+    store, ids = _seed(local_vector_store)
+    store.delete(ids[8:])
+    _register_kb("kb")
+    for orphan in ("gone", "unknown"):
+        _seed(local_vector_store, orphan, copies=1)
+    maintenance.pending_collection_deletes.add("gone")
+
+    failed = maintenance.begin_ingest("kb", ids[:2])
+    in_progress = maintenance.begin_ingest("kb", ids[2:4])
+    _age(failed)
+    upload_dir = settings.UPLOAD_DIR
+    for name, content in (("stale.pdf", b"x" * 100), ("fresh.pdf", b"y")):
+        with open(os.path.join(upload_dir, name), "wb") as f:
+            f.write(content)
+    _age(os.path.join(upload_dir, "stale.pdf"))
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        report = (await client.post("/admin/maintenance", headers=ADMIN_HEADERS)).json()
+        listed = (await client.get("/admin/maintenance", headers=ADMIN_HEADERS)).json()
+
+    assert (report["stale_uploads_removed"], report["failed_ingests_cleaned"], report["failed_chunks_deleted"]) == (1, 1, 2)
+    assert report["orphan_collections_deleted"] == ["gone"]
+    assert report["unregistered_collections"] == ["unknown"]
+    assert [c["collection"] for c in report["compactions"]] == ["kb"]
+    assert report["compactions"][0]["search_ms_after"] is not None
+    assert report["reclaimed_bytes"] >= 100 + report["compactions"][0]["reclaimed_bytes"]
+    assert report["storage_bytes_after"] < report["storage_bytes_before"]
+    assert report["errors"] == []
+    assert listed == [report]
+
+    assert sorted(os.listdir(upload_dir)) == [".ingest", ".maintenance.lock", "fresh.pdf"]
+    assert not failed.exists() and in_progress.exists()
+    assert local_vector_store.list_collections() == ["kb", "unknown"]
+    assert len(local_vector_store.get_store("kb").get_by_ids(ids)) == 6
+
+
+@pytest.mark.asyncio
+async def test_failed_upload_rolls_back_stored_chunks(local_vector_store, fake_process):
+    add = local_vector_store.add
+
+    def add_then_fail(collection, documents):
+        add(collection, documents)
+        raise RuntimeError("connection reset")
+
+    with patch.object(local_vector_store, "add", side_effect=add_then_fail):
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+            kb_id = (await client.post("/knowledge-base", json={"name": "KB"})).json()["id"]
+            upload = await client.post(f"/knowledge-base/{kb_id}/documents", files=_geo_files())
+            query = await client.post(f"/knowledge-base/{kb_id}/query", json={"query": "paris"})
+
+    assert upload.json()["errors"][0]["error"] == "connection reset"
+    assert upload.json()["documents_processed"] == 0
+    assert query.json()["results"] == []
+    assert os.listdir(os.path.join(settings.UPLOAD_DIR, ".ingest")) == []
+
+
+@pytest.mark.asyncio
+async def test_maintenance_leaves_a_slow_commit_alone(local_vector_store, fake_process, monkeypatch):
+    from app import maintenance
+    from app.api.knowledge_base import kb_registry
+
+    monkeypatch.setattr(settings, "INGEST_BATCH_CHUNKS", 1)
+    monkeypatch.setattr(settings, "MAINTENANCE_GRACE_SECONDS", -1)  # every entry is old enough
+    add = local_vector_store.aadd
+    reports = []
+
+    async def add_then_run_maintenance(collection, documents):
+        await add(collection, documents)
+        reports.append(await maintenance.run_maintenance(kb_registry))
+
+    with patch.object(local_vector_store, "aadd", side_effect=add_then_run_maintenance):
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+            kb_id = (await client.post("/knowledge-base", json={"name": "KB"})).json()["id"]
+            upload = await client.post(f"/knowledge-base/{kb_id}/documents", files=_geo_files())
+            query = await client.post(f"/knowledge-base/{kb_id}/query", json={"query": "paris", "top_k": 10})
+
+    assert upload.json()["documents_processed"] == len(GEO_TEXTS)
+    assert len(reports) == len(GEO_TEXTS)
+    assert all(report.failed_ingests_cleaned == 0 for report in reports)
+    assert len(query.json()["results"]) == len(GEO_TEXTS)
+    assert os.listdir(os.path.join(settings.UPLOAD_DIR, ".ingest")) == []
+
+
+@pytest.mark.asyncio
+async def test_failed_collection_delete_is_left_for_maintenance(mock_vector_store):
+    from app import maintenance
+
+    mock_backend, _ = mock_vector_store
+    mock_backend.delete_collection.side_effect = RuntimeError("disk busy")
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        kb_id = (await client.post("/knowledge-base", json={"name": "KB"})).json()["id"]
+        response = await client.delete(f"/knowledge-base/{kb_id}")
+        missing = await client.get(f"/knowledge-base/{kb_id}")
+
+    assert response.status_code == 204
+    assert missing.status_code == 404
+    assert maintenance.pending_collection_deletes == {kb_id}
+
+
+def test_journal_entry_records_collection_and_ids():
+    from app import maintenance
+
+    entry = maintenance.begin_ingest("t.kb", ["a", "b"])
+
+    assert json.loads(entry.read_text()) == {"collection": "t.kb", "ids": ["a", "b"]}
+    maintenance.end_ingest(entry)
+    assert not entry.exists()
+
+
+@pytest.mark.asyncio
+async def test_retry_keeps_chunks_a_failed_rollback_left_journaled(local_vector_store, fake_process):
+    from app import maintenance
+
+    add = local_vector_store.add
+
+    def add_then_fail(collection, documents):
+        add(collection, documents)
+        raise RuntimeError("connection reset")
+
+    upload = {"files": _geo_files()}
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        kb_id = (await client.post("/knowledge-base", json={"name": "KB"})).json()["id"]
+        with patch.object(local_vector_store, "add", side_effect=add_then_fail), patch.object(
+            local_vector_store, "delete_documents", side_effect=RuntimeError("still down")
+        ):
+            await client.post(f"/knowledge-base/{kb_id}/documents", **upload)
+        journal = os.listdir(os.path.join(settings.UPLOAD_DIR, ".ingest"))
+        retry = (await client.post(f"/knowledge-base/{kb_id}/documents", **upload)).json()
+        report = (await client.post("/admin/maintenance", headers=ADMIN_HEADERS)).json()
+        query = await client.post(f"/knowledge-base/{kb_id}/query", json={"query": "paris", "top_k": 10})
+
+    assert len(journal) == 1
+    assert retry["documents_processed"] == 4
+    assert os.listdir(os.path.join(settings.UPLOAD_DIR, ".ingest")) == []
+    assert report["failed_chunks_deleted"] == 0
+    assert len(query.json()["results"]) == 4
+    assert maintenance.journaled_ids(kb_id) == set()
@@ -0,0 +1,139 @@
+import pytest
+from httpx import ASGITransport, AsyncClient
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from app.main import app
+from tests.conftest import ADMIN_HEADERS
+
+
+@pytest.fixture
+def profiling(monkeypatch, tmp_path):
+    from app import profiling
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "PROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "PROFILE_HEADER_ENABLED", True)
+    monkeypatch.setattr("app.api.chat.llm", FakeListChatModel(responses=["Hi there"]))
+    profiling.recent_profiles.clear()
+    yield settings
+    profiling.recent_profiles.clear()
+
+
+@pytest.mark.asyncio
+async def test_profile_header_writes_trace(profiling):
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test", headers=ADMIN_HEADERS
+    ) as client:
+        await client.post("/chat", json={"message": "Hello"})
+        response = await client.post("/chat", json={"message": "Hello"}, headers={"X-Profile": "trace"})
+        profiles = (await client.get("/admin/profiles")).json()
+        artifact = await client.get(f"/admin/profiles/{profiles[0]['id']}")
+
+    assert response.json()["response"] == "Hi there"
+    assert len(profiles) == 1
+    assert profiles[0]["mode"] == "trace"
+    assert profiles[0]["path"] == "/chat"
+    events = artifact.json()["traceEvents"]
+    assert {"session_load", "trim", "prompt_assembly", "generation"} <= {e["name"] for e in events if e["cat"] == "stage"}
+    assert [e["name"] for e in events if e["cat"] == "llm"] == ["FakeListChatModel"]
+
+
+@pytest.mark.asyncio
+async def test_unprofiled_requests_leave_no_artifacts(profiling, monkeypatch, tmp_path):
+    monkeypatch.setattr(profiling, "PROFILE_HEADER_ENABLED", False)
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test", headers=ADMIN_HEADERS
+    ) as client:
+        await client.post("/chat", json={"message": "Hello"}, headers={"X-Profile": "trace"})
+        profiles = (await client.get("/admin/profiles")).json()
+
+    assert profiles == []
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.asyncio
+async def test_profiles_are_rotated(profiling, monkeypatch, tmp_path):
+    monkeypatch.setattr(profiling, "PROFILE_KEEP", 2)
+    monkeypatch.setattr(profiling, "PROFILE_SAMPLE_RATE", 1.0)
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test", headers=ADMIN_HEADERS
+    ) as client:
+        for _ in range(3):
+            await client.post("/chat", json={"message": "Hello"})
+        profiles = (await client.get("/admin/profiles")).json()
+
+    assert len(profiles) == 2
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted(p["filename"] for p in profiles)
+
+
+@pytest.mark.asyncio
+async def test_admin_token_guards_profiles(profiling, monkeypatch):
+    monkeypatch.setattr(profiling, "ADMIN_TOKEN", "secret")
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        await client.post("/chat", json={"message": "Hello"}, headers={"X-Profile": "trace"})
+        denied = await client.get("/admin/profiles")
+        allowed = await client.get("/admin/profiles", headers={"X-Admin-Token": "secret"})
+
+    assert denied.status_code == 403
+    # Without the token the X-Profile header is ignored too.
+    assert allowed.json() == []
+
+
+@pytest.mark.asyncio
+async def test_admin_endpoints_are_closed_without_a_token(profiling, monkeypatch):
+    monkeypatch.setattr(profiling, "ADMIN_TOKEN", None)
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        bare = await client.get("/admin/profiles")
+        guessed = await client.get("/admin/profiles", headers={"X-Admin-Token": ""})
+        maintenance = await client.post("/admin/maintenance", headers=ADMIN_HEADERS)
+
+    assert [r.status_code for r in (bare, guessed, maintenance)] == [403, 403, 403]
+    assert bare.json()["detail"] == "Admin endpoints are disabled until ADMIN_TOKEN is set"
+
+
+@pytest.mark.asyncio
+async def test_profile_header_sampling_profile(profiling):
+    pytest.importorskip("pyinstrument")
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test", headers=ADMIN_HEADERS
+    ) as client:
+        await client.post("/chat", json={"message": "Hello"}, headers={"X-Profile": "sampling"})
+        profiles = (await client.get("/admin/profiles")).json()
+        artifact = await client.get(f"/admin/profiles/{profiles[0]['id']}")
+
+    assert profiles[0]["mode"] == "sampling"
+    assert artifact.headers["content-type"].startswith("text/html")
+
+
+@pytest.mark.asyncio
+async def test_profiles_are_written_off_the_event_loop(profiling, monkeypatch):
+    import threading
+
+    from app import profiling as profiling_module
+
+    loop_thread = threading.get_ident()
+    seen = []
+    save = profiling_module._save
+
+    def recording_save(*args):
+        seen.append(threading.get_ident())
+        save(*args)
+
+    monkeypatch.setattr(profiling_module, "_save", recording_save)
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test", headers=ADMIN_HEADERS
+    ) as client:
+        await client.post("/chat", json={"message": "Hello"}, headers={"X-Profile": "trace"})
+        profiles = (await client.get("/admin/profiles")).json()
+
+    assert len(profiles) == 1
+    assert seen and seen[0] != loop_thread
@@ -0,0 +1,183 @@
+import asyncio
+from unittest.mock import patch
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from app.config import settings
+from app.main import app
+from tests.conftest import ADMIN_HEADERS, FakeEmbeddings
+
+
+class NewModelEmbeddings(FakeEmbeddings):
+    """Another "model": a larger vocabulary, so vectors have another dimension."""
+
+    VOCAB = FakeEmbeddings.VOCAB + ["country"]
+
+    def __init__(self):
+        self.gate = asyncio.Event()
+        self.gate.set()
+
+    async def aembed_documents(self, texts):
+        await self.gate.wait()
+        return self.embed_documents(texts)
+
+
+@pytest.fixture
+def new_model(local_vector_store, monkeypatch):
+    monkeypatch.setattr(settings, "REINDEX_BUSY_FRACTION", 1.0)
+    monkeypatch.setattr(settings, "REINDEX_BATCH_ROWS", 3)
+    embeddings = NewModelEmbeddings()
+    old = local_vector_store._embeddings
+    monkeypatch.setattr(local_vector_store, "embeddings_for", lambda model: embeddings if model == "new-model" else old)
+    yield embeddings
+    from app import reindex
+
+    reindex.reindex_jobs.clear()
+
+
+async def _finish():
+    from app import reindex
+
+    await asyncio.gather(*reindex._tasks.values())
+
+
+@pytest.mark.asyncio
+async def test_reindex_re_embeds_and_switches_over(local_vector_store, new_model, create_geo_kb, query_kb):
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        kb_id = await create_geo_kb(client)
+        before = await query_kb(client, kb_id)
+        started = await client.post(f"/knowledge-base/{kb_id}/reindex", json={"embedding_model": "new-model"})
+        await _finish()
+        status = (await client.get(f"/knowledge-base/{kb_id}/reindex")).json()
+        kb = (await client.get(f"/knowledge-base/{kb_id}")).json()
+        with patch.object(new_model, "embed_query", wraps=new_model.embed_query) as embed_query:
+            after = await query_kb(client, kb_id)
+
+    assert started.status_code == 202
+    assert started.json()["from_model"] == settings.OLLAMA_EMBEDDING_MODEL
+    assert status["state"] == "completed"
+    assert status["documents_done"] == status["documents_total"] == 4
+    assert status["documents_per_second"] > 0
+    assert kb["embedding_model"] == "new-model"
+    assert after == before
+    embed_query.assert_called_once()
+    (collection,) = local_vector_store.list_collections()
+    assert collection.startswith(f"{kb_id}.r")
+    assert local_vector_store.collection_model(collection) == "new-model"
+    assert local_vector_store._collection(collection).dim == len(NewModelEmbeddings.VOCAB) + 1
+
+
+@pytest.mark.asyncio
+async def test_queries_use_the_old_collection_and_uploads_reach_both_until_switch_over(
+    new_model, create_geo_kb, query_kb, fake_process
+):
+    new_model.gate.clear()
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        kb_id = await create_geo_kb(client)
+        await client.post(f"/knowledge-base/{kb_id}/reindex", json={"embedding_model": "new-model"})
+        upload = await client.post(
+            f"/knowledge-base/{kb_id}/documents",
+            files=[("files", ("capital.txt", b"Berlin report", "text/plain"))],
+        )
+        during = await query_kb(client, kb_id, "berlin report")
+        running = (await client.get(f"/knowledge-base/{kb_id}/reindex")).json()
+        kb_during = (await client.get(f"/knowledge-base/{kb_id}")).json()
+
+        new_model.gate.set()
+        await _finish()
+        after = await query_kb(client, kb_id, "berlin report")
+        kb_after = (await client.get(f"/knowledge-base/{kb_id}")).json()
+
+    assert upload.json()["documents_processed"] == 1
+    assert running["state"] == "running"
+    assert kb_during["embedding_model"] == settings.OLLAMA_EMBEDDING_MODEL
+    assert during[0][0] == "Berlin report"
+    assert after == during
+    assert kb_after["document_count"] == 5
+
+
+@pytest.mark.asyncio
+async def test_cancelled_reindex_leaves_the_knowledge_base_as_it_was(local_vector_store, new_model, create_geo_kb, query_kb):
+    new_model.gate.clear()
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        kb_id = await create_geo_kb(client)
+        before = await query_kb(client, kb_id)
+        await client.post(f"/knowledge-base/{kb_id}/reindex", json={"embedding_model": "new-model"})
+        again = await client.post(f"/knowledge-base/{kb_id}/reindex", json={"embedding_model": "new-model"})
+        shadow_existed = len(local_vector_store.list_collections()) == 2
+        cancelled = await client.delete(f"/knowledge-base/{kb_id}/reindex")
+        status = (await client.get(f"/knowledge-base/{kb_id}/reindex")).json()
+        same_model = await client.post(f"/knowledge-base/{kb_id}/reindex", json={})
+        after = await query_kb(client, kb_id)
+        nothing_to_cancel = await client.delete(f"/knowledge-base/{kb_id}/reindex")
+
+    assert again.status_code == 409
+    assert shadow_existed
+    assert cancelled.status_code == 204
+    assert status["state"] == "cancelled"
+    assert same_model.status_code == 409
+    assert "already embedded" in same_model.json()["detail"]
+    assert after == before
+    assert local_vector_store.list_collections() == [kb_id]
+    assert nothing_to_cancel.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_failed_reindex_reports_the_error_and_keeps_serving(local_vector_store, new_model, create_geo_kb, query_kb):
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        kb_id = await create_geo_kb(client)
+        with patch.object(new_model, "embed_documents", side_effect=RuntimeError("model not found")):
+            await client.post(f"/knowledge-base/{kb_id}/reindex", json={"embedding_model": "new-model"})
+            await _finish()
+        status = (await client.get(f"/knowledge-base/{kb_id}/reindex")).json()
+        jobs = (await client.get("/admin/reindex", headers=ADMIN_HEADERS)).json()
+        results = await query_kb(client, kb_id)
+
+    assert status["state"] == "failed"
+    assert status["error"] == "model not found"
+    assert [job["kb_id"] for job in jobs] == [kb_id]
+    assert results[0][0] == "Paris is in France"
+    assert local_vector_store.list_collections() == [kb_id]
+
+
+@pytest.mark.asyncio
+async def test_deleting_a_knowledge_base_stops_its_reindex(local_vector_store, new_model, create_geo_kb):
+    new_model.gate.clear()
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        kb_id = await create_geo_kb(client)
+        await client.post(f"/knowledge-base/{kb_id}/reindex", json={"embedding_model": "new-model"})
+        deleted = await client.delete(f"/knowledge-base/{kb_id}")
+
+    assert deleted.status_code == 204
+    assert local_vector_store.list_collections() == []
+
+
+@pytest.mark.asyncio
+async def test_switch_over_waits_for_a_commit_on_another_worker(tmp_path, monkeypatch, new_model, create_geo_kb):
+    fcntl = pytest.importorskip("fcntl")
+    from app import reindex
+    from app.state import SharedState
+
+    state = SharedState(str(tmp_path / "state.db"))
+    monkeypatch.setattr(reindex, "shared_state", state)
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        kb_id = await create_geo_kb(client)
+        new_model.gate.clear()
+        await client.post(f"/knowledge-base/{kb_id}/reindex", json={"embedding_model": "new-model"})
+        with open(tmp_path / "state.db.locks" / f"{kb_id}.lock", "a") as other_worker:
+            # Another worker is committing an upload to the knowledge base.
+            fcntl.flock(other_worker, fcntl.LOCK_EX)
+            new_model.gate.set()
+            await asyncio.sleep(0.3)
+            waiting = (await client.get(f"/knowledge-base/{kb_id}/reindex")).json()
+            kb_while_waiting = (await client.get(f"/knowledge-base/{kb_id}")).json()
+            fcntl.flock(other_worker, fcntl.LOCK_UN)
+        await _finish()
+        kb = (await client.get(f"/knowledge-base/{kb_id}")).json()
+    state.close()
+
+    assert waiting["state"] == "running"
+    assert waiting["documents_done"] == 4
+    assert kb_while_waiting["embedding_model"] == settings.OLLAMA_EMBEDDING_MODEL
+    assert kb["embedding_model"] == "new-model"
@@ -0,0 +1,128 @@
+import io
+import tarfile
+from unittest.mock import patch
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from app.config import settings
+from app.main import app
+from tests.conftest import GEO_TEXTS
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("quantization", ["none", "int8"])
+async def test_export_and_import_round_trip_without_embedding(local_vector_store, quantization, create_geo_kb, query_kb):
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        kb_id = await create_geo_kb(client, quantization)
+        exported = await client.get(f"/knowledge-base/{kb_id}/export")
+
+        with patch.object(local_vector_store._embeddings, "embed_documents") as embed:
+            imported = await client.post(
+                "/knowledge-base/import",
+                files={"archive": ("geo.tar", exported.content, "application/x-tar")},
+                data={"name": "Geo copy"},
+            )
+        new_id = imported.json()["id"]
+        original, copy = await query_kb(client, kb_id), await query_kb(client, new_id)
+
+    assert exported.headers["content-type"] == "application/x-tar"
+    assert imported.status_code == 201
+    embed.assert_not_called()
+    assert imported.json()["name"] == "Geo copy"
+    assert imported.json()["document_count"] == 4
+    assert imported.json()["vector_quantization"] == quantization
+    assert new_id != kb_id
+    assert copy == original
+    assert local_vector_store.get_store(new_id).get_by_ids(["x"]) == []
+
+
+@pytest.mark.asyncio
+async def test_int8_vectors_make_a_smaller_archive_with_the_same_ranking(create_geo_kb, query_kb):
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        kb_id = await create_geo_kb(client)
+        full = await client.get(f"/knowledge-base/{kb_id}/export")
+        small = await client.get(f"/knowledge-base/{kb_id}/export", params={"vectors": "int8"})
+        new_id = (await client.post(
+            "/knowledge-base/import", files={"archive": ("geo.tar", small.content, "application/x-tar")}
+        )).json()["id"]
+        original, copy = await query_kb(client, kb_id), await query_kb(client, new_id)
+
+    members = tarfile.open(fileobj=io.BytesIO(small.content)).getnames()
+    assert members == ["manifest.json", "rows/000000.jsonl.gz", "rows/000000.i8", "rows/000000.scale.f32", "end.json"]
+    vector_bytes = {
+        name: tarfile.open(fileobj=io.BytesIO(archive.content)).getmember(name).size
+        for archive, name in ((full, "rows/000000.f32"), (small, "rows/000000.i8"))
+    }
+    assert vector_bytes["rows/000000.i8"] * 4 == vector_bytes["rows/000000.f32"]
+    assert [content for content, _ in copy] == [content for content, _ in original]
+
+
+@pytest.mark.asyncio
+async def test_import_rejects_another_embedding_model(local_vector_store, monkeypatch, create_geo_kb):
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        kb_id = await create_geo_kb(client)
+        exported = await client.get(f"/knowledge-base/{kb_id}/export")
+        monkeypatch.setattr(settings, "OLLAMA_EMBEDDING_MODEL", "mxbai-embed-large")
+        response = await client.post(
+            "/knowledge-base/import", files={"archive": ("geo.tar", exported.content, "application/x-tar")}
+        )
+        listed = (await client.get("/knowledge-base")).json()
+
+    assert response.status_code == 409
+    assert "nomic-embed-text" in response.json()["detail"]
+    assert [kb["id"] for kb in listed] == [kb_id]
+    assert local_vector_store.list_collections() == [kb_id]
+
+
+@pytest.mark.asyncio
+async def test_import_counts_storage_from_the_rows_not_the_manifest(local_vector_store, monkeypatch, create_geo_kb):
+    from app.api.knowledge_base import kb_registry
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        kb_id = await create_geo_kb(client)
+        exported = await client.get(f"/knowledge-base/{kb_id}/export")
+        archive = {"archive": ("geo.tar", exported.content, "application/x-tar")}
+        imported = await client.post("/knowledge-base/import", files=archive)
+        stored = kb_registry[imported.json()["id"]]["storage_bytes"]
+        # One byte short of a third copy: the 100 bytes `create_geo_kb` recorded, then the import.
+        monkeypatch.setattr(settings, "TENANT_MAX_STORAGE_BYTES", 100 + 2 * stored - 1)
+        over_quota = await client.post("/knowledge-base/import", files=archive)
+        listed = (await client.get("/knowledge-base")).json()
+
+    # The chunk texts, as for uploads, not the 100 bytes the manifest claims.
+    assert stored == sum(len(text) for text in GEO_TEXTS)
+    assert over_quota.status_code == 413
+    assert len(listed) == 2
+    assert len(local_vector_store.list_collections()) == 2
+
+
+@pytest.mark.asyncio
+async def test_truncated_archive_leaves_nothing_behind(local_vector_store, create_geo_kb):
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        kb_id = await create_geo_kb(client)
+        exported = await client.get(f"/knowledge-base/{kb_id}/export")
+        end = tarfile.open(fileobj=io.BytesIO(exported.content)).getmember("end.json").offset
+        truncated = await client.post(
+            "/knowledge-base/import",
+            files={"archive": ("geo.tar", exported.content[:end], "application/x-tar")},
+        )
+        garbage = await client.post(
+            "/knowledge-base/import", files={"archive": ("geo.tar", b"not a tar file", "application/x-tar")}
+        )
+        listed = (await client.get("/knowledge-base")).json()
+
+    assert truncated.status_code == 422
+    assert truncated.json()["detail"] == "Archive is truncated"
+    assert garbage.status_code == 422
+    assert [kb["id"] for kb in listed] == [kb_id]
+    assert local_vector_store.list_collections() == [kb_id]
+
+
+@pytest.mark.asyncio
+async def test_export_of_another_tenants_knowledge_base_is_not_found(create_geo_kb):
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        kb_id = await create_geo_kb(client)
+        response = await client.get(f"/knowledge-base/{kb_id}/export", headers={"X-Tenant-Id": "other"})
+
+    assert response.status_code == 404
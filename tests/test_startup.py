@@ -0,0 +1,43 @@
+import subprocess
+import sys
+from pathlib import Path
+
+# Cumulative `import app.main` time, as reported by `-X importtime`. Generous
+# enough for a slow CI runner; eager loaders or clients push it well past this.
+IMPORT_BUDGET_SECONDS = 2.5
+
+# Imported on first use, never at startup.
+DEFERRED_PACKAGES = (
+    "chromadb",
+    "langchain_chroma",
+    "langchain_community",
+    "langchain_ollama",
+    "langchain_text_splitters",
+    "langgraph",
+    "ollama",
+)
+
+
+def test_app_import_stays_within_budget():
+    script = (
+        "import sys, app.main; "
+        "print(' '.join(sorted({name.split('.')[0] for name in sys.modules})))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", script],
+        cwd=Path(__file__).resolve().parent.parent,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    loaded = set(result.stdout.split())
+    assert loaded.isdisjoint(DEFERRED_PACKAGES), sorted(loaded & set(DEFERRED_PACKAGES))
+
+    # Lines look like "import time: <self us> | <cumulative us> | <indented module>".
+    cumulative_us = next(
+        int(line.split("|")[1])
+        for line in result.stderr.splitlines()
+        if line.startswith("import time:") and line.split("|")[2].strip() == "app.main"
+    )
+    assert cumulative_us / 1e6 < IMPORT_BUDGET_SECONDS
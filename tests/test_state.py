@@ -0,0 +1,187 @@
+import asyncio
+from datetime import datetime, timezone
+from unittest.mock import AsyncMock
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from app.main import app
+from app.state import SharedKnowledgeBaseRegistry, SharedState
+from tests.conftest import make_fake_response
+
+
+@pytest.fixture
+def use_worker(tmp_path, monkeypatch):
+    """Switch the app to worker `n`: its own in-process caches, one shared database."""
+    from app import memory
+    from app.api import chat
+
+    path = str(tmp_path / "state.db")
+    states: dict[int, SharedState] = {}
+    caches: dict[int, dict] = {}
+    current: list[int] = []
+
+    def switch(n: int) -> None:
+        if current:
+            caches[current[0]] = (dict(chat.sessions), dict(chat.session_positions))
+        sessions, positions = caches.get(n, ({}, {}))
+        chat.sessions.clear()
+        chat.sessions.update(sessions)
+        chat.session_positions.clear()
+        chat.session_positions.update(positions)
+        chat.agent_cursors.clear()
+        chat.window_starts.clear()
+        memory.summaries.clear()
+        state = states.setdefault(n, SharedState(path))
+        monkeypatch.setattr(chat, "shared_state", state)
+        monkeypatch.setattr(memory, "shared_state", state)
+        current[:] = [n]
+
+    yield switch
+    for state in states.values():
+        state.close()
+
+
+@pytest.mark.asyncio
+async def test_session_continues_on_any_worker(use_worker, mock_llm):
+    mock_llm.ainvoke = AsyncMock(side_effect=[make_fake_response(r) for r in ("Paris", "2.1 million", "Yes")])
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        use_worker(1)
+        first = await client.post("/chat", json={"message": "Capital of France?"})
+        session_id = first.json()["session_id"]
+        use_worker(2)
+        await client.post("/chat", json={"message": "Population?", "session_id": session_id})
+        # Worker 1 still caches the first turn only and catches up on the second.
+        use_worker(1)
+        await client.post("/chat", json={"message": "Is it big?", "session_id": session_id})
+        use_worker(3)
+        messages = await client.get(f"/chat/{session_id}/messages")
+
+    prompt = mock_llm.ainvoke.call_args.args[0]
+    assert [m.content for m in prompt] == ["Capital of France?", "Paris", "Population?", "2.1 million", "Is it big?"]
+    assert [m["content"] for m in messages.json()["messages"]] == [m.content for m in prompt] + ["Yes"]
+
+
+@pytest.mark.asyncio
+async def test_interleaved_appends_keep_stored_order(use_worker):
+    from app.api import chat
+
+    first, second, third = (HumanMessage(content=c, id=c) for c in ("first", "second", "third"))
+    use_worker(1)
+    session_id, history = "s1", chat.sessions.setdefault("s1", [])
+    await chat._append(session_id, history, first)
+    use_worker(2)
+    other = await chat._restore_history(session_id)
+    await chat._append(session_id, other, second)
+    # Worker 1 appends without reading the session first, as a turn already under way does.
+    use_worker(1)
+    await chat._append(session_id, history, third)
+    restored = await chat._restore_history(session_id)
+    use_worker(3)
+    stored = await chat._restore_history(session_id)
+
+    assert [m.content for m in restored] == ["first", "second", "third"]
+    assert [m.content for m in stored] == ["first", "second", "third"]
+
+
+@pytest.mark.asyncio
+async def test_session_locks_are_dropped_when_idle(use_worker):
+    from app.api import chat
+
+    use_worker(1)
+    history = chat.sessions.setdefault("s1", [])
+    await asyncio.gather(*(chat._append("s1", history, HumanMessage(content=c, id=c)) for c in "abc"))
+    restored = await chat._restore_history("s1")
+
+    assert [m.content for m in restored] == ["a", "b", "c"]
+    assert chat.session_locks == {} and chat._session_lock_users == {}
+
+
+@pytest.mark.asyncio
+async def test_summary_is_shared_between_workers(use_worker):
+    from app import memory
+    from app.api import chat
+
+    history = [
+        HumanMessage(content="Capital of France?", id="m1"),
+        AIMessage(content="Paris", id="m2"),
+        HumanMessage(content="Population?", id="m3"),
+    ]
+    summarizer = AsyncMock()
+    summarizer.ainvoke = AsyncMock(return_value=make_fake_response("They asked about Paris."))
+    use_worker(1)
+    await chat.shared_state.aappend_messages("s1", history)
+    memory.schedule_summary("s1", history[:2], summarizer)
+    await memory.summaries["s1"].task
+
+    use_worker(2)
+    assert await chat._restore_history("s1") == history
+    assert memory.summary_messages("s1") == [SystemMessage(content=memory.SUMMARY_PREFIX + "They asked about Paris.")]
+    assert memory.summaries["s1"].covered_id == "m2"
+
+
+@pytest.mark.asyncio
+async def test_knowledge_base_registry_is_shared(tmp_path, monkeypatch, mock_vector_store):
+    path = str(tmp_path / "state.db")
+    first = SharedKnowledgeBaseRegistry(SharedState(path))
+    second = SharedKnowledgeBaseRegistry(SharedState(path))
+    monkeypatch.setattr("app.api.knowledge_base.kb_registry", first)
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        created = (await client.post("/knowledge-base", json={"name": "Docs"})).json()
+
+    kb_id = created["id"]
+    first.add_documents(kb_id, 3)
+    second.add_documents(kb_id, 2)
+
+    assert kb_id in second and len(second) == 1 and list(second) == [kb_id]
+    assert second[kb_id]["document_count"] == 5
+    assert second[kb_id]["created_at"] == datetime.fromisoformat(created["created_at"])
+    assert second[kb_id]["created_at"].tzinfo == timezone.utc
+    del second[kb_id]
+    assert kb_id not in first
+    with pytest.raises(KeyError):
+        del first[kb_id]
+
+
+def test_update_record_keeps_counters_of_other_workers(tmp_path):
+    path = str(tmp_path / "state.db")
+    first = SharedKnowledgeBaseRegistry(SharedState(path))
+    second = SharedKnowledgeBaseRegistry(SharedState(path))
+    first["kb"] = {"id": "kb", "name": "Docs", "document_count": 0, "created_at": datetime.now(timezone.utc)}
+    stale = first["kb"]
+
+    second.add_documents("kb", 3, 30)
+    first.update_record("kb", collection="kb.r1", embedding_model="new-model")
+
+    assert second["kb"]["collection"] == "kb.r1"
+    assert second["kb"]["document_count"] == 3
+    assert second["kb"]["created_at"] == stale["created_at"]
+    with pytest.raises(KeyError):
+        first.update_record("missing", collection="x")
+
+
+@pytest.mark.asyncio
+async def test_cached_retrievals_miss_after_another_workers_upload(tmp_path, monkeypatch):
+    from app.rag import retriever
+
+    path = str(tmp_path / "state.db")
+    first, second = SharedState(path), SharedState(path)
+    monkeypatch.setattr(retriever, "shared_state", first)
+    cached = retriever._cache_key("kb", await retriever.kb_version("kb"), "q", 4, None)
+    retriever.retrieval_cache.put(cached, [("old", {}, 1.0, None)])
+
+    # What an upload on the second worker does to the shared version.
+    second.bump_collection_version("kb")
+    version = await retriever.kb_version("kb")
+
+    assert version == 1
+    assert retriever.retrieval_cache.get(retriever._cache_key("kb", version, "q", 4, None)) is None
+    first.close()
+    second.close()
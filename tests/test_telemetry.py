@@ -0,0 +1,74 @@
+import re
+from unittest.mock import AsyncMock
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+from langchain_core.messages import AIMessageChunk
+
+from app.main import app
+from app.telemetry import Counter, Histogram, registry
+from tests.conftest import make_fake_response
+
+
+def _sample(text: str, name: str, labels: str = "") -> float:
+    match = re.search(rf"^{re.escape(name + labels)} (\S+)$", text, re.MULTILINE)
+    return float(match.group(1)) if match else 0.0
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("test_seconds", "Test histogram.", ("stage",), buckets=(0.1, 1.0))
+    counter = Counter("test_total", "Test counter.")
+    try:
+        for value in (0.05, 0.1, 0.5, 3.0):
+            histogram.observe(value, stage="a")
+        counter.inc(2)
+        text = "\n".join(histogram.render() + counter.render())
+    finally:
+        registry.remove(histogram)
+        registry.remove(counter)
+
+    assert "# TYPE test_seconds histogram" in text
+    assert _sample(text, "test_seconds_bucket", '{stage="a",le="0.1"}') == 2
+    assert _sample(text, "test_seconds_bucket", '{stage="a",le="1.0"}') == 3
+    assert _sample(text, "test_seconds_bucket", '{stage="a",le="+Inf"}') == 4
+    assert _sample(text, "test_seconds_count", '{stage="a"}') == 4
+    assert _sample(text, "test_seconds_sum", '{stage="a"}') == pytest.approx(3.65)
+    assert _sample(text, "test_total") == 2
+
+
+@pytest.mark.asyncio
+async def test_metrics_record_chat_stages_and_tokens(mock_llm, monkeypatch):
+    async def fake_search(kb_id, query, top_k=None, metadata_filter=None):
+        return [("Paris is in France", {"source_filename": "geo.txt"}, 0.9, None)]
+
+    async def fake_astream(messages):
+        yield AIMessageChunk(content="Hi", usage_metadata={"input_tokens": 7, "output_tokens": 3, "total_tokens": 10})
+
+    monkeypatch.setattr("app.api.chat.aretrieve_context", fake_search)
+    mock_llm.ainvoke = AsyncMock(return_value=make_fake_response("Paris"))
+    mock_llm.astream = fake_astream
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        before = (await client.get("/metrics")).text
+        await client.post("/chat", json={"message": "Capital?", "knowledge_base_ids": ["a", "b"]})
+        await client.post("/chat/stream", json={"message": "Hello"})
+        response = await client.get("/metrics")
+
+    after = response.text
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+
+    def delta(name: str, labels: str) -> float:
+        return _sample(after, name, labels) - _sample(before, name, labels)
+
+    for stage in ("session_load", "trim", "retrieval_wait", "prompt_assembly", "generation"):
+        assert delta("chat_stage_seconds_count", f'{{stage="{stage}"}}') == 2
+    assert delta("chat_stage_seconds_count", '{stage="kb_search"}') == 2
+    assert delta("chat_stage_seconds_count", '{stage="first_token"}') == 1
+    assert delta("chat_stage_seconds_count", '{stage="sse_encode"}') == 1
+    assert delta("chat_request_seconds_count", '{endpoint="chat",mode="chat"}') == 1
+    assert delta("chat_request_seconds_count", '{endpoint="stream",mode="chat"}') == 1
+    assert delta("chat_tokens_total", '{type="input"}') == 10 + 7
+    assert delta("chat_tokens_total", '{type="output"}') == 5 + 3
+    assert _sample(after, "chat_in_flight", '{tier="large"}') == 0
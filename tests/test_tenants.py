@@ -0,0 +1,213 @@
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from app.config import settings
+from app.main import app
+from tests.conftest import ADMIN_HEADERS, make_fake_response
+
+
+def _tenant(tenant_id):
+    return {"X-Tenant-Id": tenant_id}
+
+
+@pytest.mark.asyncio
+async def test_knowledge_bases_are_isolated_per_tenant(local_vector_store, fake_process):
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        kb_id = (await client.post("/knowledge-base", json={"name": "Acme"}, headers=_tenant("acme"))).json()["id"]
+        await client.post(
+            f"/knowledge-base/{kb_id}/documents",
+            files=[("files", ("geo.txt", b"Paris is in France", "text/plain"))],
+            headers=_tenant("acme"),
+        )
+
+        own = await client.post(
+            f"/knowledge-base/{kb_id}/query", json={"query": "paris"}, headers=_tenant("acme")
+        )
+        other_query = await client.post(
+            f"/knowledge-base/{kb_id}/query", json={"query": "paris"}, headers=_tenant("globex")
+        )
+        other_get = await client.get(f"/knowledge-base/{kb_id}", headers=_tenant("globex"))
+        other_list = await client.get("/knowledge-base", headers=_tenant("globex"))
+        other_delete = await client.delete(f"/knowledge-base/{kb_id}", headers=_tenant("globex"))
+
+    assert own.json()["results"][0]["content"] == "Paris is in France"
+    assert other_query.status_code == other_get.status_code == other_delete.status_code == 404
+    assert other_list.json() == []
+    assert local_vector_store.list_collections() == [f"acme.{kb_id}"]
+
+
+@pytest.mark.asyncio
+async def test_invalid_tenant_id_is_rejected():
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.get("/knowledge-base", headers=_tenant("../etc"))
+
+    assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_unknown_tenant_is_rejected_when_tenants_are_listed(monkeypatch):
+    monkeypatch.setattr(settings, "TENANT_IDS", ["acme"])
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        known = await client.get("/knowledge-base", headers=_tenant("acme"))
+        unknown = await client.get("/knowledge-base", headers=_tenant("globex"))
+        default = await client.get("/knowledge-base")
+
+    assert known.status_code == default.status_code == 200
+    assert unknown.status_code == 403
+
+
+@pytest.mark.asyncio
+async def test_chat_sessions_are_isolated_per_tenant(mock_llm):
+    mock_llm.ainvoke = AsyncMock(return_value=make_fake_response("Hi"))
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        first = await client.post("/chat", json={"message": "Secret plan"}, headers=_tenant("acme"))
+        session_id = first.json()["session_id"]
+        other_read = await client.get(f"/chat/{session_id}/messages", headers=_tenant("globex"))
+        await client.post("/chat", json={"message": "Hello", "session_id": session_id}, headers=_tenant("globex"))
+        own_read = await client.get(f"/chat/{session_id}/messages", headers=_tenant("acme"))
+
+    assert other_read.status_code == 404
+    assert [m.content for m in mock_llm.ainvoke.call_args.args[0]] == ["Hello"]
+    assert [m["content"] for m in own_read.json()["messages"]] == ["Secret plan", "Hi"]
+
+
+def test_idle_rate_buckets_are_swept(monkeypatch):
+    from app import tenants
+
+    monkeypatch.setattr(settings, "TENANT_QUERY_RATE", 1000.0)
+    monkeypatch.setattr(settings, "TENANT_QUERY_BURST", 1)
+    monkeypatch.setattr(tenants, "_MIN_BUCKET_SWEEP", 4)
+    monkeypatch.setattr(tenants, "_next_bucket_sweep", 4)
+    monkeypatch.setattr(tenants.time, "monotonic", lambda: 100.0)
+    for i in range(4):
+        tenants.check_rate(f"tenant-{i}", "query")
+    # A second later every bucket has refilled.
+    monkeypatch.setattr(tenants.time, "monotonic", lambda: 101.0)
+    tenants.check_rate("tenant-4", "query")
+
+    assert list(tenants._buckets) == [("tenant-4", "query")]
+
+
+def test_upload_slots_are_released(monkeypatch):
+    from fastapi import HTTPException
+
+    from app import tenants
+
+    monkeypatch.setattr(settings, "TENANT_MAX_CONCURRENT_UPLOADS", 1)
+    with tenants.upload_slot("tenant-a"):
+        with pytest.raises(HTTPException) as refused, tenants.upload_slot("tenant-a"):
+            pass
+        with tenants.upload_slot("tenant-b"):
+            assert tenants._uploads_in_flight == {"tenant-a": 1, "tenant-b": 1}
+
+    assert refused.value.status_code == 429
+    assert tenants._uploads_in_flight == {}
+
+
+@pytest.mark.asyncio
+async def test_chat_rate_limit_returns_429_per_tenant(mock_llm, monkeypatch):
+    monkeypatch.setattr(settings, "TENANT_CHAT_RATE", 0.01)
+    monkeypatch.setattr(settings, "TENANT_CHAT_BURST", 2)
+    mock_llm.ainvoke = AsyncMock(return_value=make_fake_response("Hi"))
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        noisy = [
+            await client.post("/chat", json={"message": "Hello"}, headers=_tenant("noisy")) for _ in range(3)
+        ]
+        quiet = await client.post("/chat", json={"message": "Hello"}, headers=_tenant("quiet"))
+
+    assert [r.status_code for r in noisy] == [200, 200, 429]
+    assert int(noisy[-1].headers["Retry-After"]) > 0
+    assert quiet.status_code == 200
+    assert mock_llm.ainvoke.call_count == 3
+
+
+@pytest.mark.asyncio
+async def test_storage_quota_rejects_files_over_the_limit(local_vector_store, monkeypatch, fake_process):
+    monkeypatch.setattr(settings, "TENANT_MAX_STORAGE_BYTES", 30)
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        kb_id = (await client.post("/knowledge-base", json={"name": "KB"}, headers=_tenant("acme"))).json()["id"]
+        response = await client.post(
+            f"/knowledge-base/{kb_id}/documents",
+            files=[
+                ("files", ("a.txt", b"Paris is in France", "text/plain")),
+                ("files", ("b.txt", b"Berlin is in Germany", "text/plain")),
+            ],
+            headers=_tenant("acme"),
+        )
+
+    data = response.json()
+    assert data["documents_processed"] == 1
+    assert [e["filename"] for e in data["errors"]] == ["b.txt"]
+    assert "quota" in data["errors"][0]["error"]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_uploads_share_the_storage_quota(local_vector_store, monkeypatch, fake_process):
+    from app.api.knowledge_base import _storage_reserved, tenant_storage_bytes
+
+    monkeypatch.setattr(settings, "TENANT_MAX_STORAGE_BYTES", 30)
+    add = local_vector_store.aadd
+
+    async def slow_add(collection, documents):
+        # Both uploads are past the quota check before either is registered.
+        await asyncio.sleep(0.05)
+        await add(collection, documents)
+
+    async def upload(client, kb_id, name, text):
+        response = await client.post(
+            f"/knowledge-base/{kb_id}/documents", files=[("files", (name, text, "text/plain"))], headers=_tenant("acme")
+        )
+        return response.json()
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        kb_ids = [
+            (await client.post("/knowledge-base", json={"name": name}, headers=_tenant("acme"))).json()["id"]
+            for name in ("A", "B")
+        ]
+        with patch.object(local_vector_store, "aadd", side_effect=slow_add):
+            results = await asyncio.gather(
+                upload(client, kb_ids[0], "a.txt", b"Paris is in France"),
+                upload(client, kb_ids[1], "b.txt", b"Paris is in Europe"),
+            )
+
+    assert sorted(r["documents_processed"] for r in results) == [0, 1]
+    assert sum(len(r["errors"]) for r in results) == 1
+    assert await tenant_storage_bytes("acme") == 18
+    assert _storage_reserved == {}
+
+
+@pytest.mark.asyncio
+async def test_admin_lists_tenant_usage(mock_llm, local_vector_store, fake_process):
+    mock_llm.ainvoke = AsyncMock(return_value=make_fake_response("Hi"))
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        kb_id = (await client.post("/knowledge-base", json={"name": "KB"}, headers=_tenant("acme"))).json()["id"]
+        await client.post(
+            f"/knowledge-base/{kb_id}/documents",
+            files=[("files", ("geo.txt", b"Paris is in France", "text/plain"))],
+            headers=_tenant("acme"),
+        )
+        await client.post("/chat", json={"message": "Hello"}, headers=_tenant("acme"))
+        await client.post(f"/knowledge-base/{kb_id}/query", json={"query": "paris"}, headers=_tenant("acme"))
+        usage = (await client.get("/admin/tenants", headers=ADMIN_HEADERS)).json()
+
+    assert usage == [{
+        "tenant_id": "acme",
+        "knowledge_bases": 1,
+        "storage_bytes": 18,
+        "chat_requests": 1,
+        "input_tokens": 10,
+        "output_tokens": 5,
+        "total_tokens": 15,
+        "queries": 1,
+        "ingested_bytes": 18,
+        "ingested_chunks": 1,
+        "rate_limited": 0,
+    }]
@@ -0,0 +1,298 @@
+from datetime import datetime, timezone
+
+import pytest
+from langchain_core.documents import Document
+
+from app.models import RetrievalFilter
+from app.rag.vector_store.filters import build_where
+
+
+# --- Filter translation ---
+
+
+def test_build_where_empty_filter():
+    assert build_where(RetrievalFilter()) is None
+
+
+def test_build_where_single_clause():
+    assert build_where(RetrievalFilter(source_filename="a.txt")) == {"source_filename": {"$eq": "a.txt"}}
+
+
+def test_build_where_combines_clauses():
+    where = build_where(
+        RetrievalFilter(
+            source_filename=["a.txt", "b.txt"],
+            uploaded_after=datetime(2024, 1, 1, tzinfo=timezone.utc),
+            metadata={"team": "finance"},
+        )
+    )
+
+    assert where == {
+        "$and": [
+            {"source_filename": {"$in": ["a.txt", "b.txt"]}},
+            {"uploaded_at": {"$gte": 1704067200}},
+            {"team": {"$eq": "finance"}},
+        ]
+    }
+
+
+# --- Local backend ---
+
+
+def _seed(backend):
+    store = backend.get_store("kb")
+    store.add_texts(
+        ["Paris is in France", "Berlin is in Germany", "The revenue report"],
+        metadatas=[
+            {"source_filename": "geo.txt", "uploaded_at": 100},
+            {"source_filename": "geo.txt", "uploaded_at": 200},
+            {"source_filename": "finance.md", "uploaded_at": 300},
+        ],
+        ids=["paris", "berlin", "revenue"],
+    )
+    return store
+
+
+def test_local_backend_search_orders_by_distance(local_vector_store):
+    store = _seed(local_vector_store)
+
+    results = store.similarity_search_with_score("Paris France", k=2)
+
+    assert [doc.id for doc, _ in results] == ["paris", "berlin"]
+    assert results[0][1] < results[1][1]
+    assert results[0][0].metadata["source_filename"] == "geo.txt"
+
+
+def test_local_backend_filter_runs_inside_index(local_vector_store):
+    store = _seed(local_vector_store)
+    where = build_where(RetrievalFilter(source_filename="finance.md"))
+
+    results = store.similarity_search_with_score("Paris France", k=2, filter=where)
+
+    assert [doc.id for doc, _ in results] == ["revenue"]
+    ranged = store.similarity_search_with_score("Paris", k=3, filter={"uploaded_at": {"$gte": 200}})
+    assert {doc.id for doc, _ in ranged} == {"berlin", "revenue"}
+
+
+def test_local_backend_upsert_and_delete(local_vector_store):
+    store = _seed(local_vector_store)
+
+    store.add_texts(["Berlin Berlin Germany"], metadatas=[{"source_filename": "new.txt"}], ids=["berlin"])
+    store.delete(["paris"])
+
+    results = store.similarity_search_with_score("Berlin Paris France", k=5)
+    assert [doc.id for doc, _ in results] == ["berlin", "revenue"]
+    assert results[0][0].metadata["source_filename"] == "new.txt"
+
+
+def test_local_backend_upsert_keeps_the_last_duplicate(tmp_path):
+    from app.rag.vector_store.local_backend import LocalVectorStoreBackend
+    from tests.conftest import FakeEmbeddings
+
+    backend = LocalVectorStoreBackend(root=str(tmp_path), embeddings=FakeEmbeddings())
+    store = backend.get_store("kb")
+    store.add_texts(["Paris", "Berlin", "Germany"], metadatas=[{"n": 1}, {"n": 2}, {"n": 3}], ids=["x", "y", "x"])
+    reopened = LocalVectorStoreBackend(root=str(tmp_path), embeddings=FakeEmbeddings())
+
+    for backend in (backend, reopened):
+        docs = backend.get_store("kb").get_by_ids(["x", "y"])
+        assert [(d.id, d.page_content, d.metadata["n"]) for d in docs] == [("x", "Germany", 3), ("y", "Berlin", 2)]
+        assert backend.dead_fraction("kb") == 0
+        assert [d.id for d, _ in backend.search("kb", "Germany", 5)] == ["x", "y"]
+
+
+def test_local_backend_persists_across_instances(tmp_path):
+    from app.rag.vector_store.local_backend import LocalVectorStoreBackend
+    from tests.conftest import FakeEmbeddings
+
+    backend = LocalVectorStoreBackend(root=str(tmp_path), embeddings=FakeEmbeddings())
+    _seed(backend)
+    backend.get_store("kb").delete(["berlin"])
+
+    reopened = LocalVectorStoreBackend(root=str(tmp_path), embeddings=FakeEmbeddings())
+    results = reopened.get_store("kb").similarity_search_with_score("Germany", k=5)
+
+    assert reopened.list_collections() == ["kb"]
+    assert {doc.id for doc, _ in results} == {"paris", "revenue"}
+
+
+def test_local_backend_sees_writes_from_other_processes(tmp_path):
+    from app.rag.vector_store.local_backend import LocalVectorStoreBackend
+    from tests.conftest import FakeEmbeddings
+
+    # Two backends on one directory stand in for two worker processes.
+    first = LocalVectorStoreBackend(root=str(tmp_path), embeddings=FakeEmbeddings())
+    second = LocalVectorStoreBackend(root=str(tmp_path), embeddings=FakeEmbeddings())
+    assert second.get_store("kb").similarity_search_with_score("Paris", k=5) == []
+
+    _seed(first)
+    second.get_store("kb").add_texts(["Paris is the capital"], ids=["capital"])
+    first.get_store("kb").delete(["berlin"])
+
+    for backend in (first, second):
+        results = backend.get_store("kb").similarity_search_with_score("Paris France", k=5)
+        assert {doc.id for doc, _ in results} == {"paris", "capital", "revenue"}
+
+
+def test_local_backend_ann_matches_exact(local_vector_store, monkeypatch):
+    pytest.importorskip("hnswlib")
+    from app.config import settings
+
+    store = _seed(local_vector_store)
+    exact = store.similarity_search_with_score("Paris France", k=3)
+
+    monkeypatch.setattr(settings, "LOCAL_ANN_THRESHOLD", 1)
+    approximate = store.similarity_search_with_score("Paris France", k=3)
+
+    assert [doc.id for doc, _ in approximate] == [doc.id for doc, _ in exact]
+    assert approximate[0][1] == pytest.approx(exact[0][1], abs=1e-4)
+
+
+def test_local_backend_delete_collection(local_vector_store):
+    _seed(local_vector_store)
+
+    local_vector_store.delete_collection("kb")
+
+    assert local_vector_store.list_collections() == []
+    with pytest.raises(ValueError):
+        local_vector_store.delete_collection("kb")
+
+
+@pytest.mark.parametrize("mode", ["none", "int8"])
+def test_local_backend_search_during_upserts(tmp_path, mode):
+    import threading
+
+    import numpy as np
+
+    from app.rag.vector_store.local_backend import _Collection
+
+    rng = np.random.default_rng(0)
+    collection = _Collection(tmp_path)
+    collection.configure(mode)
+    collection.upsert(["0"], ["0"], [{"even": True}], rng.standard_normal((1, 8)).astype(np.float32))
+    errors = []
+    done = threading.Event()
+
+    def write():
+        try:
+            for i in range(1, 300):
+                # Every other write replaces an earlier row, leaving tombstones behind.
+                ids = [str(i), str(i // 2)]
+                metadatas = [{"even": i % 2 == 0}, {"even": i // 2 % 2 == 0}]
+                collection.upsert(ids, ids, metadatas, rng.standard_normal((2, 8)).astype(np.float32))
+        except Exception as exc:
+            errors.append(exc)
+        finally:
+            done.set()
+
+    def search():
+        query = np.ones(8, dtype=np.float32)
+        try:
+            while not done.is_set():
+                snapshot = collection.snapshot
+                for where in (None, {"even": True}):
+                    hits = collection.search(query, 5, where, snapshot)
+                    assert all(snapshot.live[row] for row, _ in hits)
+                    snapshot.documents(row for row, _ in hits)
+        except Exception as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=write)] + [threading.Thread(target=search) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert len(collection.search(np.ones(8, dtype=np.float32), 1000)) == 300
+
+
+# --- Quantization ---
+
+
+def _clustered_vectors(n, dim, seed=0):
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((16, dim)).astype(np.float32) * 4
+    return (centers[rng.integers(0, 16, n)] + rng.standard_normal((n, dim))).astype(np.float32)
+
+
+@pytest.mark.parametrize("mode", ["int8", "pq"])
+def test_quantized_search_matches_exact(tmp_path, monkeypatch, mode):
+    from app.config import settings
+    from app.rag.vector_store.local_backend import _Collection
+
+    monkeypatch.setattr(settings, "VECTOR_PQ_TRAIN_MIN", 256)
+    vectors = _clustered_vectors(1000, 32)
+    ids = [str(i) for i in range(len(vectors))]
+    exact = _Collection(tmp_path / "exact")
+    exact.upsert(ids, ids, [{} for _ in ids], vectors)
+    quantized = _Collection(tmp_path / mode)
+    quantized.configure(mode)
+    quantized.upsert(ids, ids, [{} for _ in ids], vectors)
+
+    query = vectors[7] + 0.1
+    expected = exact.search(query, 5)
+    actual = quantized.search(query, 5)
+
+    assert actual[0] == pytest.approx(expected[0], rel=1e-4)
+    assert len({row for row, _ in actual} & {row for row, _ in expected}) >= 4
+    assert quantized.resident_bytes < exact.resident_bytes + vectors.nbytes / 3
+
+
+def test_quantized_collection_reloads(tmp_path):
+    from app.rag.vector_store.local_backend import _Collection
+
+    vectors = _clustered_vectors(50, 16)
+    ids = [str(i) for i in range(len(vectors))]
+    collection = _Collection(tmp_path)
+    collection.configure("int8")
+    collection.upsert(ids, ids, [{} for _ in ids], vectors)
+
+    reopened = _Collection(tmp_path)
+
+    assert reopened.quantization == "int8"
+    assert reopened.search(vectors[3], 1)[0][0] == 3
+
+
+@pytest.mark.asyncio
+async def test_create_knowledge_base_with_quantization_unsupported(mock_vector_store):
+    from httpx import ASGITransport, AsyncClient
+
+    from app.main import app
+
+    mock_backend, _ = mock_vector_store
+    mock_backend.create_collection.side_effect = ValueError("ChromaVectorStoreBackend does not support vector quantization")
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        response = await client.post("/knowledge-base", json={"name": "Q", "vector_quantization": "int8"})
+
+    assert response.status_code == 422
+    assert "does not support" in response.json()["detail"]
+
+
+# --- Async adapter ---
+
+
+@pytest.mark.asyncio
+async def test_async_defaults_run_in_thread_pool(local_vector_store):
+    import threading
+
+    loop_thread = threading.get_ident()
+    seen = []
+    original = local_vector_store.search
+
+    def recording_search(*args):
+        seen.append(threading.get_ident())
+        return original(*args)
+
+    local_vector_store.search = recording_search
+    await local_vector_store.aadd("kb", [Document(page_content="Paris is in France", metadata={})])
+
+    results = await local_vector_store.asearch("kb", "Paris", 1)
+
+    assert results[0][0].page_content == "Paris is in France"
+    assert seen and seen[0] != loop_thread